@@ -34,9 +34,18 @@ process:
 #import MySQLdb # Not compatible with Python 3
 import mysql.connector
 import sys, os, shutil
-import numpy as np
 import pandas as pd
-# need to import module for import of xlsx file
+# workbooks are read in with the loader of the checking script (wb_QC/wb_check.py),
+# which sets the data types of the columns as for the checks (dropdown columns as
+# categoricals, numeric columns as float64, empty cells as NaN) and, if
+# SISAL_CACHE_DIR is set, reuses the spreadsheets read in when the workbook was
+# checked
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'wb_QC'))
+from wb_check import load_workbook
+# tables are written to the database by the functions of upload_tables.py
+import upload_tables
+from upload_tables import (sql_params, tb_input, tb_load, select_in, select_each,
+                           reference_key, reference_index)
 
 input_file = sys.argv[1]
 mysql_username = sys.argv[2] # "root"
@@ -49,35 +58,6 @@ if len(sys.argv) < 6:
 elif len(sys.argv) > 6:
     sys.exit('Too many arguments supplied, only five arguments are accepted: path_to_workbook mysql_username mysql_password mysql_host mysql_dbname')
 
-# Define table inputs
-def tb_input(input_table, db_table, AI_ID = False):
-    query = ("SHOW COLUMNS FROM %s;" %(db_table))
-    cursor.execute(query)
-    field_names = [j[0] for j in cursor.fetchall()]
-    # create list of all columns from sample
-    # sample_entry_field_names = list(field_names)
-    field_names = list(set(field_names).intersection(list(input_table.columns.values)))
-    if AI_ID is not False:
-        field_names.remove(AI_ID)
-    f_name = ", ".join(field_names)
-    tb_subset = input_table[field_names]
-    if tb_subset.shape[0] > 0:
-        y = tb_subset.values.tolist()
-        ls_ls = []
-        for i in y:
-            ls = [str(j) for j in i]
-            ls_ls.append(ls) 
-        str_ls = str(ls_ls)
-        str_ls = str_ls.replace('\\t', " ")
-        str_ls = str_ls.replace('], [', '), (')
-        str_ls = str_ls.replace('[[', '(')
-        str_ls = str_ls.replace(']]', ')')
-        str_ls = str_ls.replace("'nan'", 'NULL')
-        query = ("""INSERT INTO %s (%s) VALUES %s;"""
-                 %(db_table, f_name, str_ls))
-        #print(query)
-        cursor.execute(query)
-
 def query_yes_no(question, default="no"):
     """Ask a yes/no question via raw_input() and return their answer.
 
@@ -116,54 +96,50 @@ def query_yes_no(question, default="no"):
 cnx = mysql.connector.connect(user=mysql_username, 
                       passwd=mysql_password, 
                       host=mysql_host,
-                      db=mysql_dbname,use_unicode=True, charset="utf8")
+                      db=mysql_dbname,use_unicode=True, charset="utf8",
+                      allow_local_infile=upload_tables.load_data)
 cnx.autocommit = False
 
 cursor = cnx.cursor(buffered = True)
 cursor.autocommit = False
+# read in the columns of the tables of the database once
+upload_tables.set_cursor(cursor)
 # read in excel file
 # Warning counter, used to count the number of warnings. If no warnings, file is automatically moved to "Checked" folder
 warning_ctr = 0
 # Read in Workbook
 try:
-    xl = pd.ExcelFile(input_file)
-    sht_nm = xl.sheet_names
+    sheets = load_workbook(input_file)
 except:
     print('Cannot read in excel file')
     warning_ctr += 1
+    sheets = {}
 # create a list of spreadsheet namse containing "Sample data" 
 # This is because some workbooks may contain more than one spreadsheet for sample data
-sample_ls = [k for k in sht_nm if 'Sample data' in k]
-# Read in spreadsheets from the workbook
-# needs to skip first row
-# column title starts at row number 2/ index = 1
-try:
-    site_tb = xl.parse(sheet_name = 'Site metadata', skiprows = 1).dropna(how = 'all')
-except:
+sample_ls = [k for k in sheets if 'Sample data' in k]
+# Spreadsheets are read in by load_workbook (first row skipped, empty rows removed)
+site_tb = sheets.get('Site metadata')
+if site_tb is None:
     print('Cannot read in Site metadata spreadsheet, likely no spreadsheet called "Site metadata"')
     warning_ctr += 1
-try:
-    entity_tb = xl.parse(sheet_name = 'Entity metadata', skiprows = 1).dropna(how = 'all')
-except:
+entity_tb = sheets.get('Entity metadata')
+if entity_tb is None:
     print('Cannot read in Enitity metadata spreadsheet, likely no spreadsheet called "Entity metadata"')
     warning_ctr += 1
-try:
-    ref_tb = xl.parse(sheet_name = 'References', skiprows = 1).dropna(how = 'all')
-except:
+ref_tb = sheets.get('References')
+if ref_tb is None:
     print('Cannot read in References spreadsheet, likely no spreadsheet called "References"')
     warning_ctr += 1
-try:
-    dating_tb = xl.parse(sheet_name = 'Dating information', skiprows = 1).dropna(how = 'all')
-except:
+dating_tb = sheets.get('Dating information')
+if dating_tb is None:
     print('Cannot read in Dating information spreadsheet, likely no spreadsheet called "Dating information"')
     warning_ctr += 1
 # if only one spreadsheet for sample data, read in normally
 # or else append the spreadsheets one after the other
 # problem is error catching will not be able to pin point rows
 if len(sample_ls) == 1:
-    try:
-        sample_tb = xl.parse(sheet_name = 'Sample data', skiprows = 1).dropna(how = 'all')
-    except:
+    sample_tb = sheets.get('Sample data')
+    if sample_tb is None:
         print('Cannot read in sample data spreadsheet, likley no spreadsheet called "Sample data"')
         warning_ctr += 1
 elif len(sample_ls) == 0:
@@ -173,18 +149,17 @@ else:
     print('More than one sample data spreadsheet exist. Spreadsheets will be appended')
     sample_tb = pd.DataFrame()
     for i in sample_ls:
-        sp_tb = xl.parse(sheet_name = i, skiprows = 1).dropna(how = 'all')
-        sample_tb = sample_tb.append(sp_tb, ignore_index = True)
-try:
-    dating_lamina_tb = xl.parse(sheet_name = 'Lamina age vs depth', skiprows = 1).dropna(how = 'all')
-except:
+        sample_tb = sample_tb.append(sheets[i], ignore_index = True)
+dating_lamina_tb = sheets.get('Lamina age vs depth')
+if dating_lamina_tb is None:
     print('Cannot read in Lamina age vs depth spreadsheet, likely no spreadsheet called "Lamina age vs depth"')
     warning_ctr += 1
     
-# Convert all the modern_reference to string
-sample_tb.modern_reference = sample_tb.modern_reference.replace(np.nan, '', regex = True)
-dating_lamina_tb.modern_reference = dating_lamina_tb.modern_reference.replace(np.nan, '', regex = True)
-dating_tb.modern_reference = dating_tb.modern_reference.replace(np.nan, '', regex = True)
+# Convert all the modern_reference to string (dropdown columns are read in as
+# categoricals)
+sample_tb.modern_reference = sample_tb.modern_reference.astype(object).fillna('')
+dating_lamina_tb.modern_reference = dating_lamina_tb.modern_reference.astype(object).fillna('')
+dating_tb.modern_reference = dating_tb.modern_reference.astype(object).fillna('')
 
 if warning_ctr < 1:
     print('Correct interp_age to BP(1950)')
@@ -261,13 +236,21 @@ if warning_ctr < 1:
     query = ("""ALTER TABLE %s auto_increment = 1;""" %('site'))
     cursor.execute(query)
     try:
+        # site_id of the sites of the database with the site_name, latitude and
+        # longitude (4 decimals) of the sites of the workbook, matched by the
+        # database (site_name compared with the collation of the column, i.e.
+        # case insensitively) and keyed by the values of the workbook
+        site_keys = [(site_tb['site_name'][i], round(float(site_tb['latitude'][i]), 4), round(float(site_tb['longitude'][i]), 4)) for i in site_tb.index]
+        site_matches = select_each("""SELECT %s, site_id FROM site WHERE site_name = %s AND latitude = %s AND longitude = %s""", site_keys)
+        site_ids = {}
+        for n, site_key in enumerate(site_keys):
+            site_ids.setdefault(site_key, [int(row[0]) for row in site_matches.get(n, [])])
         for i in site_tb.index:
-            query = (""" SELECT site_id FROM site where site_name = "%s" and latitude = %.4f and longitude = %.4f""" %(site_tb['site_name'][i], site_tb['latitude'][i], site_tb['longitude'][i]))
-            cursor.execute(query)
-            x = cursor.rowcount
+            site_key = (site_tb['site_name'][i], round(float(site_tb['latitude'][i]), 4), round(float(site_tb['longitude'][i]), 4))
+            x = len(site_ids.get(site_key, []))
             if int(x) == 1:
                 print("Site already exists, Site data will not be imported")
-                last_site_id = int(cursor.fetchone()[0])
+                last_site_id = site_ids[site_key][0]
                 Site_exists = True
                 print("Site id = %d" %last_site_id)
             elif int(x) > 1:
@@ -275,18 +258,16 @@ if warning_ctr < 1:
                 warning_ctr += 1
             else:
                 print("Import new site into database")
-                query = ("""INSERT INTO site (site_name, latitude, longitude, elevation, geology, rock_age, monitoring) VALUES ("%s", %.4f, %.4f, %.2f, '%s', '%s', '%s');""" 
-                %(site_tb['site_name'][i],
-                  site_tb['latitude'][i],
-                  site_tb['longitude'][i],
-                  site_tb['elevation'][i],
-                  site_tb['geology'][i],
-                  site_tb['rock_age'][i],
-                  site_tb['monitoring'][i]))
-                query = query.replace('nan,', 'NULL,')
-                query = query.replace("'nan'", 'NULL')
-                cursor.execute(query)
+                query = ("""INSERT INTO site (site_name, latitude, longitude, elevation, geology, rock_age, monitoring) VALUES (%s, %s, %s, %s, %s, %s, %s);""")
+                cursor.execute(query, sql_params([site_tb['site_name'][i],
+                                                  round(float(site_tb['latitude'][i]), 4),
+                                                  round(float(site_tb['longitude'][i]), 4),
+                                                  round(float(site_tb['elevation'][i]), 2),
+                                                  site_tb['geology'][i],
+                                                  site_tb['rock_age'][i],
+                                                  site_tb['monitoring'][i]]))
                 last_site_id=cursor.lastrowid
+                site_ids[site_key] = [last_site_id]
     except mysql.connector.Error as err:
         print('Error with site import')
         warning_ctr += 1
@@ -313,14 +294,18 @@ if warning_ctr < 1:
     query = ("""ALTER TABLE %s auto_increment = 1;""" %('entity'))
     cursor.execute(query)
     try:
+        # entity_id of the entities of the site in the database with the
+        # entity_name of the entities of the workbook (compared by the database
+        # with the collation of the column, i.e. case insensitively), keyed by
+        # the entity_name of the workbook, also used for the samples and
+        # references
+        entity_keys = [(str(e), last_site_id) for e in pd.unique(entity_tb['entity_name'])]
+        entity_matches = select_each("""SELECT %s, entity_id FROM entity WHERE entity_name = %s AND site_id = %s""", entity_keys)
+        entity_ids = {}
+        for n, (entity_name, site_id) in enumerate(entity_keys):
+            entity_ids[entity_name] = [int(row[0]) for row in entity_matches.get(n, [])]
         for i in entity_tb.index:
-            query = (""" SELECT * FROM entity where entity_name = '%s' AND site_id = %d""" %(entity_tb['entity_name'][i], last_site_id))
-            cursor.execute(query)
-            x = cursor.rowcount
-            field_names = [j[0] for j in cursor.description]
-            field_names = list(set(field_names).intersection(list(entity_tb.columns.values)))
-            #field_names.remove('entity_id')
-            f_name = ", ".join(field_names)
+            x = len(entity_ids.get(str(entity_tb['entity_name'][i]), []))
             if int(x) == 1:
                 print("Entity already exists")
                 Entity_exists = True
@@ -335,57 +320,56 @@ if warning_ctr < 1:
                 one_and_only = entity_tb['one_and_only'][i]
                 if one_and_only == 'yes':
                     print("This is the one and only record of this entity. Entity is uploaded into database with entity_status = current")
-                    query = ("""INSERT INTO entity (site_id, entity_name, entity_status, depth_ref, cover_thickness, distance_entrance, speleothem_type, drip_type, d13C, d18O, d18O_water_equilibrium, trace_elements, organics, fluid_inclusions, mineralogy_petrology_fabric, clumped_isotopes, noble_gas_temperatures, C14, ODL, Mg_Ca, contact, data_DOI_URL) VALUES (%d, '%s', '%s', '%s', %f, %f, '%s', '%s', '%s', '%s', '%s', '%s', '%s', '%s', '%s', '%s', '%s', '%s', '%s', '%s', '%s', '%s');""" 
-                             %(last_site_id,
-                               entity_tb['entity_name'][i],
-                               'current',
-                               entity_tb['depth_ref'][i],
-                               entity_tb['cover_thickness'][i],
-                               entity_tb['distance_entrance'][i],
-                               entity_tb['speleothem_type'][i],
-                               entity_tb['drip_type'][i],
-                               entity_tb['d13C'][i],
-                               entity_tb['d18O'][i],
-                               entity_tb['d18O_water_equilibrium'][i],
-                               entity_tb['trace_elements'][i],
-                               entity_tb['organics'][i],
-                               entity_tb['fluid_inclusions'][i],
-                               entity_tb['mineralogy_petrology_fabric'][i],
-                               entity_tb['clumped_isotopes'][i],
-                               entity_tb['noble_gas_temperatures'][i],
-                               entity_tb['C14'][i],
-                               entity_tb['ODL'][i],
-                               entity_tb['Mg_Ca'][i],
-                               entity_tb['contact'][i],
-                               entity_tb['data_DOI_URL'][i]))
+                    query = ("""INSERT INTO entity (site_id, entity_name, entity_status, depth_ref, cover_thickness, distance_entrance, speleothem_type, drip_type, d13C, d18O, d18O_water_equilibrium, trace_elements, organics, fluid_inclusions, mineralogy_petrology_fabric, clumped_isotopes, noble_gas_temperatures, C14, ODL, Mg_Ca, contact, data_DOI_URL) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);""")
+                    params = [last_site_id,
+                              str(entity_tb['entity_name'][i]),
+                              'current',
+                              entity_tb['depth_ref'][i],
+                              entity_tb['cover_thickness'][i],
+                              entity_tb['distance_entrance'][i],
+                              entity_tb['speleothem_type'][i],
+                              entity_tb['drip_type'][i],
+                              entity_tb['d13C'][i],
+                              entity_tb['d18O'][i],
+                              entity_tb['d18O_water_equilibrium'][i],
+                              entity_tb['trace_elements'][i],
+                              entity_tb['organics'][i],
+                              entity_tb['fluid_inclusions'][i],
+                              entity_tb['mineralogy_petrology_fabric'][i],
+                              entity_tb['clumped_isotopes'][i],
+                              entity_tb['noble_gas_temperatures'][i],
+                              entity_tb['C14'][i],
+                              entity_tb['ODL'][i],
+                              entity_tb['Mg_Ca'][i],
+                              entity_tb['contact'][i],
+                              entity_tb['data_DOI_URL'][i]]
                 else:
                     print("This is not the one and only record of this entity. Entity is uploaded into database but entity_status is being left blank. This must be dealt with manually.")
-                    query = ("""INSERT INTO entity (site_id, entity_name, depth_ref, cover_thickness, distance_entrance, speleothem_type, drip_type, d13C, d18O, d18O_water_equilibrium, trace_elements, organics, fluid_inclusions, mineralogy_petrology_fabric, clumped_isotopes, noble_gas_temperatures, C14, ODL, Mg_Ca, contact, data_DOI_URL) VALUES (%d, '%s', '%s', %f, %f, '%s', '%s', '%s', '%s', '%s', '%s', '%s', '%s', '%s', '%s', '%s', '%s', '%s', '%s', '%s', '%s');""" 
-                             %(last_site_id,
-                               entity_tb['entity_name'][i],
-                               entity_tb['depth_ref'][i],
-                               entity_tb['cover_thickness'][i],
-                               entity_tb['distance_entrance'][i],
-                               entity_tb['speleothem_type'][i],
-                               entity_tb['drip_type'][i],
-                               entity_tb['d13C'][i],
-                               entity_tb['d18O'][i],
-                               entity_tb['d18O_water_equilibrium'][i],
-                               entity_tb['trace_elements'][i],
-                               entity_tb['organics'][i],
-                               entity_tb['fluid_inclusions'][i],
-                               entity_tb['mineralogy_petrology_fabric'][i],
-                               entity_tb['clumped_isotopes'][i],
-                               entity_tb['noble_gas_temperatures'][i],
-                               entity_tb['C14'][i],
-                               entity_tb['ODL'][i],
-                               entity_tb['Mg_Ca'][i],
-                               entity_tb['contact'][i],
-                               entity_tb['data_DOI_URL'][i]))
-                query = query.replace('nan,', 'NULL,')
-                query = query.replace("'nan'", 'NULL')
+                    query = ("""INSERT INTO entity (site_id, entity_name, depth_ref, cover_thickness, distance_entrance, speleothem_type, drip_type, d13C, d18O, d18O_water_equilibrium, trace_elements, organics, fluid_inclusions, mineralogy_petrology_fabric, clumped_isotopes, noble_gas_temperatures, C14, ODL, Mg_Ca, contact, data_DOI_URL) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);""")
+                    params = [last_site_id,
+                              str(entity_tb['entity_name'][i]),
+                              entity_tb['depth_ref'][i],
+                              entity_tb['cover_thickness'][i],
+                              entity_tb['distance_entrance'][i],
+                              entity_tb['speleothem_type'][i],
+                              entity_tb['drip_type'][i],
+                              entity_tb['d13C'][i],
+                              entity_tb['d18O'][i],
+                              entity_tb['d18O_water_equilibrium'][i],
+                              entity_tb['trace_elements'][i],
+                              entity_tb['organics'][i],
+                              entity_tb['fluid_inclusions'][i],
+                              entity_tb['mineralogy_petrology_fabric'][i],
+                              entity_tb['clumped_isotopes'][i],
+                              entity_tb['noble_gas_temperatures'][i],
+                              entity_tb['C14'][i],
+                              entity_tb['ODL'][i],
+                              entity_tb['Mg_Ca'][i],
+                              entity_tb['contact'][i],
+                              entity_tb['data_DOI_URL'][i]]
 #                print(query)
-                cursor.execute(query)
+                cursor.execute(query, sql_params(params))
+                entity_ids[str(entity_tb['entity_name'][i])] = [cursor.lastrowid]
 #                extract entity_id
 #                check for repeated reference based on either DOI or actual reference
 #                if no repeats, import reference into reference table in db 
@@ -438,17 +422,7 @@ if warning_ctr < 1:
                 # extract entity_name from entity spreadsheet
                 ent_name = entity_tb['entity_name'][i]
                 # try to extract entity_id from entity table in database, based on site_id and entity_name
-                # select all 
-                query = (""" SELECT * FROM entity where entity_name = '%s' and site_id = %d""" %(ent_name, last_site_id))
-                cursor.execute(query)
-                # extract column names from entity
-                field_names = [j[0] for j in cursor.description]
-                ent_data = cursor.fetchone()
-                # extract entity_id
-                # ent_id = int(ent_data[field_names == 'entity_id'])
-                # FOR SOME REASON the ABOVE INDEX for site_id instead so I will just index this manually for now
-                # entity_id is always the 2nd in the list anyways
-                ent_id = int(ent_data[1])
+                ent_id = entity_ids[str(ent_name)][0]
                 if ctr == 0:
                     first_ent_id = ent_id
                 ctr += 1
@@ -461,24 +435,27 @@ if warning_ctr < 1:
                 print('import samples')
                 if sample_tb_subset.shape[0] > 0:
                     sample_tb_subset.loc[:,'entity_id'] = ent_id
-                    tb_input(sample_tb_subset, 'sample')
-                    last_sample_insert_id=cursor.lastrowid
+                    last_sample_insert_id = tb_load(sample_tb_subset, 'sample')
                     # extract sample id from sample table in database
                     # InnoDB always ensure sequential auto_incremented ids
                     query = ("""SELECT sample_id FROM sample WHERE sample_id >= %d;""" %last_sample_insert_id)
                     cursor.execute(query)
                     last_inserted_sample_ids = [int(j[0]) for j in cursor.fetchall()]
+                    if len(last_inserted_sample_ids) != sample_tb_subset.shape[0]:
+                        # raised as a database error, so that the upload is rolled back below
+                        raise mysql.connector.errors.DataError(msg = '%d sample_id found for the %d samples of entity %s'
+                                                               %(len(last_inserted_sample_ids), sample_tb_subset.shape[0], ent_name))
                     # replace last_inserted_sample_ids into sample_id in sample_tb_subset
                     sample_tb_subset.loc[:, 'sample_id'] = last_inserted_sample_ids
                     # exclude rows with no d18O_measurement
                     sample_d18O_tb_subset = sample_tb_subset.loc[pd.notnull(sample_tb_subset['d18O_measurement']),:]
-                    tb_input(sample_d18O_tb_subset, 'd18O')
+                    tb_load(sample_d18O_tb_subset, 'd18O')
                     sample_d13C_tb_subset = sample_tb_subset.loc[pd.notnull(sample_tb_subset['d13C_measurement']),:]
-                    tb_input(sample_d13C_tb_subset, 'd13C')
+                    tb_load(sample_d13C_tb_subset, 'd13C')
                     sample_dating_tb_subset = sample_tb_subset.loc[pd.isnull(sample_tb_subset['hiatus']),:]
                     sample_dating_tb_subset = sample_dating_tb_subset.loc[pd.isnull(sample_dating_tb_subset['gap']),:]                                               
                     print('import original chronology')
-                    tb_input(sample_dating_tb_subset, 'original_chronology')
+                    tb_load(sample_dating_tb_subset, 'original_chronology')
                     # gap and hiatuses
                     sample_gap_tb_subset = sample_tb_subset.loc[pd.notnull(sample_tb_subset['gap']),:]
                     print('import gaps and hiatuses')
@@ -498,7 +475,7 @@ if warning_ctr < 1:
                     # replaces entity_id column with actualy entity id (normalisation based on the entity name)
                     dating_lamina_tb_subset.loc[:,'entity_id'] = ent_id
 #                    tb_input(dating_lamina_tb_subset, 'dating_lamina', 'dating_lamina_id')
-                    tb_input(dating_lamina_tb_subset, 'dating_lamina')
+                    tb_load(dating_lamina_tb_subset, 'dating_lamina')
         except mysql.connector.Error as err:
             print('Problems with importing sample spreadsheet (include d18O, d13C and original_chronology).')
             warning_ctr += 1
@@ -525,39 +502,43 @@ if warning_ctr < 1:
     cursor.execute(query)
     if importornot == True:
         try:
+            # ref_id of all the references of the database, keyed by
+            # normalized citation and DOI
+            cursor.execute("""SELECT ref_id, citation, publication_DOI FROM reference;""")
+            ref_ids = reference_index(cursor.fetchall())
+            # (entity_id, ref_id) already in entity_link_reference
+            entity_refs = set(select_in("""SELECT entity_id, ref_id FROM entity_link_reference WHERE entity_id IN ({})""", [ids[0] for ids in entity_ids.values()]))
             for i in ref_tb.index:
                 print(i)
 #                wah = str(MySQLdb.escape_string(ref_tb['citation'][i].encode('utf-8'))) #encode this string to utf8 before passing it through the escape_string function
                 wah = ref_tb['citation'][i]
 #                print(wah)
                 pub_DOI = ref_tb['publication_DOI'][i]
-                query = ("""SELECT ref_id FROM reference WHERE citation = "%s" AND publication_DOI = "%s"; """ %(wah, pub_DOI)) # uses AND instead of OR because there could be cases of missing DOIs, or same DOI due to typo.
-#                print(query)
-                cursor.execute(query)
-                x = cursor.rowcount
+                # uses AND instead of OR because there could be cases of missing DOIs, or same DOI due to typo.
+                ref_key = reference_key(wah, pub_DOI)
+                x = len(ref_ids.get(ref_key, []))
                 if int(x) == 1:
-                    last_ref_id = int(cursor.fetchone()[0])
+                    last_ref_id = ref_ids[ref_key][0]
                     print("Reference exists; Ref_id = %d" %last_ref_id)
                 elif int(x) > 1:
                     print("More than one reference exists with the same citation or the same DOI, CHECK DATABASE")
-                    # might have to just keep the process going and use the ref_id from the first one
+                    # keep the process going and use the ref_id from the first one
+                    last_ref_id = ref_ids[ref_key][0]
+                    print("Ref_id = %d" %last_ref_id)
                 else:
                     print("Import new reference into database")
-                    query = ("""INSERT INTO reference (citation, publication_DOI) VALUES ("%s","%s")""" %(ref_tb['citation'][i], ref_tb['publication_DOI'][i]))
-                    cursor.execute(query)
+                    query = ("""INSERT INTO reference (citation, publication_DOI) VALUES (%s, %s)""")
+                    cursor.execute(query, sql_params([ref_tb['citation'][i], ref_tb['publication_DOI'][i]]))
                     last_ref_id = cursor.lastrowid
-                query = ("SELECT entity_id FROM entity where entity_name = '%s' AND site_id = %d" %(ref_tb['entity_name'][i], last_site_id))
-                cursor.execute(query)
-                entity_id = int(cursor.fetchone()[0])
+                    ref_ids[ref_key] = [last_ref_id]
+                entity_id = entity_ids[str(ref_tb['entity_name'][i])][0]
                 # check whether current entity_reference combinations already exists
-                query = ("SELECT * FROM entity_link_reference where entity_id = %d AND ref_id = %d;" %(entity_id, last_ref_id))
-                cursor.execute(query)
-                x = cursor.rowcount
-                if int(x) > 0:
+                if (entity_id, last_ref_id) in entity_refs:
                     print("The following entity/reference combinations has already been uploaded in the database, no entry will be uploaded")
                 else:
                     query = ("INSERT INTO entity_link_reference (entity_id, ref_id) VALUES (%d, %d);" %(entity_id, last_ref_id))
                     cursor.execute(query)
+                    entity_refs.add((entity_id, last_ref_id))
         except:
             print('Problems with importing reference spreadsheet')
             warning_ctr += 1
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of upload_tables.py. The reference index (ReferenceIndexTest) and the
+batched inserts of tb_input() (InsertTest, with a cursor recording the
+statements instead of a connection) are tested without a database.
+
+The LOAD DATA LOCAL INFILE path (tb_load()) and the matching of workbook rows
+with the database (select_each()) are tested on a local MySQL/MariaDB server
+(LoadDataTest). These tests are skipped unless mysql.connector is installed
+and the environment variable SISAL_TEST_DB gives a database in which the tests
+can create (and drop) the table sisal_test_load:
+
+    SISAL_TEST_DB=user:password@localhost/sisal_test python -m pytest db_uploads
+
+The server must allow local infile (local_infile=ON) for test_load_data and
+test_load_data_rolls_back_skipped_rows. test_fallback_to_inserts turns it off
+on the server for the test (SET GLOBAL local_infile, so the user needs the
+privilege to do so, otherwise the test is skipped) and turns it on again.
+"""
+import os, sys, unittest
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import upload_tables
+try:
+    import mysql.connector
+except ImportError:
+    mysql = None
+
+test_db = os.environ.get('SISAL_TEST_DB', '')
+test_table = 'sisal_test_load'
+
+def connect():
+    """Connect to the test database (SISAL_TEST_DB) as Upload_workbooks.py does
+    with SISAL_LOAD_DATA=1"""
+    user_password, host_database = test_db.rsplit('@', 1)
+    user, password = (user_password.split(':', 1) + [''])[:2]
+    host, database = host_database.split('/', 1)
+    return(mysql.connector.connect(user = user, passwd = password, host = host, db = database,
+                                   use_unicode = True, charset = 'utf8',
+                                   allow_local_infile = True))
+
+class RecordingCursor(object):
+    """Cursor recording the statements sent by tb_input(), with the columns of
+    test_table for load_schema() and consecutive ids for lastrowid"""
+    def __init__(self, next_id = 101):
+        self.next_id, self.lastrowid = next_id, None
+        self.batches = []
+
+    def execute(self, query, params = ()):
+        pass
+
+    def fetchall(self):
+        # information_schema.COLUMNS of test_table, see load_schema()
+        return([(test_table, 'row_id', 'INT', 'NO', 'auto_increment'),
+                (test_table, 'sample_id', 'int', 'NO', ''),
+                (test_table, 'd18O_measurement', 'double', 'YES', ''),
+                (test_table, 'note', 'varchar', 'YES', '')])
+
+    def executemany(self, query, rows):
+        self.batches.append((query, rows))
+        # id of the first row of the INSERT
+        self.lastrowid = self.next_id
+        self.next_id += len(rows)
+
+class InsertTest(unittest.TestCase):
+    def setUp(self):
+        self.batch_size = upload_tables.insert_batch_size
+        upload_tables.insert_batch_size = 2
+        self.cursor = RecordingCursor()
+        upload_tables.set_cursor(self.cursor)
+
+    def tearDown(self):
+        upload_tables.insert_batch_size = self.batch_size
+        upload_tables.cursor, upload_tables.schema = None, {}
+
+    def samples(self):
+        # sample_id as floats, as read in from a workbook with missing values
+        return(pd.DataFrame({'entity_name': ['e1'] * 5,
+                             'sample_id': [1.0, 2.0, 3.0, 4.0, 5.0],
+                             'd18O_measurement': [-5.1, np.nan, 2.0, np.float64(0.25), np.nan],
+                             'note': ['tab\there', np.nan, 'text', None, "quoted 'text'"]}))
+
+    def test_batches(self):
+        first_id = upload_tables.tb_input(self.samples(), test_table)
+        self.assertEqual([len(rows) for query, rows in self.cursor.batches], [2, 2, 1])
+        self.assertEqual(set([query for query, rows in self.cursor.batches]),
+                         set(['INSERT INTO %s (sample_id, d18O_measurement, note) VALUES (%%s, %%s, %%s)' %test_table]))
+        # id of the first row of the first batch
+        self.assertEqual(first_id, 101)
+
+    def test_values(self):
+        upload_tables.tb_input(self.samples(), test_table)
+        rows = [row for query, rows in self.cursor.batches for row in rows]
+        self.assertEqual(rows, [[1, -5.1, 'tab here'], [2, None, None], [3, 2.0, 'text'],
+                                [4, 0.25, None], [5, None, "quoted 'text'"]])
+        # integers read in as floats are int in the integer columns only
+        self.assertEqual([type(row[0]) for row in rows], [int] * 5)
+        self.assertEqual(type(rows[2][1]), float)
+        self.assertEqual(type(rows[3][1]), float)
+
+    def test_sql_rows(self):
+        table = pd.DataFrame({'sample_id': [7.0, np.nan], 'd18O_measurement': [np.nan, -1.0]})
+        self.assertEqual(upload_tables.sql_rows(table, test_table), [[7, None], [None, -1.0]])
+
+    def test_no_rows(self):
+        self.assertIsNone(upload_tables.tb_input(self.samples().iloc[:0], test_table))
+        self.assertEqual(self.cursor.batches, [])
+
+class ReferenceIndexTest(unittest.TestCase):
+    def test_normalize_doi(self):
+        for doi in ['10.1038/srep24374', '10.1038/SREP24374', ' 10.1038/srep24374 ',
+                    'https://doi.org/10.1038/srep24374', 'http://doi.org/10.1038/srep24374',
+                    'https://dx.doi.org/10.1038/srep24374', 'http://dx.doi.org/10.1038/srep24374',
+                    'https://www.doi.org/10.1038/srep24374', 'http://www.doi.org/10.1038/srep24374',
+                    'www.doi.org/10.1038/srep24374', 'dx.doi.org/10.1038/srep24374', 'doi.org/10.1038/srep24374',
+                    'doi:10.1038/srep24374', 'DOI: 10.1038/SREP24374', 'HTTPS://DOI.ORG/10.1038/SREP24374']:
+            self.assertEqual(upload_tables.normalize_doi(doi), '10.1038/srep24374', doi)
+
+    def test_normalize_doi_missing(self):
+        # NULL, or 'nan' as inserted by older versions of Upload_workbooks.py
+        for doi in [None, np.nan, 'nan', 'NaN', ' nan ', '']:
+            self.assertEqual(upload_tables.normalize_doi(doi), '', doi)
+
+    def test_normalize_citation(self):
+        self.assertEqual(upload_tables.normalize_citation('Smith,  J.\tet al. (2010)\n Nature '),
+                         'smith, j. et al. (2010) nature')
+        self.assertEqual(upload_tables.normalize_citation('SMITH et al. (2010)'),
+                         upload_tables.normalize_citation(' smith  et  al. (2010)'))
+        self.assertEqual(upload_tables.normalize_citation(None), '')
+        self.assertEqual(upload_tables.normalize_citation(np.nan), '')
+
+    def test_reference_key(self):
+        self.assertEqual(upload_tables.reference_key(' Smith  (2010) ', 'https://doi.org/10.1/ABC'), ('smith (2010)', '10.1/abc'))
+        self.assertEqual(upload_tables.reference_key('Smith (2010)', None), ('smith (2010)', ''))
+        # both the citation and the DOI must match
+        self.assertNotEqual(upload_tables.reference_key('Smith (2010)', '10.1/abc'),
+                            upload_tables.reference_key('Smith (2011)', '10.1/abc'))
+        self.assertNotEqual(upload_tables.reference_key('Smith (2010)', '10.1/abc'),
+                            upload_tables.reference_key('Smith (2010)', '10.1/abd'))
+
+    def test_reference_index(self):
+        # ref_id as read from the database (int) or from reference.csv (str)
+        rows = [(12, 'Smith (2010)', '10.1/abc'),
+                ('3', 'smith  (2010)', 'https://doi.org/10.1/ABC'),
+                (7, 'Jones (2015)', None),
+                (5, 'JONES (2015)', 'nan'),
+                ('10', 'Jones (2015)', '10.2/xyz'),
+                (4, 'Smith (2010)', 'doi:10.1/abc')]
+        self.assertEqual(upload_tables.reference_index(rows),
+                         {('smith (2010)', '10.1/abc'): [3, 4, 12],
+                          ('jones (2015)', ''): [5, 7],
+                          ('jones (2015)', '10.2/xyz'): [10]})
+        self.assertEqual(upload_tables.reference_index([]), {})
+
+@unittest.skipIf(mysql is None, 'mysql.connector is not installed')
+@unittest.skipIf(test_db == '', 'no test database (SISAL_TEST_DB)')
+class LoadDataTest(unittest.TestCase):
+    def connect_table(self):
+        try:
+            self.cnx = connect()
+        except mysql.connector.Error as err:
+            self.skipTest('cannot connect to the test database: %s' %err)
+        self.cnx.autocommit = False
+        self.cursor = self.cnx.cursor(buffered = True)
+        self.cursor.execute('DROP TABLE IF EXISTS %s;' %test_table)
+        self.cursor.execute("""CREATE TABLE %s (row_id INT AUTO_INCREMENT PRIMARY KEY,
+                                                sample_id INT NOT NULL UNIQUE,
+                                                d18O_measurement DOUBLE,
+                                                note VARCHAR(100)) ENGINE = InnoDB;""" %test_table)
+        upload_tables.set_cursor(self.cursor)
+        upload_tables.set_load_data(True)
+
+    def tearDown(self):
+        upload_tables.set_load_data(False)
+        if getattr(self, 'cnx', None) is not None:
+            self.cnx.rollback()
+            if getattr(self, 'local_infile', None) is not None:
+                self.cursor.execute('SET GLOBAL local_infile = %s;' %self.local_infile)
+            self.cursor.execute('DROP TABLE IF EXISTS %s;' %test_table)
+            self.cnx.close()
+
+    def table_rows(self):
+        self.cursor.execute('SELECT row_id, sample_id, d18O_measurement, note FROM %s ORDER BY row_id;' %test_table)
+        return(self.cursor.fetchall())
+
+    def samples(self):
+        # sample_id as floats, as read in from a workbook with missing values
+        return(pd.DataFrame({'entity_name': ['e1', 'e1', 'e1'],
+                             'sample_id': [1.0, 2.0, 3.0],
+                             'd18O_measurement': [-5.1, np.nan, 0.25],
+                             'note': ['tab\there', 'back\\slash "quoted" \'text\'', np.nan]}))
+
+    def test_load_data(self):
+        self.connect_table()
+        first_id = upload_tables.tb_load(self.samples(), test_table)
+        if not upload_tables.load_data:
+            self.skipTest('the server does not allow local infile')
+        rows = self.table_rows()
+        self.assertEqual([r[0] for r in rows], [first_id, first_id + 1, first_id + 2])
+        self.assertEqual([tuple(r[1:]) for r in rows],
+                         [(1, -5.1, 'tab here'), (2, None, 'back\\slash "quoted" \'text\''), (3, 0.25, None)])
+
+    def test_load_data_rolls_back_skipped_rows(self):
+        self.connect_table()
+        samples = self.samples()
+        samples['sample_id'] = [1.0, 1.0, 2.0]
+        # LOAD DATA LOCAL skips the duplicate key with a warning only
+        with self.assertRaises(mysql.connector.Error):
+            upload_tables.tb_load(samples, test_table)
+        if not upload_tables.load_data:
+            self.skipTest('the server does not allow local infile')
+        self.cnx.rollback()
+        self.assertEqual(self.table_rows(), [])
+
+    def test_fallback_to_inserts(self):
+        # local infile turned off on the server: rows inserted by tb_input()
+        self.connect_table()
+        self.cursor.execute('SELECT @@GLOBAL.local_infile;')
+        local_infile = int(self.cursor.fetchone()[0])
+        try:
+            self.cursor.execute('SET GLOBAL local_infile = 0;')
+        except mysql.connector.Error as err:
+            self.skipTest('cannot turn off local_infile on the server: %s' %err)
+        self.local_infile = local_infile
+        first_id = upload_tables.tb_load(self.samples(), test_table)
+        self.assertFalse(upload_tables.load_data)
+        rows = self.table_rows()
+        self.assertEqual([r[0] for r in rows], [first_id, first_id + 1, first_id + 2])
+        self.assertEqual([r[1] for r in rows], [1, 2, 3])
+
+    def test_select_each_collation(self):
+        # names matched by the database with the collation of the column, so
+        # that a name differing in case only matches the existing row
+        self.connect_table()
+        upload_tables.set_load_data(False)
+        first_id = upload_tables.tb_load(pd.DataFrame({'sample_id': [1.0, 2.0],
+                                                       'note': ['Soreq Cave', 'Jeita']}), test_table)
+        self.cursor.execute("SELECT COLLATION(note) LIKE '%%\\_ci' FROM %s LIMIT 1;" %test_table)
+        if not int(self.cursor.fetchone()[0]):
+            self.skipTest('the collation of the test table is not case insensitive')
+        matches = upload_tables.select_each("""SELECT %%s, row_id FROM %s WHERE note = %%s""" %test_table,
+                                            [('soreq cave',), ('Kesang',), ('JEITA',)])
+        self.assertEqual(matches, {0: [(first_id,)], 2: [(first_id + 1,)]})
+
+if __name__ == '__main__':
+    unittest.main()
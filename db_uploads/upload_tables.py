@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""
+Functions writing the tables of a workbook to the SISAL database, used by
+Upload_workbooks.py. They are kept out of the upload script so that they can
+be imported (e.g. by test_upload_tables.py) without uploading a workbook.
+
+set_cursor() is called once after connecting: the functions write with that
+cursor, in the transaction of the upload.
+
+18 October 2026
+    - First version, with the functions of Upload_workbooks.py: batched
+      inserts (tb_input()), LOAD DATA LOCAL INFILE (tb_load()), columns of the
+      database read in once (load_schema()), lookups with one query per table
+      (select_in()) and the reference index (reference_index()).
+    - Sites and entities of a workbook matched with the database by the
+      database (select_each()), with the collation of the name columns.
+    - www.doi.org prefixes removed from the DOIs of the reference index. The
+      functions which do not use the database are imported without
+      mysql.connector.
+"""
+import os, tempfile
+try:
+    import mysql.connector
+except ImportError:
+    # the functions which do not use the database (e.g. reference_index()) can
+    # be imported and tested without the connector
+    mysql = None
+import numpy as np
+import pandas as pd
+
+# Number of rows sent in one INSERT statement by tb_input (environment variable
+# SISAL_INSERT_BATCH_SIZE)
+insert_batch_size = int(os.environ.get('SISAL_INSERT_BATCH_SIZE', '1000'))
+
+# Cursor of the connection to the database, and columns of its tables read in
+# once after connecting (see set_cursor())
+cursor = None
+schema = {}
+integer_types = ('tinyint', 'smallint', 'mediumint', 'int', 'bigint')
+
+def load_schema():
+    """Read in the columns of all the tables of the database from
+    information_schema, so that the columns of a table are not queried again
+    for each insert
+
+    Returns a dictionary keyed by table name of lists of dictionaries, one per
+    column in the order of the table, with 'name', 'type' (e.g. 'int',
+    'varchar'), 'nullable' and 'auto_increment'
+    """
+    query = ("""SELECT TABLE_NAME, COLUMN_NAME, DATA_TYPE, IS_NULLABLE, EXTRA
+                FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE()
+                ORDER BY TABLE_NAME, ORDINAL_POSITION;""")
+    cursor.execute(query)
+    tables = {}
+    for table_name, column_name, data_type, is_nullable, extra in cursor.fetchall():
+        tables.setdefault(table_name, []).append({'name': column_name,
+                                                  'type': data_type.lower(),
+                                                  'nullable': is_nullable == 'YES',
+                                                  'auto_increment': 'auto_increment' in extra})
+    return(tables)
+
+def set_cursor(db_cursor):
+    """Set the cursor used to write to the database and read in the columns of
+    its tables (load_schema()). Called once after connecting
+    """
+    global cursor, schema
+    cursor = db_cursor
+    schema = load_schema()
+
+def sql_value(v, integer = False):
+    """Value of a cell as a Python value the connector can send: tabs in text
+    are replaced by spaces, numpy numbers and dates converted, whole numbers
+    read in as floats (integer columns with missing values) converted to int
+    if integer is True
+    """
+    if isinstance(v, str):
+        return(v.replace('\t', ' '))
+    elif isinstance(v, np.generic):
+        v = v.item()
+    elif isinstance(v, pd.Timestamp):
+        return(v.to_pydatetime())
+    if integer and isinstance(v, float) and v.is_integer():
+        return(int(v))
+    return(v)
+
+def sql_rows(table, db_table):
+    """Rows of a table as lists of Python values for cursor.executemany(),
+    missing values (np.nan) as None (NULL), values of the integer columns of
+    db_table as int
+    """
+    types = dict([(c['name'], c['type']) for c in schema[db_table]])
+    integer = [types.get(c) in integer_types for c in table.columns]
+    values = table.astype(object).where(pd.notnull(table), None).values.tolist()
+    return([[sql_value(v, i) for v, i in zip(row, integer)] for row in values])
+
+# Load the sample, d18O, d13C, original_chronology and dating_lamina tables with
+# LOAD DATA LOCAL INFILE instead of INSERT statements (environment variable
+# SISAL_LOAD_DATA=1). The server must allow local infile (local_infile=ON);
+# otherwise the tables are inserted by tb_input
+load_data = os.environ.get('SISAL_LOAD_DATA', '0') == '1'
+# mysql.connector error numbers for LOAD DATA LOCAL INFILE disabled on the server
+# or on the connection
+load_data_disabled_errno = (1148, 2068, 3948, 3950)
+
+def set_load_data(enabled):
+    """Turn the LOAD DATA LOCAL INFILE fast path of tb_load() on or off. The
+    connection must be opened with allow_local_infile=True for it to be used
+    """
+    global load_data
+    load_data = enabled
+
+def sql_params(values):
+    """Values of one row as parameters of cursor.execute(): missing values
+    (np.nan) as None (NULL), other values converted by sql_value()
+    """
+    return(tuple([None if (not isinstance(v, str)) and pd.isnull(v) else sql_value(v) for v in values]))
+
+def tb_columns(input_table, db_table, AI_ID = False):
+    """Columns of the database table which are in input_table, in the order of
+    the database table, without the auto-increment column AI_ID
+
+    Returns (list of column names, name of the auto-increment column of the
+    database table or None)
+    """
+    columns = schema[db_table]
+    auto_increment = [c['name'] for c in columns if c['auto_increment']]
+    field_names = [c['name'] for c in columns if c['name'] in input_table.columns.values]
+    if AI_ID is not False:
+        field_names.remove(AI_ID)
+    return(field_names, auto_increment[0] if len(auto_increment) > 0 else None)
+
+# Define table inputs
+def tb_input(input_table, db_table, AI_ID = False):
+    """Insert the rows of a table into a table of the database (only the columns
+    of the database table, without the auto-increment column AI_ID), in batches
+    of insert_batch_size rows sent with executemany. The values are sent as
+    parameters, so that quotes in the text (e.g. citations, notes) do not need
+    to be escaped
+
+    Returns the id of the first row inserted (None if there are no rows)
+    """
+    field_names = tb_columns(input_table, db_table, AI_ID)[0]
+    f_name = ", ".join(field_names)
+    tb_subset = input_table[field_names]
+    first_id = None
+    if tb_subset.shape[0] > 0:
+        query = ("""INSERT INTO %s (%s) VALUES (%s)"""
+                 %(db_table, f_name, ", ".join(["%s"] * len(field_names))))
+        rows = sql_rows(tb_subset, db_table)
+        for start in range(0, len(rows), insert_batch_size):
+            cursor.executemany(query, rows[start:start + insert_batch_size])
+            if first_id is None:
+                # ids of the rows of one INSERT are consecutive (InnoDB)
+                first_id = cursor.lastrowid
+    return(first_id)
+
+def tsv_value(v):
+    """Value of a cell as a field of a LOAD DATA file (default FIELDS ESCAPED BY
+    '\\'): NULL as \\N, backslashes, tabs and line breaks escaped
+    """
+    if v is None:
+        return('\\N')
+    elif isinstance(v, bool):
+        return(str(int(v)))
+    elif isinstance(v, float):
+        return(repr(v))
+    return(str(v).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r'))
+
+def tb_load(input_table, db_table, AI_ID = False):
+    """Load the rows of a table into a table of the database as tb_input(), but
+    with one LOAD DATA LOCAL INFILE statement reading a temporary tab-separated
+    file, in the transaction of the upload. Used for the tables with one row per
+    sample if load_data is True. If the server does not allow local infile,
+    load_data is set to False and the rows are inserted by tb_input()
+
+    LOAD DATA LOCAL skips or truncates the rows it cannot load (duplicate keys,
+    values which cannot be converted) with a warning instead of an error. All
+    the rows must be loaded with no warnings (notes, e.g. decimals rounded as
+    by INSERT, are allowed), otherwise mysql.connector.errors.DataError is
+    raised, so that the upload is rolled back
+
+    Returns the id of the first row inserted (None if there are no rows)
+    """
+    global load_data
+    if not load_data:
+        return(tb_input(input_table, db_table, AI_ID))
+    field_names, auto_increment = tb_columns(input_table, db_table, AI_ID)
+    tb_subset = input_table[field_names]
+    if tb_subset.shape[0] == 0:
+        return(None)
+    if auto_increment is not None:
+        # LOAD DATA does not report the first auto-increment id
+        cursor.execute("SELECT IFNULL(MAX(%s), 0) FROM %s;" %(auto_increment, db_table))
+        previous_id = int(cursor.fetchone()[0])
+    rows = sql_rows(tb_subset, db_table)
+    tsv = tempfile.NamedTemporaryFile('w', suffix = '.tsv', delete = False, encoding = 'utf-8', newline = '\n')
+    try:
+        with tsv:
+            for row in rows:
+                tsv.write('\t'.join([tsv_value(v) for v in row]) + '\n')
+        query = ("""LOAD DATA LOCAL INFILE %%s INTO TABLE %s CHARACTER SET utf8
+                    FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' (%s)"""
+                 %(db_table, ", ".join(field_names)))
+        try:
+            cursor.execute(query, (tsv.name,))
+        except mysql.connector.Error as err:
+            if err.errno not in load_data_disabled_errno:
+                raise
+            print("LOAD DATA LOCAL INFILE is not allowed ({}), tables are inserted instead".format(err))
+            load_data = False
+            return(tb_input(input_table, db_table, AI_ID))
+    finally:
+        os.remove(tsv.name)
+    check_loaded(cursor.rowcount, cursor.warning_count, len(rows), db_table)
+    if auto_increment is None:
+        return(None)
+    cursor.execute("SELECT MIN(%s) FROM %s WHERE %s > %d;" %(auto_increment, db_table, auto_increment, previous_id))
+    return(cursor.fetchone()[0])
+
+def check_loaded(rowcount, warning_count, n_rows, db_table):
+    """Check that LOAD DATA loaded all the n_rows rows of db_table (rowcount)
+    with no warnings other than notes
+
+    Raises mysql.connector.errors.DataError otherwise, with the first warnings
+    """
+    warnings = []
+    if warning_count > 0:
+        cursor.execute("SHOW WARNINGS;")
+        warnings = cursor.fetchall()
+    # warnings beyond max_error_count are not listed, and are not known to be notes
+    errors = [w for w in warnings if w[0] != 'Note'] + [None] * (warning_count - len(warnings))
+    if (rowcount != n_rows) or (len(errors) > 0):
+        details = "; ".join(["%s %s: %s" %tuple(w) for w in errors[:5] if w is not None])
+        raise mysql.connector.errors.DataError(msg = "LOAD DATA loaded %d of the %d rows of %s with %d warning/s (%s)"
+                                               %(rowcount, n_rows, db_table, len(errors), details))
+
+def select_in(query, values, params = ()):
+    """Run a SELECT query whose IN-list ({} in query) holds values, sent as
+    parameters after params, so that all the rows of a workbook are looked up
+    in the database with one query
+
+    Returns the rows selected (none if values is empty)
+    """
+    values = [sql_value(v) for v in values]
+    if len(values) == 0:
+        return([])
+    cursor.execute(query.format(", ".join(["%s"] * len(values))), tuple(params) + tuple(values))
+    return(cursor.fetchall())
+
+def select_each(query, keys):
+    """Run a SELECT query once for each key (tuple of the values of a row of a
+    workbook, sent as parameters) in one UNION ALL statement. The first column
+    of query is %s, the position of the key in keys, so that the rows of the
+    database are matched with the rows of the workbook by the database, with
+    the collation of its columns (e.g. site names compared case insensitively
+    by utf8_general_ci), as when each row was looked up with its own query
+
+    Returns a dictionary keyed by position in keys of the lists of rows
+    selected (without the position) for the keys with matching rows
+    """
+    if len(keys) == 0:
+        return({})
+    params = []
+    for n, key in enumerate(keys):
+        params += [n] + list(sql_params(key))
+    cursor.execute(" UNION ALL ".join(["(%s)" % query] * len(keys)), tuple(params))
+    matches = {}
+    for row in cursor.fetchall():
+        matches.setdefault(int(row[0]), []).append(tuple(row[1:]))
+    return(matches)
+
+# Prefixes removed from publication_DOI before comparing references (compared in
+# lower case, longest first)
+doi_prefixes = ('https://www.doi.org/', 'http://www.doi.org/', 'https://dx.doi.org/', 'http://dx.doi.org/',
+                'https://doi.org/', 'http://doi.org/', 'www.doi.org/', 'dx.doi.org/', 'doi.org/', 'doi:')
+
+def normalize_doi(doi):
+    """DOI without its URL or doi: prefix, in lower case (DOIs are case
+    insensitive), e.g. 'https://doi.org/10.1038/SREP24374' -> '10.1038/srep24374'.
+    Missing DOIs (NULL, or 'nan' as inserted by older versions of this script)
+    are ''
+    """
+    if pd.isnull(doi):
+        return('')
+    doi = str(doi).strip().lower()
+    if doi == 'nan':
+        return('')
+    for prefix in doi_prefixes:
+        if doi.startswith(prefix):
+            return(doi[len(prefix):].strip())
+    return(doi)
+
+def normalize_citation(citation):
+    """Citation with runs of spaces, tabs and line breaks collapsed into one
+    space, in lower case, so that citations differing only in spacing or case
+    are matched ('' if missing)
+    """
+    if pd.isnull(citation):
+        return('')
+    return(" ".join(str(citation).split()).lower())
+
+def reference_key(citation, publication_DOI):
+    """Key of a reference in the reference index: (normalized citation,
+    normalized DOI). Both must match, as there could be missing DOIs or the
+    same DOI due to a typo
+    """
+    return((normalize_citation(citation), normalize_doi(publication_DOI)))
+
+def reference_index(rows):
+    """Index of the references of the database, built once for the upload
+
+    rows: (ref_id, citation, publication_DOI) of the reference table (e.g. from
+    SELECT ref_id, citation, publication_DOI FROM reference, or the rows of
+    reference.csv)
+
+    Returns a dictionary of the ref_id (in increasing order) keyed by
+    reference_key()
+    """
+    index = {}
+    for ref_id, citation, publication_DOI in sorted(rows, key = lambda row: int(row[0])):
+        index.setdefault(reference_key(citation, publication_DOI), []).append(int(ref_id))
+    return(index)
@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of wb_check.py on small workbooks written by the tests (write_workbook(),
+with a few errors in each spreadsheet so that the checks raise warnings).
+
+The incremental checks (check_workbook() with a state, IncrementalTest), the
+streamed Sample data (low_memory, LowMemoryTest) and the sections of checks run
+on a pool (sheet_workers, SheetWorkersTest) must give the same messages, in the
+same order, and the same number of warnings as a check of the workbook from
+scratch.
+
+The QC server (ServerTest) must only check the workbooks of requests sent to
+127.0.0.1 or localhost with its token. When a workbook stops the process
+checking it, the inbox daemon (InboxTest) must only report that workbook as
+not checked, and check the other workbooks queued on the same pool:
+
+    python -m pytest wb_QC
+"""
+import http.client, json, multiprocessing, os, sys, shutil, tempfile, threading, time, unittest
+import openpyxl
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import wb_check, wb_client
+
+site_columns = ['site_name', 'latitude', 'longitude', 'elevation', 'geology', 'rock_age', 'monitoring']
+entity_columns = ['entity_name', 'one_and_only', 'entity_status_info', 'entity_status_notes', 'depth_ref', 'cover_thickness',
+                  'distance_entrance', 'speleothem_type', 'drip_type', 'd13C', 'd18O', 'd18O_water_equilibrium', 'trace_elements',
+                  'organics', 'fluid_inclusions', 'mineralogy_petrology_fabric', 'clumped_isotopes', 'noble_gas_temperatures', 'C14',
+                  'ODL', 'Mg_Ca', 'contact', 'data_DOI_URL']
+reference_columns = ['entity_name', 'citation', 'publication_DOI']
+dating_columns = ['entity_name', 'date_type', 'depth_dating', 'dating_thickness', 'lab_num', 'material_dated', 'min_weight',
+                  'max_weight', 'uncorr_age', 'uncorr_age_uncert_pos', 'uncorr_age_uncert_neg', '14C_correction', 'calib_used',
+                  'date_used', '238U_content', '238U_uncertainty', '232Th_content', '232Th_uncertainty', '230Th_content',
+                  '230Th_uncertainty', '230Th_232Th_ratio', '230Th_232Th_ratio_uncertainty', '230Th_238U_activity',
+                  '230Th_238U_activity_uncertainty', '234U_238U_activity', '234U_238U_activity_uncertainty', 'decay_constant',
+                  'ini_230Th_232Th_ratio', 'ini_230Th_232Th_ratio_uncertainty', 'corr_age', 'corr_age_uncert_pos',
+                  'corr_age_uncert_neg', 'modern_reference', 'chem_year']
+lamina_columns = ['entity_name', 'depth_lam', 'lam_thickness', 'lam_age', 'lam_age_uncert_pos', 'lam_age_uncert_neg', 'modern_reference']
+sample_columns = ['entity_name', 'depth_sample', 'hiatus', 'gap', 'mineralogy', 'arag_corr', 'interp_age', 'interp_age_uncert_pos',
+                  'interp_age_uncert_neg', 'age_model_type', 'modern_reference', 'ann_lam_check', 'dep_rate_check', 'sample_thickness',
+                  'd13C_measurement', 'd13C_precision', 'd18O_measurement', 'd18O_precision', 'iso_std']
+
+def workbook_rows(n_entities = 10, n_samples = 20):
+    """Rows of the spreadsheets of a small workbook with errors
+
+    Args:
+        n_entities: integer. Number of entities (at least 10 for all the errors)
+        n_samples: integer. Number of rows of each entity in the Sample data
+
+    Returns:
+        dictionary keyed by spreadsheet name: list of dictionaries (one per row,
+        keyed by column name)
+
+    NOTES:
+        ent01 is a composite, ent04 has the same depth_sample in two rows far
+        apart, ent05 an age inversion, ent08 a hiatus, and the last rows of
+        ent03 are at the end of the Sample data (after the other entities).
+    """
+    sheets = {'Site metadata': [dict(site_name = 'Test cave', latitude = 10.5, longitude = 20.25, elevation = 'unknown',
+                                     geology = 'limestone', rock_age = 'Holocene', monitoring = 'no')],
+              'Entity metadata': [], 'References': [], 'Dating information': [], 'Lamina age vs depth': [], 'Sample data': []}
+    moved = []
+    for e in range(n_entities):
+        name = 'ent%02d' %e
+        composite = e == 1
+        from_base = e % 3 == 0
+        depth_max = 500.0 + 10 * e
+        sheets['Entity metadata'].append(dict(entity_name = name, one_and_only = 'yes', entity_status_info = 'not applicable',
+                                              depth_ref = 'from base' if from_base else 'from top', cover_thickness = 5 if e % 2 else 'unknown',
+                                              distance_entrance = 20, speleothem_type = 'composite' if composite else 'stalagmite',
+                                              drip_type = 'not applicable' if composite else 'seepage flow', d13C = 'yes', d18O = 'yes',
+                                              d18O_water_equilibrium = 'unknown', trace_elements = 'no', organics = 'no', fluid_inclusions = 'no',
+                                              mineralogy_petrology_fabric = 'no', clumped_isotopes = 'no', noble_gas_temperatures = 'no',
+                                              C14 = 'no', ODL = 'no', Mg_Ca = 'no', contact = 'Jane Doe',
+                                              data_DOI_URL = 'unknown' if e == 2 else 'http://x/%d' %e))
+        sheets['References'].append(dict(entity_name = name, citation = 'Author %d (2010)' %(e // 2),
+                                         publication_DOI = '10.1/99' if e == 5 else '10.1/%d' %(e // 2)))
+        if not composite:
+            for d in range(6):
+                age = 100 + 1000 * (5 - d if from_base else d)
+                row = dict(entity_name = name, date_type = 'MC-ICP-MS U/Th', depth_dating = round(depth_max * d / 5, 1), dating_thickness = 2,
+                           lab_num = 'L%d' %d, material_dated = 'calcite', min_weight = 0.1, max_weight = 0.2, uncorr_age = age + 5,
+                           uncorr_age_uncert_pos = 10, uncorr_age_uncert_neg = 10, date_used = 'yes', decay_constant = 'Cheng et al. 2013',
+                           corr_age = age, corr_age_uncert_pos = 10, corr_age_uncert_neg = -3 if (e == 6) & (d == 1) else 12,
+                           modern_reference = 'Year of chemistry' if e == 7 else 'BP (1950)', chem_year = 2010 if e == 7 else None)
+                row.update({'238U_content': 100, '238U_uncertainty': 1, '232Th_content': 2, '232Th_uncertainty': 0.1,
+                            '230Th_content': 'x' if (e == 4) & (d == 2) else 3, '230Th_uncertainty': 0.1, '230Th_232Th_ratio': 10,
+                            '230Th_232Th_ratio_uncertainty': 1, '230Th_238U_activity': 0.5, '230Th_238U_activity_uncertainty': 0.01,
+                            '234U_238U_activity': 1.1, '234U_238U_activity_uncertainty': 0.01, 'ini_230Th_232Th_ratio': 4.4,
+                            'ini_230Th_232Th_ratio_uncertainty': 2.2})
+                sheets['Dating information'].append(row)
+        if e == 8:
+            sheets['Dating information'].append(dict(entity_name = name, date_type = 'Event; hiatus', depth_dating = depth_max / 2 + 0.05,
+                                                     date_used = 'yes', corr_age = 5))
+        if e == 9:
+            for d in range(10):
+                sheets['Lamina age vs depth'].append(dict(entity_name = name, depth_lam = d, lam_thickness = 1, lam_age = 100 + d,
+                                                          lam_age_uncert_pos = 1, lam_age_uncert_neg = 1, modern_reference = 'BP (1950)'))
+        for s in range(n_samples):
+            depth = round(depth_max * s / n_samples, 3)
+            frac = 1 - s / n_samples if from_base else s / n_samples
+            row = dict(entity_name = name, depth_sample = depth, mineralogy = 'calcite', arag_corr = 'not applicable',
+                       interp_age = round(100 + 5000 * frac, 3), interp_age_uncert_pos = 20, interp_age_uncert_neg = 20,
+                       age_model_type = 'StalAge', modern_reference = 'Year of chemistry' if e == 7 else 'BP (1950)',
+                       ann_lam_check = 'not applicable', dep_rate_check = 'no', sample_thickness = 0.5,
+                       d13C_measurement = round(-5 + s / 10.0, 3), d13C_precision = 0.05, d18O_measurement = round(-6 + e / 10.0, 3),
+                       d18O_precision = 0.05, iso_std = 'Vienna-PDB')
+            if composite and (s == n_samples // 2):
+                row = dict(entity_name = name, gap = 'G')
+            if (e == 3) & (s == 7):
+                row['d18O_measurement'] = 'n.d.'
+            if (e == 4) & (s in (3, n_samples - 3)):
+                row['depth_sample'] = 12345.0
+            if (e == 5) & (s == 11):
+                row['interp_age'] = row['interp_age'] - 3000
+            if (e == 6) & (s == 9):
+                row['mineralogy'] = 'calcit'
+            if (e == 8) & (s == n_samples // 3):
+                row = dict(entity_name = name, depth_sample = depth, hiatus = 'H', mineralogy = 'calcite')
+            if (e == 3) & (s >= n_samples - 5):
+                moved.append(row)
+            else:
+                sheets['Sample data'].append(row)
+    sheets['Sample data'] += moved
+    return(sheets)
+
+def write_workbook(file_name, sheets):
+    """Write the rows of workbook_rows() to an .xlsx workbook laid out as the
+    SISAL workbook (description in the first row, column names in the second)
+
+    Args:
+        file_name: string
+        sheets: dictionary, see workbook_rows()
+
+    Returns:
+        None
+    """
+    columns = [('Site metadata', site_columns), ('Entity metadata', entity_columns), ('References', reference_columns),
+               ('Dating information', dating_columns), ('Lamina age vs depth', lamina_columns), ('Sample data', sample_columns)]
+    wb = openpyxl.Workbook(write_only = True)
+    for sheet_name, column_names in columns:
+        ws = wb.create_sheet(sheet_name)
+        ws.append(['%s of the test workbook' %sheet_name])
+        ws.append(column_names)
+        for row in sheets[sheet_name]:
+            ws.append([row.get(c) for c in column_names])
+    wb.save(file_name)
+
+def checked(result):
+    """Part of the output of check_workbook() which must not depend on how the
+    checks were run"""
+    return(dict([(key, result[key]) for key in ['messages', 'warning_ctr', 'unknown_counts', 'fatal']]))
+
+class WorkbookTest(unittest.TestCase):
+    """Writes the test workbook to a temporary folder, with the cache off"""
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.folder, 'test_workbook.xlsx')
+        self.sheets = workbook_rows()
+        write_workbook(self.file_name, self.sheets)
+        self.cache_folder = wb_check.cache_dir
+        wb_check.set_cache_dir('')
+
+    def tearDown(self):
+        wb_check.set_cache_dir(self.cache_folder)
+        shutil.rmtree(self.folder)
+
+class IncrementalTest(WorkbookTest):
+    def check_edit(self, sheet_name, edit):
+        """Check the workbook with a state, edit one spreadsheet, and check that
+        the incremental check gives the same result as a check from scratch"""
+        state = {}
+        first = wb_check.check_workbook(self.file_name, state = state)
+        self.assertEqual(checked(first), checked(wb_check.check_workbook(self.file_name)))
+        before = wb_check.sheet_fingerprints(self.file_name)
+        edit(self.sheets[sheet_name])
+        write_workbook(self.file_name, self.sheets)
+        after = wb_check.sheet_fingerprints(self.file_name)
+        # only the edited spreadsheet changed, the others are taken from the state
+        self.assertEqual([name for name in before if before[name] != after[name]], [sheet_name])
+        incremental = wb_check.check_workbook(self.file_name, state = state)
+        clean = wb_check.check_workbook(self.file_name)
+        self.assertNotEqual(first['messages'], clean['messages'])
+        self.assertEqual(checked(incremental), checked(clean))
+
+    def test_edit_dating(self):
+        def edit(rows):
+            for row in rows:
+                if (row['entity_name'] == 'ent06') & (row.get('corr_age_uncert_neg') == -3):
+                    row['corr_age_uncert_neg'] = 12
+                if row['date_type'] == 'Event; hiatus':
+                    row['depth_dating'] = 174.0 # depth of the hiatus of ent08 in the Sample data
+        self.check_edit('Dating information', edit)
+
+    def test_edit_sample_entity(self):
+        def edit(rows):
+            for row in rows:
+                if (row['entity_name'] == 'ent05') & (row.get('interp_age', 0) < 0):
+                    row['interp_age'] += 3000 # fixes the age inversion of ent05
+                if (row['entity_name'] == 'ent06') & (row.get('depth_sample') == 0):
+                    row['interp_age'] = 99999.0 # new age inversion of ent06
+        self.check_edit('Sample data', edit)
+
+    def test_state_unchanged(self):
+        state = {}
+        first = wb_check.check_workbook(self.file_name, state = state)
+        self.assertEqual(checked(wb_check.check_workbook(self.file_name, state = state)), checked(first))
+
+class LowMemoryTest(WorkbookTest):
+    def tearDown(self):
+        wb_check.set_low_memory(False, 20000)
+        WorkbookTest.tearDown(self)
+
+    def test_small_chunks(self):
+        # 7 rows per chunk: the rows of each entity (20) span chunks, and the
+        # repeated depths of ent04 and the rows of ent03 are in different chunks
+        whole = wb_check.check_workbook(self.file_name)
+        wb_check.set_low_memory(True, 7)
+        wb = wb_check.read_workbook(self.file_name, stream = True)
+        self.assertIn('sample_columns', wb)
+        self.assertLess(len(wb['sample']), len(wb['sample_columns']))
+        streamed = wb_check.check_workbook(self.file_name)
+        self.assertEqual(checked(streamed), checked(whole))
+        self.assertTrue(any(['12345.0' in m for m in streamed['messages']]))
+
+class SheetWorkersTest(WorkbookTest):
+    def tearDown(self):
+        wb_check.set_sheet_workers(1)
+        WorkbookTest.tearDown(self)
+
+    def test_same_order(self):
+        serial = wb_check.check_workbook(self.file_name)
+        wb_check.set_sheet_workers(2)
+        parallel = wb_check.check_workbook(self.file_name)
+        self.assertEqual(checked(parallel), checked(serial))
+
+    def test_same_order_with_state(self):
+        serial = wb_check.check_workbook(self.file_name)
+        wb_check.set_sheet_workers(2)
+        state = {}
+        for i in range(2):
+            self.assertEqual(checked(wb_check.check_workbook(self.file_name, state = state)), checked(serial))
+
+class ServerTest(WorkbookTest):
+    def setUp(self):
+        WorkbookTest.setUp(self)
+        self.token_dirs = (wb_check.server_token_dir, wb_client.server_token_dir)
+        wb_check.server_token_dir = wb_client.server_token_dir = self.folder
+        self.server = wb_check.start_server(0)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target = self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        wb_check.stop_server(self.server)
+        self.assertFalse(os.path.exists(wb_check.server_token_file(self.port)))
+        wb_check.server_token_dir, wb_client.server_token_dir = self.token_dirs
+        WorkbookTest.tearDown(self)
+
+    def post(self, headers):
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout = 60)
+        try:
+            connection.request('POST', '/check', json.dumps({'input_file': self.file_name}), headers)
+            response = connection.getresponse()
+            return(response.status, json.loads(response.read().decode('utf-8')))
+        finally:
+            connection.close()
+
+    def test_token_file(self):
+        token_file = wb_check.server_token_file(self.port)
+        self.assertEqual(os.stat(token_file).st_mode & 0o777, 0o600)
+        self.assertEqual(wb_client.read_token(self.port), self.server.token)
+
+    def test_check(self):
+        result = wb_client.check_on_server(self.file_name, self.port)
+        self.assertEqual(checked(result), checked(wb_check.check_workbook(self.file_name)))
+
+    def test_no_token(self):
+        status, content = self.post({'Content-Type': 'application/json'})
+        self.assertEqual(status, 403)
+        status, content = self.post({'Content-Type': 'application/json', 'X-SISAL-QC-Token': 'x' * len(self.server.token)})
+        self.assertEqual(status, 403)
+        self.assertNotIn('messages', content)
+
+    def test_rebound_host(self):
+        # a web page of attacker.example whose name now resolves to 127.0.0.1
+        for host in ['attacker.example:%d' %self.port, 'attacker.example', '127.0.0.1:%d' %(self.port + 1)]:
+            status, content = self.post({'Host': host, 'Content-Type': 'application/json', 'X-SISAL-QC-Token': self.server.token})
+            self.assertEqual(status, 403)
+            self.assertNotIn('messages', content)
+        status, content = self.post({'Host': 'localhost:%d' %self.port, 'Content-Type': 'application/json',
+                                     'X-SISAL-QC-Token': self.server.token})
+        self.assertEqual(status, 200)
+
+checked_workbook = wb_check.check_workbook
+
+def check_or_stop(input_file = None, *args, **kwargs):
+    """check_workbook() which stops the process checking a workbook whose name
+    contains 'stops' (as when a process runs out of memory)"""
+    if 'stops' in os.path.basename(input_file):
+        os._exit(1)
+    time.sleep(0.5) # still queued when the process of a_stops.xlsx stops
+    return(checked_workbook(input_file, *args, **kwargs))
+
+@unittest.skipUnless(multiprocessing.get_start_method() == 'fork', 'check_or_stop() is only used by forked processes')
+class InboxTest(WorkbookTest):
+    def setUp(self):
+        WorkbookTest.setUp(self)
+        self.saved = (wb_check.check_workbook, wb_check.worker_pool, wb_check.inbox_settle_time, wb_check.inbox_poll_interval)
+        self.pools = []
+        def worker_pool(workers = None):
+            self.pools.append(workers)
+            return(self.saved[1](workers))
+        wb_check.check_workbook, wb_check.worker_pool = check_or_stop, worker_pool
+        wb_check.inbox_settle_time, wb_check.inbox_poll_interval = 0, 0.2
+
+    def tearDown(self):
+        wb_check.check_workbook, wb_check.worker_pool, wb_check.inbox_settle_time, wb_check.inbox_poll_interval = self.saved
+        WorkbookTest.tearDown(self)
+
+    def test_process_stopped(self):
+        inbox = os.path.join(self.folder, 'inbox')
+        os.mkdir(inbox)
+        names = ['a_stops', 'b', 'c', 'd']
+        for name in names:
+            shutil.copy(self.file_name, os.path.join(inbox, name + '.xlsx'))
+        reports = [os.path.join(inbox, name + '_report.txt') for name in names]
+        stop = threading.Event()
+        daemon = threading.Thread(target = wb_check.watch_inbox, args = (inbox, 2, stop))
+        daemon.start()
+        try:
+            deadline = time.time() + 120
+            while (not all([os.path.exists(f) for f in reports])) and (time.time() < deadline):
+                time.sleep(0.2)
+        finally:
+            stop.set()
+            daemon.join()
+        with open(reports[0]) as f:
+            self.assertEqual(f.read(), 'The checks of %s stopped the process checking it\n' %os.path.join(inbox, 'a_stops.xlsx'))
+        result = checked_workbook(self.file_name)
+        for report in reports[1:]:
+            with open(report) as f:
+                self.assertEqual(f.read(), '\n'.join(result['messages'] + ['%d warning/s were detected' %result['warning_ctr']]) + '\n')
+        # the pool of the daemon is started again once, the pool checking the
+        # workbooks alone once after a_stops.xlsx
+        self.assertEqual(self.pools, [2, 2, 1, 1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,6 +5,27 @@ Created on Tue Apr 25 14:30:18 2017
 @author: A
 
 Codes check the workbooks and inform the database manager of the checks
+18 October 2026
+    - Wrapped the checks of each section into functions, so that the checks can be imported and run from other scripts. check_workbook() checks a workbook (file name or spreadsheets already read in) and returns the warnings, informative messages and counts. Running the script from the command line is unchanged.
+    - Errors that stop the checks raise WorkbookError inside the functions. The command line still prints the message and terminates.
+    - Spreadsheets are read in by load_workbook(), which is also used by Upload_workbooks.py, and the data types of their columns are set there once (dropdown columns as categoricals, numeric columns as float64), so that the checks and the upload get the same tables. With --cache (or the environment variable SISAL_CACHE_DIR set to a folder), the spreadsheets read in are cached on disk (~/.sisal_cache, or SISAL_CACHE_DIR), keyed by the content of the workbook, so that a workbook which is checked again or uploaded is not read in from Excel again. The cache is off by default. Spreadsheets are cached as numpy arrays (.npz, read without pickle, columns mixing text and numbers written as text with the type of each cell) and results as JSON, so that no code is run from the cache. The least recently used spreadsheets are removed when the cache holds more than 1 GB (SISAL_CACHE_MAX_MB) or 500 workbooks.
+    - Results of the checks in a batch are cached (in the results folder of the cache), keyed by the content of the workbook, the version of this script (hash of wb_check.py) and the versions of pandas and numpy. Workbooks which did not change since they were last checked are not checked again; their warnings are printed from the cache and marked '(cached)' in the summary table. Only the most recently used entries of the cache are kept (cache_size).
+    - Check for possible missing hiatuses (find_possible_hiatuses) is performed for all entities at once: the age steps are compared with the mean age step of each entity on depth-sorted arrays, and the flagged pairs of depths are tested against the depths of the entity with searchsorted instead of nested loops. Warnings are unchanged.
+    - Repeated depth_sample and interp_age (find_repeated_records) are found for all entities at once with duplicated()/groupby instead of counting each value. Warnings are unchanged.
+    - The Dating information, Sample data and Lamina age vs depth tables are split per entity once (partition_by_entity()) for the checks performed per entity. These checks can be run on a pool of threads or processes for one workbook with many entities (--entity-workers, --entity-pool); the messages are printed in the same order as without a pool. The pool is started once per workbook (check_workbook()) and shared by all its sections.
+    - Profiling of the checks (--profile, or environment variable SISAL_PROFILE=1): the wall time and rows of each section and of each call of a check function are written to <workbook>_profile.json next to the workbook. --profile-memory (or SISAL_PROFILE_MEMORY=1) also records their peak memory with tracemalloc, which slows the checks down several times; the profile then has 'memory_traced': true, as its wall times are not those of a run without it.
+    - Checks repeated on many columns (numbers, positive numbers, value/uncertainty pairs, dropdown lists, hiatus/gap rows) are declared as column rules (e.g. dating_column_rules) and checked in one scan of the table by check_rules().
+    - Streamed checks of very large Sample data spreadsheets (--low-memory, or environment variable SISAL_LOW_MEMORY=1): the rows are read in chunks with a read-only reader and the whole table is never built (stream_sample_sheet()). Each chunk is checked as it is read: only the rows which the checks of the rows flag are kept, with the first row of each entity meeting each condition checked for an entity as a whole (running state per entity), the "unknown" are counted, and the few columns needed for the repeated depths and ages, the age inversions and the possible hiatuses (sample_key_columns) are kept for all the rows. The warnings are the same as without it. Not used with --watch (the state needs the whole tables).
+    - Section 5 loads the columns as declared in column_schema: dropdown columns are categoricals with the dropdown list as categories and are checked against the list through their codes, numeric columns are always float64: the cells which are not numbers are np.nan in the column and are kept as read in, with their rows, in the attrs of the table (InvalidNumbers), which follow its slices, for check_numbers() and the rules to report (they are not counted as missing, see isnull_cells()). The Sample data table of large workbooks takes about a fifth of the memory.
+    - Age inversions in Sample data are found for all entities at once (find_age_inversions(): one lexsort by entity and depth signed by depth_ref) and reported per entity as before. Text in interp_age no longer stops the checks.
+    - The lamination dates of all entities are ordered with one lexsort and two consecutive events of the same type are found with one shifted comparison. check_yearofchemistry_crosstable() splits the chem_year of the entities once from the Dating information table. Dates at the same depth now keep their row order.
+    - References: repeated citations/DOIs are grouped once (find_multiple_values()), placeholders and spaces are flagged on whole columns (placeholder_mask()) and the data_DOI_URL vs publication_DOI check merges the last 10 characters of both by entity.
+    - Incremental checks of a workbook being edited (--watch, or check_workbook() with a state): the workbook is checked again each time it is saved. Spreadsheets whose part of the .xlsx file did not change are not read in again, a section of the checks is only run again if a table it read changed (rows compared by hash, fingerprint()) and the checks per entity only for the entities whose rows changed. The other messages are printed from the state, so the report is complete and the same as without it.
+    - QC server (python wb_check.py --serve): keeps the checks loaded and checks the workbooks sent to it on a pool of processes started once. wb_client.py file.xlsx sends a workbook to the server and prints the warnings and moves the workbook as python wb_check.py file.xlsx does (without a server, it checks the workbook itself). The server only answers requests sent to 127.0.0.1 or localhost, and only checks the workbooks of requests with the random token it writes to ~/.sisal_qc_token_<port> (SISAL_QC_TOKEN_DIR) when it starts, which wb_client.py reads.
+    - Inbox daemon (python wb_check.py inbox --daemon): the workbooks put in the inbox folder, or modified there, are checked on a pool of processes as they arrive (inotify on Linux, otherwise the folder is scanned every inbox_poll_interval seconds). The messages are written to <workbook>_report.txt next to each workbook, and the workbooks which passed are moved to inbox/Checked. If a process of the pool dies (e.g. out of memory), the workbooks queued on it are checked again one at a time, and only the workbook which stops the process is reported as not checked.
+    - The checks of each spreadsheet of one workbook can run at the same time on a pool of threads (--sheet-workers), followed by the checks across spreadsheets (section_stages), and their checks per entity (most of the time of the Sample data checks) are split in batches over a pool of as many processes, unless --entity-workers is given. The threads alone do not make the checks faster (they hold the GIL); the gain comes from the processes and needs several CPUs. Reading the workbook is not split and is most of the time of large workbooks. The messages and the number of warnings are the same, in the same order, as without it, also with --watch. With --profile the sections run one after the other. --sheet-workers, --entity-workers and --entity-pool also apply to each workbook of a batch, of the inbox daemon and of the QC server (init_worker()).
+    - Batch mode: a folder, a glob pattern (in quotes) or several workbooks can be given on the command line, e.g. python wb_check.py submissions --workers 8. The workbooks are checked in parallel (--workers, default: number of CPUs), the warnings are printed per workbook followed by a summary table, and the workbooks that passed are moved to the Checked folder next to them.
+
 13 September 2019 (A)
     - Renamed file from wb_checkv12.py to wb_check.py to allow more smooth tracking of file history. The version name is to only be attached to the version distributed to people. Git does not track the history of files very well when the names are changed.
     - Dating table, calib_used column: added options 'unknown' and 'other'
@@ -88,6 +109,11 @@ Codes check the workbooks and inform the database manager of the checks
 import pandas as pd
 import numpy as np
 import shutil, os, sys
+import argparse, ctypes, ctypes.util, glob, hashlib, hmac, http.server, secrets, select, threading
+import copy, datetime, functools, json, pickle, time, tracemalloc, zipfile
+from xml.etree import ElementTree
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from numbers import Number
 import xlrd # needs to be added to read excel files. usually installed along with pandas 
 # turn off pandas chained assignment warning
@@ -96,453 +122,1950 @@ pd.options.mode.chained_assignment = None
 # =============================================================================
 # Section 2. Read in the workbook
 # =============================================================================
-#input_file = 'test_input_files/test_entity_status_notes_number.xlsx'
-input_file = sys.argv[1]
-# Try to read in the workbook
-try:
-    xl = pd.ExcelFile(input_file)
-    sht_nm = xl.sheet_names
-except:
-    # If fails to read in workbook, exit the script
-    sys.exit('Cannot read in excel file. input_file name may be supplied incorrectly.')
-
-# List of spreadsheet names containing "Sample data"
-# This is to check for cases where workbooks contain more than one Sample data
-# spreadsheet.
-sample_ls = [k for k in sht_nm if 'Sample data' in k]
-# -----------------------------------------------------------------------------
-# Read in spreadsheets from the workbook
-# -----------------------------------------------------------------------------
-# Skip first row (description row)
-# column title starts at row number 2/ index = 1
-try:
-    site_tb = xl.parse(sheet_name = 'Site metadata', skiprows = 1).dropna(how = 'all')
-except:
-    sys.exit('Cannot read in Site metadata spreadsheet, likely no spreadsheet called "Site metadata"')
-try:
-    entity_tb = xl.parse(sheet_name = 'Entity metadata', skiprows = 1).dropna(how = 'all')
-except:
-    sys.exit('Cannot read in Enitity metadata spreadsheet, likely no spreadsheet called "Entity metadata"')
-try:
-    ref_tb = xl.parse(sheet_name = 'References', skiprows = 1).dropna(how = 'all')
-except:
-    sys.exit('Cannot read in References spreadsheet, likely no spreadsheet called "References"')
-try:
-    dating_tb = xl.parse(sheet_name = 'Dating information', skiprows = 1).dropna(how = 'all')
-except:
-    sys.exit('Cannot read in Dating information spreadsheet, likely no spreadsheet called "Dating information"')
-try:
-    dating_lamina_tb = xl.parse(sheet_name = 'Lamina age vs depth', skiprows = 1).dropna(how = 'all')
-except:
-    sys.exit('Cannot read in Lamina age vs depth spreadsheet, likely no spreadsheet called "Lamina age vs depth"')
-
-# Read in sample spreadsheet
-if len(sample_ls) == 1:
-    try:
-        sample_tb = xl.parse(sheet_name = 'Sample data', skiprows = 1).dropna(how = 'all')
-    except:
-        sys.exit('Cannot read in Sample data spreadsheet, likely no spreadsheet called "Sample data"')
-elif len(sample_ls) == 0:
-    sys.exit('Sample data spreadsheet does not exist, likely no spreadsheet called "Sample data"')
-else:
-    sys.exit('More than one Sample data spreadsheet exist. This is not allowed')
+# Keys of the tables of a workbook and the names of their spreadsheets
+sheet_names = {'site': 'Site metadata',
+               'entity': 'Entity metadata',
+               'ref': 'References',
+               'dating': 'Dating information',
+               'dating_lamina': 'Lamina age vs depth',
+               'sample': 'Sample data'}
 
-# =============================================================================
-# Section 3. Check workbook is the right version
-# =============================================================================
-site_col = set(['site_name', 'latitude', 'longitude', 'elevation', 'geology', 'rock_age', 'monitoring']) - set(site_tb.columns)
-entity_col = set(['entity_name', 'one_and_only', 'entity_status_info', 'entity_status_notes', 'depth_ref', 'cover_thickness', 'distance_entrance', 'speleothem_type', 'drip_type', 'd13C', 'd18O', 'd18O_water_equilibrium', 'trace_elements', 'organics', 'fluid_inclusions', 'mineralogy_petrology_fabric', 'clumped_isotopes', 'noble_gas_temperatures', 'C14', 'ODL', 'Mg_Ca', 'contact', 'data_DOI_URL']) - set(entity_tb.columns)
-ref_col = set(['entity_name', 'citation', 'publication_DOI']) - set(ref_tb.columns)
-date_col = set(['entity_name','date_type','depth_dating','dating_thickness','lab_num','material_dated','min_weight','max_weight','uncorr_age','uncorr_age_uncert_pos','uncorr_age_uncert_neg','14C_correction','calib_used','date_used','238U_content','238U_uncertainty','232Th_content','232Th_uncertainty','230Th_content','230Th_uncertainty','230Th_232Th_ratio','230Th_232Th_ratio_uncertainty','230Th_238U_activity','230Th_238U_activity_uncertainty','234U_238U_activity','234U_238U_activity_uncertainty','decay_constant','ini_230Th_232Th_ratio','ini_230Th_232Th_ratio_uncertainty','corr_age','corr_age_uncert_pos','corr_age_uncert_neg','modern_reference','chem_year']) - set(dating_tb.columns)
-lam_col = set(['entity_name', 'depth_lam', 'lam_thickness', 'lam_age', 'lam_age_uncert_pos', 'lam_age_uncert_neg', 'modern_reference']) - set(dating_lamina_tb.columns)
-sample_col = set(['entity_name', 'depth_sample', 'hiatus', 'gap', 'mineralogy', 'arag_corr', 'interp_age', 'interp_age_uncert_pos', 'interp_age_uncert_neg', 'age_model_type', 'modern_reference', 'ann_lam_check', 'dep_rate_check', 'sample_thickness', 'd13C_measurement', 'd13C_precision', 'd18O_measurement', 'd18O_precision', 'iso_std']) - set(sample_tb.columns)
-if len(site_col) + len(entity_col) + len(ref_col) + len(date_col) + len(lam_col) + len(sample_col) > 0:
-    if len(site_col) > 0:
-        print('Site metadata table is missing column: %s' %str(list(site_col)))
-    if len(entity_col) > 0:
-        print('Entity metadata table is missing column: %s' %str(list(entity_col)))
-    if len(ref_col) > 0:
-        print('Entity metadata table is missing column: %s' %str(list(ref_col)))
-    if len(date_col) > 0:
-        print('Entity metadata table is missing column: %s' %str(list(date_col)))
-    if len(lam_col) > 0:
-        print('Entity metadata table is missing column: %s' %str(list(lam_col)))
-    if len(sample_col) > 0:
-        print('Entity metadata table is missing column: %s' %str(list(sample_col)))
-    sys.exit('This workbook is likely not version 12. The checks cannot be performed.')
+# Folder of the cache of the spreadsheets read in and of the results of the
+# checks. The cache is only used if it is turned on, with --cache (folder
+# default_cache_dir) or the environment variable SISAL_CACHE_DIR. '' to not use
+# a cache
+default_cache_dir = os.path.join(os.path.expanduser('~'), '.sisal_cache')
+cache_dir = os.environ.get('SISAL_CACHE_DIR', '')
+# Maximum number of entries and total size in bytes of each folder of the cache
+# (the least recently used entries are removed). The size of the workbooks
+# folder can be set in MB in the environment variable SISAL_CACHE_MAX_MB
+cache_size = {'workbooks': 500, 'results': 5000}
+cache_max_bytes = {'workbooks': int(os.environ.get('SISAL_CACHE_MAX_MB', '1024')) << 20,
+                   'results': 128 << 20}
+# File extension of the entries of each folder of the cache: spreadsheets as
+# numpy arrays (read without pickle), results as JSON
+cache_extension = {'workbooks': 'npz', 'results': 'json'}
+# Increase if the spreadsheets are read in differently (cached spreadsheets of
+# older versions are then not used)
+loader_version = 3
 
-# =============================================================================
-# Section 4. Define prerequisite functions
-# =============================================================================
+def set_cache_dir(folder):
+    """Set the folder of the cache (cache_dir), e.g. in the processes of a batch
 
-def count_values(table, value):
-    """Count the number of occurences of a particular value in a table
-    
     Args:
-        table: A pandas dataframe object. Table with the data.
-        value: string, the value to count 
-    
+        folder: string. Folder of the cache, '' to not use a cache
+
     Returns:
-        integer, count of occurences of value specified in 'value'
-    
-    Raises:
         None
     """
-    ctr = 0
-    for i in table.index:
-        ctr += len(np.flatnonzero(table.loc[i,:] == value))
-    return(ctr)
+    global cache_dir
+    cache_dir = folder
+
+def file_hash(input_file):
+    """Compute the hash of the content of a file
 
-def check_possible_hiatuses(table, depthcol, agecol, hiatuscol, depth_ref, entity_name = '', modrefcol = 'modern_reference', na_rm = False):
-    """Check for possible missing hiatuses
-    
     Args:
-        table: A pandas dataframe object. Table with the sample data.
-        depthcol: string, name of the depth column
-        agecol: string, name of the age column
-        hiatuscol: string, name of the hiatus column
-        depth_ref: string, depth reference ('from top' or 'from base')
-        entity_name: string, name of entity (to be printed in warnings)
-        modrefcol: string, name of modern reference column 
-        na_rm: boolean, whether or not to remove rows with missing ages. (default to False)
-    
+        input_file: string. File name
+
     Returns:
-        integer, either 0 or 1
-    
+        string, SHA-1 hex digest of the file
+    """
+    h = hashlib.sha1()
+    with open(input_file, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return(h.hexdigest())
+
+def json_value(value):
+    """Value which the json module cannot write, as JSON (numpy numbers as
+    Python numbers, anything else as text)
+
+    Args:
+        value: the value
+
+    Returns:
+        number or string
+    """
+    return(value.item() if isinstance(value, np.generic) else str(value))
+
+# Cells of the text columns of the spreadsheets in the cache: each cell is
+# written as text, with its type (see encode_cells())
+cell_types = ['text', 'missing', 'integer', 'float', 'boolean', 'datetime', 'time']
+
+def encode_cells(values):
+    """Write the cells of a column mixing text and numbers (object column) as
+    text with the type of each cell, so that they are cached without pickle
+
+    Args:
+        values: numpy array of objects. Cells of the column
+
+    Returns:
+        tuple, (numpy array of strings, numpy array of the positions of the
+        types in cell_types)
+
     Raises:
-        None
-        
-    NOTES:
-        This function only works with the sample table and therefore there is no table_name argument
+        TypeError: a cell is not text, a number, a date or a time
     """
-    if na_rm == True:
-        table = table.loc[pd.notnull(table[agecol]),:]
-    else:
-        pass
-    table_nohiat = table.loc[table[hiatuscol] == '', :] # np.nan has been replaced with ''
-    table_nohiat.loc[table_nohiat[modrefcol] == 'CE/BCE',agecol] = 1950 - table_nohiat.loc[table_nohiat[modrefcol] == 'CE/BCE',agecol]
-    if table_nohiat[depthcol].isnull().values.any() == True:
-        print('Sample data tab: Entity %s has samples (not identified as hiatuses) that are missing depths. Checks for possible hiatuses cannot be performed. Warning is issued' %entity_name)
-        return(1)
-    if depth_ref == 'from top':
-        table_nohiat = table_nohiat.sort_values(by = [depthcol], ascending = True)
-    elif depth_ref == 'from base':
-        table_nohiat = table_nohiat.sort_values(by = [depthcol], ascending = False)
-    else:
-        print('Entity metadata tab: The depth_ref chosen is not "from top" or "from base"')
-        return(1)
-    agediff = np.diff(table_nohiat[agecol])
-    avg_agediff = np.mean(agediff)
-    diff_idx = np.flatnonzero(np.diff(table_nohiat[agecol]) >= avg_agediff*5)
-    if len(diff_idx) > 0:
-        table_nohiat = table_nohiat.reset_index(drop = True)
-        depth1 = table_nohiat[depthcol][diff_idx]
-        depth2 = table_nohiat[depthcol][diff_idx + 1]
-        paired_depths = np.column_stack((depth1, depth2))
-        hiatus_depth = table.loc[pd.notnull(table[hiatuscol]),depthcol]
-        paired_depths_no = False
-        if len(hiatus_depth) != 0:
-            idx = []
-            for j in range(0, paired_depths.shape[0]):
-                l = paired_depths[j]
-                ctr = 0
-                for k in hiatus_depth:
-                    if (l[0] > k >l[1])|(l[1] > k >l[0]):
-                        ctr += 1
-                    else:
-                        pass
-                if ctr < 1:
-                    idx.append(j)
-            if len(idx) > 0:
-                paired_depths = paired_depths[idx]
-            else:
-                paired_depths_no = True
-        if (paired_depths.shape[0] > 0) & (paired_depths_no == False):
-            for j in range(0, paired_depths.shape[0]):
-                if j == 0:
-                    depths = str(list(paired_depths[j])).replace(',', ' and')
-                else:
-                    more_depths = str(list(paired_depths[j])).replace(',', ' and')
-                    depths = '%s and %s' %(depths, more_depths)
-            if entity_name != '':
-                entity_name = 'Entity %s; ' %entity_name
-            print('Informative: Sample data tab: %s There is a possible unaccounted hiatus between the following paired %s: %s ' %(entity_name, depthcol, depths))
-            return(0) # THIS IS CURRENTLY INFORMATIVE
+    texts, types = [], []
+    for v in values:
+        if isinstance(v, np.generic):
+            v = v.item()
+        if isinstance(v, str):
+            texts.append(v)
+            types.append(0)
+        elif (v is None) or pd.isnull(v):
+            texts.append('')
+            types.append(1)
+        elif isinstance(v, bool):
+            texts.append(str(int(v)))
+            types.append(4)
+        elif isinstance(v, int):
+            texts.append(str(v))
+            types.append(2)
+        elif isinstance(v, float):
+            texts.append(repr(v))
+            types.append(3)
+        elif isinstance(v, datetime.datetime):
+            texts.append(v.isoformat())
+            types.append(5)
+        elif isinstance(v, datetime.time):
+            texts.append(v.isoformat())
+            types.append(6)
         else:
-            return(0)
-    else:
-        return(0)
+            raise TypeError('cell of type %s cannot be cached' %type(v).__name__)
+    return((np.array(texts, dtype = str), np.array(types, dtype = np.uint8)))
 
-def check_ages_and_depths_in_order(table, depthcol, agecol, depth_ref, table_name, entity_name = '', na_rm = False):
-    """Check that ages and depths are in order
+def decode_cells(texts, types):
+    """Cells of a column written by encode_cells()
 
     Args:
-        table: A pandas dataframe object. Table with the data.
-        depthcol: string, name of the depth column
-        agecol: string, name of the age column
-        depth_ref: string, depth reference ('from top' or 'from base')
-        table_name: string, name of table (to be printed in warnings)
-        entity_name: string, name of entity (to be printed in warnings)
-        na_rm: boolean, whether or not to remove rows with missing ages. (default to False)
-        
+        texts: numpy array of strings
+        types: numpy array of the positions of the types in cell_types
+
     Returns:
-        integer, either 0 or 1
+        numpy array of objects
+    """
+    decode = [str, lambda t: np.nan, int, float, lambda t: bool(int(t)),
+              datetime.datetime.fromisoformat, datetime.time.fromisoformat]
+    values = np.empty(len(texts), dtype = object)
+    values[:] = [decode[c](t) for t, c in zip(texts.tolist(), types.tolist())]
+    return(values)
+
+def sheets_to_arrays(sheets):
+    """Write spreadsheets read in as numpy arrays (no Python objects), for the
+    cache of the spreadsheets (numpy .npz file read without pickle)
+
+    Args:
+        sheets: dictionary of pandas dataframe objects keyed by spreadsheet name
+
+    Returns:
+        dictionary of numpy arrays: 'header' (JSON text, as bytes, with the
+        spreadsheet and column names and how each column is written), and the
+        index and columns of each spreadsheet
 
     Raises:
-        None
+        TypeError: a column or cell which cannot be written as numpy arrays
+
+    NOTES:
+        - Dropdown columns (categoricals) are written as their codes and
+          categories, columns of numbers/dates as they are, and other columns
+          (text, or text mixed with numbers, the mistakes the checks look for)
+          as text with the type of each cell (encode_cells()), as are the cells
+          of the numeric columns which are not numbers (invalid_numbers()).
     """
-    if na_rm == True:
-        table = table.loc[pd.notnull(table[agecol]),:]
-    else:
-        pass
-    if depth_ref == 'from top':
-        table = table.sort_values(by = [depthcol], ascending = True)
-    elif depth_ref == 'from base':
-        table = table.sort_values(by = [depthcol], ascending = False)
-    else:
-        print('Entity metadata tab: The depth_ref chosen is not "from top" or "from base"')
-        return(1)
-    diff_idx = np.flatnonzero(np.diff(table[agecol]) <= 0)
-    table = table.reset_index(drop = True)
-    if entity_name != '':
-        entity_name = 'Entity %s;' %entity_name
-    if (len(diff_idx) + 1) == table.shape[0]:
-        print('%s tab: %s depth_ref is likely wrong (all ages are inverted)' %(table_name, entity_name))
-        return(1)
-    elif len(diff_idx) > 0:
-        depth1 = table[depthcol][diff_idx]
-        depth2 = table[depthcol][diff_idx + 1]
-        paired_depths = np.column_stack((depth1, depth2))
-        for j in range(0, paired_depths.shape[0]):
-            if j == 0:
-                depths = str(list(paired_depths[j])).replace(',', ' and')
+    arrays, header = {}, []
+    for n, (sheet, table) in enumerate(sheets.items()):
+        if table.index.dtype.kind not in 'iu':
+            raise TypeError('index of %s cannot be cached' %sheet)
+        arrays['%d/index' %n] = table.index.values
+        kinds = []
+        for m, (col, column) in enumerate(table.items()):
+            key = '%d/%d' %(n, m)
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                arrays[key] = column.cat.codes.values
+                arrays[key + '/categories'] = np.array(list(column.cat.categories), dtype = str)
+                kinds.append('category')
+            elif column.dtype.kind in 'biufM':
+                arrays[key] = column.values
+                kinds.append('values')
+            elif column.dtype == object:
+                arrays[key], arrays[key + '/types'] = encode_cells(column.values)
+                kinds.append('cells')
             else:
-                more_depths = str(list(paired_depths[j])).replace(',', ' and')
-                depths = '%s and %s' %(depths, more_depths)
-        print('%s tab: %s There is %s inversion at the following paired %s: %s ' %(table_name, entity_name, agecol, depthcol, depths))
-        return(1)
-    else:
-        return(0)
+                raise TypeError('column %s of %s cannot be cached' %(col, sheet))
+        # cells of the numeric columns which are not numbers (see set_table_types())
+        invalid = invalid_numbers(table)
+        for col, cells in invalid.items():
+            key = '%d/invalid/%d' %(n, list(table.columns).index(col))
+            arrays[key + '/index'] = cells.index.values
+            arrays[key], arrays[key + '/types'] = encode_cells(cells.values)
+        header.append({'sheet': sheet, 'columns': list(table.columns), 'kinds': kinds,
+                       'invalid': [list(table.columns).index(col) for col in invalid]})
+    arrays['header'] = np.frombuffer(json.dumps(header).encode('utf-8'), dtype = np.uint8)
+    return(arrays)
 
-def check_values2list(table, col_name, table_name, dropdownlist, na_rm = False):
-    """Check that values are from a list
+def arrays_to_sheets(arrays):
+    """Spreadsheets written by sheets_to_arrays()
 
     Args:
-        table: A pandas dataframe object. Table with the data.
-        col_name: string. Name of column to check
-        table_name: string. Name of table (to be printed in warnings).
-        dropdownlist: list of string. List for the column to be checked against
-        na_rm: boolean. whether or not to accept NA
+        arrays: dictionary-like of numpy arrays (e.g. numpy .npz file)
 
     Returns:
-        integer, either 0 or 1
+        dictionary of pandas dataframe objects keyed by spreadsheet name
+    """
+    sheets = {}
+    for n, sheet in enumerate(json.loads(arrays['header'].tobytes().decode('utf-8'))):
+        table = {}
+        for m, kind in enumerate(sheet['kinds']):
+            key = '%d/%d' %(n, m)
+            if kind == 'category':
+                column = pd.Categorical.from_codes(arrays[key], arrays[key + '/categories'].tolist())
+            elif kind == 'values':
+                column = arrays[key]
+            else:
+                column = decode_cells(arrays[key], arrays[key + '/types'])
+            table[m] = column
+        table = pd.DataFrame(table, index = arrays['%d/index' %n])
+        table.columns = sheet['columns']
+        if len(sheet['invalid']) > 0:
+            cells = InvalidNumbers()
+            for m in sheet['invalid']:
+                key = '%d/invalid/%d' %(n, m)
+                cells[sheet['columns'][m]] = pd.Series(decode_cells(arrays[key], arrays[key + '/types']),
+                                                       index = arrays[key + '/index'], name = sheet['columns'][m])
+            table.attrs['invalid_numbers'] = cells
+        sheets[sheet['sheet']] = table
+    return(sheets)
 
-    Raises:
-        None
+def cache_file_name(folder, key):
+    """File name of an entry of the cache
+
+    Args:
+        folder: string. Folder of the cache ('workbooks' or 'results')
+        key: string. Key of the entry
+
+    Returns:
+        string, file name of the entry, None if there is no cache
     """
-    if na_rm == True:
-        table = table.loc[pd.notnull(table[col_name]),:]
-    else:
-        pass
-    list_append = []
-    for i in table.index:
-        subset = table.loc[i,col_name]
-        if subset not in dropdownlist:
-            list_append.append((i+3))
-    if len(list_append) > 0:
-        print('%s tab: %s; %d row(s) contains values not in the dropdown lists. row: %s' %(table_name, col_name, len(list_append), str(list_append).replace('[', '').replace(']', '')))
-        return(1)
-    else:
-        return(0)
+    if not cache_dir:
+        return(None)
+    return(os.path.join(cache_dir, folder, '%s.%s' %(key, cache_extension[folder])))
 
-def check_no_values(table, table_name, col_name, col_dtype_str_set = False):
-    """Check that there are no missing values in a column.
+def read_cache(folder, key):
+    """Read in an entry of the cache
 
     Args:
-        table: A pandas dataframe object. Table with the data.
-        table_name: string. Name of table (to be printed in warnings).
-        col_name: string. Name of column to check
-        col_dtype_str_set: boolean. True if np.nan has been replaced with ''
+        folder: string. Folder of the cache ('workbooks' or 'results')
+        key: string. Key of the entry
 
     Returns:
-        integer, either 0 or 1
+        the object cached (dictionary of spreadsheets for 'workbooks', see
+        load_workbook(), dictionary for 'results'), None if not in the cache
+    """
+    cache_file = cache_file_name(folder, key)
+    if (cache_file is None) or (not os.path.isfile(cache_file)):
+        return(None)
+    try:
+        if folder == 'workbooks':
+            with np.load(cache_file, allow_pickle = False) as arrays:
+                cached = arrays_to_sheets(arrays)
+        else:
+            with open(cache_file) as f:
+                cached = json.load(f)
+        # mark the entry as recently used (see evict_cache())
+        os.utime(cache_file, None)
+        return(cached)
+    except Exception:
+        return(None) # unreadable entry, as if not in the cache
 
-    Raises:
+def write_cache(folder, key, value):
+    """Write an entry in the cache, and remove the least recently used entries if
+    the folder has more than cache_size[folder] entries or cache_max_bytes[folder]
+    bytes
+
+    Args:
+        folder: string. Folder of the cache ('workbooks' or 'results')
+        key: string. Key of the entry
+        value: object to cache. Dictionary of spreadsheets for 'workbooks'
+            (see sheets_to_arrays()), dictionary written as JSON for 'results'
+
+    Returns:
         None
     """
-    idx = []
-    if (col_dtype_str_set == False):
-        idx = table.loc[pd.isnull(table[col_name]),:].index + 3
-    elif (col_dtype_str_set == True):
-        idx = table.loc[table[col_name] == ''].index + 3
-    if len(idx) > 0:
-        print('%s tab: %s; %d row(s) is missing. row: %s' %(table_name, col_name, len(idx), str(list(idx)).replace('[', '').replace(']', '')))
-        return(1)
-    else:
-        return(0)
+    cache_file = cache_file_name(folder, key)
+    if cache_file is None:
+        return
+    # write to a temporary file first, as other processes may read the cache
+    tmp_file = '%s.%d.tmp' %(cache_file, os.getpid())
+    try:
+        if not os.path.isdir(os.path.dirname(cache_file)):
+            os.makedirs(os.path.dirname(cache_file))
+        with open(tmp_file, 'wb' if folder == 'workbooks' else 'w') as f:
+            if folder == 'workbooks':
+                np.savez_compressed(f, **sheets_to_arrays(value))
+            else:
+                json.dump(value, f, default = json_value)
+        os.replace(tmp_file, cache_file)
+        evict_cache(folder)
+    except (IOError, OSError, TypeError, ValueError):
+        # everything still works without a cache
+        if os.path.isfile(tmp_file):
+            os.remove(tmp_file)
+
+def evict_cache(folder):
+    """Remove the least recently used entries of a folder of the cache, so that
+    at most cache_size[folder] entries and cache_max_bytes[folder] bytes are kept
 
-def check_independent_dependent_col(table, table_name, independent_column, dependent_column):
-    """Check that if there are values in one column, that a dependent column must also have values
-    
     Args:
-        table: A pandas dataframe object. Table with the data.
-        table_name: string. Name of table (to be printed in warnings).
-        independent_column: string. Name of the independent column
-        dependent_column: string. Name of the dependent column
+        folder: string. Folder of the cache ('workbooks' or 'results')
 
     Returns:
-        integer, either 0 or 1
-        
-    Raises:
         None
     """
-    sub_tb = table.loc[pd.isnull(table[independent_column]) & pd.notnull(table[dependent_column]),:]
-    # +3 because values starts on row number 3
-    number_of_rows = sub_tb.shape[0]
-    ctr = False
-    if number_of_rows > 0:
-        Row_numbers = str([i for i in (sub_tb.index + 3)]).replace('[','').replace(']', '')
-        print('%s tab: %d row(s) have %s but no %s. See row(s) %s' %(table_name, number_of_rows, dependent_column, independent_column, Row_numbers))
-        ctr = True
-    if ctr == False:
-        return(0)
-    else:
-        return(1)
+    cache_files = []
+    for f in glob.glob(os.path.join(cache_dir, folder, '*.%s' %cache_extension[folder])):
+        try:
+            cache_files.append((os.path.getmtime(f), os.path.getsize(f), f))
+        except OSError:
+            pass # removed by another process
+    # most recently used first
+    cache_files.sort(reverse = True)
+    kept_bytes = 0
+    for n, (mtime, size, f) in enumerate(cache_files):
+        kept_bytes += size
+        if (n < cache_size[folder]) & (kept_bytes <= cache_max_bytes[folder]):
+            continue
+        try:
+            os.remove(f)
+        except OSError:
+            pass # already removed by another process
 
-def check_Isotope_Checks(table, independent_column, dependent_column1, dependent_column2):
-    sub_tb = table.loc[pd.notnull(table[independent_column]) & (pd.isnull(table[dependent_column1]) & pd.isnull(table[dependent_column2])),:]
-    # +3 because values starts on row number 3
-    number_of_rows = len(sub_tb.index)
-    if number_of_rows > 0:
-        print('Sample table tab: There is at least one row with isotope standard and no d13C or d18O measurement. Ensure that only isotope measurements have iso_std info. %d rows. See row(s): %s' %(number_of_rows, str(list(sub_tb.index + 3)).replace(']','').replace('[', '')) )
-        return(1)
-    else:
-        return(0)
+# Streamed checks of the Sample data spreadsheets (--low-memory or environment
+# variable SISAL_LOW_MEMORY=1): the rows are read in chunks of sample_chunk_rows
+# rows and the whole table is never built. Only the rows which the checks can
+# flag and a few columns of all the rows are kept (see stream_sample_sheet())
+low_memory = os.environ.get('SISAL_LOW_MEMORY', '') not in ['', '0']
+sample_chunk_rows = 20000
+# Columns of all the rows kept when the Sample data is streamed, for the checks
+# comparing the rows of an entity (repeated depths and ages, age inversions,
+# possible hiatuses, depths of the hiatuses, ann_lam_check across spreadsheets)
+sample_key_columns = ['entity_name', 'depth_sample', 'interp_age', 'hiatus', 'modern_reference', 'ann_lam_check']
 
-# Check that entity names in table exists in the Entity metadata spreadsheet
-def check_entity_names(entity_tb, table, tablename):
-    """Check that entity_name in table exists in the Entity metadata spreadsheet
+def set_low_memory(enabled, chunk_rows = None):
+    """Turn the streamed checks of the Sample data spreadsheets on or off
 
     Args:
-        entity_tb, A pandas dataframe object. Table with Entity metadata
-        table: A pandas dataframe object. Table with the data.
-        table_name: string. Name of table (to be printed in warnings).
-        
-    Returns:
-        integer, either 0 or 1
+        enabled: boolean
+        chunk_rows: integer. Number of rows read in at once (default: unchanged)
 
-    Raises:
+    Returns:
         None
     """
-    entity_name_list = []
-    for i in np.unique(table['entity_name']):
-        if i not in list(entity_tb['entity_name']):
-            entity_name_list.append(str(i))
-    if len(entity_name_list) > 0:
-        print('Entity metadata tab: Entity %s is missing from the list (we have found it in the %s spreadsheet)' %(str(entity_name_list).replace('[', '').replace(']', ''),tablename))
-        return(1)
-    else:
-        return(0)
+    global low_memory, sample_chunk_rows
+    low_memory = enabled
+    if chunk_rows is not None:
+        sample_chunk_rows = chunk_rows
 
-# Check that column are only numbers
-def check_numbers(table, tablename, column):
-    """Check for non-numeric numbers in a column
+def convert_cell(cell):
+    """Value of a cell of an openpyxl worksheet, as pandas reads it in (empty
+    cells are '', errors np.nan and numbers without decimals integers)
 
     Args:
-        table: A pandas dataframe object. Table with the data.
-        table_name: string. Name of table (to be printed in warnings).
-        col_name: string. Name of column
-        
+        cell: openpyxl cell
+
     Returns:
-        integer, either 0 or 1
+        value of the cell
+    """
+    if cell.value is None:
+        return('')
+    elif cell.data_type == 'e':
+        return(np.nan)
+    elif cell.data_type == 'n':
+        value = int(cell.value)
+        if value == cell.value:
+            return(value)
+    return(cell.value)
 
-    Raises:
-        None
+def sheet_rows(sheet):
+    """Rows of a spreadsheet, one at a time, as pandas reads them in (empty cells
+    at the end of the rows and empty rows at the end of the spreadsheet removed)
+
+    Args:
+        sheet: openpyxl worksheet (read-only)
+
+    Returns:
+        generator of lists of values
     """
-    warning = False
-    store_ls = []
-    for i in table.index:
-        obj = table.loc[i, column]
-        if isinstance(obj, Number):
-            pass
-        else:
-            warning = True
-            store_ls.append(i)
-    if warning == True:
-        store_ls_len = len(store_ls)
-        store_ls = str([i+3 for i in store_ls]).replace('[', '').replace(']', '')
-        print('%s tab: %s; %d row(s) is not a number. row: %s' %(tablename, column, store_ls_len, store_ls))
-        return(1)
-    else:
-        return(0)
+    sheet.reset_dimensions()
+    empty_rows = 0
+    for row in sheet.rows:
+        values = [convert_cell(cell) for cell in row]
+        while (len(values) > 0) and (isinstance(values[-1], str)) and (values[-1] == ''):
+            values.pop()
+        if len(values) == 0:
+            empty_rows += 1 # only kept if there are rows after them
+            continue
+        for i in range(empty_rows):
+            yield([])
+        empty_rows = 0
+        yield(values)
+
+def parse_rows(rows, width, header = 0):
+    """Convert rows of values to a dataframe as pandas does when reading in a
+    spreadsheet (missing values and data types)
 
-# check that there is only one record for each depth
-def check_no_repeated_records(table, tablename, entity_name, column):
-    """Check that there are no repeated values in the database (to the nearest 6 d.p.)
-    
     Args:
-        table: A pandas dataframe object. Table with the data.
-        tablename: string. Name of table (to be printed in warnings).
-        entity_name: string. Name of entity
-        column: string. Name of column
-        
+        rows: list of lists of values. Rows (the first one is the header, if header = 0)
+        width: integer. Number of columns (the rows are filled in with '')
+        header: integer or None. Row of the column names
+
     Returns:
-        integer, either 0 or 1
+        A pandas dataframe object
+    """
+    rows = [row + [''] * (width - len(row)) for row in rows]
+    return(pd.io.parsers.TextParser(rows, header = header, skip_blank_lines = False).read())
 
-    Raises:
-        None
+def read_sheet_chunks(sheet, chunk_rows, dtypes, converted):
+    """Read in a spreadsheet (first row skipped, column names in the second row)
+    in chunks of rows, keeping only one chunk of raw values in memory
+
+    Args:
+        sheet: openpyxl worksheet (read-only)
+        chunk_rows: integer. Number of rows read in at once
+        dtypes: dictionary, filled in with the data types each column was read
+            in as in the chunks (set of strings, keyed by column name)
+        converted: set, filled in with the columns read in as numbers in a
+            chunk which had cells that are not numbers in the spreadsheet (e.g.
+            the text '12'), which pandas converts only if the whole column can be
+
+    Returns:
+        generator of pandas dataframe objects, the chunks as pd.ExcelFile.parse
+        (skiprows = 1) reads in the rows of the whole spreadsheet (index: row
+        number as in the whole table, empty rows removed). The data type of a
+        column is found per chunk
+
+    NOTES:
+        - The rows of each chunk are filled in up to the widest row of the chunk
+          (the first two rows included): the columns of a chunk are the first
+          columns of the whole spreadsheet.
     """
-    table = table.loc[pd.to_numeric(table[column], errors = 'coerce').notnull(),:]
-    col_val = list(table[column].round(6)) # round to 6 dp first to prevent rounding issues
-    if len(col_val) == len(set(col_val)):
-        return(0)
-    else:
-        ls = list(sorted(set([x for x in col_val if col_val.count(x) > 1])))
-        rep = str(ls)[1:-1]
-        col_number = []
-        for i in ls:
-            col_number.append(list(table[table[column].round(6).isin([i])].index + 3))
-        print('%s tab: Entity %s; The following %s occured more than once: %s Row: %s' %(tablename, entity_name, column, rep, str(col_number)[1:-1]))
-        return(1)
+    rows = sheet_rows(sheet)
+    try:
+        description, header = next(rows), next(rows)
+    except StopIteration:
+        return
+    min_width = max(len(description), len(header))
+    def parse_chunk(batch, n_rows):
+        chunk = parse_rows([header] + batch, max([min_width] + [len(r) for r in batch]))
+        chunk.index = range(n_rows, n_rows + len(chunk.index))
+        for p, c in enumerate(chunk.columns):
+            # data type of each column in the chunk (with the empty rows)
+            dtypes.setdefault(c, set()).add(str(chunk[c].dtype))
+            if (chunk[c].dtype != object) and (c not in converted):
+                if any([(type(r[p]) not in (int, float)) and (r[p] != '') for r in batch if p < len(r)]):
+                    converted.add(c)
+        return(chunk.dropna(how = 'all'))
+    n_rows = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == chunk_rows:
+            chunk = parse_chunk(batch, n_rows)
+            n_rows += len(batch)
+            batch = []
+            if len(chunk.index) > 0:
+                yield(chunk)
+    if len(batch) > 0:
+        chunk = parse_chunk(batch, n_rows)
+        if len(chunk.index) > 0:
+            yield(chunk)
 
-# Check that column are only numbers
-def check_positivenumbers(table, tablename, column, na_rm = False):
-    """Check if numbers positive
+def flag_sample_rows(table, composites):
+    """Flag the rows of a chunk of the Sample data table which the checks of the
+    rows of the Sample data (Sections 7.i.c, 7.ii, 7.iii.c and 7.vi.a) can flag
 
     Args:
-        table: A pandas dataframe object. Table with the data.
-        tablename: string. Name of table (to be printed in warnings).
-        column: string. Name of column
-        na_rm: boolean. whether or not to accept NA
-        
+        table: A pandas dataframe object. Rows of the Sample data (data types
+            and empty cells as set by set_column_types())
+        composites: list of strings. entity_name of the composites
+
     Returns:
-        integer, either 0 or 1
+        numpy array of booleans, True for the rows to keep
 
-    Raises:
-        None
+    NOTES:
+        - A row is kept if it breaks one of the conditions of these checks,
+          whatever the subset of rows the check is run on (e.g. rows with an
+          age model), so that the checks list the same rows. All the rows of
+          hiatuses, gaps and composites are kept.
     """
-    ctr = 0
-    store_ls = []
-    if na_rm == True:
-        table = table.loc[pd.notnull(table[column]),:]
-    else:
-        pass
-    for i in table.index:
-        obj = table.loc[i, column]
-        if pd.isnull(obj) | (obj < 0):
-            ctr+=1
-            store_ls.append(i)
-        else:
-            pass
-    if ctr > 0:
-        store_ls_len = len(store_ls)
-        store_ls = str([i+3 for i in store_ls]).replace('[', '').replace(']', '')
-        print('%s tab: %s; %d row(s) is not a positive number (or not a number). row: %s' %(tablename, column, store_ls_len, store_ls))
-        return(1)
-    else:
+    dropdowns = [(c, v) for c, v in column_schema['sample'].items() if isinstance(v, list)]
+    depths = table['depth_sample'].values.astype(float)
+    ages = table['interp_age'].values.astype(float)
+    uncert_pos = table['interp_age_uncert_pos'].values.astype(float)
+    uncert_neg = table['interp_age_uncert_neg'].values.astype(float)
+    mineralogy, arag_corr = table['mineralogy'], table['arag_corr']
+    with np.errstate(invalid = 'ignore'):
+        masks = [table['entity_name'].isin(composites).values,
+                 (table['hiatus'] == 'H').values, (table['gap'] == 'G').values,
+                 isnull_cells(table['entity_name']).values, (table['entity_name'] == '').values,
+                 # missing, not a number or negative depths, missing ages, ages
+                 # (converted to BP(1950)) out of range
+                 np.isnan(depths) | (depths < 0), np.isnan(ages),
+                 np.where((table['modern_reference'] == 'CE/BCE').values, 1950 - ages, ages) < -70,
+                 # uncertainties entered as min/max ages (check_notminmax_age())
+                 ((ages <= uncert_pos) & (ages >= uncert_neg)) | ((ages <= uncert_neg) & (ages >= uncert_pos)),
+                 # mineralogy and arag_corr which do not go together
+                 (mineralogy.isin(['calcite', 'vaterite', 'secondary calcite']) & (arag_corr != 'not applicable')).values,
+                 (mineralogy.isin(['aragonite', 'mixed']) & (arag_corr == 'not applicable')).values,
+                 ((mineralogy == 'unknown') & (arag_corr != 'unknown')).values,
+                 # isotope standard without measurements (check_Isotope_Checks())
+                 (notnull_cells(table['iso_std']) & isnull_cells(table['d18O_measurement']) & isnull_cells(table['d13C_measurement'])).values]
+        # column rules (numbers, positive numbers, precision/measurements co-existing)
+        masks += evaluate_rules(table, sample_column_rules)[0]
+        # values not in the dropdown lists (empty cells flagged, except hiatus and gap)
+        for col_name, dropdownlist in dropdowns:
+            if col_name in ['hiatus', 'gap']:
+                masks.append(not_in_list_mask(table[col_name], dropdownlist) & notnull_cells(table[col_name]).values)
+            else:
+                masks.append(not_in_list_mask(table[col_name], [v for v in dropdownlist if v != '']))
+    # cells of the numeric columns which are not numbers
+    for cells in invalid_numbers(table).values():
+        masks.append(table.index.isin(cells.index))
+    return(np.logical_or.reduce(masks))
+
+def first_sample_rows(table):
+    """Conditions of the checks of the Sample data which are checked for an
+    entity as a whole (e.g. whether all its ages are missing, whether one of its
+    rows is 'Year of chemistry'), on a chunk of the Sample data table
+
+    Args:
+        table: A pandas dataframe object. Rows of the Sample data (data types
+            and empty cells as set by set_column_types())
+
+    Returns:
+        dictionary of numpy arrays of booleans keyed by condition, True for the
+        rows which meet the condition. The first row of each entity meeting
+        each condition is kept (see stream_sample_sheet())
+    """
+    nohiat = (table['hiatus'] != 'H').values
+    uncert_neg = nohiat & isnull_cells(table['interp_age_uncert_neg']).values
+    return({'sample': nohiat,
+            'interp_age': nohiat & notnull_cells(table['interp_age']).values,
+            'year_of_chemistry': nohiat & (table['modern_reference'] == 'Year of chemistry').values,
+            'mixed_arag_corr': nohiat & ((table['mineralogy'] == 'mixed') & table['arag_corr'].isin(['unknown', 'yes'])).values,
+            'uncert_neg': uncert_neg,
+            'uncert_neg_depth': uncert_neg & ~np.isnan(table['depth_sample'].values.astype(float))})
+
+def stream_sample_sheet(sheet, chunk_rows, composites = []):
+    """Stream a Sample data spreadsheet in chunks of rows and keep only what the
+    checks need, instead of the whole table (low_memory)
+
+    Args:
+        sheet: openpyxl worksheet (read-only)
+        chunk_rows: integer. Number of rows read in at once
+        composites: list of strings. entity_name of the composites (all their
+            rows are kept for check_composites())
+
+    Returns:
+        tuple of three, None if the spreadsheet has no data rows or cannot be
+        streamed (it is then read in as a whole, see NOTES):
+            A pandas dataframe object. Rows of the Sample data flagged by
+            flag_sample_rows(), and the first row of each entity meeting each
+            condition of first_sample_rows() (data types set by set_table_types())
+            A pandas dataframe object. sample_key_columns of all the rows
+            A pandas series object. Number of "unknown" per column (see count_values())
+
+    NOTES:
+        - The checks give the same warnings on these tables as on the whole
+          table: the checks of the rows only list the rows they flag, and the
+          checks of an entity as a whole only need one of its rows which meets
+          (or does not meet) their condition. The entities which already have
+          a row kept for each condition are the running state of the stream.
+          Repeated depths and ages, age inversions and possible hiatuses are
+          found on the key columns (the rows of an entity are not always in
+          order of depth in the spreadsheet).
+        - The data type of a column is found per chunk. The table cannot be
+          streamed if entity_name is not read in as the same type in all the
+          chunks, or if a column with cells read in as numbers in one chunk
+          (e.g. the text '12') is text in another one, as pandas reads them in
+          differently for the whole spreadsheet.
+    """
+    dtypes, converted = {}, set()
+    first = {} # entities with a row kept for each condition of first_sample_rows()
+    texts = {}
+    rows, keys, invalid, unknowns = [], [], {}, pd.Series(dtype = int)
+    for chunk in read_sheet_chunks(sheet, chunk_rows, dtypes, converted):
+        if len(set(column_schema['sample']) - set(chunk.columns)) > 0:
+            return(None) # missing columns are reported by check_columns()
+        set_table_types(chunk, 'sample')
+        fill_empty_cells(chunk, 'sample')
+        unknowns = unknowns.add(pd.Series(count_values([('sample table', chunk)], 'unknown')[2]['sample table'], dtype = int), fill_value = 0)
+        keep = flag_sample_rows(chunk, composites)
+        for condition, mask in first_sample_rows(chunk).items():
+            seen = first.setdefault(condition, set())
+            idx = np.flatnonzero(mask)
+            names = pd.Series(chunk['entity_name'].values[idx])
+            new = (~names.duplicated() & ~names.isin(seen)).values
+            keep[idx[new]] = True
+            seen.update(names[new])
+        for col_name, cells in invalid_numbers(chunk).items():
+            invalid.setdefault(col_name, []).append(cells)
+        chunk.attrs = {}
+        key_chunk = chunk[sample_key_columns].copy()
+        key_chunk['entity_name'] = [texts.setdefault(v, v) for v in key_chunk['entity_name']]
+        keys.append(key_chunk)
+        rows.append(chunk.loc[keep])
+    if (len(rows) == 0) or (len(dtypes.get('entity_name', [])) > 1) or \
+       any([not (dtypes[c] <= set(['int64', 'float64'])) for c in converted]):
+        return(None)
+    invalid = InvalidNumbers([(c, pd.concat(cells)) for c, cells in invalid.items()])
+    table = pd.concat(rows)
+    key_table = pd.concat(keys)
+    table.attrs['invalid_numbers'] = invalid
+    key_table.attrs['invalid_numbers'] = InvalidNumbers([(c, cells) for c, cells in invalid.items() if c in sample_key_columns])
+    for t in [table, key_table]:
+        # dropdown columns whose chunks have different categories are text
+        set_table_types(t, 'sample')
+        fill_empty_cells(t, 'sample')
+    unknowns = unknowns.reindex(table.columns, fill_value = 0).astype(int)
+    return((table, key_table, unknowns))
+
+def sheet_fingerprints(input_file):
+    """Fingerprints of the spreadsheets of an .xlsx workbook, read from the
+    directory of the zip archive (the spreadsheets are not read in)
+
+    Args:
+        input_file: string. File name of the workbook
+
+    Returns:
+        dictionary keyed by spreadsheet name: tuple of the CRC of the spreadsheet
+        and of the shared text and styles of the workbook. None if the workbook
+        is not an .xlsx file (e.g. .xls)
+
+    NOTES:
+        - A spreadsheet with the same fingerprint as before did not change and
+          does not need to be read in again (see load_workbook()). The shared
+          text is in the fingerprint of every spreadsheet: new text in one
+          spreadsheet makes all of them read in again.
+    """
+    ns = {'main': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main',
+          'rel': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'}
+    try:
+        with zipfile.ZipFile(input_file) as z:
+            crcs = dict([(info.filename, info.CRC) for info in z.infolist()])
+            workbook = ElementTree.fromstring(z.read('xl/workbook.xml'))
+            rels = ElementTree.fromstring(z.read('xl/_rels/workbook.xml.rels'))
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError, IOError, OSError):
+        return(None)
+    targets = dict([(r.get('Id'), r.get('Target', '')) for r in rels])
+    shared = (crcs.get('xl/sharedStrings.xml'), crcs.get('xl/styles.xml'))
+    fingerprints = {}
+    for sheet in workbook.iter('{%s}sheet' %ns['main']):
+        target = targets.get(sheet.get('{%s}id' %ns['rel']), '')
+        part = target[1:] if target.startswith('/') else 'xl/' + target
+        fingerprints[sheet.get('name')] = (crcs.get(part),) + shared
+    return(fingerprints)
+
+def load_workbook(input_file, reuse = None, streamed = None):
+    """Read in the spreadsheets of a workbook (the spreadsheets of sheet_names and
+    all spreadsheets with 'Sample data' in their name). The workbook is opened
+    once, and the spreadsheets read in are cached in cache_dir
+
+    Args:
+        input_file: string. File name of the workbook
+        reuse: dictionary of pandas dataframe objects keyed by spreadsheet name.
+            Spreadsheets known not to have changed since they were read in
+            (see sheet_fingerprints()), used instead of reading them in again
+        streamed: dictionary, or None. If given, the Sample data spreadsheets
+            are streamed (see stream_sample_sheet()): the reduced tables are
+            returned and the other outputs of stream_sample_sheet() are added
+            to streamed, keyed by spreadsheet name
+
+    Returns:
+        dictionary of pandas dataframe objects keyed by spreadsheet name (empty
+        rows removed). Spreadsheets which could not be read in are None, missing
+        spreadsheets are not in the dictionary
+
+    Raises:
+        the errors of open() and pd.ExcelFile if the workbook cannot be read in
+
+    NOTES:
+        - The cache is only used if cache_dir is set (--cache or SISAL_CACHE_DIR),
+          and is keyed by the hash of the content of the workbook, so that a
+          workbook which is edited is read in again. Spreadsheets are cached as
+          numpy arrays read without pickle (see sheets_to_arrays()): columns
+          mixing text and numbers (the mistakes the checks look for) are kept
+          as they are.
+        - The data types of the columns are set once here (set_table_types()),
+          for the checks and for the upload of the workbooks.
+        - Streamed workbooks are not cached (the tables are not the whole
+          spreadsheets). The Sample data spreadsheets are read in last, once the
+          composites are known from the Entity metadata.
+    """
+    key = None
+    if cache_dir and (streamed is None):
+        key = '%s_v%d_pd%s' %(file_hash(input_file), loader_version, pd.__version__)
+        sheets = read_cache('workbooks', key)
+        if sheets is not None:
+            return(sheets)
+    xl = pd.ExcelFile(input_file)
+    table_keys = dict([(sheet, key) for key, sheet in sheet_names.items()])
+    sheets = {}
+    for sheet in sorted(xl.sheet_names, key = lambda sheet: (streamed is not None) and ('Sample data' in sheet)):
+        if (sheet in sheet_names.values()) | ('Sample data' in sheet):
+            # Skip first row (description row)
+            # column title starts at row number 2/ index = 1
+            if (reuse is not None) and (reuse.get(sheet) is not None):
+                sheets[sheet] = reuse[sheet]
+                continue
+            try:
+                table = None
+                if (streamed is not None) & ('Sample data' in sheet) & (xl.engine == 'openpyxl'):
+                    entity_tb = sheets.get(sheet_names['entity'])
+                    composites = []
+                    if (entity_tb is not None) and ('speleothem_type' in entity_tb) and ('entity_name' in entity_tb):
+                        composites = list(entity_tb.loc[entity_tb['speleothem_type'] == 'composite', 'entity_name'])
+                    result = stream_sample_sheet(xl.book[sheet], sample_chunk_rows, composites)
+                    if result is not None:
+                        table, streamed[sheet] = result[0], result[1:]
+                if table is None:
+                    table = xl.parse(sheet_name = sheet, skiprows = 1).dropna(how = 'all')
+                set_table_types(table, table_keys.get(sheet, 'sample'))
+                sheets[sheet] = table
+            except Exception:
+                sheets[sheet] = None
+    if (key is not None) & all([sheets[k] is not None for k in sheets]):
+        write_cache('workbooks', key, sheets)
+    return(sheets)
+
+def read_workbook(input_file, reuse = None, stream = False):
+    """Read in the spreadsheets of a workbook
+
+    Args:
+        input_file: string. File name of the workbook
+        reuse: dictionary of pandas dataframe objects. Spreadsheets which did not
+            change, see load_workbook()
+        stream: boolean. Whether to stream the Sample data spreadsheet (low_memory)
+
+    Returns:
+        dictionary of pandas dataframe objects. Tables of the workbook, keyed as
+        in sheet_names (empty rows removed). If the Sample data spreadsheet was
+        streamed, 'sample' only has the rows the checks need, and the key
+        columns of all the rows and the counts of "unknown" are in
+        'sample_columns' and 'sample_unknowns' (see stream_sample_sheet())
+
+    Raises:
+        WorkbookError: the workbook or one of its spreadsheets cannot be read in
+    """
+    # Try to read in the workbook
+    streamed = {} if stream else None
+    try:
+        sheets = load_workbook(input_file, reuse, streamed)
+    except:
+        # If fails to read in workbook, exit the script
+        raise WorkbookError('Cannot read in excel file. input_file name may be supplied incorrectly.')
+
+    # List of spreadsheet names containing "Sample data"
+    # This is to check for cases where workbooks contain more than one Sample data
+    # spreadsheet.
+    sample_ls = [k for k in sheets if 'Sample data' in k]
+    if sheets.get('Site metadata') is None:
+        raise WorkbookError('Cannot read in Site metadata spreadsheet, likely no spreadsheet called "Site metadata"')
+    if sheets.get('Entity metadata') is None:
+        raise WorkbookError('Cannot read in Enitity metadata spreadsheet, likely no spreadsheet called "Entity metadata"')
+    if sheets.get('References') is None:
+        raise WorkbookError('Cannot read in References spreadsheet, likely no spreadsheet called "References"')
+    if sheets.get('Dating information') is None:
+        raise WorkbookError('Cannot read in Dating information spreadsheet, likely no spreadsheet called "Dating information"')
+    if sheets.get('Lamina age vs depth') is None:
+        raise WorkbookError('Cannot read in Lamina age vs depth spreadsheet, likely no spreadsheet called "Lamina age vs depth"')
+
+    # Read in sample spreadsheet
+    if len(sample_ls) == 1:
+        if sheets.get('Sample data') is None:
+            raise WorkbookError('Cannot read in Sample data spreadsheet, likely no spreadsheet called "Sample data"')
+    elif len(sample_ls) == 0:
+        raise WorkbookError('Sample data spreadsheet does not exist, likely no spreadsheet called "Sample data"')
+    else:
+        raise WorkbookError('More than one Sample data spreadsheet exist. This is not allowed')
+    wb = dict([(key, sheets[sheet_names[key]]) for key in sheet_names])
+    if stream and (sheet_names['sample'] in streamed):
+        wb['sample_columns'], wb['sample_unknowns'] = streamed[sheet_names['sample']]
+    return(wb)
+
+# =============================================================================
+# Section 3. Check workbook is the right version
+# =============================================================================
+def check_columns(wb):
+    """Check that all the tables of the workbook have the columns of version 12
+
+    Args:
+        wb: dictionary of pandas dataframe objects. Tables of the workbook
+
+    Returns:
+        None
+
+    Raises:
+        WorkbookError: one or more columns are missing
+    """
+    site_tb, entity_tb, ref_tb = wb['site'], wb['entity'], wb['ref']
+    dating_tb, dating_lamina_tb, sample_tb = wb['dating'], wb['dating_lamina'], wb['sample']
+    site_col = set(['site_name', 'latitude', 'longitude', 'elevation', 'geology', 'rock_age', 'monitoring']) - set(site_tb.columns)
+    entity_col = set(['entity_name', 'one_and_only', 'entity_status_info', 'entity_status_notes', 'depth_ref', 'cover_thickness', 'distance_entrance', 'speleothem_type', 'drip_type', 'd13C', 'd18O', 'd18O_water_equilibrium', 'trace_elements', 'organics', 'fluid_inclusions', 'mineralogy_petrology_fabric', 'clumped_isotopes', 'noble_gas_temperatures', 'C14', 'ODL', 'Mg_Ca', 'contact', 'data_DOI_URL']) - set(entity_tb.columns)
+    ref_col = set(['entity_name', 'citation', 'publication_DOI']) - set(ref_tb.columns)
+    date_col = set(['entity_name','date_type','depth_dating','dating_thickness','lab_num','material_dated','min_weight','max_weight','uncorr_age','uncorr_age_uncert_pos','uncorr_age_uncert_neg','14C_correction','calib_used','date_used','238U_content','238U_uncertainty','232Th_content','232Th_uncertainty','230Th_content','230Th_uncertainty','230Th_232Th_ratio','230Th_232Th_ratio_uncertainty','230Th_238U_activity','230Th_238U_activity_uncertainty','234U_238U_activity','234U_238U_activity_uncertainty','decay_constant','ini_230Th_232Th_ratio','ini_230Th_232Th_ratio_uncertainty','corr_age','corr_age_uncert_pos','corr_age_uncert_neg','modern_reference','chem_year']) - set(dating_tb.columns)
+    lam_col = set(['entity_name', 'depth_lam', 'lam_thickness', 'lam_age', 'lam_age_uncert_pos', 'lam_age_uncert_neg', 'modern_reference']) - set(dating_lamina_tb.columns)
+    sample_col = set(['entity_name', 'depth_sample', 'hiatus', 'gap', 'mineralogy', 'arag_corr', 'interp_age', 'interp_age_uncert_pos', 'interp_age_uncert_neg', 'age_model_type', 'modern_reference', 'ann_lam_check', 'dep_rate_check', 'sample_thickness', 'd13C_measurement', 'd13C_precision', 'd18O_measurement', 'd18O_precision', 'iso_std']) - set(sample_tb.columns)
+    if len(site_col) + len(entity_col) + len(ref_col) + len(date_col) + len(lam_col) + len(sample_col) > 0:
+        if len(site_col) > 0:
+            report('Site metadata table is missing column: %s' %str(list(site_col)))
+        if len(entity_col) > 0:
+            report('Entity metadata table is missing column: %s' %str(list(entity_col)))
+        if len(ref_col) > 0:
+            report('Entity metadata table is missing column: %s' %str(list(ref_col)))
+        if len(date_col) > 0:
+            report('Entity metadata table is missing column: %s' %str(list(date_col)))
+        if len(lam_col) > 0:
+            report('Entity metadata table is missing column: %s' %str(list(lam_col)))
+        if len(sample_col) > 0:
+            report('Entity metadata table is missing column: %s' %str(list(sample_col)))
+        raise WorkbookError('This workbook is likely not version 12. The checks cannot be performed.')
+
+# =============================================================================
+# Section 4. Define prerequisite functions
+# =============================================================================
+class WorkbookError(Exception):
+    """Raised when the checks cannot continue on a workbook (e.g. a spreadsheet
+    is missing or there are repeated entity_name). The message is printed when
+    the script terminates.
+    """
+    pass
+
+# Messages collected by check_workbook() for the workbook checked in this thread
+message_log = threading.local()
+
+def report(message):
+    """Print out a warning or informative message. When called from
+    check_workbook(), the message is also kept for the results
+
+    Args:
+        message: string. Warning or informative message
+
+    Returns:
+        None
+    """
+    messages = getattr(message_log, 'messages', None)
+    if messages is None:
+        print(message)
+    else:
+        messages.append(message)
+        if message_log.echo:
+            print(message)
+
+
+# Profiling of the checks (--profile or environment variable SISAL_PROFILE=1):
+# wall time and rows of each section and of each call of a check. With
+# --profile-memory (or SISAL_PROFILE_MEMORY=1), also their peak memory, traced
+# by tracemalloc, which slows the checks down several times (the wall times are
+# then not those of a run without it)
+profile_memory = os.environ.get('SISAL_PROFILE_MEMORY', '') not in ['', '0']
+profile_checks = profile_memory or (os.environ.get('SISAL_PROFILE', '') not in ['', '0'])
+# Profile of the workbook checked in this thread (see start_profile())
+profile_log = threading.local()
+
+def set_profiling(enabled, memory = False):
+    """Turn the profiling of the checks on or off
+
+    Args:
+        enabled: boolean
+        memory: boolean. Also trace the peak memory (tracemalloc), which slows
+            the checks down
+
+    Returns:
+        None
+    """
+    global profile_checks, profile_memory
+    profile_checks, profile_memory = enabled or memory, memory
+
+def start_profile():
+    """Start recording the profile of the workbook checked in this thread
+
+    Returns:
+        None
+    """
+    profile_log.memory = profile_memory
+    profile_log.tracing = profile_memory and not tracemalloc.is_tracing()
+    if profile_log.tracing:
+        tracemalloc.start()
+    profile_log.sections, profile_log.calls, profile_log.stack = [], [], []
+    profile_log.section, profile_log.start = '', time.perf_counter()
+
+def stop_profile():
+    """Stop recording the profile started by start_profile()
+
+    Returns:
+        dictionary with
+            'wall_time_s': float, total wall time of the checks
+            'memory_traced': boolean, True if the peak memory was traced (the
+                wall times then include the overhead of tracemalloc)
+            'sections': list of dictionaries, one per section ('section',
+                'wall_time_s', 'rows', 'peak_memory_bytes')
+            'functions': list of dictionaries, calls per check function
+                ('function', 'calls', 'wall_time_s', 'rows'), slowest first
+            'calls': list of dictionaries, one per call of a check function
+                ('section', 'function', 'wall_time_s', 'rows', 'peak_memory_bytes')
+
+    NOTES:
+        - Peak memory is the peak of the memory allocated by Python (tracemalloc),
+          including pandas and numpy arrays. It is None unless profile_memory
+          is on.
+        - wall_time_s of a call includes the calls of other check functions made
+          from it. Calls run on a pool of --entity-workers are only counted in
+          the time of their section.
+    """
+    functions = {}
+    for c in profile_log.calls:
+        f = functions.setdefault(c['function'], {'function': c['function'], 'calls': 0, 'wall_time_s': 0.0, 'rows': 0})
+        f['calls'] += 1
+        f['wall_time_s'] += c['wall_time_s']
+        f['rows'] += c['rows'] or 0
+    profile = {'wall_time_s': time.perf_counter() - profile_log.start,
+               'memory_traced': profile_log.memory,
+               'sections': profile_log.sections,
+               'functions': sorted(functions.values(), key = lambda f: -f['wall_time_s']),
+               'calls': profile_log.calls}
+    if profile_log.tracing:
+        tracemalloc.stop()
+    profile_log.calls = None
+    return(profile)
+
+def profile_enter():
+    """Start timing a section or a call (nested in the section or call running)
+
+    Returns:
+        dictionary, the timer to give to profile_exit()
+    """
+    if profile_log.memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        for frame in profile_log.stack:
+            frame['peak'] = max(frame['peak'], peak)
+        tracemalloc.reset_peak()
+    frame = {'start': time.perf_counter(), 'peak': 0}
+    profile_log.stack.append(frame)
+    return(frame)
+
+def profile_exit(frame):
+    """Stop timing a section or a call started by profile_enter()
+
+    Args:
+        frame: dictionary. Output of profile_enter()
+
+    Returns:
+        dictionary, 'wall_time_s' and 'peak_memory_bytes' (None unless the
+        memory is traced)
+    """
+    wall_time = time.perf_counter() - frame['start']
+    profile_log.stack.remove(frame)
+    if not profile_log.memory:
+        return({'wall_time_s': wall_time, 'peak_memory_bytes': None})
+    peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+    for parent in profile_log.stack:
+        parent['peak'] = max(parent['peak'], peak)
+    return({'wall_time_s': wall_time, 'peak_memory_bytes': peak})
+
+def count_rows(tables):
+    """Number of rows of a table, or of all the tables of a workbook
+
+    Args:
+        tables: A pandas dataframe object, or dictionary of pandas dataframe
+            objects (tables of the workbook keyed as in sheet_names)
+
+    Returns:
+        integer, None if tables is neither
+    """
+    if isinstance(tables, pd.DataFrame):
+        return(len(tables.index))
+    if isinstance(tables, dict):
+        return(sum([len(tables[key].index) for key in sheet_names if isinstance(tables.get(key), pd.DataFrame)]))
+    return(None)
+
+def profiled(check):
+    """Decorator recording each call of a check function in the profile, when
+    the workbook is checked with profiling on
+
+    Args:
+        check: function. The check
+
+    Returns:
+        function
+    """
+    @functools.wraps(check)
+    def profiled_check(*args, **kwargs):
+        if getattr(profile_log, 'calls', None) is None:
+            return(check(*args, **kwargs))
+        frame = profile_enter()
+        try:
+            return(check(*args, **kwargs))
+        finally:
+            record = profile_exit(frame)
+            tables = [a for a in args if isinstance(a, pd.DataFrame)]
+            record.update({'section': profile_log.section, 'function': check.__name__,
+                           'rows': count_rows(tables[0]) if len(tables) > 0 else None})
+            profile_log.calls.append(record)
+    return(profiled_check)
+
+def run_section(section, check, *args):
+    """Run a section of the checks, recorded in the profile when the workbook
+    is checked with profiling on
+
+    Args:
+        section: string. Number of the section, e.g. '7.i.a'
+        check: function. The section
+        *args: arguments of check
+
+    Returns:
+        output of check
+    """
+    if getattr(profile_log, 'calls', None) is None:
+        return(call_section(section, check, args))
+    profile_log.section = section
+    # rows of the tables checked, or read in (Section 2)
+    rows = count_rows(args[0]) if len(args) > 0 else None
+    frame = profile_enter()
+    output = None
+    try:
+        output = call_section(section, check, args)
+        return(output)
+    finally:
+        record = profile_exit(frame)
+        record.update({'section': section, 'rows': rows if rows is not None else count_rows(output)})
+        profile_log.sections.append(record)
+
+def write_profile(result):
+    """Write the profile of a workbook to a JSON file next to the workbook
+    (<workbook>_profile.json)
+
+    Args:
+        result: dictionary. Output of check_workbook() with profiling on
+
+    Returns:
+        None
+    """
+    if (result.get('profile') is None) | (result['input_file'] is None):
+        return
+    profile = dict([('workbook', result['input_file']), ('checker_version', checker_version)] + list(result['profile'].items()))
+    try:
+        with open(os.path.splitext(result['input_file'])[0] + '_profile.json', 'w') as f:
+            json.dump(profile, f, indent = 1)
+    except (IOError, OSError):
+        print('Unable to write the profile of %s.' %result['input_file'])
+
+# Number of threads/processes for the checks performed per entity (1: one
+# entity after the other) and type of pool ('thread' or 'process')
+entity_workers = 1
+entity_pool = 'thread'
+# Batches of checks per worker of the pool (see run_entity_checks())
+entity_batches = 4
+
+def set_entity_workers(workers, pool = 'thread'):
+    """Set the number of workers and type of pool for the checks performed per entity
+
+    Args:
+        workers: integer. Number of threads/processes (1: no pool)
+        pool: string. 'thread' or 'process'
+
+    Returns:
+        None
+    """
+    global entity_workers, entity_pool
+    entity_workers, entity_pool = workers, pool
+
+# Pool of the checks performed per entity of the workbook checked in this thread,
+# started once by check_workbook() (None: no pool)
+entity_log = threading.local()
+
+def entity_pool_workers():
+    """Number of workers of the pool of the checks performed per entity
+
+    Returns:
+        integer, entity_workers, or sheet_workers if entity_workers <= 1 (the
+        checks per entity of the sections run on sheet_workers processes, see
+        run_section_stages())
+    """
+    return(entity_workers if entity_workers > 1 else sheet_workers)
+
+def start_entity_pool():
+    """Start the pool of the checks performed per entity of a workbook
+    (entity_workers, entity_pool, or sheet_workers processes), used by all its
+    sections
+
+    Args:
+        None
+
+    Returns:
+        ThreadPoolExecutor or ProcessPoolExecutor object, None if
+        entity_pool_workers() <= 1
+    """
+    if entity_pool_workers() <= 1:
+        return(None)
+    if (entity_pool == 'process') or (entity_workers <= 1):
+        return(ProcessPoolExecutor(max_workers = entity_pool_workers()))
+    return(ThreadPoolExecutor(max_workers = entity_workers))
+
+def partition_by_entity(table):
+    """Split a table into one table per entity, in one pass
+
+    Args:
+        table: A pandas dataframe object. Table with an entity_name column
+
+    Returns:
+        dictionary of pandas dataframe objects keyed by entity_name (rows in the
+        order of table)
+    """
+    return(dict(list(table.groupby('entity_name', sort = False))))
+
+def run_captured(check, args):
+    """Run a check in a thread/process of a pool, keeping its messages instead of
+    printing them
+
+    Args:
+        check: function. The check
+        args: tuple. Arguments of check
+
+    Returns:
+        tuple, (output of check, list of messages)
+    """
+    messages = []
+    previous = (getattr(message_log, 'messages', None), getattr(message_log, 'echo', False))
+    message_log.messages, message_log.echo = messages, False
+    try:
+        return((check(*args), messages))
+    finally:
+        message_log.messages, message_log.echo = previous
+
+def run_batch(checks):
+    """Run a batch of checks in a thread/process of a pool, see run_captured()
+
+    Args:
+        checks: list of tuples, (function, tuple of arguments)
+
+    Returns:
+        list of the outputs of run_captured(), in the order of checks
+    """
+    return([run_captured(check, args) for check, args in checks])
+
+def run_entity_checks(checks):
+    """Run checks performed per entity, in a pool if entity_pool_workers() > 1.
+    The messages are printed in the order of checks, as without a pool
+
+    Args:
+        checks: list of tuples, (function, tuple of arguments). Each function
+            returns a number of warnings
+
+    Returns:
+        integer, total number of warnings
+
+    NOTES:
+        - The pool is started once per workbook by check_workbook() and
+          shared by its sections (entity_log). The checks are sent to it in
+          batches (entity_batches per worker), so that a process gets the rows
+          of many entities at once instead of one entity per task.
+        - When the workbook is checked with a state (incremental checks, see
+          call_section()), the number of warnings and the messages of a check
+          whose arguments (e.g. the rows of the entity) did not change since
+          the last check are taken from the state instead of running it again.
+    """
+    state = getattr(incremental_log, 'state', None)
+    executor = getattr(entity_log, 'executor', None)
+    if (state is None) & (((executor is None) & (entity_workers <= 1)) | (len(checks) < 2)):
+        return(sum([check(*args) for check, args in checks]))
+    keys, done = [None] * len(checks), {}
+    if state is not None:
+        entity_memo = state.setdefault('entities', {})
+        keys = [(check.__name__, fingerprint(args)) for check, args in checks]
+        done = dict([(n, entity_memo[k]) for n, k in enumerate(keys) if k in entity_memo])
+    to_run = [n for n in range(len(checks)) if n not in done]
+    # pool of the workbook (see check_workbook()), or a pool for these checks
+    # only when called on their own
+    own_executor = (executor is None) & (entity_workers > 1) & (len(to_run) > 1)
+    if own_executor:
+        executor = start_entity_pool()
+    if (executor is not None) & (len(to_run) > 1):
+        size = -(-len(to_run) // (entity_batches * entity_pool_workers()))
+        batches = [[checks[n] for n in to_run[k:k + size]] for k in range(0, len(to_run), size)]
+        outputs = (output for batch in executor.map(run_batch, batches) for output in batch)
+    else:
+        outputs = (run_captured(*checks[n]) for n in to_run)
+    warning_ctr = 0
+    try:
+        # results come back in the order of checks: an error is raised after
+        # the messages of the checks before it are printed, as without a pool
+        for n in range(len(checks)):
+            output, messages = done[n] if n in done else next(outputs)
+            for message in messages:
+                report(message)
+            warning_ctr += output
+            if state is not None:
+                # most recently used last, see entity_memo_size
+                entity_memo.pop(keys[n], None)
+                entity_memo[keys[n]] = (output, messages)
+    finally:
+        # cancel the checks not run yet if an error was raised
+        outputs.close()
+        if own_executor:
+            executor.shutdown()
+    if state is not None:
+        for k in list(entity_memo)[:max(0, len(entity_memo) - entity_memo_size)]:
+            del entity_memo[k]
+    return(warning_ctr)
+
+# =============================================================================
+# Incremental checks: a workbook checked again with the same state (see
+# check_workbook()) only runs the sections whose tables changed
+# =============================================================================
+# State of the workbook checked with a state in this thread, and the
+# fingerprints of the tables of its wb (key: (value, fingerprint))
+incremental_log = threading.local()
+# Maximum number of checks per entity whose results are kept in a state (the
+# least recently used are removed)
+entity_memo_size = 20000
+
+def fingerprint(value):
+    """Fingerprint of a table, or of any other value kept in wb or given to a
+    check
+
+    Args:
+        value: A pandas dataframe or series object, tuple/list of values, or any
+            value which can be pickled
+
+    Returns:
+        string, SHA-1 hex digest
+
+    NOTES:
+        - A table is hashed column by column, from the bytes of the values
+          (codes and categories of the dropdown columns) and the row numbers.
+          Columns of text and numbers are pickled, so that the type of each
+          cell is in the hash: 1 and '1' are different cells for the checks.
+          So are the cells of the numeric columns which are not numbers (see
+          invalid_numbers()).
+    """
+    h = hashlib.sha1()
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        table = value.to_frame() if isinstance(value, pd.Series) else value
+        h.update(pickle.dumps((type(value).__name__, table.index)))
+        for col, column in table.items():
+            values = column.values
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                h.update(pickle.dumps(list(column.cat.categories)))
+                values = column.cat.codes.values
+            h.update(pickle.dumps((col, str(column.dtype))))
+            if isinstance(values, np.ndarray) and (values.dtype != object):
+                h.update(np.ascontiguousarray(values).tobytes())
+            else:
+                h.update(pickle.dumps(values))
+        for col, cells in sorted(invalid_numbers(value).items()):
+            h.update(pickle.dumps((col, cells.index, cells.values)))
+    elif isinstance(value, (tuple, list)):
+        h.update(type(value).__name__.encode())
+        for v in value:
+            h.update(fingerprint(v).encode())
+    else:
+        h.update(pickle.dumps(value))
+    return(h.hexdigest())
+
+class TrackedTables(dict):
+    """Tables of a workbook (wb) given to a section by call_section(). Records
+    the tables the section reads (with their fingerprint before the section
+    changes them) and the tables it sets
+    """
+    def __init__(self, wb, known):
+        dict.__init__(self, wb)
+        self.known = known
+        self.inputs, self.written = {}, set()
+
+    def fingerprint(self, key):
+        """Fingerprint of wb[key] ('missing' if not in wb), computed once per
+        value unless the value is changed in place (see call_section())"""
+        if not dict.__contains__(self, key):
+            return('missing')
+        value = dict.__getitem__(self, key)
+        known = self.known.get(key)
+        if (known is None) or (known[0] is not value):
+            known = (value, fingerprint(value))
+            self.known[key] = known
+        return(known[1])
+
+    def read(self, key):
+        if (key not in self.inputs) & (key not in self.written):
+            self.inputs[key] = self.fingerprint(key)
+
+    def __getitem__(self, key):
+        self.read(key)
+        return(dict.__getitem__(self, key))
+
+    def get(self, key, default = None):
+        self.read(key)
+        return(dict.get(self, key, default))
+
+    def __contains__(self, key):
+        self.read(key)
+        return(dict.__contains__(self, key))
+
+    def __setitem__(self, key, value):
+        self.written.add(key)
+        dict.__setitem__(self, key, value)
+
+def call_section(section, check, args):
+    """Run a section of the checks. When the workbook is checked with a state
+    (see check_workbook()), the section is not run again if the tables it read
+    and its other arguments did not change since the last check: its messages
+    are printed again, and the tables it set or changed are set again in wb
+
+    Args:
+        section: string. Number of the section, e.g. '7.i.a'
+        check: function. The section
+        args: tuple. Arguments of check, wb first
+
+    Returns:
+        output of check
+    """
+    state = getattr(incremental_log, 'state', None)
+    if (state is None) or (len(args) == 0) or (not isinstance(args[0], dict)):
+        return(check(*args))
+    wb, known = args[0], incremental_log.fingerprints
+    tracked = TrackedTables(wb, known)
+    args_fingerprint = fingerprint(args[1:])
+    memo = state.setdefault('sections', {}).get(section)
+    if (memo is not None) and (memo['args'] == args_fingerprint) and \
+            all([tracked.fingerprint(key) == fp for key, fp in memo['inputs'].items()]):
+        for message in memo['messages']:
+            report(message)
+        for key, (fp, value) in memo['outputs'].items():
+            wb[key] = copy.deepcopy(value)
+            known[key] = (wb[key], fp)
+        return(copy.deepcopy(memo['output']))
+    messages = message_log.messages
+    n_messages = len(messages)
+    try:
+        output = check(tracked, *args[1:])
+    finally:
+        for key in tracked.written:
+            wb[key] = dict.__getitem__(tracked, key)
+    # tables set by the section, or read and changed in place
+    outputs = {}
+    for key in set(tracked.inputs) | tracked.written:
+        if dict.__contains__(tracked, key):
+            value = dict.__getitem__(tracked, key)
+            known[key] = (value, fingerprint(value))
+            if (key in tracked.written) or (known[key][1] != tracked.inputs[key]):
+                outputs[key] = (known[key][1], copy.deepcopy(value))
+    state['sections'][section] = {'args': args_fingerprint, 'inputs': tracked.inputs, 'outputs': outputs,
+                                  'messages': messages[n_messages:], 'output': copy.deepcopy(output)}
+    return(output)
+
+@profiled
+def count_values(tables, value):
+    """Count the number of occurences of a particular value in several tables
+
+    Args:
+        tables: list of (string, pandas dataframe) tuples. Name of each table
+            (to be printed in the summary) and the table with the data, or a
+            pandas series of the counts per column if already counted (see
+            stream_sample_sheet())
+        value: string, the value to count
+
+    Returns:
+        tuple of three: integer, total count of occurences of 'value' in all
+        tables; dictionary, count per table name; dictionary, for each table
+        name a dictionary of column name to count (only columns with at least
+        one occurence, in column order)
+
+    Raises:
+        None
+    """
+    table_count = {}
+    column_count = {}
+    for table_name, table in tables:
+        if isinstance(table, pd.Series):
+            col_ctr = table
+        else:
+            # compares the whole table at once, columns of other types are all False
+            col_ctr = (table == value).sum()
+            # cells of the numeric columns which are not numbers (see set_table_types())
+            for col, cells in invalid_numbers(table).items():
+                col_ctr[col] += (cells == value).sum()
+        col_ctr = col_ctr[col_ctr > 0]
+        column_count[table_name] = dict((col, int(ctr)) for col, ctr in col_ctr.items())
+        table_count[table_name] = int(col_ctr.sum())
+    return(sum(table_count.values()), table_count, column_count)
+
+@profiled
+def find_possible_hiatuses(table, depthcol, agecol, hiatuscol, depth_refs, modrefcol = 'modern_reference', na_rm = False):
+    """Find possible missing hiatuses, for all entities at once
+    
+    Args:
+        table: A pandas dataframe object. Table with the sample data.
+        depthcol: string, name of the depth column
+        agecol: string, name of the age column
+        hiatuscol: string, name of the hiatus column
+        depth_refs: dictionary, depth reference ('from top' or 'from base') of each entity_name
+        modrefcol: string, name of modern reference column 
+        na_rm: boolean, whether or not to remove rows with missing ages. (default to False)
+    
+    Returns:
+        dictionary keyed by entity_name. 'missing depths' if samples (not identified
+        as hiatuses) are missing depths, 'wrong depth_ref' if the depth_ref is not
+        'from top' or 'from base', or else a numpy array of the paired depths
+        (one pair per row) between which there is a possible unaccounted hiatus
+    
+    Raises:
+        None
+        
+    NOTES:
+        This function only works with the sample table and therefore there is no table_name argument
+        Within each entity, samples (not identified as hiatuses) are ordered by
+        depth. A pair of consecutive samples is flagged when its age step is at
+        least 5 times the mean age step of the entity, unless there is a sample
+        (e.g. a hiatus) of the entity between the two depths. All the pairs are
+        tested against the depths of the entities at once, with searchsorted.
+    """
+    if na_rm == True:
+        table = table.loc[notnull_cells(table[agecol]),:]
+    else:
+        pass
+    codes, entities = pd.factorize(table['entity_name'])
+    depths = table[depthcol].values
+    depths_num = pd.to_numeric(table[depthcol], errors = 'coerce').values.astype(float)
+    ages = pd.to_numeric(table[agecol], errors = 'coerce').values.astype(float)
+    ages = np.where((table[modrefcol] == 'CE/BCE').values, 1950 - ages, ages)
+    nohiat = (table[hiatuscol] == '').values # np.nan has been replaced with ''
+    # sign of the depths for the ordering of each entity, 0 if depth_ref is wrong
+    direction = np.array([{'from top': 1, 'from base': -1}.get(depth_refs.get(i), 0) for i in entities], dtype = int)
+    missing_depths = np.bincount(codes[nohiat & isnull_cells(table[depthcol]).values], minlength = len(entities)) > 0
+    possible_hiatuses = {}
+    for n in range(len(entities)):
+        if missing_depths[n]:
+            possible_hiatuses[entities[n]] = 'missing depths'
+        elif direction[n] == 0:
+            possible_hiatuses[entities[n]] = 'wrong depth_ref'
+        else:
+            possible_hiatuses[entities[n]] = np.empty((0, 2), dtype = depths.dtype)
+    # order the samples by entity, then depth (from top) or reversed depth (from base)
+    rows = np.flatnonzero(nohiat & (direction[codes] != 0) & ~missing_depths[codes])
+    rows = rows[np.lexsort((depths_num[rows] * direction[codes[rows]], codes[rows]))]
+    if len(rows) < 2:
+        return(possible_hiatuses)
+    code_sorted = codes[rows]
+    agediff = np.diff(ages[rows])
+    same_entity = code_sorted[1:] == code_sorted[:-1]
+    # mean age step of each entity (np.nan if an age is missing)
+    starts = np.flatnonzero(np.r_[True, code_sorted[1:] != code_sorted[:-1]])
+    ends = np.r_[starts[1:], len(rows)]
+    avg_agediff = np.full(len(entities), np.nan)
+    for start, end in zip(starts, ends):
+        if end - start > 1:
+            avg_agediff[code_sorted[start]] = np.mean(agediff[start:end - 1])
+    with np.errstate(invalid = 'ignore'):
+        diff_idx = np.flatnonzero(same_entity & (agediff >= avg_agediff[code_sorted[:-1]]*5))
+    if len(diff_idx) == 0:
+        return(possible_hiatuses)
+    pair_code = code_sorted[diff_idx]
+    depth1, depth2 = depths_num[rows[diff_idx]], depths_num[rows[diff_idx + 1]]
+    # count the samples of the same entity strictly between the paired depths:
+    # (entity, depth) are combined into one sorted integer key (rank of the depth)
+    other = np.flatnonzero(pd.notnull(table[hiatuscol]).values & ~np.isnan(depths_num))
+    uniq, ranks = np.unique(np.concatenate((depths_num[other], np.minimum(depth1, depth2), np.maximum(depth1, depth2))), return_inverse = True)
+    m = len(uniq) + 1
+    other_keys = np.sort(codes[other].astype(np.int64)*m + ranks[:len(other)])
+    low_keys = pair_code.astype(np.int64)*m + ranks[len(other):len(other) + len(diff_idx)]
+    high_keys = pair_code.astype(np.int64)*m + ranks[len(other) + len(diff_idx):]
+    between = np.searchsorted(other_keys, high_keys, 'left') - np.searchsorted(other_keys, low_keys, 'right')
+    keep = between == 0
+    for n in np.unique(pair_code[keep]):
+        idx = diff_idx[keep & (pair_code == n)]
+        possible_hiatuses[entities[n]] = np.column_stack((depths[rows[idx]], depths[rows[idx + 1]]))
+    return(possible_hiatuses)
+
+@profiled
+def report_possible_hiatuses(possible_hiatuses, depthcol, entity_name = ''):
+    """Print out the possible missing hiatuses of an entity found by find_possible_hiatuses
+    
+    Args:
+        possible_hiatuses: string or numpy array. Result of find_possible_hiatuses for the entity
+        depthcol: string, name of the depth column
+        entity_name: string, name of entity (to be printed in warnings)
+    
+    Returns:
+        integer, either 0 or 1
+    
+    Raises:
+        None
+    """
+    if isinstance(possible_hiatuses, str):
+        if possible_hiatuses == 'missing depths':
+            report('Sample data tab: Entity %s has samples (not identified as hiatuses) that are missing depths. Checks for possible hiatuses cannot be performed. Warning is issued' %entity_name)
+        else:
+            report('Entity metadata tab: The depth_ref chosen is not "from top" or "from base"')
+        return(1)
+    if (possible_hiatuses is not None) and (possible_hiatuses.shape[0] > 0):
+        depths = ' and '.join([str(list(j)).replace(',', ' and') for j in possible_hiatuses])
+        if entity_name != '':
+            entity_name = 'Entity %s; ' %entity_name
+        report('Informative: Sample data tab: %s There is a possible unaccounted hiatus between the following paired %s: %s ' %(entity_name, depthcol, depths))
+        return(0) # THIS IS CURRENTLY INFORMATIVE
+    else:
+        return(0)
+
+@profiled
+def find_age_inversions(table, depthcol, agecol, depth_refs, hiatuscol = None, modrefcol = None):
+    """Find the age inversions of all entities at once
+
+    Args:
+        table: A pandas dataframe object. Table with the data (all entities)
+        depthcol: string, name of the depth column
+        agecol: string, name of the age column
+        depth_refs: dictionary. depth_ref keyed by entity_name
+        hiatuscol: string, name of the hiatus column. If given, hiatuses are left out
+        modrefcol: string, name of the modern_reference column. If given, ages
+            in CE/BCE are converted to BP(1950)
+
+    Returns:
+        dictionary keyed by entity_name (entities with depth_ref "from top" or
+        "from base" and samples), tuple (mean age step, number of samples,
+        numpy array of the paired depths where the age does not increase)
+
+    Raises:
+        None
+
+    NOTES:
+        Samples with a depth that is not a number are left out. The samples of
+        all entities are ordered with one lexsort by entity, then by depth
+        (from top) or reversed depth (from base), so that the age steps of all
+        entities are taken with one np.diff.
+    """
+    codes, entities = pd.factorize(table['entity_name'])
+    depths = table[depthcol].values
+    depths_num = pd.to_numeric(table[depthcol], errors = 'coerce').values.astype(float)
+    ages = pd.to_numeric(table[agecol], errors = 'coerce').values.astype(float)
+    if modrefcol is not None:
+        ages = np.where((table[modrefcol] == 'CE/BCE').values, 1950 - ages, ages)
+    # sign of the depths for the ordering of each entity, 0 if depth_ref is wrong
+    direction = np.array([{'from top': 1, 'from base': -1}.get(depth_refs.get(i), 0) for i in entities], dtype = int)
+    keep = (codes >= 0) & ~np.isnan(depths_num)
+    keep[keep] = direction[codes[keep]] != 0
+    if hiatuscol is not None:
+        keep &= (table[hiatuscol] != 'H').values
+    rows = np.flatnonzero(keep)
+    rows = rows[np.lexsort((depths_num[rows] * direction[codes[rows]], codes[rows]))]
+    code_sorted = codes[rows]
+    agediff = np.diff(ages[rows])
+    with np.errstate(invalid = 'ignore'):
+        inverted = np.flatnonzero((agediff <= 0) & (code_sorted[1:] == code_sorted[:-1]))
+    starts = np.flatnonzero(np.r_[True, code_sorted[1:] != code_sorted[:-1]]) if len(rows) > 0 else np.zeros(0, dtype = int)
+    ends = np.r_[starts[1:], len(rows)]
+    # inverted steps of each entity
+    bounds = np.searchsorted(inverted, np.r_[starts, len(rows)])
+    age_inversions = {}
+    for n, (start, end) in enumerate(zip(starts, ends)):
+        idx = inverted[bounds[n]:bounds[n + 1]]
+        avg_agediff = np.mean(agediff[start:end - 1]) if end - start > 1 else np.nan
+        age_inversions[entities[code_sorted[start]]] = (avg_agediff, end - start, np.column_stack((depths[rows[idx]], depths[rows[idx + 1]])))
+    return(age_inversions)
+
+@profiled
+def report_age_inversions(age_inversions, depthcol, agecol, table_name, entity_name = ''):
+    """Print out the age inversions of an entity found by find_age_inversions
+
+    Args:
+        age_inversions: tuple. Result of find_age_inversions for the entity (None
+            if the entity has no samples)
+        depthcol: string, name of the depth column
+        agecol: string, name of the age column
+        table_name: string, name of table (to be printed in warnings)
+        entity_name: string, name of entity (to be printed in warnings)
+
+    Returns:
+        integer, either 0 or 1
+
+    Raises:
+        None
+    """
+    if age_inversions is None:
+        return(0)
+    avg_agediff, sample_count, paired_depths = age_inversions
+    if entity_name != '':
+        entity_name = 'Entity %s;' %entity_name
+    if (paired_depths.shape[0] + 1) == sample_count:
+        report('%s tab: %s depth_ref is likely wrong (all ages are inverted)' %(table_name, entity_name))
+        return(1)
+    elif paired_depths.shape[0] > 0:
+        depths = ' and '.join([str(list(j)).replace(',', ' and') for j in paired_depths])
+        report('%s tab: %s There is %s inversion at the following paired %s: %s ' %(table_name, entity_name, agecol, depthcol, depths))
+        return(1)
+    else:
+        return(0)
+
+@profiled
+def check_values2list(table, col_name, table_name, dropdownlist, na_rm = False):
+    """Check that values are from a list
+
+    Args:
+        table: A pandas dataframe object. Table with the data.
+        col_name: string. Name of column to check
+        table_name: string. Name of table (to be printed in warnings).
+        dropdownlist: list of string. List for the column to be checked against
+        na_rm: boolean. whether or not to accept NA
+
+    Returns:
+        integer, either 0 or 1
+
+    Raises:
+        None
+    """
+    if na_rm == True:
+        table = table.loc[notnull_cells(table[col_name]),:]
+    else:
+        pass
+    list_append = (table.index[not_in_list_mask(table[col_name], dropdownlist)] + 3).tolist()
+    if len(list_append) > 0:
+        report('%s tab: %s; %d row(s) contains values not in the dropdown lists. row: %s' %(table_name, col_name, len(list_append), str(list_append).replace('[', '').replace(']', '')))
+        return(1)
+    else:
+        return(0)
+
+@profiled
+def check_no_values(table, table_name, col_name, col_dtype_str_set = False):
+    """Check that there are no missing values in a column.
+
+    Args:
+        table: A pandas dataframe object. Table with the data.
+        table_name: string. Name of table (to be printed in warnings).
+        col_name: string. Name of column to check
+        col_dtype_str_set: boolean. True if np.nan has been replaced with ''
+
+    Returns:
+        integer, either 0 or 1
+
+    Raises:
+        None
+    """
+    idx = []
+    if (col_dtype_str_set == False):
+        idx = table.loc[isnull_cells(table[col_name]),:].index + 3
+    elif (col_dtype_str_set == True):
+        idx = table.loc[table[col_name] == ''].index + 3
+    if len(idx) > 0:
+        report('%s tab: %s; %d row(s) is missing. row: %s' %(table_name, col_name, len(idx), str(list(idx)).replace('[', '').replace(']', '')))
+        return(1)
+    else:
+        return(0)
+
+@profiled
+def check_independent_dependent_col(table, table_name, independent_column, dependent_column):
+    """Check that if there are values in one column, that a dependent column must also have values
+    
+    Args:
+        table: A pandas dataframe object. Table with the data.
+        table_name: string. Name of table (to be printed in warnings).
+        independent_column: string. Name of the independent column
+        dependent_column: string. Name of the dependent column
+
+    Returns:
+        integer, either 0 or 1
+        
+    Raises:
+        None
+    """
+    sub_tb = table.loc[isnull_cells(table[independent_column]) & notnull_cells(table[dependent_column]),:]
+    # +3 because values starts on row number 3
+    number_of_rows = sub_tb.shape[0]
+    ctr = False
+    if number_of_rows > 0:
+        Row_numbers = str([i for i in (sub_tb.index + 3)]).replace('[','').replace(']', '')
+        report('%s tab: %d row(s) have %s but no %s. See row(s) %s' %(table_name, number_of_rows, dependent_column, independent_column, Row_numbers))
+        ctr = True
+    if ctr == False:
+        return(0)
+    else:
+        return(1)
+
+@profiled
+def check_Isotope_Checks(table, independent_column, dependent_column1, dependent_column2):
+    sub_tb = table.loc[notnull_cells(table[independent_column]) & (isnull_cells(table[dependent_column1]) & isnull_cells(table[dependent_column2])),:]
+    # +3 because values starts on row number 3
+    number_of_rows = len(sub_tb.index)
+    if number_of_rows > 0:
+        report('Sample table tab: There is at least one row with isotope standard and no d13C or d18O measurement. Ensure that only isotope measurements have iso_std info. %d rows. See row(s): %s' %(number_of_rows, str(list(sub_tb.index + 3)).replace(']','').replace('[', '')) )
+        return(1)
+    else:
+        return(0)
+
+# Check that entity names in table exists in the Entity metadata spreadsheet
+@profiled
+def check_entity_names(entity_tb, table, tablename):
+    """Check that entity_name in table exists in the Entity metadata spreadsheet
+
+    Args:
+        entity_tb, A pandas dataframe object. Table with Entity metadata
+        table: A pandas dataframe object. Table with the data.
+        table_name: string. Name of table (to be printed in warnings).
+        
+    Returns:
+        integer, either 0 or 1
+
+    Raises:
+        None
+    """
+    entity_name_list = []
+    for i in np.unique(table['entity_name']):
+        if i not in list(entity_tb['entity_name']):
+            entity_name_list.append(str(i))
+    if len(entity_name_list) > 0:
+        report('Entity metadata tab: Entity %s is missing from the list (we have found it in the %s spreadsheet)' %(str(entity_name_list).replace('[', '').replace(']', ''),tablename))
+        return(1)
+    else:
+        return(0)
+
+@profiled
+def not_number_mask(column_values):
+    """Flag the cells of a column which are not numbers (np.nan counts as a number,
+    unless it was a cell which is not a number, see invalid_number_mask())
+
+    Args:
+        column_values: A pandas series object. Column with the data.
+
+    Returns:
+        numpy array of booleans, True where the cell is not a number
+
+    Raises:
+        None
+
+    NOTES:
+        Text that looks like a number (e.g. '12') is still text in the workbook
+        and is flagged, as it was when each cell was checked with isinstance.
+    """
+    if column_values.dtype.kind in 'biufc':
+        # cells which were not numbers are np.nan (see set_table_types())
+        return invalid_number_mask(column_values)
+    if column_values.dtype.kind in 'mM':
+        # column of dates/times (e.g. a cell formatted as a date in Excel)
+        return np.ones(len(column_values), dtype = bool)
+    coerced = pd.to_numeric(column_values, errors = 'coerce')
+    not_number = (coerced.isnull() & column_values.notnull()) | (column_values.map(type) == str)
+    return not_number.values
+
+class InvalidNumbers(dict):
+    """Cells of the numeric columns of a table which are not numbers, as read in
+    (pandas series keyed by column name, indexed by row), kept in
+    table.attrs['invalid_numbers'] by set_table_types(). The columns are float64
+    with np.nan in these cells. Not changed once set, so that it is shared by
+    the slices and copies of the table instead of being copied with them
+    """
+    def __deepcopy__(self, memo):
+        return(self)
+
+def invalid_numbers(values):
+    """Cells which are not numbers of the numeric columns of a table or column
+
+    Args:
+        values: A pandas dataframe or series object
+
+    Returns:
+        dictionary of pandas series objects keyed by column name (empty if
+        all the cells are numbers), only the rows of values
+    """
+    cells = values.attrs.get('invalid_numbers', {})
+    if isinstance(values, pd.Series):
+        cells = dict([(c, cells[c]) for c in [values.name] if c in cells])
+    else:
+        cells = dict([(c, cells[c]) for c in cells if c in values.columns])
+    return(dict([(c, v[v.index.isin(values.index)]) for c, v in cells.items()]))
+
+def invalid_number_mask(column_values):
+    """Flag the cells of a numeric column which are not numbers in the workbook
+    (np.nan in the column, see set_table_types())
+
+    Args:
+        column_values: A pandas series object. Column with the data.
+
+    Returns:
+        numpy array of booleans, True where the cell is not a number
+    """
+    cells = column_values.attrs.get('invalid_numbers', {}).get(column_values.name)
+    if cells is None:
+        return(np.zeros(len(column_values), dtype = bool))
+    return(column_values.index.isin(cells.index))
+
+def isnull_cells(values):
+    """pd.isnull() for the cells of a table or column, where the cells of the
+    numeric columns which are not numbers (np.nan, see invalid_number_mask())
+    are not missing
+
+    Args:
+        values: A pandas dataframe or series object, or a value
+
+    Returns:
+        same as pd.isnull()
+    """
+    missing = pd.isnull(values)
+    if isinstance(values, pd.Series):
+        missing = missing & ~invalid_number_mask(values)
+    elif isinstance(values, pd.DataFrame):
+        for c, cells in invalid_numbers(values).items():
+            missing[c] = missing[c] & ~values.index.isin(cells.index)
+    return(missing)
+
+def notnull_cells(values):
+    """pd.notnull() for the cells of a table or column, see isnull_cells()
+
+    Args:
+        values: A pandas dataframe or series object, or a value
+
+    Returns:
+        same as pd.notnull()
+    """
+    if isinstance(values, (pd.Series, pd.DataFrame)):
+        return(~isnull_cells(values))
+    return(pd.notnull(values))
+
+@profiled
+def not_in_list_mask(column_values, dropdownlist):
+    """Flag the cells of a column which are not from a list (np.nan is flagged)
+
+    Args:
+        column_values: A pandas series object. Column with the data.
+        dropdownlist: list of string. List for the column to be checked against
+
+    Returns:
+        numpy array of booleans, True where the cell is not from the list
+
+    Raises:
+        None
+
+    NOTES:
+        Dropdown columns are categoricals (see set_column_types()): only their
+        categories are looked up in the list, then the result is read off the
+        codes of the cells (code -1, np.nan, reads the appended False).
+    """
+    if isinstance(column_values.dtype, pd.CategoricalDtype):
+        in_list = np.append(column_values.cat.categories.isin(frozenset(dropdownlist)), False)
+        return ~in_list[column_values.cat.codes.values]
+    # one isin over the whole column instead of a lookup per row
+    return ~column_values.isin(frozenset(dropdownlist)).values
+
+# Check that column are only numbers
+@profiled
+def check_numbers(table, tablename, column):
+    """Check for non-numeric numbers in a column
+
+    Args:
+        table: A pandas dataframe object. Table with the data.
+        table_name: string. Name of table (to be printed in warnings).
+        col_name: string. Name of column
+        
+    Returns:
+        integer, either 0 or 1
+
+    Raises:
+        None
+    """
+    store_ls = table.index[not_number_mask(table[column])]
+    if len(store_ls) > 0:
+        store_ls_len = len(store_ls)
+        store_ls = str((store_ls + 3).tolist()).replace('[', '').replace(']', '')
+        report('%s tab: %s; %d row(s) is not a number. row: %s' %(tablename, column, store_ls_len, store_ls))
+        return(1)
+    else:
+        return(0)
+
+# check that there is only one record for each depth
+@profiled
+def find_repeated_records(table, column):
+    """Find the repeated values (to the nearest 6 d.p.) of each entity, for all entities at once
+    
+    Args:
+        table: A pandas dataframe object. Table with the data.
+        column: string. Name of column
+        
+    Returns:
+        dictionary keyed by entity_name, only for entities with repeated values:
+        tuple of (list of the repeated values (sorted), list of the lists of
+        row numbers of each repeated value)
+
+    Raises:
+        None
+    """
+    values = pd.to_numeric(table[column], errors = 'coerce')
+    values = values.loc[values.notnull()].round(6) # round to 6 dp first to prevent rounding issues
+    entities = table.loc[values.index, 'entity_name']
+    repeated = pd.DataFrame({'entity_name': entities.values, 'value': values.values}).duplicated(keep = False).values
+    repeated_records = {}
+    if repeated.any():
+        rows = pd.Series(values.index[repeated] + 3).groupby([entities.values[repeated], values.values[repeated]], sort = True).apply(list)
+        for (entity_name, value), rows_value in zip(rows.index.tolist(), rows.tolist()):
+            ls, col_number = repeated_records.setdefault(entity_name, ([], []))
+            ls.append(value)
+            col_number.append(rows_value)
+    return(repeated_records)
+
+@profiled
+def check_no_repeated_records(repeated_records, tablename, entity_name, column):
+    """Check that there are no repeated values in the database (to the nearest 6 d.p.)
+    
+    Args:
+        repeated_records: dictionary. Output of find_repeated_records for column
+        tablename: string. Name of table (to be printed in warnings).
+        entity_name: string. Name of entity
+        column: string. Name of column
+        
+    Returns:
+        integer, either 0 or 1
+
+    Raises:
+        None
+    """
+    if entity_name not in repeated_records:
+        return(0)
+    else:
+        ls, col_number = repeated_records[entity_name]
+        rep = str(ls)[1:-1]
+        report('%s tab: Entity %s; The following %s occured more than once: %s Row: %s' %(tablename, entity_name, column, rep, str(col_number)[1:-1]))
+        return(1)
+
+# Check that column are only numbers
+@profiled
+def check_positivenumbers(table, tablename, column, na_rm = False):
+    """Check if numbers positive
+
+    Args:
+        table: A pandas dataframe object. Table with the data.
+        tablename: string. Name of table (to be printed in warnings).
+        column: string. Name of column
+        na_rm: boolean. whether or not to accept NA
+        
+    Returns:
+        integer, either 0 or 1
+
+    Raises:
+        None
+    """
+    if na_rm == True:
+        table = table.loc[notnull_cells(table[column]),:]
+    else:
+        pass
+    # anything that is not numeric becomes np.nan and is flagged with the negatives
+    values = pd.to_numeric(table[column], errors = 'coerce')
+    store_ls = table.index[(values.isnull() | (values < 0)).values]
+    if len(store_ls) > 0:
+        store_ls_len = len(store_ls)
+        store_ls = str((store_ls + 3).tolist()).replace('[', '').replace(']', '')
+        report('%s tab: %s; %d row(s) is not a positive number (or not a number). row: %s' %(tablename, column, store_ls_len, store_ls))
+        return(1)
+    else:
         return(0)
                                
 # Check that if Modern_reference = year of chemistry that Year_done exist in dating information 
+@profiled
 def check_yearofchemistry_crosstable(sample_tb, dating_tb):
     """Cross check for chem_year when there is a year of chemistry. If both 
     tables are dating table, then it is allowed to have more than one chem_year
@@ -564,15 +2087,20 @@ def check_yearofchemistry_crosstable(sample_tb, dating_tb):
     sample_tb_subset = sample_tb.loc[sample_tb['modern_reference'] == 'Year of chemistry',:] #EDIT
     if sample_tb_subset.shape[0] > 0:
         warning_count = 0
+        dating_tb_sample_tb = False
+        if sample_tb is dating_tb:
+            dating_tb_sample_tb = True
+            # if referencing the same table (in case of using dating table), check references also for the dates which were not used in the original model
+            chem_rows = (dating_tb['modern_reference'] == 'Year of chemistry')
+        else:
+            # if referencing a different table (i.e. sample table to dating table), only refer to dates which were used in the original model
+            chem_rows = (dating_tb['modern_reference'] == 'Year of chemistry') & (dating_tb['date_used'] != 'no')
+        # chem_year of each entity, split once from the dating table (joined to the entities of sample_tb below)
+        chem_years = dating_tb.loc[chem_rows, 'chem_year']
+        chem_years = dict(list(chem_years.groupby(dating_tb.loc[chem_rows, 'entity_name'].values, sort = False)))
+        no_chem_year = dating_tb['chem_year'].values[:0]
         for i in np.unique(sample_tb_subset['entity_name']):
-            dating_tb_sample_tb = False
-            if sample_tb is dating_tb:
-                dating_tb_sample_tb = True
-                # if referencing the same table (in case of using dating table), check references also for the dates which were not used in the original model
-                unique_list = np.unique(dating_tb.loc[(dating_tb['entity_name'] == i) & (dating_tb['modern_reference'] == 'Year of chemistry'), 'chem_year'])
-            else:
-                # if referencing a different table (i.e. sample table to dating table), only refer to dates which were used in the original model
-                unique_list = np.unique(dating_tb.loc[(dating_tb['entity_name'] == i) & (dating_tb['modern_reference'] == 'Year of chemistry') & (dating_tb['date_used'] != 'no'), 'chem_year'])
+            unique_list = np.unique(chem_years[i].values if i in chem_years else no_chem_year)
             notnumber = False
             for k in unique_list:
                 if isinstance(k, Number):
@@ -586,43 +2114,44 @@ def check_yearofchemistry_crosstable(sample_tb, dating_tb):
                     break
             if (notnumber == True):
                 if (dating_tb_sample_tb == True):
-                    print('Dating information tab: Entity %s has chem_year which is not a finite number (or missing) where modern_reference is Year of chemistry.' %(i))
+                    report('Dating information tab: Entity %s has chem_year which is not a finite number (or missing) where modern_reference is Year of chemistry.' %(i))
                     warning_count += 1
                 else:
                     if (unique_list.shape[0] == 0):
                         warning_count += 1
-                        print('Dating information tab: Entity %s is missing chem_year where modern_reference is Year of chemistry.' %(i))
+                        report('Dating information tab: Entity %s is missing chem_year where modern_reference is Year of chemistry.' %(i))
                     elif (unique_list.shape[0] == 1):
                         warning_count += 1
-                        print('Dating information tab: Entity %s has chem_year which is not a finite number (or missing) where modern_reference is Year of chemistry.' %(i))
+                        report('Dating information tab: Entity %s has chem_year which is not a finite number (or missing) where modern_reference is Year of chemistry.' %(i))
                     else:
                         if (np.isfinite(unique_list).any()):
-                            print('Dating information tab: date_used = "yes"; Entity %s has more than one chem_year, not all of which are a finite number (or missing). This may also be flagged in other checks' %(i))
+                            report('Dating information tab: date_used = "yes"; Entity %s has more than one chem_year, not all of which are a finite number (or missing). This may also be flagged in other checks' %(i))
                             warning_count += 1
                         else:
                             warning_count += 1
-                            print('Dating information tab: Entity %s has more than one chem_year, all of which are not a finite number (or missing) where modern_reference is Year of chemistry.' %(i))
+                            report('Dating information tab: Entity %s has more than one chem_year, all of which are not a finite number (or missing) where modern_reference is Year of chemistry.' %(i))
             else:
                 if (dating_tb_sample_tb == True):
                     if (unique_list.shape[0] >= 1):
                         pass
                     else:
-                        print('Dating information tab: Entity %s is missing chem_year where modern_reference is Year of chemistry.' %(i))
+                        report('Dating information tab: Entity %s is missing chem_year where modern_reference is Year of chemistry.' %(i))
                         warning_count += 1
                 else:
                     if (unique_list.shape[0] == 1):
                         pass
                     elif (unique_list.shape[0] < 1):
-                        print('Dating information tab: Entity %s is missing chem_year in Dating Information spreadsheet (where date_used = "yes"). If chem_year exists in the workbook, it is likely that date_used = "no". Best practice is to convert all dates to the same modern reference manually' %(i))
+                        report('Dating information tab: Entity %s is missing chem_year in Dating Information spreadsheet (where date_used = "yes"). If chem_year exists in the workbook, it is likely that date_used = "no". Best practice is to convert all dates to the same modern reference manually' %(i))
                         warning_count += 1
                     else:
-                        print('Informative: Dating information tab: Entity %s has more than one chem_year. The youngest chem_year will be used when converting the database to BP(1950). Please check whether this is correct.' %(i))
+                        report('Informative: Dating information tab: Entity %s has more than one chem_year. The youngest chem_year will be used when converting the database to BP(1950). Please check whether this is correct.' %(i))
 #                        warning_count += 1
         return(warning_count)
     else:
         return(0)
 
         
+@profiled
 def check_notminmax_age(table, age, uncert1, uncert2, table_name, entity_name = '', na_rm = False):
     """Check if a set of values are not min/max ages in a column (age is inbetween or equal to the uncertaintites)
     
@@ -642,19 +2171,20 @@ def check_notminmax_age(table, age, uncert1, uncert2, table_name, entity_name =
         None
     """
     if na_rm == True:
-        table = table.loc[pd.notnull(table[uncert1]),:] # only uncert1 is required as there are other checks for the coexistence of both uncert1 and uncert2
+        table = table.loc[notnull_cells(table[uncert1]),:] # only uncert1 is required as there are other checks for the coexistence of both uncert1 and uncert2
     else:
         pass
     list_append = list(table.index[((table[age] <= table[uncert1]) & (table[age] >= table[uncert2])) | ((table[age] <= table[uncert2]) & (table[age] >= table[uncert1]))] + 3)
     if (len(list_append) > 1):
         if entity_name != '':
             entity_name = 'Entity %s;' %entity_name
-        print('%s tab; %s It looks like %s and %s have been entered as ranges (min/max) instead of uncertainties. %d row(s). row: %s' %(table_name, entity_name, uncert1, uncert2, len(list_append), str(list_append).replace('[', '').replace(']', '')))
+        report('%s tab; %s It looks like %s and %s have been entered as ranges (min/max) instead of uncertainties. %d row(s). row: %s' %(table_name, entity_name, uncert1, uncert2, len(list_append), str(list_append).replace('[', '').replace(']', '')))
         return(1)
     else:
         return(0)
         
         
+@profiled
 def check_numbers_in_range(table, tablename, column, minval, maxval, na_rm = False):
     """Check if numbers are in range in a column (assuming they are all numeric)
 
@@ -673,26 +2203,68 @@ def check_numbers_in_range(table, tablename, column, minval, maxval, na_rm = Fal
         None
     """
     if na_rm == True:
-        table = table.loc[pd.notnull(table[column]),:]
+        table = table.loc[notnull_cells(table[column]),:]
     else:
         pass
-    warning = False
-    store_ls = []
-    for i in table.index:
-        obj = table.loc[i, column]
-        if ((obj <= maxval) & (obj >= minval)):
-            pass
-        else:
-            warning = True
-            store_ls.append(i)
-    if warning == True:
+    # np.nan (missing or not numeric) fails both comparisons and is flagged
+    values = pd.to_numeric(table[column], errors = 'coerce')
+    store_ls = table.index[~((values <= maxval) & (values >= minval)).values]
+    if len(store_ls) > 0:
         store_ls_len = len(store_ls)
-        store_ls = str([i+3 for i in store_ls]).replace('[', '').replace(']', '')
-        print('%s table: %s; %d row(s) is not within the valid range (>=%.2f and <=%.2f) (or not a number). row: %s' %(tablename, column, store_ls_len, minval, maxval, store_ls))
+        store_ls = str((store_ls + 3).tolist()).replace('[', '').replace(']', '')
+        report('%s table: %s; %d row(s) is not within the valid range (>=%.2f and <=%.2f) (or not a number). row: %s' %(tablename, column, store_ls_len, minval, maxval, store_ls))
         return(1)
     else:
         return(0)
         
+# Values which are not a citation or a DOI (compared in lower case)
+reference_placeholders = ['unknown', '', ' ', 'n/a', 'na', 'not known', 'notknown', 'not applicable', 'unkwn']
+
+@profiled
+def placeholder_mask(column_values):
+    """Flag the cells which are a placeholder (reference_placeholders) or have
+    spaces before/after the text
+
+    Args:
+        column_values: A pandas series object. Column with the data (text).
+
+    Returns:
+        numpy array of booleans, True where the cell is incorrect
+
+    Raises:
+        None
+    """
+    text = column_values.astype(str)
+    return (text.str.lower().isin(frozenset(reference_placeholders)) | text.str.startswith(' ') | text.str.endswith(' ')).values
+
+@profiled
+def find_multiple_values(table, key_col, value_col):
+    """Group the rows of a table by the values of a column which occur more than
+    once, with the number of different values of another column in each group
+
+    Args:
+        table: A pandas dataframe object. Table with the data.
+        key_col: string. Name of the column to group by (e.g. citation)
+        value_col: string. Name of the column with the values (e.g. publication_DOI)
+
+    Returns:
+        tuple, (set of the values of key_col which occur more than once;
+        dictionary keyed by these values, tuple (number of different values
+        of value_col, index of the rows))
+    """
+    counts = table[key_col].value_counts()
+    repeated = set(counts[counts > 1].index)
+    groups = {}
+    if len(repeated) > 0:
+        subset = table.loc[table[key_col].isin(repeated).values, [key_col, value_col]]
+        grouped = subset.groupby(key_col, sort = False)
+        value_counts = grouped[value_col].nunique(dropna = False)
+        value_counts = dict(zip(value_counts.index, value_counts.values))
+        for key, rows in grouped.indices.items():
+            groups[key] = (value_counts[key], subset.index[rows])
+    return((repeated, groups))
+
+@profiled
 def check_hiatusgaps_columns(table, table_name, diagnosiscolumn, hiatusorgap, must_filled_columns, maybe_filled_columns = []):
     """Check that when a row is a hiatus, the other columns are filled in properly (i.e. some columns must be filled in while othesr must not)#
         
@@ -712,15 +2284,16 @@ def check_hiatusgaps_columns(table, table_name, diagnosiscolumn, hiatusorgap, mu
     """
     if hiatusorgap in list(table[diagnosiscolumn]):
         subset_tb = table.loc[(table[diagnosiscolumn] == hiatusorgap),:]
-        subset_tb = subset_tb.replace('', np.nan, regex=True)
-        hiatus_check = pd.isnull(subset_tb)
+        # empty cells: np.nan or '' (np.nan replaced by '' in text columns),
+        # compared per column so that categoricals keep their categories
+        hiatus_check = isnull_cells(subset_tb) | (subset_tb == '')
         if hiatus_check.shape[0] > 0:
             store_idx = np.array([])
             store_idx2 = np.array([])
             colname_empty = []
             colname_mustfill = []
             for i in hiatus_check.columns:
-#                print(i)
+#                report(i)
                 temp_tb = hiatus_check.loc[hiatus_check[i] == True,i]
                 temp_tb2 = hiatus_check.loc[hiatus_check[i] == False,i]
                 if i in must_filled_columns:
@@ -742,15 +2315,15 @@ def check_hiatusgaps_columns(table, table_name, diagnosiscolumn, hiatusorgap, mu
                 warning += 1
                 store_idx = list(set(store_idx.astype('int') + 3))
                 store_idx.sort()
-                print('%s tab: For %s, %s should be filled in but is empty. see row: %s' %(table_name, hiatusorgap, str(colname_mustfill).replace('[', '').replace(']', ''), str(store_idx).replace('[', '').replace(']', '')))
+                report('%s tab: For %s, %s should be filled in but is empty. see row: %s' %(table_name, hiatusorgap, str(colname_mustfill).replace('[', '').replace(']', ''), str(store_idx).replace('[', '').replace(']', '')))
             if len(store_idx2) > 0:
                 warning += 1
                 store_idx2 = list(set(store_idx2.astype('int') + 3))
                 store_idx2.sort()
                 if len(maybe_filled_columns) > 0:
-                    print('%s tab: For %s, There are columns which must be empty but are filled in. row: %s. see column(s): %s' %(table_name, hiatusorgap, str(store_idx2).replace('[', '').replace(']', ''), str(colname_empty).replace('[', '').replace(']', '')))
+                    report('%s tab: For %s, There are columns which must be empty but are filled in. row: %s. see column(s): %s' %(table_name, hiatusorgap, str(store_idx2).replace('[', '').replace(']', ''), str(colname_empty).replace('[', '').replace(']', '')))
                 else:
-                    print('%s tab: For %s, Only %s should be filled in. Other columns must be empty. see row: %s' %(table_name, hiatusorgap, str(must_filled_columns).replace('[', '').replace(']', ''), str(store_idx2).replace('[', '').replace(']', '')))
+                    report('%s tab: For %s, Only %s should be filled in. Other columns must be empty. see row: %s' %(table_name, hiatusorgap, str(must_filled_columns).replace('[', '').replace(']', ''), str(store_idx2).replace('[', '').replace(']', '')))
             if warning > 0:
                 return(warning)
             else:
@@ -761,66 +2334,356 @@ def check_hiatusgaps_columns(table, table_name, diagnosiscolumn, hiatusorgap, mu
     else:
         return(0)
 
+# Column rules: the checks above which are repeated on many columns of a table
+# are declared as data and checked in one scan of the table (check_rules()).
+# Each rule is a tuple:
+#   ('number', column): column must be numbers (check_numbers())
+#   ('positive', column, na_rm): column must be positive numbers (check_positivenumbers())
+#   ('number_positive', column, na_rm): 'number', then 'positive' if all are numbers
+#   ('paired', independent_column, dependent_column): check_independent_dependent_col()
+#   ('dropdown', column, dropdownlist, na_rm): check_values2list()
+#   ('hiatusgap', diagnosiscolumn, hiatusorgap, must_filled_columns, maybe_filled_columns):
+#       check_hiatusgaps_columns()
+def compile_rules(rules):
+    """Compile column rules into a plan: the features (missing, not a number,
+    numeric value) of each column are computed only once for all the rules
+
+    Args:
+        rules: list of tuples. Column rules (see above)
+
+    Returns:
+        dictionary with
+            'rules': list of tuples, rules
+            'missing': list of strings, columns whose missing values are needed
+            'number': list of strings, columns checked for non-numbers
+            'numeric': list of strings, columns whose numeric values are needed
+            'blank': boolean, True if empty cells of all columns are needed
+                ('hiatusgap' rules)
+
+    Raises:
+        ValueError: unknown rule
+    """
+    missing, number, numeric = [], [], []
+    for rule in rules:
+        if rule[0] == 'number':
+            number.append(rule[1])
+        elif rule[0] in ['positive', 'number_positive']:
+            numeric.append(rule[1])
+            missing.append(rule[1])
+            if rule[0] == 'number_positive':
+                number.append(rule[1])
+        elif rule[0] == 'paired':
+            missing += [rule[1], rule[2]]
+        elif rule[0] == 'dropdown':
+            missing.append(rule[1])
+        elif rule[0] != 'hiatusgap':
+            raise ValueError('Unknown column rule %s' %str(rule))
+    return({'rules': list(rules),
+            'missing': sorted(set(missing)), 'number': sorted(set(number)), 'numeric': sorted(set(numeric)),
+            'blank': any([rule[0] == 'hiatusgap' for rule in rules])})
+
+def evaluate_rules(table, plan):
+    """Evaluate the rules of a plan on a table: one row mask per rule (two for
+    'number_positive' and 'hiatusgap'), flagged together in one pass
+
+    Args:
+        table: A pandas dataframe object. Table with the data.
+        plan: dictionary. Output of compile_rules()
+
+    Returns:
+        tuple, (list of numpy arrays of booleans, True where a row breaks the
+        rule, in the order of the rules; numpy array of booleans, True for the
+        masks with at least one row; dictionary of the columns of each
+        'hiatusgap' mask which are filled in/empty where they should not be)
+    """
+    missing = dict([(c, isnull_cells(table[c]).values) for c in plan['missing']])
+    not_number = dict([(c, not_number_mask(table[c])) for c in plan['number']])
+    numeric = dict([(c, pd.to_numeric(table[c], errors = 'coerce').values) for c in plan['numeric']])
+    if plan['blank']:
+        # empty cells: np.nan or '' (np.nan replaced by '' in text columns)
+        blank = (isnull_cells(table) | (table == '')).values
+        columns = list(table.columns)
+    masks = []
+    hiatusgap_columns = {}
+    for rule in plan['rules']:
+        if rule[0] == 'number':
+            masks.append(not_number[rule[1]])
+        elif rule[0] in ['positive', 'number_positive']:
+            if rule[0] == 'number_positive':
+                masks.append(not_number[rule[1]])
+            # anything that is not numeric becomes np.nan and is flagged with the negatives
+            mask = pd.isnull(numeric[rule[1]]) | (numeric[rule[1]] < 0)
+            masks.append(mask & ~missing[rule[1]] if rule[2] else mask)
+        elif rule[0] == 'paired':
+            masks.append(missing[rule[1]] & ~missing[rule[2]])
+        elif rule[0] == 'dropdown':
+            mask = not_in_list_mask(table[rule[1]], rule[2])
+            masks.append(mask & ~missing[rule[1]] if rule[3] else mask)
+        elif rule[0] == 'hiatusgap':
+            rows = (table[rule[1]] == rule[2]).values
+            must = np.array([c in rule[3] for c in columns], dtype = bool)
+            empty = ~must & np.array([c not in rule[4] for c in columns], dtype = bool)
+            mustfill_cells = blank[rows][:, must]
+            empty_cells = ~blank[rows][:, empty]
+            hiatusgap_columns[len(masks)] = [str(c) for c, f in zip(np.array(columns, dtype = object)[must], mustfill_cells.any(axis = 0)) if f]
+            hiatusgap_columns[len(masks) + 1] = [str(c) for c, f in zip(np.array(columns, dtype = object)[empty], empty_cells.any(axis = 0)) if f]
+            mask = np.zeros(len(table.index), dtype = bool)
+            mask[rows] = mustfill_cells.any(axis = 1)
+            masks.append(mask)
+            mask = np.zeros(len(table.index), dtype = bool)
+            mask[rows] = empty_cells.any(axis = 1)
+            masks.append(mask)
+    if len(masks) == 0:
+        return((masks, np.zeros(0, dtype = bool), hiatusgap_columns))
+    return((masks, np.vstack(masks).any(axis = 1), hiatusgap_columns))
+
+@profiled
+def check_rules(table, table_name, plan):
+    """Check the column rules of a plan on a table. The warnings are the same,
+    and in the same order, as calling the checks of the rules one after the other
+
+    Args:
+        table: A pandas dataframe object. Table with the data.
+        table_name: string. Name of table (to be printed in warnings).
+        plan: dictionary. Output of compile_rules()
+
+    Returns:
+        integer, number of warnings
+    """
+    masks, flagged, hiatusgap_columns = evaluate_rules(table, plan)
+    rows = lambda n: (table.index[masks[n]] + 3).tolist()
+    row_list = lambda n: str(rows(n)).replace('[', '').replace(']', '')
+    # rows of hiatuses/gaps are sorted and listed once
+    sorted_row_list = lambda n: str(sorted(set(rows(n)))).replace('[', '').replace(']', '')
+    warning_ctr = 0
+    n = 0
+    for rule in plan['rules']:
+        if rule[0] in ['number', 'number_positive']:
+            if flagged[n]:
+                report('%s tab: %s; %d row(s) is not a number. row: %s' %(table_name, rule[1], len(rows(n)), row_list(n)))
+                warning_ctr += 1
+            n += 1
+        if rule[0] in ['positive', 'number_positive']:
+            # 'number_positive': positive numbers only checked if all are numbers
+            if flagged[n] & ((rule[0] == 'positive') | (not flagged[n - 1])):
+                report('%s tab: %s; %d row(s) is not a positive number (or not a number). row: %s' %(table_name, rule[1], len(rows(n)), row_list(n)))
+                warning_ctr += 1
+            n += 1
+        elif rule[0] == 'paired':
+            if flagged[n]:
+                report('%s tab: %d row(s) have %s but no %s. See row(s) %s' %(table_name, len(rows(n)), rule[2], rule[1], row_list(n)))
+                warning_ctr += 1
+            n += 1
+        elif rule[0] == 'dropdown':
+            if flagged[n]:
+                report('%s tab: %s; %d row(s) contains values not in the dropdown lists. row: %s' %(table_name, rule[1], len(rows(n)), row_list(n)))
+                warning_ctr += 1
+            n += 1
+        elif rule[0] == 'hiatusgap':
+            hiatusorgap = {'H': 'hiatuses', 'G': 'gaps'}.get(rule[2], rule[2])
+            if flagged[n]:
+                report('%s tab: For %s, %s should be filled in but is empty. see row: %s' %(table_name, hiatusorgap, str(hiatusgap_columns[n]).replace('[', '').replace(']', ''), sorted_row_list(n)))
+                warning_ctr += 1
+            if flagged[n + 1]:
+                if len(rule[4]) > 0:
+                    report('%s tab: For %s, There are columns which must be empty but are filled in. row: %s. see column(s): %s' %(table_name, hiatusorgap, sorted_row_list(n + 1), str(hiatusgap_columns[n + 1]).replace('[', '').replace(']', '')))
+                else:
+                    report('%s tab: For %s, Only %s should be filled in. Other columns must be empty. see row: %s' %(table_name, hiatusorgap, str(rule[3]).replace('[', '').replace(']', ''), sorted_row_list(n + 1)))
+                warning_ctr += 1
+            n += 2
+    return(warning_ctr)
+
 # =============================================================================
 # Section 5. Set columns data types
 # =============================================================================
-# set all np.nan to '' in columns which are non-numeric
-sample_tb.entity_name = sample_tb.entity_name.replace(np.nan, '', regex = True)
-sample_tb.modern_reference = sample_tb.modern_reference.replace(np.nan, '', regex = True)
-sample_tb.hiatus = sample_tb.hiatus.replace(np.nan, '', regex = True)
-sample_tb.gap = sample_tb.gap.replace(np.nan, '', regex = True)
-sample_tb.mineralogy = sample_tb.mineralogy.replace(np.nan, '', regex = True)
-sample_tb.arag_corr = sample_tb.arag_corr.replace(np.nan, '', regex = True)
-sample_tb.ann_lam_check = sample_tb.ann_lam_check.replace(np.nan, '', regex = True)
-sample_tb.dep_rate_check = sample_tb.dep_rate_check.replace(np.nan, '', regex = True)
-entity_tb.data_DOI_URL = entity_tb.data_DOI_URL.replace(np.nan, '', regex = True)
-entity_tb.entity_name = entity_tb.entity_name.replace(np.nan, '', regex = True)
-entity_tb.entity_status_notes = entity_tb.entity_status_notes.replace(np.nan, '', regex = True)
-ref_tb.entity_name = ref_tb.entity_name.replace(np.nan, '', regex = True)
-ref_tb.citation = ref_tb.citation.replace(np.nan, '', regex = True)
-ref_tb.publication_DOI = ref_tb.publication_DOI.replace(np.nan, '', regex = True)
-dating_tb.entity_name = dating_tb.entity_name.replace(np.nan, '', regex = True)
-dating_tb.date_used = dating_tb.date_used.replace(np.nan, '', regex = True)
-dating_tb.date_type = dating_tb.date_type.replace(np.nan, '', regex = True)
-dating_tb.calib_used = dating_tb.calib_used.replace(np.nan, '', regex = True)
-# convert all site and entity names to string
-# site_tb.site_name = site_tb.site_name.astype('str')
-if entity_tb.entity_name.dtype != 'O':
-    entity_tb.entity_name = entity_tb.entity_name.astype('str')
-if entity_tb.entity_status_notes.dtype != 'O':
-    entity_tb.entity_status_notes = entity_tb.entity_status_notes.astype('str')
-if dating_tb.entity_name.dtype != 'O':
-    dating_tb.entity_name = dating_tb.entity_name.astype('str')
-if dating_lamina_tb.entity_name.dtype != 'O':
-    dating_lamina_tb.entity_name = dating_lamina_tb.entity_name.astype('str')
-if sample_tb.entity_name.dtype != 'O':
-    sample_tb.entity_name = sample_tb.entity_name.astype('str')
-if ref_tb.entity_name.dtype != 'O':
-    ref_tb.entity_name = ref_tb.entity_name.astype('str')
-# convert everything in reference table to string
-# ref_tb.citation = ref_tb.citation.astype('str') # This cannot be converted to string as citation often contains some special characters.
-if ref_tb.publication_DOI.dtype != 'O':
-    ref_tb.publication_DOI = ref_tb.publication_DOI.astype('str')
+# Schema of the tables: how each column is loaded by set_column_types()
+#   'text': np.nan replaced by ''
+#   'number': numeric column (float64, the cells which are not numbers are kept
+#       in the attrs of the table for check_numbers(), see set_table_types())
+#   list: dropdown column, loaded as a categorical with the dropdown list as
+#       categories (values not in the list are kept as extra categories). If ''
+#       is in the list, np.nan is replaced by ''
+modern_reference_list = ['BP (1950)', 'b2k', 'CE/BCE', 'Year of chemistry']
+column_schema = {
+    'site': {'latitude': 'number', 'longitude': 'number', 'elevation': 'number',
+             'geology': ['limestone', 'dolomite', 'gypsum', 'magmatic', 'marble', 'granite', 'mixed', 'unknown', 'other'],
+             'rock_age': ['Holocene', 'Pleistocene', 'Pliocene', 'Miocene', 'Oligocene', 'Eocene', 'Palaeocene', 'Cretaceous', 'Jurassic', 'Triassic', 'Permian', 'Carboniferous', 'Devonian', 'Silurian', 'Ordovician', 'Cambrian', 'Precambrian', 'unknown'],
+             'monitoring': ['yes', 'no', 'unknown']},
+    'entity': dict([('entity_name', 'text'), ('entity_status_notes', 'text'), ('data_DOI_URL', 'text'),
+                    ('cover_thickness', 'number'), ('distance_entrance', 'number'),
+                    ('one_and_only', ['yes', 'no']),
+                    ('entity_status_info', ['completely supersedes', 'completely superseded by', 'partially supersedes', 'partially superseded by', 'not applicable']),
+                    ('depth_ref', ['from top', 'from base', 'not applicable']),
+                    ('speleothem_type', ['composite', 'stalagmite', 'stalactite', 'flowstone', 'other', 'unknown']),
+                    ('drip_type', ['seepage flow', 'seasonal drip', 'fast flow', 'mixture', 'unknown', 'not applicable'])] +
+                   [(c, ['yes', 'no', 'unknown']) for c in ['d13C', 'd18O', 'd18O_water_equilibrium', 'trace_elements', 'organics', 'fluid_inclusions',
+                                                             'mineralogy_petrology_fabric', 'clumped_isotopes', 'noble_gas_temperatures', 'C14', 'ODL', 'Mg_Ca']]),
+    'ref': {'entity_name': 'text', 'citation': 'text', 'publication_DOI': 'text'},
+    'dating': dict([('entity_name', 'text'),
+                    ('date_type', ['C14', 'MC-ICP-MS U/Th', 'ICP-MS U/Th Other', 'Alpha U/Th', 'TIMS', 'U/Th unspecified', 'Cross-dating', 'Multiple methods', 'Event; hiatus', 'Event; gap (composite record)', 'Event; actively forming', 'Event; start of laminations', 'Event; end of laminations', 'unknown', 'other', '']),
+                    ('date_used', ['yes', 'no', 'unknown', '']),
+                    ('calib_used', ['INTCAL13 NH', 'INTCAL13 SH', 'INTCAL13 marine', 'INTCAL09', 'INTCAL09 marine', 'INTCAL04 NH', 'INTCAL04 SH', 'INTCAL98', 'FAIRBANKS09', 'not calibrated', 'other', 'unknown', '']),
+                    ('material_dated', ['calcite', 'aragonite', 'organic', 'other', 'unknown']),
+                    ('decay_constant', ['Cheng et al. 2000', 'Cheng et al. 2013', 'Edwards et al. 1987', 'Ivanovich & Harmon 1992', 'other', 'unknown']),
+                    # CE/BCE ages are converted to BP(1950) by the checks
+                    ('modern_reference', modern_reference_list + ['BP(1950)'])] +
+                   [(c, 'number') for c in ['depth_dating', 'dating_thickness', 'min_weight', 'max_weight', 'uncorr_age', 'uncorr_age_uncert_pos', 'uncorr_age_uncert_neg',
+                                            '14C_correction', '238U_content', '238U_uncertainty', '232Th_content', '232Th_uncertainty', '230Th_content', '230Th_uncertainty',
+                                            '230Th_232Th_ratio', '230Th_232Th_ratio_uncertainty', '230Th_238U_activity', '230Th_238U_activity_uncertainty',
+                                            '234U_238U_activity', '234U_238U_activity_uncertainty', 'ini_230Th_232Th_ratio', 'ini_230Th_232Th_ratio_uncertainty',
+                                            'corr_age', 'corr_age_uncert_pos', 'corr_age_uncert_neg', 'chem_year']]),
+    'dating_lamina': dict([('modern_reference', modern_reference_list)] +
+                          [(c, 'number') for c in ['depth_lam', 'lam_thickness', 'lam_age', 'lam_age_uncert_pos', 'lam_age_uncert_neg']]),
+    'sample': dict([('entity_name', 'text'),
+                    ('hiatus', ['H', '']),
+                    ('gap', ['G', '']),
+                    ('mineralogy', ['calcite', 'secondary calcite', 'aragonite', 'vaterite', 'mixed', 'unknown', '']),
+                    ('arag_corr', ['yes', 'no', 'not applicable', 'unknown', '']),
+                    ('age_model_type', ['linear', 'linear between dates', 'polynomial fit', 'polynomial fit omitting outliers', 'Bayesian', 'Bayesian Bacon', 'Bayesian Bchron', 'StalAge', 'StalAge and other', 'Clam', 'COPRA', 'OxCal', 'combination of methods', 'unknown', 'other']),
+                    ('modern_reference', modern_reference_list + ['']),
+                    ('ann_lam_check', ['14C peak', '14C slope', 'U/Th cycle', 'trace element cycle', 'assumed', 'unknown', 'not applicable', 'other', '']),
+                    ('dep_rate_check', ['yes', 'no', 'assumed', 'unknown', 'not applicable', '']),
+                    ('iso_std', ['PDB', 'Vienna-PDB'])] +
+                   [(c, 'number') for c in ['depth_sample', 'interp_age', 'interp_age_uncert_pos', 'interp_age_uncert_neg', 'sample_thickness',
+                                            'd13C_measurement', 'd13C_precision', 'd18O_measurement', 'd18O_precision']])}
+
+def dropdown_column(column_values, dropdownlist):
+    """Convert a dropdown column to a categorical with the dropdown list as
+    categories, followed by the other values found in the column
+
+    Args:
+        column_values: A pandas series object. Column with the data.
+        dropdownlist: list of string. List for the column
+
+    Returns:
+        A pandas series object. The column as a categorical, or unchanged if it
+        has values which are not text (kept as read for the checks) or is
+        already a categorical of the dropdown list
+    """
+    if isinstance(column_values.dtype, pd.CategoricalDtype) and \
+       (list(column_values.cat.categories[:len(dropdownlist)]) == list(dropdownlist)):
+        return(column_values)
+    values = column_values[column_values.notnull()]
+    if not (values.map(type) == str).all():
+        return(column_values)
+    extra = [v for v in pd.unique(values) if v not in set(dropdownlist)]
+    return(column_values.astype(pd.CategoricalDtype(list(dropdownlist) + extra)))
+
+def set_table_types(table, key):
+    """Set the data types of the columns of a table as declared in column_schema
+    (dropdown columns as categoricals, numeric columns as float64, entity_name
+    as string). Used by load_workbook(), so that the checks and the upload of
+    the workbooks get the same tables. The table is modified in place
+
+    Args:
+        table: pandas dataframe object. Table read in
+        key: string. Key of the table in sheet_names
+
+    Returns:
+        None
+
+    NOTES:
+        - Missing columns are left out (see check_columns()), empty cells are
+          kept as np.nan.
+        - The cells of the numeric columns which are not numbers are np.nan,
+          and are kept as read in in table.attrs['invalid_numbers']
+          (InvalidNumbers), so that check_numbers() and the rules flag them
+          (see invalid_number_mask()) and isnull_cells() does not count them as
+          missing.
+    """
+    cells = InvalidNumbers(table.attrs.get('invalid_numbers', {}))
+    for col_name, col_type in column_schema[key].items():
+        if col_name not in table:
+            continue
+        if col_type == 'number':
+            if table[col_name].dtype.kind not in 'biuf':
+                invalid = not_number_mask(table[col_name])
+                if invalid.any():
+                    cells[col_name] = table[col_name][invalid]
+                table[col_name] = pd.to_numeric(table[col_name].astype(object).where(~invalid), errors = 'coerce').astype('float64')
+        elif col_type != 'text':
+            table[col_name] = dropdown_column(table[col_name], col_type)
+    if len(cells) > 0:
+        table.attrs['invalid_numbers'] = cells
+    # convert all site and entity names to string
+    # site_tb.site_name = site_tb.site_name.astype('str')
+    if ('entity_name' in table) and (table.entity_name.dtype != 'O'):
+        table['entity_name'] = table.entity_name.astype('str')
+
+def fill_empty_cells(table, key):
+    """Replace np.nan by '' in the text columns and in the dropdown columns which
+    can be left empty of a table (columns of column_schema which are missing are
+    left out). The table is modified in place
+
+    Args:
+        table: pandas dataframe object. Table read in
+        key: string. Key of the table in sheet_names
+
+    Returns:
+        None
+    """
+    for col_name, col_type in column_schema[key].items():
+        if (col_name in table) and ((col_type == 'text') or ((col_type != 'number') and ('' in col_type))):
+            # set all np.nan to '' in columns which are non-numeric
+            table[col_name] = table[col_name].fillna('')
+
+def set_column_types(wb):
+    """Set the data types of the columns as declared in column_schema (see
+    set_table_types()), replace np.nan by '' in text columns and in the dropdown
+    columns which can be left empty, and convert entity_status_notes and
+    publication_DOI to string. The tables of wb are modified in place
+
+    Args:
+        wb: dictionary of pandas dataframe objects. Tables of the workbook
+
+    Returns:
+        None
+
+    NOTES:
+        - The tables read in by load_workbook() already have their data types
+          set; set_table_types() leaves them as they are.
+    """
+    entity_tb, ref_tb = wb['entity'], wb['ref']
+    for key in sheet_names:
+        set_table_types(wb[key], key)
+        fill_empty_cells(wb[key], key)
+    if entity_tb.entity_status_notes.dtype != 'O':
+        entity_tb.entity_status_notes = entity_tb.entity_status_notes.astype('str')
+    # convert everything in reference table to string
+    # ref_tb.citation = ref_tb.citation.astype('str') # This cannot be converted to string as citation often contains some special characters.
+    if ref_tb.publication_DOI.dtype != 'O':
+        ref_tb.publication_DOI = ref_tb.publication_DOI.astype('str')
 
 # =============================================================================
 # Section 6. Count number of unknowns
 # =============================================================================
-# count number of unknowns in each table and print this at the end
-site_unkwn = count_values(site_tb, 'unknown')
-entity_unkwn = count_values(entity_tb, 'unknown')
-dating_unkwn = count_values(dating_tb, 'unknown')
-sample_unkwn = count_values(sample_tb, 'unknown')
-total_unkwn = site_unkwn + entity_unkwn + dating_unkwn + sample_unkwn
-entity_count = len(pd.unique(entity_tb['entity_name']))
+def count_unknowns(wb):
+    """Count the number of "unknown" in the Site metadata, Entity metadata,
+    Dating information and Sample data tables
+
+    Args:
+        wb: dictionary of pandas dataframe objects. Tables of the workbook
+
+    Returns:
+        tuple, (total count, count per table, count per column) as in count_values()
+
+    NOTES:
+        - The Sample data is counted as it is streamed if low_memory (wb['sample']
+          only has some of its rows, see stream_sample_sheet())
+    """
+    return(count_values([('site table', wb['site']),
+                         ('entity table', wb['entity']),
+                         ('dating information table', wb['dating']),
+                         ('sample table', wb.get('sample_unknowns', wb['sample']))], 'unknown'))
 
 # =============================================================================
 # 
 # # Section 7. Start content checking
 # 
 # =============================================================================
-# Initiate warning counter
-warning_ctr = 0
-
+# Each of the sections below is a function of the tables of the workbook (wb),
+# which prints out its warnings and returns the number of warnings. The
+# sections are run in the order of section_checks (end of Section 7).
 # _____________________________________________________________________________
 #
 # Section 7.i. Check for all entities/sites
@@ -831,988 +2694,1146 @@ y_n_nk_list = ['yes', 'no', 'unknown']
 # -----------------------------------------------------------------------------
 # Section 7.i.a. Site spreadsheet 
 # -----------------------------------------------------------------------------
-# Check that the site table has one and only one record
-if len(site_tb.index) != 1:
-    sys.exit('Site metadata table is either empty or has more than one site. Only one site per workbook is allowed.')
-else:
-    lat = site_tb.loc[0, 'latitude']
-    lon = site_tb.loc[0, 'longitude']
-    # Check that latitude, longitude and elevation are numbers
-    loc_warning = False
-    if check_numbers(site_tb, 'Site metadata', 'latitude') == 0:
-        if check_numbers_in_range(site_tb, 'Site metadata', 'latitude', -90, 90) == 1:
+def check_site_sheet(wb):
+    """Section 7.i.a. Checks on the Site metadata spreadsheet
+
+    Args:
+        wb: dictionary of pandas dataframe objects. Tables of the workbook
+
+    Returns:
+        integer, number of warnings
+    """
+    site_tb = wb['site']
+    warning_ctr = 0
+    # Check that the site table has one and only one record
+    if len(site_tb.index) != 1:
+        raise WorkbookError('Site metadata table is either empty or has more than one site. Only one site per workbook is allowed.')
+    else:
+        lat = site_tb.loc[0, 'latitude']
+        lon = site_tb.loc[0, 'longitude']
+        # Check that latitude, longitude and elevation are numbers
+        loc_warning = False
+        if check_numbers(site_tb, 'Site metadata', 'latitude') == 0:
+            if check_numbers_in_range(site_tb, 'Site metadata', 'latitude', -90, 90) == 1:
+                warning_ctr += 1
+                loc_warning = True
+        else:
             warning_ctr += 1
             loc_warning = True
-    else:
-        warning_ctr += 1
-        loc_warning = True
-    if check_numbers(site_tb, 'Site metadata', 'longitude') == 0:
-        if check_numbers_in_range(site_tb, 'Site metadata', 'longitude', -180, 180) == 1:
+        if check_numbers(site_tb, 'Site metadata', 'longitude') == 0:
+            if check_numbers_in_range(site_tb, 'Site metadata', 'longitude', -180, 180) == 1:
+                warning_ctr += 1
+                loc_warning = True
+        else:
             warning_ctr += 1
             loc_warning = True
-    else:
-        warning_ctr += 1
-        loc_warning = True
-    if loc_warning == True:
-        print('Site metadata tab: The coordinates for this site are definitely wrong, please check')
-    else:
-        print('Informative: Site metadata tab: This site is at Lat: %f deg and Lon: %f deg. Ensure that these have been properly converted to decimal degrees and are correct' %(lat, lon))
-    site_name = site_tb.loc[0, 'site_name'] 
-    if check_no_values(site_tb, 'Site metadata', 'site_name') == 0:
-        if site_name.startswith(' ') | site_name.endswith(' '):
+        if loc_warning == True:
+            report('Site metadata tab: The coordinates for this site are definitely wrong, please check')
+        else:
+            report('Informative: Site metadata tab: This site is at Lat: %f deg and Lon: %f deg. Ensure that these have been properly converted to decimal degrees and are correct' %(lat, lon))
+        site_name = site_tb.loc[0, 'site_name'] 
+        if check_no_values(site_tb, 'Site metadata', 'site_name') == 0:
+            if site_name.startswith(' ') | site_name.endswith(' '):
+                warning_ctr += 1
+                report('Site metadata tab: The site_name either starts or ends with a space. Please remove the extra space')
+        else:
             warning_ctr += 1
-            print('Site metadata tab: The site_name either starts or ends with a space. Please remove the extra space')
-    else:
-        warning_ctr += 1
-    # Check that entity name is being filled in the entity metadata spreadsheet
-#    if check_no_values(site_tb, 'Site metadata', 'elevation') == 1:
-    if len(site_tb.loc[pd.isnull(site_tb['elevation']), 'elevation'].index) > 0:
-#        warning_ctr += 1
-        print('Informative: Site metadata: elevation is missing. Please check and make sure that elevation is truly missing.')
-    else:
-        warning_ctr += check_numbers(site_tb, 'Site metadata', 'elevation')
-    # Check that if geology is filled in, and if so, that they are from a dropdown list
-    if check_no_values(site_tb, 'Site metadata', 'geology') == 0:
-        warning_ctr += check_values2list(site_tb, 'geology', 'Site metadata', ['limestone', 'dolomite', 'gypsum', 'magmatic', 'marble', 'granite', 'mixed', 'unknown', 'other'])
-    else:
-        warning_ctr += 1
-    if check_no_values(site_tb, 'Site metadata', 'rock_age') == 0:
-        warning_ctr += check_values2list(site_tb, 'rock_age', 'Site metadata', ['Holocene', 'Pleistocene', 'Pliocene', 'Miocene', 'Oligocene', 'Eocene', 'Palaeocene', 'Cretaceous', 'Jurassic', 'Triassic', 'Permian', 'Carboniferous', 'Devonian', 'Silurian', 'Ordovician', 'Cambrian', 'Precambrian', 'unknown'])
-    else:
-        warning_ctr += 1
-    if check_no_values(site_tb, 'Site metadata', 'monitoring') == 0:
-        warning_ctr += check_values2list(site_tb, 'monitoring', 'Site metadata', y_n_nk_list)
-    else:
-        warning_ctr += 1
-
+        # Check that entity name is being filled in the entity metadata spreadsheet
+    #    if check_no_values(site_tb, 'Site metadata', 'elevation') == 1:
+        if len(site_tb.loc[isnull_cells(site_tb['elevation']), 'elevation'].index) > 0:
+    #        warning_ctr += 1
+            report('Informative: Site metadata: elevation is missing. Please check and make sure that elevation is truly missing.')
+        else:
+            warning_ctr += check_numbers(site_tb, 'Site metadata', 'elevation')
+        # Check that if geology is filled in, and if so, that they are from a dropdown list
+        if check_no_values(site_tb, 'Site metadata', 'geology') == 0:
+            warning_ctr += check_values2list(site_tb, 'geology', 'Site metadata', ['limestone', 'dolomite', 'gypsum', 'magmatic', 'marble', 'granite', 'mixed', 'unknown', 'other'])
+        else:
+            warning_ctr += 1
+        if check_no_values(site_tb, 'Site metadata', 'rock_age') == 0:
+            warning_ctr += check_values2list(site_tb, 'rock_age', 'Site metadata', ['Holocene', 'Pleistocene', 'Pliocene', 'Miocene', 'Oligocene', 'Eocene', 'Palaeocene', 'Cretaceous', 'Jurassic', 'Triassic', 'Permian', 'Carboniferous', 'Devonian', 'Silurian', 'Ordovician', 'Cambrian', 'Precambrian', 'unknown'])
+        else:
+            warning_ctr += 1
+        if check_no_values(site_tb, 'Site metadata', 'monitoring') == 0:
+            warning_ctr += check_values2list(site_tb, 'monitoring', 'Site metadata', y_n_nk_list)
+        else:
+            warning_ctr += 1
+    return(warning_ctr)
 
 # -----------------------------------------------------------------------------
 # Section 7.i.b. Entity spreadsheet
 # -----------------------------------------------------------------------------
-if len(entity_tb.index) == 0:
-    sys.exit('Entity_metadata tab: There are no entities in this workbook. The checks will terminate here.') 
-if check_no_values(entity_tb, 'Entity metadata', 'entity_name') == 0:
-    for i in set(entity_tb['entity_name']):
-        if i.startswith(' ') | i.endswith(' '):
+def check_entity_sheet(wb):
+    """Section 7.i.b. Checks on the Entity metadata spreadsheet
+
+    Args:
+        wb: dictionary of pandas dataframe objects. Tables of the workbook
+
+    Returns:
+        integer, number of warnings
+    """
+    entity_tb = wb['entity']
+    warning_ctr = 0
+    if len(entity_tb.index) == 0:
+        raise WorkbookError('Entity_metadata tab: There are no entities in this workbook. The checks will terminate here.') 
+    if check_no_values(entity_tb, 'Entity metadata', 'entity_name') == 0:
+        for i in set(entity_tb['entity_name']):
+            if i.startswith(' ') | i.endswith(' '):
+                warning_ctr += 1
+                report('Entity metadata tab: The entity_name %s either starts or ends with a space. Please remove the extra space' %i)
+        ent_ls = list(entity_tb['entity_name'])
+        rep_ent = list(sorted(set([x for x in ent_ls if ent_ls.count(x) > 1]))) 
+        if len(rep_ent) > 0:
             warning_ctr += 1
-            print('Entity metadata tab: The entity_name %s either starts or ends with a space. Please remove the extra space' %i)
-    ent_ls = list(entity_tb['entity_name'])
-    rep_ent = list(sorted(set([x for x in ent_ls if ent_ls.count(x) > 1]))) 
-    if len(rep_ent) > 0:
-        warning_ctr += 1
-        sys.exit('Entity metadata tab: There are repeated entity_name(s): %s. The checking script cannot continue and will terminate here.' %str(list(rep_ent)).replace('[', '').replace(']', ''))
-else:
-    warning_ctr += 1
-if check_no_values(entity_tb, 'Entity metadata', 'speleothem_type') == 0: 
-    warning_ctr += check_values2list(entity_tb, 'speleothem_type', 'Entity metadata', ['composite', 'stalagmite', 'stalactite', 'flowstone', 'other', 'unknown'])
-else:
-    warning_ctr += 1
-if check_no_values(entity_tb, 'Entity metadata', 'depth_ref') == 0:
-    warning_ctr += check_values2list(entity_tb, 'depth_ref', 'Entity metadata', ['from top', 'from base', 'not applicable'])
-else:
-    warning_ctr += 1
-# Check that the values are from within the list
-warning_ctr += check_values2list(entity_tb, 'drip_type', 'Entity metadata', ['seepage flow', 'seasonal drip', 'fast flow', 'mixture', 'unknown', 'not applicable'])
-Entity_y_n_nk = ['d13C', 'd18O', 'd18O_water_equilibrium', 'trace_elements', 'organics', 'fluid_inclusions', 'mineralogy_petrology_fabric', 'clumped_isotopes', 'noble_gas_temperatures', 'C14', 'ODL', 'Mg_Ca']
-for i in Entity_y_n_nk:
-    if check_no_values(entity_tb, 'Entity metadata', i) == 0:
-        warning_ctr += check_values2list(entity_tb, i, 'Entity metadata', y_n_nk_list)
+            raise WorkbookError('Entity metadata tab: There are repeated entity_name(s): %s. The checking script cannot continue and will terminate here.' %str(list(rep_ent)).replace('[', '').replace(']', ''))
     else:
         warning_ctr += 1
-# Check that contact names are filled in properly
-
-for i in entity_tb.index:
-    contact = entity_tb['contact'][i]
-    if pd.isnull(contact):
-        print('Entity metadata tab: Contact_name in row %d is empty. Name and surname(s) are required' %(i + 3))
-        warning_ctr += 1
-        continue
-    elif isinstance(contact, Number):
-        print('Entity metadata tab: Contact_name in row %d is numeric instead of text. Name and surname(s) are required' %(i + 3))
-        warning_ctr += 1
-        continue
-    elif ' ' not in contact:
-        print('Entity metadata tab: Contact_name in row %d is only one word. Name and surname(s) are required' %(i + 3))
-        warning_ctr += 1
-        continue
-    elif contact.isspace() | contact.startswith(' ') | contact.endswith(' '):
-        print('Entity metadata tab: Contact_name in row %d is just spaces or starts and ends with spaces. Name and surname(s) are required' %(i + 3))
+    if check_no_values(entity_tb, 'Entity metadata', 'speleothem_type') == 0: 
+        warning_ctr += check_values2list(entity_tb, 'speleothem_type', 'Entity metadata', ['composite', 'stalagmite', 'stalactite', 'flowstone', 'other', 'unknown'])
+    else:
         warning_ctr += 1
-        continue
+    if check_no_values(entity_tb, 'Entity metadata', 'depth_ref') == 0:
+        warning_ctr += check_values2list(entity_tb, 'depth_ref', 'Entity metadata', ['from top', 'from base', 'not applicable'])
     else:
-        words = contact.split(' ')
-        countr = 0
-        # if name is two word long and one is initial, this is not accepted
-        # if this is a three worded name, one initial is accepted
-        if len(words) > 2:
-            threshold = 1
+        warning_ctr += 1
+    # Check that the values are from within the list
+    warning_ctr += check_values2list(entity_tb, 'drip_type', 'Entity metadata', ['seepage flow', 'seasonal drip', 'fast flow', 'mixture', 'unknown', 'not applicable'])
+    Entity_y_n_nk = ['d13C', 'd18O', 'd18O_water_equilibrium', 'trace_elements', 'organics', 'fluid_inclusions', 'mineralogy_petrology_fabric', 'clumped_isotopes', 'noble_gas_temperatures', 'C14', 'ODL', 'Mg_Ca']
+    for i in Entity_y_n_nk:
+        if check_no_values(entity_tb, 'Entity metadata', i) == 0:
+            warning_ctr += check_values2list(entity_tb, i, 'Entity metadata', y_n_nk_list)
         else:
-            threshold = 0
-        for j in words:
-            # Check for names with one letter length. Likely initials
-            if len(j) < 2:
-                countr += 1
-            # Check for initials with full stop at the end of their names
-            elif j.endswith('.'):
-                countr += 1
-        if countr > threshold:
-            print('Entity metadata tab: Contact_name in row %d seems to not fulfill the criteria of a full name. Name and surname(s) are required' %(i + 3))
             warning_ctr += 1
+    # Check that contact names are filled in properly
 
-# Check one and only
-if check_no_values(entity_tb, 'Entity metadata', 'one_and_only') == 0:
-    if check_values2list(entity_tb, 'one_and_only', 'Entity metadata', ['yes', 'no']) == 0:
-        if check_no_values(entity_tb, 'Entity metadata', 'entity_status_info') == 0:
-            if check_values2list(entity_tb, 'entity_status_info', 'Entity metadata', ['completely supersedes', 'completely superseded by', 'partially supersedes', 'partially superseded by', 'not applicable']) == 0:
-                one_and_only_entity = entity_tb.loc[(entity_tb['one_and_only'] == 'yes') & (entity_tb['entity_status_info'] != 'not applicable'),:]
-                if one_and_only_entity.shape[0] > 0:
-                    warning_ctr += 1
-                    print('Entity metadata tab: if one_and_only = "yes", entity_status_info must be "not applicable". See row %s' %(str([i+3 for i in one_and_only_entity.index]).replace('[', '').replace(']', '')))
-                one_and_only_entity = entity_tb.loc[(entity_tb['one_and_only'] == 'yes') & (entity_tb['entity_status_notes'] != ''),:]
-                if one_and_only_entity.shape[0] > 0:
-                    warning_ctr += 1
-                    print('Entity metadata tab: if one_and_only = "yes", entity_status_notes must be empty. See row %s' %(str([i+3 for i in one_and_only_entity.index]).replace('[', '').replace(']', '')))
-                not_one_and_only_ent = entity_tb.loc[(entity_tb['one_and_only'] == 'no'),:]
-                # Note that check_no_values was not used here as the checks are already 
-                # taken into account when creating the indices. '' already replaces
-                # np.nan and we do not allow '' anyways
-                indices = [i for i, s in enumerate(not_one_and_only_ent['entity_status_info']) if (any(x == s.lower() for x in ['not applicable']))]
-                not_one_and_only_ent = not_one_and_only_ent.iloc[indices,:]
-                if not_one_and_only_ent.shape[0] > 0:
-                    warning_ctr += 1
-                    print('Entity metadata tab: if one_and_only = "no", entity_status_info cannot be "not applicable". row number: %s' %(str([i+3 for i in not_one_and_only_ent.index]).replace('[', '').replace(']', ''))) 
-                indices = [i for i, s in enumerate(not_one_and_only_ent['entity_status_notes']) if (any(x == s.lower() for x in ['unknown', 'unknwn', '', ' ', 'n/a', 'na', 'not applicable', 'not known', 'notknown', 'unkwn'])) | s.isspace()]
-                not_one_and_only_ent = not_one_and_only_ent.iloc[indices,:]
-                if not_one_and_only_ent.shape[0] > 0:
-                    warning_ctr += 1
-                    print('Entity metadata tab: if one_and_only = "no", entity_status_notes cannot be empty, "NA", "unknown", "not known" (and their respective variants, see notes in SISAL_wb_checks GD document if required). row number: %s' %(str([i+3 for i in not_one_and_only_ent.index]).replace('[', '').replace(']', '')))
+    for i in entity_tb.index:
+        contact = entity_tb['contact'][i]
+        if pd.isnull(contact):
+            report('Entity metadata tab: Contact_name in row %d is empty. Name and surname(s) are required' %(i + 3))
+            warning_ctr += 1
+            continue
+        elif isinstance(contact, Number):
+            report('Entity metadata tab: Contact_name in row %d is numeric instead of text. Name and surname(s) are required' %(i + 3))
+            warning_ctr += 1
+            continue
+        elif ' ' not in contact:
+            report('Entity metadata tab: Contact_name in row %d is only one word. Name and surname(s) are required' %(i + 3))
+            warning_ctr += 1
+            continue
+        elif contact.isspace() | contact.startswith(' ') | contact.endswith(' '):
+            report('Entity metadata tab: Contact_name in row %d is just spaces or starts and ends with spaces. Name and surname(s) are required' %(i + 3))
+            warning_ctr += 1
+            continue
+        else:
+            words = contact.split(' ')
+            countr = 0
+            # if name is two word long and one is initial, this is not accepted
+            # if this is a three worded name, one initial is accepted
+            if len(words) > 2:
+                threshold = 1
+            else:
+                threshold = 0
+            for j in words:
+                # Check for names with one letter length. Likely initials
+                if len(j) < 2:
+                    countr += 1
+                # Check for initials with full stop at the end of their names
+                elif j.endswith('.'):
+                    countr += 1
+            if countr > threshold:
+                report('Entity metadata tab: Contact_name in row %d seems to not fulfill the criteria of a full name. Name and surname(s) are required' %(i + 3))
+                warning_ctr += 1
+
+    # Check one and only
+    if check_no_values(entity_tb, 'Entity metadata', 'one_and_only') == 0:
+        if check_values2list(entity_tb, 'one_and_only', 'Entity metadata', ['yes', 'no']) == 0:
+            if check_no_values(entity_tb, 'Entity metadata', 'entity_status_info') == 0:
+                if check_values2list(entity_tb, 'entity_status_info', 'Entity metadata', ['completely supersedes', 'completely superseded by', 'partially supersedes', 'partially superseded by', 'not applicable']) == 0:
+                    one_and_only_entity = entity_tb.loc[(entity_tb['one_and_only'] == 'yes') & (entity_tb['entity_status_info'] != 'not applicable'),:]
+                    if one_and_only_entity.shape[0] > 0:
+                        warning_ctr += 1
+                        report('Entity metadata tab: if one_and_only = "yes", entity_status_info must be "not applicable". See row %s' %(str([i+3 for i in one_and_only_entity.index]).replace('[', '').replace(']', '')))
+                    one_and_only_entity = entity_tb.loc[(entity_tb['one_and_only'] == 'yes') & (entity_tb['entity_status_notes'] != ''),:]
+                    if one_and_only_entity.shape[0] > 0:
+                        warning_ctr += 1
+                        report('Entity metadata tab: if one_and_only = "yes", entity_status_notes must be empty. See row %s' %(str([i+3 for i in one_and_only_entity.index]).replace('[', '').replace(']', '')))
+                    not_one_and_only_ent = entity_tb.loc[(entity_tb['one_and_only'] == 'no'),:]
+                    # Note that check_no_values was not used here as the checks are already 
+                    # taken into account when creating the indices. '' already replaces
+                    # np.nan and we do not allow '' anyways
+                    indices = [i for i, s in enumerate(not_one_and_only_ent['entity_status_info']) if (any(x == s.lower() for x in ['not applicable']))]
+                    not_one_and_only_ent = not_one_and_only_ent.iloc[indices,:]
+                    if not_one_and_only_ent.shape[0] > 0:
+                        warning_ctr += 1
+                        report('Entity metadata tab: if one_and_only = "no", entity_status_info cannot be "not applicable". row number: %s' %(str([i+3 for i in not_one_and_only_ent.index]).replace('[', '').replace(']', ''))) 
+                    indices = [i for i, s in enumerate(not_one_and_only_ent['entity_status_notes']) if (any(x == s.lower() for x in ['unknown', 'unknwn', '', ' ', 'n/a', 'na', 'not applicable', 'not known', 'notknown', 'unkwn'])) | s.isspace()]
+                    not_one_and_only_ent = not_one_and_only_ent.iloc[indices,:]
+                    if not_one_and_only_ent.shape[0] > 0:
+                        warning_ctr += 1
+                        report('Entity metadata tab: if one_and_only = "no", entity_status_notes cannot be empty, "NA", "unknown", "not known" (and their respective variants, see notes in SISAL_wb_checks GD document if required). row number: %s' %(str([i+3 for i in not_one_and_only_ent.index]).replace('[', '').replace(']', '')))
 
+                else:
+                    warning_ctr += 1
             else:
                 warning_ctr += 1
         else:
             warning_ctr += 1
     else:
         warning_ctr += 1
-else:
-    warning_ctr += 1
-
-# Check that the number columns are filled in properly
-warning_ctr += check_numbers(entity_tb, 'Entity metadata', 'cover_thickness')
-warning_ctr += check_numbers(entity_tb, 'Entity metadata', 'distance_entrance')
-# Check that data_DOI_URL are entered properly. Either empty or an actual URL/DOI
-indices = [i for i, s in enumerate(entity_tb['data_DOI_URL']) if (any(x == s.lower() for x in ['unknown', ' ', 'n/a', 'na', 'not known', 'notknown', 'not applicable', 'unkwn'])) | s.startswith(' ') | s.endswith(' ')]
-indices = entity_tb.iloc[indices,:].index + 3
-if len(indices) > 0:
-    warning_ctr += 1
-    print('Entity metadata tab: the NOAA/PANGEA URL or DOI of the data in row %s is incorrect. This cannot be "unknown", "N/A", "not known", etc. or have spaces before/after the text. It must either be the URL/DOI or just empty (as is expected in most cases)' %str(list(indices)))
-else:
-    # Check that data_DOI_URL starts with http, 10. or ftp.
-    entity_tb_s = entity_tb.loc[entity_tb['data_DOI_URL'] != '',:]
-    indices = [i for i, s in enumerate(entity_tb_s['data_DOI_URL']) if not (s.startswith('10.') | s.startswith('ftp') | s.startswith('http'))]
-    indices = entity_tb_s.iloc[indices,:].index + 3
+
+    # Check that the number columns are filled in properly
+    warning_ctr += check_numbers(entity_tb, 'Entity metadata', 'cover_thickness')
+    warning_ctr += check_numbers(entity_tb, 'Entity metadata', 'distance_entrance')
+    # Check that data_DOI_URL are entered properly. Either empty or an actual URL/DOI
+    indices = [i for i, s in enumerate(entity_tb['data_DOI_URL']) if (any(x == s.lower() for x in ['unknown', ' ', 'n/a', 'na', 'not known', 'notknown', 'not applicable', 'unkwn'])) | s.startswith(' ') | s.endswith(' ')]
+    indices = entity_tb.iloc[indices,:].index + 3
     if len(indices) > 0:
         warning_ctr += 1
-        print('Entity metadata tab: the NOAA/PANGEA URL or DOI of the data in row %s is incorrect. The URL or DOI must start with either "10.", "ftp", or "http".' %str(list(indices))) 
+        report('Entity metadata tab: the NOAA/PANGEA URL or DOI of the data in row %s is incorrect. This cannot be "unknown", "N/A", "not known", etc. or have spaces before/after the text. It must either be the URL/DOI or just empty (as is expected in most cases)' %str(list(indices)))
+    else:
+        # Check that data_DOI_URL starts with http, 10. or ftp.
+        entity_tb_s = entity_tb.loc[entity_tb['data_DOI_URL'] != '',:]
+        indices = [i for i, s in enumerate(entity_tb_s['data_DOI_URL']) if not (s.startswith('10.') | s.startswith('ftp') | s.startswith('http'))]
+        indices = entity_tb_s.iloc[indices,:].index + 3
+        if len(indices) > 0:
+            warning_ctr += 1
+            report('Entity metadata tab: the NOAA/PANGEA URL or DOI of the data in row %s is incorrect. The URL or DOI must start with either "10.", "ftp", or "http".' %str(list(indices))) 
+    return(warning_ctr)
+
+def sample_columns(wb):
+    """Sample data table with all its rows, for the checks which only need
+    sample_key_columns (e.g. depth ranges, repeated depths and age inversions)
 
+    Args:
+        wb: dictionary of pandas dataframe objects. Tables of the workbook
+
+    Returns:
+        A pandas dataframe object. wb['sample_columns'] if the Sample data was
+        streamed (see stream_sample_sheet()), wb['sample'] otherwise
+    """
+    return(wb.get('sample_columns', wb['sample']))
 
 # -----------------------------------------------------------------------------
 # Section 7.i.c. Sample spreadsheet   
 # -----------------------------------------------------------------------------
-warning_ctr += check_values2list(sample_tb, 'hiatus', 'Sample data', ['H', ''], na_rm = True)  # added '' as np.nan was replaced by ''
-warning_ctr += check_values2list(sample_tb, 'gap', 'Sample data', ['G', ''], na_rm = True)  # added '' as np.nan was replaced by ''
-ent_ls = []
-for i in entity_tb.index:
-    ent_name = entity_tb['entity_name'][i]
-    sample_tb_s = sample_tb.loc[sample_tb['entity_name'] == ent_name,:]
-    if len(sample_tb_s.index) == 0:
-        ent_ls.append(ent_name)
-if len(ent_ls) > 0:
-    warning_ctr += 1
-    print('Sample data tab: Entity %s has no Sample data. This will only be accepted if this entity is part of a composite and its isotope data is to be submitted to SISAL soon. If this is the case (and no other warnings are issued), you can move the file into the Checked folder manually.' %str(ent_ls).replace('[','').replace(']','')) 
-
+def check_sample_sheet_all(wb):
+    """Section 7.i.c. Checks on the Sample data spreadsheet (all entities)
 
+    Args:
+        wb: dictionary of pandas dataframe objects. Tables of the workbook
 
+    Returns:
+        integer, number of warnings
+    """
+    entity_tb, sample_tb = wb['entity'], wb['sample']
+    warning_ctr = 0
+    warning_ctr += check_values2list(sample_tb, 'hiatus', 'Sample data', ['H', ''], na_rm = True)  # added '' as np.nan was replaced by ''
+    warning_ctr += check_values2list(sample_tb, 'gap', 'Sample data', ['G', ''], na_rm = True)  # added '' as np.nan was replaced by ''
+    # entities with no rows in the Sample data table
+    ent_ls = list(entity_tb.loc[~entity_tb['entity_name'].isin(sample_columns(wb)['entity_name']), 'entity_name'])
+    if len(ent_ls) > 0:
+        warning_ctr += 1
+        report('Sample data tab: Entity %s has no Sample data. This will only be accepted if this entity is part of a composite and its isotope data is to be submitted to SISAL soon. If this is the case (and no other warnings are issued), you can move the file into the Checked folder manually.' %str(ent_ls).replace('[','').replace(']','')) 
+    return(warning_ctr)
 
 # _____________________________________________________________________________
 #
 # Section 7.ii. Check for composites
 # _____________________________________________________________________________
-if 'composite' in list(entity_tb['speleothem_type']):
-    print('Informative: Notes tab: There is a composite in this workbook. Please list the entity_names/references (or entity_id if already in SISAL) of the records used to construct this composite in the Notes tab.')
-ent_ls2 = []
-for i in entity_tb.index:
-    ent_name = entity_tb['entity_name'][i]
-    speleothem_type = entity_tb['speleothem_type'][i]
-    drip_type = entity_tb['drip_type'][i]
-    dating_tb_s = dating_tb.loc[dating_tb['entity_name'] == ent_name,:]
-    if speleothem_type == 'composite':
-        print('Entity %s is a composite, checks will be done separatley. Ensure that individual records forming this composite are listed in the Notes tab.' %ent_name)
-        if drip_type != 'not applicable':
-            warning_ctr += 1
-            print('Entity metadata tab: Entity %s is a composite. Drip type must be "not applicable".' %ent_name) 
-        dating_tb_composite = dating_tb.loc[dating_tb['entity_name'] == ent_name,:]
-        sample_tb_composite = sample_tb.loc[sample_tb['entity_name'] == ent_name,:]
-        dating_lamina_tb_composite = dating_lamina_tb.loc[dating_lamina_tb['entity_name'] == ent_name,:]
-        dating_tb = dating_tb.loc[dating_tb['entity_name'] != ent_name,:]
-        sample_tb = sample_tb.loc[sample_tb['entity_name'] != ent_name,:]
-        dating_lamina_tb = dating_lamina_tb.loc[dating_lamina_tb['entity_name'] != ent_name,:]
-        # ---------------------------------------------------------------------
-        # Section 7.ii.a. Sample spreadsheet
-        # ---------------------------------------------------------------------
-        warning_ctr += check_no_values(sample_tb_composite, 'Sample data', 'entity_name')
-        warning_ctr += check_hiatusgaps_columns(sample_tb_composite, 'Sample data', 'gap', 'G', ['entity_name', 'gap'])
-        sample_tb_composite_rm_gap = sample_tb_composite[(sample_tb_composite['gap'] == '')]
-        a = check_no_values(sample_tb_composite_rm_gap, 'Sample data', 'modern_reference')  
-        b = check_values2list(sample_tb_composite_rm_gap, 'modern_reference', 'Sample data', ['BP (1950)', 'b2k', 'CE/BCE', 'Year of chemistry'])
-        warning_ctr += a + b
-        if check_no_values(sample_tb_composite_rm_gap, 'Sample data', 'interp_age') == 0:
-            if check_numbers(sample_tb_composite_rm_gap, 'Sample data', 'interp_age') == 0:
-                if check_independent_dependent_col(sample_tb_composite_rm_gap, 'Sample data', 'interp_age', 'interp_age_uncert_pos') == 0:
-                    if check_independent_dependent_col(sample_tb_composite_rm_gap, 'Sample data', 'interp_age', 'interp_age_uncert_neg') == 0:
-                        if check_positivenumbers(sample_tb_composite_rm_gap, 'Sample data', 'interp_age_uncert_pos', na_rm = True) == 0:
-                            if check_positivenumbers(sample_tb_composite_rm_gap, 'Sample data', 'interp_age_uncert_neg', na_rm = True) == 0:
-                                check_notminmax_age(sample_tb_composite_rm_gap, 'interp_age', 'interp_age_uncert_pos', 'interp_age_uncert_neg', 'Sample', ent_name)
+def check_composites(wb):
+    """Section 7.ii. Checks on composites. Rows of composites are removed from
+    the Dating information, Sample data and Lamina age vs depth tables in wb
+
+    Args:
+        wb: dictionary of pandas dataframe objects. Tables of the workbook
+
+    Returns:
+        integer, number of warnings
+    """
+    entity_tb, sample_tb = wb['entity'], wb['sample']
+    dating_tb, dating_lamina_tb = wb['dating'], wb['dating_lamina']
+    warning_ctr = 0
+    if 'composite' in list(entity_tb['speleothem_type']):
+        report('Informative: Notes tab: There is a composite in this workbook. Please list the entity_names/references (or entity_id if already in SISAL) of the records used to construct this composite in the Notes tab.')
+    ent_ls2 = []
+    # tables split per entity once; rows of composites are removed after the loop
+    dating_parts = partition_by_entity(dating_tb)
+    sample_parts = partition_by_entity(sample_tb)
+    dating_lamina_parts = partition_by_entity(dating_lamina_tb)
+    composites = []
+    for i in entity_tb.index:
+        ent_name = entity_tb['entity_name'][i]
+        speleothem_type = entity_tb['speleothem_type'][i]
+        drip_type = entity_tb['drip_type'][i]
+        dating_tb_s = dating_parts.get(ent_name, dating_tb.iloc[:0])
+        if speleothem_type == 'composite':
+            report('Entity %s is a composite, checks will be done separatley. Ensure that individual records forming this composite are listed in the Notes tab.' %ent_name)
+            if drip_type != 'not applicable':
+                warning_ctr += 1
+                report('Entity metadata tab: Entity %s is a composite. Drip type must be "not applicable".' %ent_name) 
+            dating_tb_composite = dating_parts.get(ent_name, dating_tb.iloc[:0])
+            sample_tb_composite = sample_parts.get(ent_name, sample_tb.iloc[:0])
+            dating_lamina_tb_composite = dating_lamina_parts.get(ent_name, dating_lamina_tb.iloc[:0])
+            composites.append(ent_name)
+            # ---------------------------------------------------------------------
+            # Section 7.ii.a. Sample spreadsheet
+            # ---------------------------------------------------------------------
+            warning_ctr += check_no_values(sample_tb_composite, 'Sample data', 'entity_name')
+            warning_ctr += check_hiatusgaps_columns(sample_tb_composite, 'Sample data', 'gap', 'G', ['entity_name', 'gap'])
+            sample_tb_composite_rm_gap = sample_tb_composite[(sample_tb_composite['gap'] == '')]
+            a = check_no_values(sample_tb_composite_rm_gap, 'Sample data', 'modern_reference')  
+            b = check_values2list(sample_tb_composite_rm_gap, 'modern_reference', 'Sample data', ['BP (1950)', 'b2k', 'CE/BCE', 'Year of chemistry'])
+            warning_ctr += a + b
+            if check_no_values(sample_tb_composite_rm_gap, 'Sample data', 'interp_age') == 0:
+                if check_numbers(sample_tb_composite_rm_gap, 'Sample data', 'interp_age') == 0:
+                    if check_independent_dependent_col(sample_tb_composite_rm_gap, 'Sample data', 'interp_age', 'interp_age_uncert_pos') == 0:
+                        if check_independent_dependent_col(sample_tb_composite_rm_gap, 'Sample data', 'interp_age', 'interp_age_uncert_neg') == 0:
+                            if check_positivenumbers(sample_tb_composite_rm_gap, 'Sample data', 'interp_age_uncert_pos', na_rm = True) == 0:
+                                if check_positivenumbers(sample_tb_composite_rm_gap, 'Sample data', 'interp_age_uncert_neg', na_rm = True) == 0:
+                                    check_notminmax_age(sample_tb_composite_rm_gap, 'interp_age', 'interp_age_uncert_pos', 'interp_age_uncert_neg', 'Sample', ent_name)
+                                else:
+                                    warning_ctr += 1
                             else:
                                 warning_ctr += 1
                         else:
                             warning_ctr += 1
                     else:
                         warning_ctr += 1
+                    if a == 0:
+                        if b == 0:
+                            # convert to CE/BCE to BP(1950) first
+                            sample_tb_composite_rm_gap.loc[sample_tb_composite_rm_gap['modern_reference'] == 'CE/BCE', 'interp_age'] = 1950 - sample_tb_composite_rm_gap.loc[sample_tb_composite_rm_gap['modern_reference'] == 'CE/BCE', 'interp_age'] 
+                            warning_ctr += check_numbers_in_range(sample_tb_composite_rm_gap, 'Sample table', 'interp_age', -70, np.inf)
+                            # Check if Sample data Modern_reference == 'Year of chemistry' that Year_done is filled in for the same entity in the Dating_information 
+                            try:
+                                warning_ctr += check_yearofchemistry_crosstable(sample_tb_composite_rm_gap.loc[sample_tb_composite_rm_gap['modern_reference'] == 'Year of chemistry',:], dating_tb_composite)
+                            except:
+                                warning_ctr += 1
+                                report('Dating information and Sample data tab (composite entity): There is a problem checking chem_year when modern_reference is "Year of chemistry". Perhaps modern_reference is entirely missing. Please check.')
                 else:
                     warning_ctr += 1
-                if a == 0:
-                    if b == 0:
-                        # convert to CE/BCE to BP(1950) first
-                        sample_tb_composite_rm_gap.loc[sample_tb_composite_rm_gap['modern_reference'] == 'CE/BCE', 'interp_age'] = 1950 - sample_tb_composite_rm_gap.loc[sample_tb_composite_rm_gap['modern_reference'] == 'CE/BCE', 'interp_age'] 
-                        warning_ctr += check_numbers_in_range(sample_tb_composite_rm_gap, 'Sample table', 'interp_age', -70, np.inf)
-                        # Check if Sample data Modern_reference == 'Year of chemistry' that Year_done is filled in for the same entity in the Dating_information 
-                        try:
-                            warning_ctr += check_yearofchemistry_crosstable(sample_tb_composite_rm_gap.loc[sample_tb_composite_rm_gap['modern_reference'] == 'Year of chemistry',:], dating_tb_composite)
-                        except:
-                            warning_ctr += 1
-                            print('Dating information and Sample data tab (composite entity): There is a problem checking chem_year when modern_reference is "Year of chemistry". Perhaps modern_reference is entirely missing. Please check.')
+            else:
+                warning_ctr += 1
+            warning_ctr += check_numbers(sample_tb_composite_rm_gap, 'Sample data', 'd18O_measurement')
+            warning_ctr += check_numbers(sample_tb_composite_rm_gap, 'Sample data', 'd18O_precision')
+            warning_ctr += check_numbers(sample_tb_composite_rm_gap, 'Sample data', 'd13C_measurement')
+            warning_ctr += check_numbers(sample_tb_composite_rm_gap, 'Sample data', 'd13C_precision')
+
+            warning_ctr += check_independent_dependent_col(sample_tb_composite_rm_gap, 'Sample data', independent_column='d18O_measurement', dependent_column='d18O_precision')
+            warning_ctr += check_independent_dependent_col(sample_tb_composite_rm_gap, 'Sample data', 'd13C_measurement', 'd13C_precision')
+            warning_ctr += check_independent_dependent_col(sample_tb_composite_rm_gap, 'Sample data', 'd18O_precision', 'd18O_measurement')
+            warning_ctr += check_independent_dependent_col(sample_tb_composite_rm_gap, 'Sample data', 'd13C_precision', 'd13C_measurement')
+            warning_ctr += check_independent_dependent_col(sample_tb_composite_rm_gap, 'Sample data', 'interp_age_uncert_neg', 'interp_age_uncert_pos')
+            warning_ctr += check_independent_dependent_col(sample_tb_composite_rm_gap, 'Sample data', 'interp_age_uncert_pos', 'interp_age_uncert_neg')
+            warning_ctr += check_independent_dependent_col(sample_tb_composite_rm_gap, 'Sample data', 'iso_std', 'd18O_measurement')
+            warning_ctr += check_independent_dependent_col(sample_tb_composite_rm_gap, 'Sample data', 'iso_std', 'd13C_measurement')
+            warning_ctr += check_Isotope_Checks(sample_tb_composite_rm_gap, 'iso_std', 'd18O_measurement', 'd13C_measurement')
+            warning_ctr += check_values2list(sample_tb_composite_rm_gap, 'hiatus', 'Sample data', ['H', ''], na_rm = True) # added '' as np.nan was replaced by ''
+            warning_ctr += check_values2list(sample_tb_composite_rm_gap, 'gap', 'Sample data', ['G', ''], na_rm = True) # added '' as np.nan was replaced by ''
+    # =============================================================================
+    #         #
+    # =============================================================================
+            # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+            # Check on sample table of composites
+            # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+            if check_no_values(sample_tb_composite_rm_gap, 'Sample metadata', 'mineralogy', col_dtype_str_set = True) == 0:
+                a1 = check_values2list(sample_tb_composite_rm_gap, 'mineralogy', 'Sample data', ['calcite', 'secondary calcite', 'aragonite', 'vaterite', 'mixed', 'unknown'])
+            else:
+                warning_ctr += 1
+                a1 = 0
+            if check_no_values(sample_tb_composite_rm_gap, 'Sample metadata', 'arag_corr', col_dtype_str_set = True) == 0:
+                b1 = check_values2list(sample_tb_composite_rm_gap, 'arag_corr', 'Sample data', ['yes', 'no', 'not applicable', 'unknown'])
+            else:
+                warning_ctr += 1
+                b1 = 0
+            warning_ctr += a1 + b1
+            if (a1 == 0) & (b1 == 0): # If the sample table excluding gaps have mineralogy and arag_corr
+                # Check if mineralogy = 'calcite', 'secondary calcite' or 'vaterite', arag_corr must be 'not applicable'
+                sample_calcite = sample_tb_composite_rm_gap.loc[(sample_tb_composite_rm_gap['mineralogy'] == 'calcite') | (sample_tb_composite_rm_gap['mineralogy'] == 'vaterite') | (sample_tb_composite_rm_gap['mineralogy'] == 'secondary calcite'), :]
+                row_no = sample_calcite.loc[sample_calcite['arag_corr'] != 'not applicable',:].index
+                if len(row_no) > 0:
+                    row_no = str([i+3 for i in row_no]).replace('[', '').replace(']', '')
+                    report('Sample data tab: if mineralogy is not "aragonite" or "mixed", arag_corr must be "not applicable". See row(s) %s' %row_no)
+                    warning_ctr += 1
+                else:
+                    pass # all are 'not applicable'
+
+                # Check if mineralogy = 'aragonite' or 'mixed', arag_corr is not 'not applicable'
+                sample_calcite = sample_tb_composite_rm_gap.loc[(sample_tb_composite_rm_gap['mineralogy'] == 'aragonite') | (sample_tb_composite_rm_gap['mineralogy'] == 'mixed'), :]
+                row_no = sample_calcite.loc[sample_calcite['arag_corr'] == 'not applicable',:].index
+                if len(row_no) > 0:
+                    row_no = str([i+3 for i in row_no]).replace('[', '').replace(']', '')
+                    report('Sample data tab: if mineralogy = "aragonite" or "mixed", arag_corr must be something different than "not applicable". See row(s) %s' %row_no)
+                    warning_ctr += 1
+                else:
+                    pass # all are 'not applicable'
+
+                # Check if mineralogy = 'unknown' that arag_corr must be 'unknown'
+                sample_calcite = sample_tb_composite_rm_gap.loc[(sample_tb_composite_rm_gap['mineralogy'] == 'mixed'), :]
+                row_no = sample_calcite.loc[(sample_calcite['arag_corr'] == 'unknown')|(sample_calcite['arag_corr'] == 'yes'),:].index
+                if len(row_no) > 0:
+                    report('Informative: Sample data tab: There are samples with mixed mineralogy where aragonite correction has been performed. Please make sure to give as much detail as possible in the notes section with regards to this.')
+                else:
+                    pass # all are 'not applicable'
+                # Check if mineralogy = 'unknown' that arag_corr must be 'unknown'
+                sample_calcite = sample_tb_composite_rm_gap.loc[(sample_tb_composite_rm_gap['mineralogy'] == 'unknown'), :]
+                row_no = sample_calcite.loc[sample_calcite['arag_corr'] != 'unknown',:].index
+                if len(row_no) > 0:
+                    row_no = str([i+3 for i in row_no]).replace('[', '').replace(']', '')
+                    report('Sample data tab: if mineralogy = unknown, arag_corr cannot be anything other than "unknown". See row(s) %s' %row_no)
+                    warning_ctr += 1
+                else:
+                    pass # all are 'not applicable'
+    #        warning_ctr += check_values2list(sample_tb_composite_rm_gap, 'mineralogy', 'Sample data', ['calcite', 'secondary calcite', 'aragonite', 'vaterite', 'mixed', 'unknown', ''], na_rm = True)  # added '' as np.nan was replaced by ''
+    # =============================================================================
+    #         #
+    # =============================================================================
+            warning_ctr += check_values2list(sample_tb_composite_rm_gap, 'arag_corr', 'Sample data', ['yes', 'no', 'not applicable', 'unknown'])
+            warning_ctr += check_values2list(sample_tb_composite_rm_gap, 'age_model_type', 'Sample data', ['linear', 'linear between dates', 'polynomial fit', 'polynomial fit omitting outliers', 'Bayesian', 'Bayesian Bacon', 'Bayesian Bchron', 'StalAge', 'StalAge and other', 'Clam', 'COPRA', 'OxCal', 'combination of methods', 'unknown', 'other'])
+            if check_no_values(sample_tb_composite_rm_gap, 'Sample data', 'ann_lam_check', col_dtype_str_set = True) == 0:
+                warning_ctr += check_values2list(sample_tb_composite_rm_gap, 'ann_lam_check', 'Sample data', ['14C peak', '14C slope', 'U/Th cycle', 'trace element cycle', 'assumed', 'unknown', 'not applicable', 'other'])
+            else:
+                warning_ctr += 1
+            if check_no_values(sample_tb_composite_rm_gap, 'Sample data', 'dep_rate_check', col_dtype_str_set = True) == 0:
+                warning_ctr += check_values2list(sample_tb_composite_rm_gap, 'dep_rate_check', 'Sample data', ['yes', 'no', 'assumed', 'unknown', 'not applicable'])
+            else:
+                warning_ctr += 1
+            warning_ctr += check_values2list(sample_tb_composite_rm_gap, 'iso_std', 'Sample data', ['PDB', 'Vienna-PDB'])
+            # ---------------------------------------------------------------------
+            # Section 7.ii.b. Dating spreadsheet
+            # ---------------------------------------------------------------------
+            if len(dating_tb_composite.index) > 0:
+                warning_ctr += 1
+                report('Dating information tab: Something has been entered in the dating spreadsheet for the composite entity %s. This should be left empty for composites.' %ent_name)
+            # ---------------------------------------------------------------------
+            # Section 7.ii.c. Lamina age vs depth spreadsheet
+            # ---------------------------------------------------------------------
+            if len(dating_lamina_tb_composite.index) > 0:
+                warning_ctr += 1
+                report('Lamina age vs depth tab: Something has been entered in the lamina age vs depth spreadsheet for the composite entity %s, This should be left empty for composites.' %ent_name)
+        else:
+            if drip_type == 'not applicable':
+                warning_ctr += 1
+                report('Entity metadata tab: Entity %s is not a composite and drip type cannot be "not applicable".' %ent_name) 
+            if len(dating_tb_s.index) == 0:
+                ent_ls2.append(ent_name)
+            pass
+
+    if len(ent_ls2) > 0:
+        warning_ctr += 1
+        report('Sample data tab: Entity %s is not a composite and has no Dating information data. This will only be accepted in very special cases. If this is the only warning (and dating info is really not retrievable) move the workbook to the Checked folder manually.' %str(ent_ls2).replace('[','').replace(']','')) 
+    if len(composites) > 0:
+        dating_tb = dating_tb.loc[~dating_tb['entity_name'].isin(composites),:]
+        sample_tb = sample_tb.loc[~sample_tb['entity_name'].isin(composites),:]
+        dating_lamina_tb = dating_lamina_tb.loc[~dating_lamina_tb['entity_name'].isin(composites),:]
+        if 'sample_columns' in wb:
+            wb['sample_columns'] = wb['sample_columns'].loc[~wb['sample_columns']['entity_name'].isin(composites),:]
+    wb['dating'], wb['sample'], wb['dating_lamina'] = dating_tb, sample_tb, dating_lamina_tb
+    return(warning_ctr)
+
+# _____________________________________________________________________________
+#
+# Section 7.iii. Check for non-composites
+# _____________________________________________________________________________
+
+# -----------------------------------------------------------------------------
+# Section 7.iii.a. Site spreadsheet 
+# -----------------------------------------------------------------------------
+# NONE, all checks for sites are performed irrespect of the entity
+
+# -----------------------------------------------------------------------------
+# Section 7.iii.b. Entity spreadsheet
+# -----------------------------------------------------------------------------
+# NONE, all checks for entities are performed above.
+
+# -----------------------------------------------------------------------------
+# Section 7.iii.c. Sample spreadsheet
+# -----------------------------------------------------------------------------
+@profiled
+def check_sample_entity(sample_tb_subset, i, depth_refs, repeated_depths, repeated_ages, possible_hiatuses, age_inversions):
+    """Section 7.iii.c.5. Checks on the Sample data of one entity (with an age
+    model, including hiatuses): min/max ages, repeated depths and ages, ages in
+    order and possible hiatuses
+
+    Args:
+        sample_tb_subset: A pandas dataframe object. Sample data of the entity
+        i: string. entity_name
+        depth_refs: dictionary. depth_ref keyed by entity_name (at least entity i)
+        repeated_depths: dictionary. Output of find_repeated_records (depth_sample)
+        repeated_ages: dictionary. Output of find_repeated_records (interp_age)
+        possible_hiatuses: output of find_possible_hiatuses for the entity
+        age_inversions: output of find_age_inversions for the entity
+
+    Returns:
+        integer, number of warnings
+    """
+    warning_ctr = 0
+    warning_ctr += check_notminmax_age(sample_tb_subset, 'interp_age', 'interp_age_uncert_pos', 'interp_age_uncert_neg', 'Sample', i)
+    depth_ref = depth_refs[i]
+    a = check_no_repeated_records(repeated_depths, 'Sample data', i, 'depth_sample')
+    b = check_no_repeated_records(repeated_ages, 'Sample data', i, 'interp_age')
+    warning_ctr += a + b
+    sample_tb_subset_rm_hiatus = sample_tb_subset.loc[(sample_tb_subset['hiatus'] != 'H'),:]
+    if a == 0:
+        if b == 0:
+            # samples in order and ages in BP(1950) in find_age_inversions
+            if depth_ref in ['from top', 'from base']:
+                sample_tb_subset_rm_hiatus = sample_tb_subset_rm_hiatus.loc[pd.to_numeric(sample_tb_subset_rm_hiatus['depth_sample'], errors = 'coerce').notnull(),:]
+                if (age_inversions is not None) and (age_inversions[0] <= 0):
+                    report("Sample data tab: Entity %s. depth_ref likely wrong. The oldest speleothem sample cannot be the one at the top! Further checks cannot be completed until this is fixed." %i)
+                    warning_ctr += 1
+                else:
+                    warning_ctr += report_age_inversions(age_inversions, 'depth_sample', 'interp_age', 'Sample data', i)
+                    warning_ctr += report_possible_hiatuses(possible_hiatuses, 'depth_sample', i)
+    if any(isnull_cells(sample_tb_subset_rm_hiatus['interp_age_uncert_neg'])):
+        report('Informative: Sample data tab: Entity %s; Excluding hiatuses, there are missing interp_age uncertainties. This is possible but please make sure that you have tried your best to obtain this information' %i)
+    return(warning_ctr)
+
+# Column rules of the Sample data table (see check_rules())
+sample_hiatus_rules = compile_rules([('hiatusgap', 'hiatus', 'H', ['entity_name', 'depth_sample', 'hiatus'], [])])
+# excluding hiatuses
+sample_column_rules = compile_rules([('number', 'd18O_measurement'),
+                                     ('number', 'd13C_measurement')] +
+                                    [('number_positive', c, True) for c in ['interp_age_uncert_pos', 'interp_age_uncert_neg', 'sample_thickness', 'd18O_precision', 'd13C_precision']] +
+                                    [('paired', 'd18O_measurement', 'd18O_precision'),
+                                     ('paired', 'd13C_measurement', 'd13C_precision'),
+                                     ('paired', 'd18O_precision', 'd18O_measurement'),
+                                     ('paired', 'd13C_precision', 'd13C_measurement'),
+                                     ('paired', 'interp_age_uncert_neg', 'interp_age_uncert_pos'),
+                                     ('paired', 'interp_age_uncert_pos', 'interp_age_uncert_neg'),
+                                     ('paired', 'iso_std', 'd18O_measurement'),
+                                     ('paired', 'iso_std', 'd13C_measurement')])
+
+def check_sample_sheet(wb):
+    """Section 7.iii.c. Checks on the Sample data spreadsheet (non-composites)
+
+    Args:
+        wb: dictionary of pandas dataframe objects. Tables of the workbook
+
+    Returns:
+        integer, number of warnings
+    """
+    entity_tb, sample_tb, dating_tb = wb['entity'], wb['sample'], wb['dating']
+    # all the rows of the key columns if the Sample data was streamed (see sample_columns())
+    sample_cols = sample_columns(wb)
+    warning_ctr = 0
+    if len(sample_cols.index) > 0:
+        # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        # 7.iii.c.1. Check on sample table (full) 
+        # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        warning_ctr += check_no_values(sample_tb, 'Sample data', 'entity_name')
+        # Check that depth_sample is in mm not cm or m
+        sample_parts = partition_by_entity(sample_cols)
+        for i in set(sample_cols['entity_name']):
+            if max(sample_parts[i]['depth_sample']) - min(sample_parts[i]['depth_sample']) <= 100:
+    #            warning_ctr += 1
+                report('Informative: Sample data tab: The total length of Entity %s is less than 100mm. This is either a very small speleothem or the depths are in cm.' %i)
+        # Check depth_sample values
+        pass_depthsample_checks = False
+        if check_no_values(sample_tb, 'Sample data', 'depth_sample') == 0:
+            pass_depthsample_checks = True
+            if check_numbers(sample_tb, 'Sample data', 'depth_sample') == 0:
+                warning_ctr += check_positivenumbers(sample_tb, 'Sample data', 'depth_sample')
             else:
                 warning_ctr += 1
         else:
             warning_ctr += 1
-        warning_ctr += check_numbers(sample_tb_composite_rm_gap, 'Sample data', 'd18O_measurement')
-        warning_ctr += check_numbers(sample_tb_composite_rm_gap, 'Sample data', 'd18O_precision')
-        warning_ctr += check_numbers(sample_tb_composite_rm_gap, 'Sample data', 'd13C_measurement')
-        warning_ctr += check_numbers(sample_tb_composite_rm_gap, 'Sample data', 'd13C_precision')
-        
-        warning_ctr += check_independent_dependent_col(sample_tb_composite_rm_gap, 'Sample data', independent_column='d18O_measurement', dependent_column='d18O_precision')
-        warning_ctr += check_independent_dependent_col(sample_tb_composite_rm_gap, 'Sample data', 'd13C_measurement', 'd13C_precision')
-        warning_ctr += check_independent_dependent_col(sample_tb_composite_rm_gap, 'Sample data', 'd18O_precision', 'd18O_measurement')
-        warning_ctr += check_independent_dependent_col(sample_tb_composite_rm_gap, 'Sample data', 'd13C_precision', 'd13C_measurement')
-        warning_ctr += check_independent_dependent_col(sample_tb_composite_rm_gap, 'Sample data', 'interp_age_uncert_neg', 'interp_age_uncert_pos')
-        warning_ctr += check_independent_dependent_col(sample_tb_composite_rm_gap, 'Sample data', 'interp_age_uncert_pos', 'interp_age_uncert_neg')
-        warning_ctr += check_independent_dependent_col(sample_tb_composite_rm_gap, 'Sample data', 'iso_std', 'd18O_measurement')
-        warning_ctr += check_independent_dependent_col(sample_tb_composite_rm_gap, 'Sample data', 'iso_std', 'd13C_measurement')
-        warning_ctr += check_Isotope_Checks(sample_tb_composite_rm_gap, 'iso_std', 'd18O_measurement', 'd13C_measurement')
-        warning_ctr += check_values2list(sample_tb_composite_rm_gap, 'hiatus', 'Sample data', ['H', ''], na_rm = True) # added '' as np.nan was replaced by ''
-        warning_ctr += check_values2list(sample_tb_composite_rm_gap, 'gap', 'Sample data', ['G', ''], na_rm = True) # added '' as np.nan was replaced by ''
-# =============================================================================
-#         #
-# =============================================================================
+
+        warning_ctr += check_rules(sample_tb, 'Sample data', sample_hiatus_rules)
         # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-        # Check on sample table of composites
+        # 7.iii.c.2. Check on sample table (excluding hiatuses) 
         # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-        if check_no_values(sample_tb_composite_rm_gap, 'Sample metadata', 'mineralogy', col_dtype_str_set = True) == 0:
-            a1 = check_values2list(sample_tb_composite_rm_gap, 'mineralogy', 'Sample data', ['calcite', 'secondary calcite', 'aragonite', 'vaterite', 'mixed', 'unknown'])
+        sample_tb_rm_hiatus = sample_tb.loc[sample_tb['hiatus'] != 'H']
+        if check_no_values(sample_tb_rm_hiatus, 'Sample metadata', 'mineralogy', col_dtype_str_set = True) == 0:
+            a1 = check_values2list(sample_tb_rm_hiatus, 'mineralogy', 'Sample data', ['calcite', 'secondary calcite', 'aragonite', 'vaterite', 'mixed', 'unknown'])
         else:
             warning_ctr += 1
             a1 = 0
-        if check_no_values(sample_tb_composite_rm_gap, 'Sample metadata', 'arag_corr', col_dtype_str_set = True) == 0:
-            b1 = check_values2list(sample_tb_composite_rm_gap, 'arag_corr', 'Sample data', ['yes', 'no', 'not applicable', 'unknown'])
+        if check_no_values(sample_tb_rm_hiatus, 'Sample metadata', 'arag_corr', col_dtype_str_set = True) == 0:
+            b1 = check_values2list(sample_tb_rm_hiatus, 'arag_corr', 'Sample data', ['yes', 'no', 'not applicable', 'unknown'])
         else:
             warning_ctr += 1
             b1 = 0
         warning_ctr += a1 + b1
-        if (a1 == 0) & (b1 == 0): # If the sample table excluding gaps have mineralogy and arag_corr
+        if (a1 == 0) & (b1 == 0): # If the sample table excluding hiatuses have mineralogy and arag_corr
             # Check if mineralogy = 'calcite', 'secondary calcite' or 'vaterite', arag_corr must be 'not applicable'
-            sample_calcite = sample_tb_composite_rm_gap.loc[(sample_tb_composite_rm_gap['mineralogy'] == 'calcite') | (sample_tb_composite_rm_gap['mineralogy'] == 'vaterite') | (sample_tb_composite_rm_gap['mineralogy'] == 'secondary calcite'), :]
+            sample_calcite = sample_tb_rm_hiatus.loc[(sample_tb_rm_hiatus['mineralogy'] == 'calcite') | (sample_tb_rm_hiatus['mineralogy'] == 'vaterite') | (sample_tb_rm_hiatus['mineralogy'] == 'secondary calcite'), :]
             row_no = sample_calcite.loc[sample_calcite['arag_corr'] != 'not applicable',:].index
             if len(row_no) > 0:
                 row_no = str([i+3 for i in row_no]).replace('[', '').replace(']', '')
-                print('Sample data tab: if mineralogy is not "aragonite" or "mixed", arag_corr must be "not applicable". See row(s) %s' %row_no)
+                report('Sample data tab: if mineralogy is not "aragonite" or "mixed", arag_corr must be "not applicable". See row(s) %s' %row_no)
                 warning_ctr += 1
             else:
                 pass # all are 'not applicable'
-            
+
             # Check if mineralogy = 'aragonite' or 'mixed', arag_corr is not 'not applicable'
-            sample_calcite = sample_tb_composite_rm_gap.loc[(sample_tb_composite_rm_gap['mineralogy'] == 'aragonite') | (sample_tb_composite_rm_gap['mineralogy'] == 'mixed'), :]
+            sample_calcite = sample_tb_rm_hiatus.loc[(sample_tb_rm_hiatus['mineralogy'] == 'aragonite') | (sample_tb_rm_hiatus['mineralogy'] == 'mixed'), :]
             row_no = sample_calcite.loc[sample_calcite['arag_corr'] == 'not applicable',:].index
             if len(row_no) > 0:
                 row_no = str([i+3 for i in row_no]).replace('[', '').replace(']', '')
-                print('Sample data tab: if mineralogy = "aragonite" or "mixed", arag_corr must be something different than "not applicable". See row(s) %s' %row_no)
+                report('Sample data tab: if mineralogy = "aragonite" or "mixed", arag_corr must be something different than "not applicable". See row(s) %s' %row_no)
                 warning_ctr += 1
             else:
                 pass # all are 'not applicable'
-            
+
             # Check if mineralogy = 'unknown' that arag_corr must be 'unknown'
-            sample_calcite = sample_tb_composite_rm_gap.loc[(sample_tb_composite_rm_gap['mineralogy'] == 'mixed'), :]
+            sample_calcite = sample_tb_rm_hiatus.loc[(sample_tb_rm_hiatus['mineralogy'] == 'mixed'), :]
             row_no = sample_calcite.loc[(sample_calcite['arag_corr'] == 'unknown')|(sample_calcite['arag_corr'] == 'yes'),:].index
             if len(row_no) > 0:
-                print('Informative: Sample data tab: There are samples with mixed mineralogy where aragonite correction has been performed. Please make sure to give as much detail as possible in the notes section with regards to this.')
+                report('Informative: Sample data tab: There are samples with mixed mineralogy where aragonite correction has been performed. Please make sure to give as much detail as possible in the notes section with regards to this.')
+            else:
+                pass # all are 'not applicable'
+            # Check if mineralogy = 'unknown' that arag_corr must be 'unknown'
+            sample_calcite = sample_tb_rm_hiatus.loc[(sample_tb_rm_hiatus['mineralogy'] == 'unknown'), :]
+            row_no = sample_calcite.loc[sample_calcite['arag_corr'] != 'unknown',:].index
+            if len(row_no) > 0:
+                row_no = str([i+3 for i in row_no]).replace('[', '').replace(']', '')
+                report('Sample data tab: if mineralogy = unknown, arag_corr cannot be anything other than "unknown". See row(s) %s' %row_no)
+                warning_ctr += 1
+            else:
+                pass # all are 'not applicable'
+        # Check that the numbers columns are filled in properly, positive numbers
+        # and precision/measurements co-existing
+        warning_ctr += check_rules(sample_tb_rm_hiatus, 'Sample data', sample_column_rules)
+        warning_ctr += check_Isotope_Checks(sample_tb_rm_hiatus, 'iso_std', 'd18O_measurement', 'd13C_measurement')
+        warning_ctr += check_values2list(sample_tb_rm_hiatus, 'iso_std', 'Sample data', ['PDB', 'Vienna-PDB'])
+        # Check that there are no 'gaps' in the normal entities
+        if sample_tb_rm_hiatus.loc[sample_tb_rm_hiatus['gap'] == 'G',:].shape[0] > 0:
+            report('Sample data tab: A gap column is filled in with non-composite entities. Check if this should be a hiatus instead.')
+            warning_ctr += 1
+        # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        # 7.iii.c.3. Check on sample table (entities with no age model)
+        # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        # repeated depths and ages of all entities, reported per entity below
+        repeated_depths = find_repeated_records(sample_cols, 'depth_sample')
+        repeated_ages = find_repeated_records(sample_cols, 'interp_age')
+        sample_rm_hiatus_parts = partition_by_entity(sample_tb_rm_hiatus)
+        no_agemodel = []
+        for i in set(sample_cols.loc[sample_cols['hiatus'] != 'H', 'entity_name']):
+            sample_tb_rm_hiatus_ent = sample_rm_hiatus_parts[i]
+            if all(isnull_cells(sample_tb_rm_hiatus_ent['interp_age'])):
+                # Excludes entities with no age models from future checks (below the loop)
+                no_agemodel.append(i)
+                # Check for repeated depths when there is no age model
+                warning_ctr += check_no_repeated_records(repeated_depths, 'Sample data', i, 'depth_sample')
+                warning_ctr += 1
+                report('Sample data tab: Entity %s is likely missing an age model. This is not allowed except for some VERY special cases. No more checks will be done for this entity. Please add a dummy age-depth model to make sure that all other checks can be performed. IMPORTANT: Do not forget to delete the dummy age-depth model from the workbook once it has passed all checks!' %i)
+                if all(notnull_cells(sample_tb_rm_hiatus_ent['interp_age_uncert_pos'])):
+                    report('Sample data tab: If entity %s has no age model, interp_age_uncert_pos should be empty.' %i)
+                if all(notnull_cells(sample_tb_rm_hiatus_ent['interp_age_uncert_neg'])):
+                    report('Sample data tab: If entity %s has no age model, interp_age_uncert_neg should be empty' %i)
+                if all(pd.notnull(sample_tb_rm_hiatus_ent['age_model_type'])):
+                    report('Sample data tab: Entity %s is likely missing an age model (i.e. no interp_ages). If this is correct, age_model_type should be empty.' %i)
+                if all(sample_tb_rm_hiatus_ent['modern_reference'] != ''):
+                    report('Sample data tab: Entity %s is likely missing an age model (i.e. no interp_ages). If this is correct, modern_reference should be empty.' %i)
+                if all(sample_tb_rm_hiatus_ent['ann_lam_check'] != ''):
+                    report('Sample data tab: Entity %s is likely missing an age model (i.e. no interp_ages). If this is correct, ann_lam_check should be empty.' %i)            
+                if all(sample_tb_rm_hiatus_ent['dep_rate_check'] != ''):
+                    report('Sample data tab: Entity %s is likely missing an age model (i.e. no interp_ages). If this is correct, dep_rate_check should be empty.' %i)
+        sample_tb_no_agemodel = sample_tb.loc[~sample_tb['entity_name'].isin(no_agemodel), :].copy()
+        sample_tb_rm_hiatus_agemodel = sample_tb_rm_hiatus.loc[~sample_tb_rm_hiatus['entity_name'].isin(no_agemodel), :].copy()
+        sample_cols_no_agemodel = sample_tb_no_agemodel
+        if sample_cols is not sample_tb:
+            sample_cols_no_agemodel = sample_cols.loc[~sample_cols['entity_name'].isin(no_agemodel), :]
+        # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        # 7.iii.c.4. Check on sample table (excluding hiatuses and entities with no agemodel)
+        # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        if check_no_values(sample_tb_rm_hiatus_agemodel, 'Sample data', 'modern_reference') == 0:
+            check_modref = check_values2list(sample_tb_rm_hiatus_agemodel, 'modern_reference', 'Sample data', ['BP (1950)', 'b2k', 'CE/BCE', 'Year of chemistry'])
+        else:
+            warning_ctr += 1
+            check_modref = 0
+        warning_ctr += check_modref
+        check_interp_age = False
+        if check_no_values(sample_tb_rm_hiatus_agemodel, 'Sample data', 'interp_age') == 0:
+            if check_numbers(sample_tb_rm_hiatus_agemodel, 'Sample data', 'interp_age') == 0:
+                if check_independent_dependent_col(sample_tb_rm_hiatus_agemodel, 'Sample data', 'interp_age', 'interp_age_uncert_pos') == 0:
+                    if check_independent_dependent_col(sample_tb_rm_hiatus_agemodel, 'Sample data', 'interp_age', 'interp_age_uncert_neg') == 0:
+                        check_interp_age = True
+                    else:
+                        warning_ctr += 1
+                else:
+                    warning_ctr += 1
             else:
-                pass # all are 'not applicable'
-            # Check if mineralogy = 'unknown' that arag_corr must be 'unknown'
-            sample_calcite = sample_tb_composite_rm_gap.loc[(sample_tb_composite_rm_gap['mineralogy'] == 'unknown'), :]
-            row_no = sample_calcite.loc[sample_calcite['arag_corr'] != 'unknown',:].index
-            if len(row_no) > 0:
-                row_no = str([i+3 for i in row_no]).replace('[', '').replace(']', '')
-                print('Sample data tab: if mineralogy = unknown, arag_corr cannot be anything other than "unknown". See row(s) %s' %row_no)
                 warning_ctr += 1
-            else:
-                pass # all are 'not applicable'
-#        warning_ctr += check_values2list(sample_tb_composite_rm_gap, 'mineralogy', 'Sample data', ['calcite', 'secondary calcite', 'aragonite', 'vaterite', 'mixed', 'unknown', ''], na_rm = True)  # added '' as np.nan was replaced by ''
-# =============================================================================
-#         #
-# =============================================================================
-        warning_ctr += check_values2list(sample_tb_composite_rm_gap, 'arag_corr', 'Sample data', ['yes', 'no', 'not applicable', 'unknown'])
-        warning_ctr += check_values2list(sample_tb_composite_rm_gap, 'age_model_type', 'Sample data', ['linear', 'linear between dates', 'polynomial fit', 'polynomial fit omitting outliers', 'Bayesian', 'Bayesian Bacon', 'Bayesian Bchron', 'StalAge', 'StalAge and other', 'Clam', 'COPRA', 'OxCal', 'combination of methods', 'unknown', 'other'])
-        if check_no_values(sample_tb_composite_rm_gap, 'Sample data', 'ann_lam_check', col_dtype_str_set = True) == 0:
-            warning_ctr += check_values2list(sample_tb_composite_rm_gap, 'ann_lam_check', 'Sample data', ['14C peak', '14C slope', 'U/Th cycle', 'trace element cycle', 'assumed', 'unknown', 'not applicable', 'other'])
         else:
-            warning_ctr += 1
-        if check_no_values(sample_tb_composite_rm_gap, 'Sample data', 'dep_rate_check', col_dtype_str_set = True) == 0:
-            warning_ctr += check_values2list(sample_tb_composite_rm_gap, 'dep_rate_check', 'Sample data', ['yes', 'no', 'assumed', 'unknown', 'not applicable'])
+            warning_ctr += 1                     
+        if check_modref == 0:
+            if check_interp_age:
+                # if modern_reference is CE/BCE, the ages must be converted to BP(1950) before performing checks
+                sample_tb_rm_hiatus_agemodel.loc[sample_tb_rm_hiatus_agemodel['modern_reference'] == 'CE/BCE','interp_age'] = 1950 - sample_tb_rm_hiatus_agemodel.loc[sample_tb_rm_hiatus_agemodel['modern_reference'] == 'CE/BCE','interp_age'] 
+                warning_ctr += check_numbers_in_range(sample_tb_rm_hiatus_agemodel.loc[sample_tb_rm_hiatus_agemodel['hiatus'] != 'H',:], 'Sample table', 'interp_age', -70, np.inf)
+
+        # Check that values are from lists
+        warning_ctr += check_values2list(sample_tb_rm_hiatus_agemodel, 'age_model_type', 'Sample data', ['linear', 'linear between dates', 'polynomial fit', 'polynomial fit omitting outliers', 'Bayesian', 'Bayesian Bacon', 'Bayesian Bchron', 'StalAge', 'StalAge and other', 'Clam', 'COPRA', 'OxCal', 'combination of methods', 'unknown', 'other'])
+        if check_no_values(sample_tb_rm_hiatus_agemodel, 'Sample data', 'ann_lam_check', col_dtype_str_set = True) == 0:
+            warning_ctr += check_values2list(sample_tb_rm_hiatus_agemodel, 'ann_lam_check', 'Sample data', ['14C peak', '14C slope', 'U/Th cycle', 'trace element cycle', 'assumed', 'unknown', 'not applicable', 'other'])
         else:
             warning_ctr += 1
-        warning_ctr += check_values2list(sample_tb_composite_rm_gap, 'iso_std', 'Sample data', ['PDB', 'Vienna-PDB'])
-        # ---------------------------------------------------------------------
-        # Section 7.ii.b. Dating spreadsheet
-        # ---------------------------------------------------------------------
-        if len(dating_tb_composite.index) > 0:
+        if check_no_values(sample_tb_rm_hiatus_agemodel, 'Sample data', 'dep_rate_check', col_dtype_str_set = True) == 0:
+            warning_ctr += check_values2list(sample_tb_rm_hiatus_agemodel, 'dep_rate_check', 'Sample data', ['yes', 'no', 'assumed', 'unknown', 'not applicable'])
+        else:
             warning_ctr += 1
-            print('Dating information tab: Something has been entered in the dating spreadsheet for the composite entity %s. This should be left empty for composites.' %ent_name)
-        # ---------------------------------------------------------------------
-        # Section 7.ii.c. Lamina age vs depth spreadsheet
-        # ---------------------------------------------------------------------
-        if len(dating_lamina_tb_composite.index) > 0:
+        # Check if Sample data Modern_reference == 'Year of chemistry' that Year_done is filled in for the same entity in the Dating_information 
+        sample_tb_subset = sample_tb_rm_hiatus_agemodel.loc[(sample_tb_rm_hiatus_agemodel['modern_reference'] == 'Year of chemistry') & (sample_tb_rm_hiatus_agemodel['hiatus'] != 'H'),:] #EDIT
+        try:
+            warning_ctr += check_yearofchemistry_crosstable(sample_tb_subset, dating_tb)
+        except:
             warning_ctr += 1
-            print('Lamina age vs depth tab: Something has been entered in the lamina age vs depth spreadsheet for the composite entity %s, This should be left empty for composites.' %ent_name)
+            report('Dating information and Sample data tab: There is a problem checking chem_year when modern_reference is "Year of chemistry". Perhaps modern_reference is entirely missing. Please check.')
+        # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        # 7.iii.c.5. Check on sample table (excluding entities with no agemodel, including hiatuses)
+        # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        # possible hiatuses and age inversions of all entities, reported per entity below
+        depth_refs = dict(entity_tb.drop_duplicates('entity_name')[['entity_name', 'depth_ref']].values)
+        possible_hiatuses = find_possible_hiatuses(sample_cols_no_agemodel, 'depth_sample', 'interp_age', 'hiatus', depth_refs)
+        age_inversions = find_age_inversions(sample_cols_no_agemodel, 'depth_sample', 'interp_age', depth_refs, 'hiatus', 'modern_reference')
+        sample_parts = partition_by_entity(sample_tb_no_agemodel)
+        warning_ctr += run_entity_checks([(check_sample_entity, (sample_parts[i], i, {i: depth_refs[i]} if i in depth_refs else {},
+                                                                 {i: repeated_depths[i]} if i in repeated_depths else {},
+                                                                 {i: repeated_ages[i]} if i in repeated_ages else {},
+                                                                 possible_hiatuses.get(i), age_inversions.get(i)))
+                                          for i in set(sample_cols_no_agemodel['entity_name'])])
+        if sample_cols is not sample_tb:
+            # all the rows for check_across_sheets()
+            sample_tb_rm_hiatus_agemodel = sample_cols_no_agemodel.loc[sample_cols_no_agemodel['hiatus'] != 'H', :]
     else:
-        if drip_type == 'not applicable':
-            warning_ctr += 1
-            print('Entity metadata tab: Entity %s is not a composite and drip type cannot be "not applicable".' %ent_name) 
-        if len(dating_tb_s.index) == 0:
-            ent_ls2.append(ent_name)
-        pass
-
-if len(ent_ls2) > 0:
-    warning_ctr += 1
-    print('Sample data tab: Entity %s is not a composite and has no Dating information data. This will only be accepted in very special cases. If this is the only warning (and dating info is really not retrievable) move the workbook to the Checked folder manually.' %str(ent_ls2).replace('[','').replace(']','')) 
-
-
-# _____________________________________________________________________________
-#
-# Section 7.iii. Check for non-composites
-# _____________________________________________________________________________
+        # If sample table is empty, then create a copy of sample_tb_rm_hiatus_agemodel
+        # as it is being called later on
+        sample_tb_rm_hiatus_agemodel = sample_tb.copy()
+    wb['sample_rm_hiatus_agemodel'] = sample_tb_rm_hiatus_agemodel
+    if len(sample_cols.index) > 0:
+        wb['pass_depthsample_checks'] = pass_depthsample_checks
+    return(warning_ctr)
 
 # -----------------------------------------------------------------------------
-# Section 7.iii.a. Site spreadsheet 
+# Section 7.iii.d. Dating spreadsheet
 # -----------------------------------------------------------------------------
-# NONE, all checks for sites are performed irrespect of the entity
+# Column rules of the Dating information table (see check_rules())
+dating_event_rules = compile_rules([('hiatusgap', 'date_type', 'Event; hiatus', ['entity_name', 'depth_dating', 'date_used', 'date_type'], []),
+                                    ('hiatusgap', 'date_type', 'Event; actively forming', ['entity_name', 'depth_dating', 'date_used', 'date_type', 'corr_age', 'corr_age_uncert_pos', 'corr_age_uncert_neg', 'modern_reference'], ['chem_year']),
+                                    ('hiatusgap', 'date_type', 'Event; start of laminations', ['entity_name', 'depth_dating', 'date_used', 'date_type', 'corr_age', 'corr_age_uncert_pos', 'corr_age_uncert_neg', 'modern_reference'], ['chem_year']),
+                                    ('hiatusgap', 'date_type', 'Event; end of laminations', ['entity_name', 'depth_dating', 'date_used', 'date_type', 'corr_age', 'corr_age_uncert_pos', 'corr_age_uncert_neg', 'modern_reference'], ['chem_year']),
+                                    ('hiatusgap', 'date_type', 'other', ['entity_name', 'depth_dating', 'date_used', 'date_type', 'corr_age', 'modern_reference'], ['dating_thickness', 'material_dated', 'min_weight', 'max_weight', 'corr_age_uncert_neg', 'corr_age_uncert_pos', 'lab_num'])])
+dating_column_rules = compile_rules([('number', 'uncorr_age'),
+                                     ('number', 'corr_age')] +
+                                    [('number_positive', c, True) for c in ['dating_thickness', 'min_weight','max_weight', '14C_correction',
+                                                                            'uncorr_age_uncert_pos', 'uncorr_age_uncert_neg', '238U_content','238U_uncertainty',
+                                                                            '232Th_content', '232Th_uncertainty', '230Th_content', '230Th_uncertainty',
+                                                                            '230Th_232Th_ratio','230Th_232Th_ratio_uncertainty', '230Th_238U_activity', '230Th_238U_activity_uncertainty',
+                                                                            '234U_238U_activity', '234U_238U_activity_uncertainty', 'ini_230Th_232Th_ratio', 'ini_230Th_232Th_ratio_uncertainty',
+                                                                            'corr_age_uncert_pos', 'corr_age_uncert_neg','chem_year']] +
+                                    [('paired', 'uncorr_age', 'uncorr_age_uncert_pos'),
+                                     ('paired', 'uncorr_age', 'uncorr_age_uncert_neg'),
+                                     ('paired', '234U_238U_activity', '234U_238U_activity_uncertainty'),
+                                     ('paired', 'ini_230Th_232Th_ratio', 'ini_230Th_232Th_ratio_uncertainty'),
+                                     ('paired', '238U_content', '238U_uncertainty'),
+                                     ('paired', '232Th_content', '232Th_uncertainty'),
+                                     ('paired', '230Th_content', '230Th_uncertainty'),
+                                     ('paired', '230Th_232Th_ratio', '230Th_232Th_ratio_uncertainty'),
+                                     ('paired', '230Th_238U_activity', '230Th_238U_activity_uncertainty'),
+                                     ('paired', 'corr_age', 'corr_age_uncert_pos'),
+                                     ('paired', 'corr_age', 'corr_age_uncert_neg'),
+                                     ('paired', 'corr_age_uncert_pos', 'corr_age_uncert_neg'),
+                                     ('paired', 'corr_age_uncert_neg', 'corr_age_uncert_pos')])
 
-# -----------------------------------------------------------------------------
-# Section 7.iii.b. Entity spreadsheet
-# -----------------------------------------------------------------------------
-# NONE, all checks for entities are performed above.
+def check_dating_sheet(wb):
+    """Section 7.iii.d. Checks on the Dating information spreadsheet (non-composites)
 
-# -----------------------------------------------------------------------------
-# Section 7.iii.c. Sample spreadsheet
-# -----------------------------------------------------------------------------
+    Args:
+        wb: dictionary of pandas dataframe objects. Tables of the workbook
 
-if len(sample_tb.index) > 0:
-    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-    # 7.iii.c.1. Check on sample table (full) 
-    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-    warning_ctr += check_no_values(sample_tb, 'Sample data', 'entity_name')
-    # Check that depth_sample is in mm not cm or m
-    for i in set(sample_tb['entity_name']):
-        if max(sample_tb.loc[sample_tb['entity_name'] == i,'depth_sample']) - min(sample_tb.loc[sample_tb['entity_name'] == i,'depth_sample']) <= 100:
-#            warning_ctr += 1
-            print('Informative: Sample data tab: The total length of Entity %s is less than 100mm. This is either a very small speleothem or the depths are in cm.' %i)
-    # Check depth_sample values
-    pass_depthsample_checks = False
-    if check_no_values(sample_tb, 'Sample data', 'depth_sample') == 0:
-        pass_depthsample_checks = True
-        if check_numbers(sample_tb, 'Sample data', 'depth_sample') == 0:
-            warning_ctr += check_positivenumbers(sample_tb, 'Sample data', 'depth_sample')
+    Returns:
+        integer, number of warnings
+    """
+    entity_tb, dating_tb = wb['entity'], wb['dating']
+    warning_ctr = 0
+    if len(dating_tb.index) > 0:
+        # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        # 7.iii.c.1. Check on dating table (full) 
+        # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        # Check date_type exists and from dropdown list
+        pass_datetype_warning = False
+        if check_no_values(dating_tb, 'Dating information', 'date_type', True) == 0:
+            warning_ctr += check_values2list(dating_tb, 'date_type', 'Dating information', ['C14', 'MC-ICP-MS U/Th', 'ICP-MS U/Th Other', 'Alpha U/Th', 'TIMS', 'U/Th unspecified', 'Cross-dating', 'Multiple methods', 'Event; hiatus', 'Event; gap (composite record)', 'Event; actively forming', 'Event; start of laminations', 'Event; end of laminations', 'unknown', 'other'])
+            pass_datetype_warning = True
         else:
             warning_ctr += 1
-    else:
-        warning_ctr += 1
-
-    warning_ctr += check_hiatusgaps_columns(sample_tb, 'Sample data', 'hiatus', 'H', ['entity_name', 'depth_sample', 'hiatus'])
-    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-    # 7.iii.c.2. Check on sample table (excluding hiatuses) 
-    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-    sample_tb_rm_hiatus = sample_tb.loc[sample_tb['hiatus'] != 'H']
-    if check_no_values(sample_tb_rm_hiatus, 'Sample metadata', 'mineralogy', col_dtype_str_set = True) == 0:
-        a1 = check_values2list(sample_tb_rm_hiatus, 'mineralogy', 'Sample data', ['calcite', 'secondary calcite', 'aragonite', 'vaterite', 'mixed', 'unknown'])
-    else:
-        warning_ctr += 1
-        a1 = 0
-    if check_no_values(sample_tb_rm_hiatus, 'Sample metadata', 'arag_corr', col_dtype_str_set = True) == 0:
-        b1 = check_values2list(sample_tb_rm_hiatus, 'arag_corr', 'Sample data', ['yes', 'no', 'not applicable', 'unknown'])
-    else:
-        warning_ctr += 1
-        b1 = 0
-    warning_ctr += a1 + b1
-    if (a1 == 0) & (b1 == 0): # If the sample table excluding hiatuses have mineralogy and arag_corr
-        # Check if mineralogy = 'calcite', 'secondary calcite' or 'vaterite', arag_corr must be 'not applicable'
-        sample_calcite = sample_tb_rm_hiatus.loc[(sample_tb_rm_hiatus['mineralogy'] == 'calcite') | (sample_tb_rm_hiatus['mineralogy'] == 'vaterite') | (sample_tb_rm_hiatus['mineralogy'] == 'secondary calcite'), :]
-        row_no = sample_calcite.loc[sample_calcite['arag_corr'] != 'not applicable',:].index
-        if len(row_no) > 0:
-            row_no = str([i+3 for i in row_no]).replace('[', '').replace(']', '')
-            print('Sample data tab: if mineralogy is not "aragonite" or "mixed", arag_corr must be "not applicable". See row(s) %s' %row_no)
-            warning_ctr += 1
+        # Check date_used exists and from dropdown list
+        pass_dateused_warning = False
+        if check_no_values(dating_tb, 'Dating information', 'date_used', True) == 0:
+            warning_ctr += check_values2list(dating_tb, 'date_used', 'Dating information', y_n_nk_list)
+            pass_dateused_warning = True
         else:
-            pass # all are 'not applicable'
-        
-        # Check if mineralogy = 'aragonite' or 'mixed', arag_corr is not 'not applicable'
-        sample_calcite = sample_tb_rm_hiatus.loc[(sample_tb_rm_hiatus['mineralogy'] == 'aragonite') | (sample_tb_rm_hiatus['mineralogy'] == 'mixed'), :]
-        row_no = sample_calcite.loc[sample_calcite['arag_corr'] == 'not applicable',:].index
-        if len(row_no) > 0:
-            row_no = str([i+3 for i in row_no]).replace('[', '').replace(']', '')
-            print('Sample data tab: if mineralogy = "aragonite" or "mixed", arag_corr must be something different than "not applicable". See row(s) %s' %row_no)
             warning_ctr += 1
+        # Check for entity_name
+        pass_depthdating_warning = False
+        if check_no_values(dating_tb, 'Dating information', 'depth_dating') == 0:
+            pass_depthdating_warning = True
+            # Check that depth_dating is a number and is a positive number
+            if check_numbers(dating_tb, 'Dating information', 'depth_dating') == 0:
+                warning_ctr += check_positivenumbers(dating_tb, 'Dating information', 'depth_dating')
+            else:
+                warning_ctr += 1
         else:
-            pass # all are 'not applicable'
-        
-        # Check if mineralogy = 'unknown' that arag_corr must be 'unknown'
-        sample_calcite = sample_tb_rm_hiatus.loc[(sample_tb_rm_hiatus['mineralogy'] == 'mixed'), :]
-        row_no = sample_calcite.loc[(sample_calcite['arag_corr'] == 'unknown')|(sample_calcite['arag_corr'] == 'yes'),:].index
-        if len(row_no) > 0:
-            print('Informative: Sample data tab: There are samples with mixed mineralogy where aragonite correction has been performed. Please make sure to give as much detail as possible in the notes section with regards to this.')
-        else:
-            pass # all are 'not applicable'
-        # Check if mineralogy = 'unknown' that arag_corr must be 'unknown'
-        sample_calcite = sample_tb_rm_hiatus.loc[(sample_tb_rm_hiatus['mineralogy'] == 'unknown'), :]
-        row_no = sample_calcite.loc[sample_calcite['arag_corr'] != 'unknown',:].index
-        if len(row_no) > 0:
-            row_no = str([i+3 for i in row_no]).replace('[', '').replace(']', '')
-            print('Sample data tab: if mineralogy = unknown, arag_corr cannot be anything other than "unknown". See row(s) %s' %row_no)
             warning_ctr += 1
+        # Check for entity_name
+        pass_entityname_warning = False
+        if check_no_values(dating_tb, 'Dating information', 'entity_name', True) == 0:
+            pass_entityname_warning = True
         else:
-            pass # all are 'not applicable'
-    # Check that the numbers columns are filled in properly
-    samplecolumnnameslist = ['d18O_measurement', 'd13C_measurement']
-    for i in samplecolumnnameslist:
-        warning_ctr += check_numbers(sample_tb_rm_hiatus, 'Sample data', i)
-    # Check for positive numbers
-    samplecolumnnameslist2 = ['interp_age_uncert_pos', 'interp_age_uncert_neg', 'sample_thickness', 'd18O_precision',
-                             'd13C_precision']
-    for i in samplecolumnnameslist2:
-        if check_numbers(sample_tb_rm_hiatus, 'Sample data', i) == 0:
-            warning_ctr += check_positivenumbers(sample_tb_rm_hiatus, 'Sample data', i, na_rm = True)
-        else:
-            warning_ctr += 1
-    # Check for precision/measurements co-existing
-    warning_ctr += check_independent_dependent_col(sample_tb_rm_hiatus, 'Sample data', independent_column='d18O_measurement', dependent_column='d18O_precision')
-    warning_ctr += check_independent_dependent_col(sample_tb_rm_hiatus, 'Sample data', 'd13C_measurement', 'd13C_precision')
-    warning_ctr += check_independent_dependent_col(sample_tb_rm_hiatus, 'Sample data', 'd18O_precision', 'd18O_measurement')
-    warning_ctr += check_independent_dependent_col(sample_tb_rm_hiatus, 'Sample data', 'd13C_precision', 'd13C_measurement')
-    warning_ctr += check_independent_dependent_col(sample_tb_rm_hiatus, 'Sample data', 'interp_age_uncert_neg', 'interp_age_uncert_pos')
-    warning_ctr += check_independent_dependent_col(sample_tb_rm_hiatus, 'Sample data', 'interp_age_uncert_pos', 'interp_age_uncert_neg')
-    warning_ctr += check_independent_dependent_col(sample_tb_rm_hiatus, 'Sample data', 'iso_std', 'd18O_measurement')
-    warning_ctr += check_independent_dependent_col(sample_tb_rm_hiatus, 'Sample data', 'iso_std', 'd13C_measurement')
-    warning_ctr += check_Isotope_Checks(sample_tb_rm_hiatus, 'iso_std', 'd18O_measurement', 'd13C_measurement')
-    warning_ctr += check_values2list(sample_tb_rm_hiatus, 'iso_std', 'Sample data', ['PDB', 'Vienna-PDB'])
-    # Check that there are no 'gaps' in the normal entities
-    if sample_tb_rm_hiatus.loc[sample_tb_rm_hiatus['gap'] == 'G',:].shape[0] > 0:
-        print('Sample data tab: A gap column is filled in with non-composite entities. Check if this should be a hiatus instead.')
-        warning_ctr += 1
-    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-    # 7.iii.c.3. Check on sample table (entities with no age model)
-    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-    sample_tb_no_agemodel = sample_tb.copy()
-    sample_tb_rm_hiatus_agemodel = sample_tb_rm_hiatus.copy()
-    for i in set(sample_tb_rm_hiatus['entity_name']):
-        sample_tb_rm_hiatus_ent = sample_tb_rm_hiatus.loc[sample_tb_rm_hiatus['entity_name'] == i, :]
-        if all(pd.isnull(sample_tb_rm_hiatus_ent['interp_age'])):
-            # Excludes entities with no age models from future checks ---------
-            sample_tb_no_agemodel = sample_tb_no_agemodel.loc[sample_tb_no_agemodel['entity_name'] != i, :]
-            sample_tb_rm_hiatus_agemodel = sample_tb_rm_hiatus_agemodel.loc[sample_tb_rm_hiatus_agemodel['entity_name'] != i, :]
-            # Check for repeated depths when there is no age model
-            warning_ctr += check_no_repeated_records(sample_tb.loc[sample_tb['entity_name'] == i, :], 'Sample data', i, 'depth_sample')
             warning_ctr += 1
-            print('Sample data tab: Entity %s is likely missing an age model. This is not allowed except for some VERY special cases. No more checks will be done for this entity. Please add a dummy age-depth model to make sure that all other checks can be performed. IMPORTANT: Do not forget to delete the dummy age-depth model from the workbook once it has passed all checks!' %i)
-            if all(pd.notnull(sample_tb_rm_hiatus_ent['interp_age_uncert_pos'])):
-                print('Sample data tab: If entity %s has no age model, interp_age_uncert_pos should be empty.' %i)
-            if all(pd.notnull(sample_tb_rm_hiatus_ent['interp_age_uncert_neg'])):
-                print('Sample data tab: If entity %s has no age model, interp_age_uncert_neg should be empty' %i)
-            if all(pd.notnull(sample_tb_rm_hiatus_ent['age_model_type'])):
-                print('Sample data tab: Entity %s is likely missing an age model (i.e. no interp_ages). If this is correct, age_model_type should be empty.' %i)
-            if all(sample_tb_rm_hiatus_ent['modern_reference'] != ''):
-                print('Sample data tab: Entity %s is likely missing an age model (i.e. no interp_ages). If this is correct, modern_reference should be empty.' %i)
-            if all(sample_tb_rm_hiatus_ent['ann_lam_check'] != ''):
-                print('Sample data tab: Entity %s is likely missing an age model (i.e. no interp_ages). If this is correct, ann_lam_check should be empty.' %i)            
-            if all(sample_tb_rm_hiatus_ent['dep_rate_check'] != ''):
-                print('Sample data tab: Entity %s is likely missing an age model (i.e. no interp_ages). If this is correct, dep_rate_check should be empty.' %i)
-    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-    # 7.iii.c.4. Check on sample table (excluding hiatuses and entities with no agemodel)
-    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-    if check_no_values(sample_tb_rm_hiatus_agemodel, 'Sample data', 'modern_reference') == 0:
-        check_modref = check_values2list(sample_tb_rm_hiatus_agemodel, 'modern_reference', 'Sample data', ['BP (1950)', 'b2k', 'CE/BCE', 'Year of chemistry'])
-    else:
-        warning_ctr += 1
-        check_modref = 0
-    warning_ctr += check_modref
-    check_interp_age = False
-    if check_no_values(sample_tb_rm_hiatus_agemodel, 'Sample data', 'interp_age') == 0:
-        if check_numbers(sample_tb_rm_hiatus_agemodel, 'Sample data', 'interp_age') == 0:
-            if check_independent_dependent_col(sample_tb_rm_hiatus_agemodel, 'Sample data', 'interp_age', 'interp_age_uncert_pos') == 0:
-                if check_independent_dependent_col(sample_tb_rm_hiatus_agemodel, 'Sample data', 'interp_age', 'interp_age_uncert_neg') == 0:
-                    check_interp_age = True
-                else:
+        if pass_datetype_warning:
+            if pass_dateused_warning:
+                if pass_entityname_warning:
+                    if pass_depthdating_warning:
+                        # Check that the rows with 'Event; hiatus' or 'Event; gap', etc. are filled in properly
+                        warning_ctr += check_rules(dating_tb, 'Dating information', dating_event_rules)
+
+        # Check that min_weight and max_weight coexists and min_weight cannot be greater than max_weight
+        if check_independent_dependent_col(dating_tb, 'Dating information', 'min_weight', 'max_weight') == 0:
+            if check_independent_dependent_col(dating_tb, 'Dating information', 'max_weight', 'min_weight') == 0:
+                dating_idx_weight = dating_tb.loc[dating_tb.min_weight > dating_tb.max_weight,:].index
+                if len(dating_idx_weight) > 0:
                     warning_ctr += 1
+                    report('Dating information tab: min_weight is greater than max_weight at row %s' %(str(list(dating_idx_weight))))
             else:
                 warning_ctr += 1
         else:
             warning_ctr += 1
-    else:
-        warning_ctr += 1                     
-    if check_modref == 0:
-        if check_interp_age:
-            # if modern_reference is CE/BCE, the ages must be converted to BP(1950) before performing checks
-            sample_tb_rm_hiatus_agemodel.loc[sample_tb_rm_hiatus_agemodel['modern_reference'] == 'CE/BCE','interp_age'] = 1950 - sample_tb_rm_hiatus_agemodel.loc[sample_tb_rm_hiatus_agemodel['modern_reference'] == 'CE/BCE','interp_age'] 
-            warning_ctr += check_numbers_in_range(sample_tb_rm_hiatus_agemodel.loc[sample_tb_rm_hiatus_agemodel['hiatus'] != 'H',:], 'Sample table', 'interp_age', -70, np.inf)
-    
-    # Check that values are from lists
-    warning_ctr += check_values2list(sample_tb_rm_hiatus_agemodel, 'age_model_type', 'Sample data', ['linear', 'linear between dates', 'polynomial fit', 'polynomial fit omitting outliers', 'Bayesian', 'Bayesian Bacon', 'Bayesian Bchron', 'StalAge', 'StalAge and other', 'Clam', 'COPRA', 'OxCal', 'combination of methods', 'unknown', 'other'])
-    if check_no_values(sample_tb_rm_hiatus_agemodel, 'Sample data', 'ann_lam_check', col_dtype_str_set = True) == 0:
-        warning_ctr += check_values2list(sample_tb_rm_hiatus_agemodel, 'ann_lam_check', 'Sample data', ['14C peak', '14C slope', 'U/Th cycle', 'trace element cycle', 'assumed', 'unknown', 'not applicable', 'other'])
-    else:
-        warning_ctr += 1
-    if check_no_values(sample_tb_rm_hiatus_agemodel, 'Sample data', 'dep_rate_check', col_dtype_str_set = True) == 0:
-        warning_ctr += check_values2list(sample_tb_rm_hiatus_agemodel, 'dep_rate_check', 'Sample data', ['yes', 'no', 'assumed', 'unknown', 'not applicable'])
-    else:
-        warning_ctr += 1
-    # Check if Sample data Modern_reference == 'Year of chemistry' that Year_done is filled in for the same entity in the Dating_information 
-    sample_tb_subset = sample_tb_rm_hiatus_agemodel.loc[(sample_tb_rm_hiatus_agemodel['modern_reference'] == 'Year of chemistry') & (sample_tb_rm_hiatus_agemodel['hiatus'] != 'H'),:] #EDIT
-    try:
-        warning_ctr += check_yearofchemistry_crosstable(sample_tb_subset, dating_tb)
-    except:
-        warning_ctr += 1
-        print('Dating information and Sample data tab: There is a problem checking chem_year when modern_reference is "Year of chemistry". Perhaps modern_reference is entirely missing. Please check.')
-    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-    # 7.iii.c.5. Check on sample table (excluding entities with no agemodel, including hiatuses)
-    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-    for i in set(sample_tb_no_agemodel['entity_name']):
-        sample_tb_subset = sample_tb_no_agemodel.loc[sample_tb['entity_name'] == i,:]
-        warning_ctr += check_notminmax_age(sample_tb_subset, 'interp_age', 'interp_age_uncert_pos', 'interp_age_uncert_neg', 'Sample', i)
-        depth_ref = entity_tb.loc[entity_tb['entity_name'] == i,'depth_ref'].values[0]
-        a = check_no_repeated_records(sample_tb_subset, 'Sample data', i, 'depth_sample')
-        b = check_no_repeated_records(sample_tb_subset, 'Sample data', i, 'interp_age')
-        warning_ctr += a + b
-        sample_tb_subset_rm_hiatus = sample_tb_subset.loc[(sample_tb_subset['hiatus'] != 'H'),:]
-        # if modern_reference is CE/BCE, the ages must be converted to BP(1950) before performing checks
-        sample_tb_subset_rm_hiatus.loc[sample_tb_subset_rm_hiatus['modern_reference'] == 'CE/BCE','interp_age'] = 1950 - sample_tb_subset_rm_hiatus.loc[sample_tb_subset_rm_hiatus['modern_reference'] == 'CE/BCE','interp_age'] 
-        if a == 0:
-            if b == 0:
-                further_check = True
-                if depth_ref == 'from top':
-                    sample_tb_subset_rm_hiatus = sample_tb_subset_rm_hiatus.loc[pd.to_numeric(sample_tb_subset_rm_hiatus['depth_sample'], errors = 'coerce').notnull(),:].sort_values(by = ['depth_sample'], ascending = True)
-                elif depth_ref == 'from base':
-                    sample_tb_subset_rm_hiatus = sample_tb_subset_rm_hiatus.loc[pd.to_numeric(sample_tb_subset_rm_hiatus['depth_sample'], errors = 'coerce').notnull(),:].sort_values(by = ['depth_sample'], ascending = False)
-                else:
-                    further_check = False
-                if further_check == True:
-                    if (np.mean(np.diff(sample_tb_subset_rm_hiatus['interp_age'])) <= 0):
-                        print("Sample data tab: Entity %s. depth_ref likely wrong. The oldest speleothem sample cannot be the one at the top! Further checks cannot be completed until this is fixed." %i)
-                        warning_ctr += 1
-                    else:
-                        warning_ctr += check_ages_and_depths_in_order(sample_tb_subset_rm_hiatus, 'depth_sample', 'interp_age', depth_ref, 'Sample data', i)
-                        warning_ctr += check_possible_hiatuses(sample_tb_subset, 'depth_sample', 'interp_age', 'hiatus', depth_ref, i)
-        if any(pd.isnull(sample_tb_subset_rm_hiatus['interp_age_uncert_neg'])):
-            print('Informative: Sample data tab: Entity %s; Excluding hiatuses, there are missing interp_age uncertainties. This is possible but please make sure that you have tried your best to obtain this information' %i)
-else:
-    # If sample table is empty, then create a copy of sample_tb_rm_hiatus_agemodel
-    # as it is being called later on
-    sample_tb_rm_hiatus_agemodel = sample_tb.copy()
-# -----------------------------------------------------------------------------
-# Section 7.iii.d. Dating spreadsheet
-# -----------------------------------------------------------------------------
-if len(dating_tb.index) > 0:
-    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-    # 7.iii.c.1. Check on dating table (full) 
-    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-    # Check date_type exists and from dropdown list
-    pass_datetype_warning = False
-    if check_no_values(dating_tb, 'Dating information', 'date_type', True) == 0:
-        warning_ctr += check_values2list(dating_tb, 'date_type', 'Dating information', ['C14', 'MC-ICP-MS U/Th', 'ICP-MS U/Th Other', 'Alpha U/Th', 'TIMS', 'U/Th unspecified', 'Cross-dating', 'Multiple methods', 'Event; hiatus', 'Event; gap (composite record)', 'Event; actively forming', 'Event; start of laminations', 'Event; end of laminations', 'unknown', 'other'])
-        pass_datetype_warning = True
-    else:
-        warning_ctr += 1
-    # Check date_used exists and from dropdown list
-    pass_dateused_warning = False
-    if check_no_values(dating_tb, 'Dating information', 'date_used', True) == 0:
-        warning_ctr += check_values2list(dating_tb, 'date_used', 'Dating information', y_n_nk_list)
-        pass_dateused_warning = True
-    else:
-        warning_ctr += 1
-    # Check for entity_name
-    pass_depthdating_warning = False
-    if check_no_values(dating_tb, 'Dating information', 'depth_dating') == 0:
-        pass_depthdating_warning = True
-        # Check that depth_dating is a number and is a positive number
-        if check_numbers(dating_tb, 'Dating information', 'depth_dating') == 0:
-            warning_ctr += check_positivenumbers(dating_tb, 'Dating information', 'depth_dating')
-        else:
+        # Check that uncorr_age are numeric (np.nan is considered a number), positive
+        # numbers and that measurements are being filled in properly
+        warning_ctr += check_rules(dating_tb, 'Dating information', dating_column_rules)
+        # check if there are modern_reference when there are corr_age
+        if check_independent_dependent_col(dating_tb, 'Dating information', 'modern_reference', 'corr_age') == 0:
+            # check if modern_reference is from dropdown list. na_rm = True as it can be empty if there are no corr_age
+            warning_ctr += check_values2list(dating_tb, 'modern_reference', 'Dating information', ['BP (1950)', 'b2k', 'CE/BCE', 'Year of chemistry'], na_rm = True)
+        try:
+            # Check if Dating information/Lamina age vs depth Modern_reference == 'Year of chemistry' that Year_done is filled in 
+            warning_ctr += check_yearofchemistry_crosstable(dating_tb, dating_tb)
+        except:
             warning_ctr += 1
-    else:
-        warning_ctr += 1
-    # Check for entity_name
-    pass_entityname_warning = False
-    if check_no_values(dating_tb, 'Dating information', 'entity_name', True) == 0:
-        pass_entityname_warning = True
-    else:
-        warning_ctr += 1
-    if pass_datetype_warning:
-        if pass_dateused_warning:
-            if pass_entityname_warning:
-                if pass_depthdating_warning:
-                    # Check that the rows with 'Event; hiatus' or 'Event; gap', etc. are filled in properly
-                    warning_ctr += check_hiatusgaps_columns(dating_tb, 'Dating information', 'date_type', 'Event; hiatus', ['entity_name', 'depth_dating', 'date_used', 'date_type'])
-                    warning_ctr += check_hiatusgaps_columns(dating_tb, 'Dating information', 'date_type', 'Event; actively forming', ['entity_name', 'depth_dating', 'date_used', 'date_type', 'corr_age', 'corr_age_uncert_pos', 'corr_age_uncert_neg', 'modern_reference'], ['chem_year'])
-                    warning_ctr += check_hiatusgaps_columns(dating_tb, 'Dating information', 'date_type', 'Event; start of laminations', ['entity_name', 'depth_dating', 'date_used', 'date_type', 'corr_age', 'corr_age_uncert_pos', 'corr_age_uncert_neg', 'modern_reference'], ['chem_year'])
-                    warning_ctr += check_hiatusgaps_columns(dating_tb, 'Dating information', 'date_type', 'Event; end of laminations', ['entity_name', 'depth_dating', 'date_used', 'date_type', 'corr_age', 'corr_age_uncert_pos', 'corr_age_uncert_neg', 'modern_reference'], ['chem_year'])
-                    warning_ctr += check_hiatusgaps_columns(dating_tb, 'Dating information', 'date_type', 'other', ['entity_name', 'depth_dating', 'date_used', 'date_type', 'corr_age', 'modern_reference'], ['dating_thickness', 'material_dated', 'min_weight', 'max_weight', 'corr_age_uncert_neg', 'corr_age_uncert_pos', 'lab_num'])
-
-    # Check that min_weight and max_weight coexists and min_weight cannot be greater than max_weight
-    if check_independent_dependent_col(dating_tb, 'Dating information', 'min_weight', 'max_weight') == 0:
-        if check_independent_dependent_col(dating_tb, 'Dating information', 'max_weight', 'min_weight') == 0:
-            dating_idx_weight = dating_tb.loc[dating_tb.min_weight > dating_tb.max_weight,:].index
-            if len(dating_idx_weight) > 0:
+            report('Dating information tab: There is a problem checking chem_year when modern_reference is "Year of chemistry". Perhaps modern_reference is entirely missing. Please check.')
+        # Check if values are from list
+        warning_ctr += check_values2list(dating_tb, 'calib_used', 'Dating information', ['INTCAL13 NH', 'INTCAL13 SH', 'INTCAL13 marine', 'INTCAL09', 'INTCAL09 marine', 'INTCAL04 NH', 'INTCAL04 SH', 'INTCAL98', 'FAIRBANKS09', 'not calibrated', 'other', 'unknown', ''], na_rm = True)  # added '' as np.nan was replaced by ''
+        # Check that for each entity that corr_age_uncert_pos and neg are not min and max ages
+        dating_parts = partition_by_entity(dating_tb)
+        checks = []
+        for i in set(dating_tb['entity_name']):
+            checks.append((check_notminmax_age, (dating_parts[i], 'corr_age', 'corr_age_uncert_pos', 'corr_age_uncert_neg', 'Dating', i)))
+            checks.append((check_notminmax_age, (dating_parts[i], 'uncorr_age', 'uncorr_age_uncert_pos', 'uncorr_age_uncert_neg', 'Dating', i)))
+        warning_ctr += run_entity_checks(checks)
+        # Check that corr_age is in range
+        # if modern_reference is CE/BCE, the ages must be converted to BP(1950) before performing checks
+        dating_tb.loc[dating_tb['modern_reference'] == 'CE/BCE','corr_age'] = 1950 - dating_tb.loc[dating_tb['modern_reference'] == 'CE/BCE','corr_age'] 
+        dating_tb.loc[dating_tb['modern_reference'] == 'CE/BCE','modern_reference'] = 'BP(1950)'
+        warning_ctr += check_numbers_in_range(dating_tb.loc[(dating_tb['date_type'] != 'Event; hiatus') & ((dating_tb['date_used'] == 'yes') | (dating_tb['date_used'] == 'unknown')),:], 'Dating information table', 'corr_age', -70, np.inf)
+        # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        # 7.iii.c.2. Check on dating table (excluding date_type LIKE ‘Event; %’)
+        # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        events_list = ['Event; gap (composite record)', 'Event; hiatus', 'Event; actively forming', 'Event; start of laminations', 'Event; end of laminations']
+        ctr = 0
+        for p in events_list:
+            ctr += 1
+            if ctr == 1:
+                dating_tb_subset_no_events = dating_tb.loc[(dating_tb['date_type'] != p), :]
+            else:
+                dating_tb_subset_no_events = dating_tb_subset_no_events.loc[(dating_tb_subset_no_events['date_type'] != p), :]
+        if dating_tb_subset_no_events.shape[0] > 0:
+            warning_ctr += check_values2list(dating_tb_subset_no_events, 'material_dated', 'Dating information', ['calcite', 'aragonite', 'organic', 'other', 'unknown'])
+        # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        # 7.iii.c.3. Check on dating table (excluding where date_used = 'no' and date_type = 'Event; hiatus') 
+        # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        dating_tb_useinagemodel = dating_tb.loc[(dating_tb['date_used'] != 'no') & (dating_tb['date_type'] != 'Event; hiatus')& (dating_tb['date_type'] != 'Event; gap (composite record'),:]
+        if len(dating_tb_useinagemodel.index) > 0:
+            for k in ['corr_age', 'corr_age_uncert_pos', 'corr_age_uncert_neg', 'modern_reference']:
+                sub_tb = dating_tb_useinagemodel.loc[isnull_cells(dating_tb_useinagemodel[k]),:]
+                number_of_rows = len(sub_tb.index)
+                if number_of_rows > 0:
+                    Row_numbers = str(list(sub_tb.index + 3)).replace('[','').replace(']', '')
+                    report('Dating information tab: %s is not filled in when date_used = "yes" or "unknown". %d row(s). row: %s' %(k, number_of_rows, Row_numbers))
+                    warning_ctr += 1
+        used_entities = set(dating_tb_useinagemodel['entity_name'])
+        for i in set(dating_tb['entity_name']):
+            if i not in used_entities:
                 warning_ctr += 1
-                print('Dating information tab: min_weight is greater than max_weight at row %s' %(str(list(dating_idx_weight))))
-        else:
-            warning_ctr += 1
-    else:
-        warning_ctr += 1
-    # Check that uncorr_age are numeric (np.nan is considered a number)
-    warning_ctr += check_numbers(dating_tb, 'Dating information', 'uncorr_age')
-    warning_ctr += check_numbers(dating_tb, 'Dating information', 'corr_age')
-    # Check for positive numbers
-    datingcolumnnameslist2 = ['dating_thickness', 'min_weight','max_weight', '14C_correction',
-                  'uncorr_age_uncert_pos', 'uncorr_age_uncert_neg', '238U_content','238U_uncertainty',
-                  '232Th_content', '232Th_uncertainty', '230Th_content', '230Th_uncertainty',
-                  '230Th_232Th_ratio','230Th_232Th_ratio_uncertainty', '230Th_238U_activity', '230Th_238U_activity_uncertainty',
-                  '234U_238U_activity', '234U_238U_activity_uncertainty', 'ini_230Th_232Th_ratio',	'ini_230Th_232Th_ratio_uncertainty', 
-                  'corr_age_uncert_pos', 'corr_age_uncert_neg','chem_year']
-    for j in datingcolumnnameslist2:
-        if check_numbers(dating_tb, 'Dating information', j) == 0:
-            warning_ctr += check_positivenumbers(dating_tb, 'Dating information', j, na_rm = True)
+                report('Dating information tab: Entity %s has no dating info other than hiatuses and/or not used dates. This is not allowed except for very special cases where the entity is missing an age model.' %(i))
+        # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        # 7.iii.c.4. Check integrity of dating table based on date_used
+        # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        dating_c14 = dating_tb.loc[(dating_tb['date_type'] == 'C14'), :]
+        # Where date_used == 'C14'
+        if dating_c14.shape[0] > 0:
+            warning_ctr += check_values2list(dating_c14, 'calib_used', 'Dating information', ['INTCAL13 NH', 'INTCAL13 SH', 'INTCAL13 marine', 'INTCAL09', 'INTCAL09 marine', 'INTCAL04 NH', 'INTCAL04 SH', 'INTCAL98', 'FAIRBANKS09', 'not calibrated', 'other', 'unknown'])
         else:
-            warning_ctr += 1
-    # Check that measurements are being filled in properly
-    warning_ctr += check_independent_dependent_col(dating_tb, 'Dating information', 'uncorr_age', 'uncorr_age_uncert_pos')
-    warning_ctr += check_independent_dependent_col(dating_tb, 'Dating information', 'uncorr_age', 'uncorr_age_uncert_neg')
-    warning_ctr += check_independent_dependent_col(dating_tb, 'Dating information', '234U_238U_activity', '234U_238U_activity_uncertainty')
-    warning_ctr += check_independent_dependent_col(dating_tb, 'Dating information', 'ini_230Th_232Th_ratio', 'ini_230Th_232Th_ratio_uncertainty')
-    warning_ctr += check_independent_dependent_col(dating_tb, 'Dating information', '238U_content', '238U_uncertainty')
-    warning_ctr += check_independent_dependent_col(dating_tb, 'Dating information', '232Th_content', '232Th_uncertainty')
-    warning_ctr += check_independent_dependent_col(dating_tb, 'Dating information', '230Th_content', '230Th_uncertainty')
-    warning_ctr += check_independent_dependent_col(dating_tb, 'Dating information', '230Th_232Th_ratio', '230Th_232Th_ratio_uncertainty')
-    warning_ctr += check_independent_dependent_col(dating_tb, 'Dating information', '230Th_238U_activity', '230Th_238U_activity_uncertainty')
-    warning_ctr += check_independent_dependent_col(dating_tb, 'Dating information', 'corr_age', 'corr_age_uncert_pos')
-    warning_ctr += check_independent_dependent_col(dating_tb, 'Dating information', 'corr_age', 'corr_age_uncert_neg')
-    warning_ctr += check_independent_dependent_col(dating_tb, 'Dating information', 'corr_age_uncert_pos', 'corr_age_uncert_neg')
-    warning_ctr += check_independent_dependent_col(dating_tb, 'Dating information', 'corr_age_uncert_neg', 'corr_age_uncert_pos')
-    # check if there are modern_reference when there are corr_age
-    if check_independent_dependent_col(dating_tb, 'Dating information', 'modern_reference', 'corr_age') == 0:
-        # check if modern_reference is from dropdown list. na_rm = True as it can be empty if there are no corr_age
-        warning_ctr += check_values2list(dating_tb, 'modern_reference', 'Dating information', ['BP (1950)', 'b2k', 'CE/BCE', 'Year of chemistry'], na_rm = True)
-    try:
-        # Check if Dating information/Lamina age vs depth Modern_reference == 'Year of chemistry' that Year_done is filled in 
-        warning_ctr += check_yearofchemistry_crosstable(dating_tb, dating_tb)
-    except:
-        warning_ctr += 1
-        print('Dating information tab: There is a problem checking chem_year when modern_reference is "Year of chemistry". Perhaps modern_reference is entirely missing. Please check.')
-    # Check if values are from list
-    warning_ctr += check_values2list(dating_tb, 'calib_used', 'Dating information', ['INTCAL13 NH', 'INTCAL13 SH', 'INTCAL13 marine', 'INTCAL09', 'INTCAL09 marine', 'INTCAL04 NH', 'INTCAL04 SH', 'INTCAL98', 'FAIRBANKS09', 'not calibrated', 'other', 'unknown', ''], na_rm = True)  # added '' as np.nan was replaced by ''
-    # Check that for each entity that corr_age_uncert_pos and neg are not min and max ages
-    for i in set(dating_tb['entity_name']):
-        warning_ctr += check_notminmax_age(dating_tb.loc[dating_tb['entity_name'] == i,:], 'corr_age', 'corr_age_uncert_pos', 'corr_age_uncert_neg', 'Dating', i)
-        warning_ctr += check_notminmax_age(dating_tb.loc[dating_tb['entity_name'] == i,:], 'uncorr_age', 'uncorr_age_uncert_pos', 'uncorr_age_uncert_neg', 'Dating', i)
-    # Check that corr_age is in range
-    # if modern_reference is CE/BCE, the ages must be converted to BP(1950) before performing checks
-    dating_tb.loc[dating_tb['modern_reference'] == 'CE/BCE','corr_age'] = 1950 - dating_tb.loc[dating_tb['modern_reference'] == 'CE/BCE','corr_age'] 
-    dating_tb.loc[dating_tb['modern_reference'] == 'CE/BCE','modern_reference'] = 'BP(1950)'
-    warning_ctr += check_numbers_in_range(dating_tb.loc[(dating_tb['date_type'] != 'Event; hiatus') & ((dating_tb['date_used'] == 'yes') | (dating_tb['date_used'] == 'unknown')),:], 'Dating information table', 'corr_age', -70, np.inf)
-    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-    # 7.iii.c.2. Check on dating table (excluding date_type LIKE ‘Event; %’)
-    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-    events_list = ['Event; gap (composite record)', 'Event; hiatus', 'Event; actively forming', 'Event; start of laminations', 'Event; end of laminations']
-    ctr = 0
-    for p in events_list:
-        ctr += 1
-        if ctr == 1:
-            dating_tb_subset_no_events = dating_tb.loc[(dating_tb['date_type'] != p), :]
+            pass # there are no C14 dates in this workbook
+        # Where date_used != 'C14'
+        dating_notc14 = dating_tb.loc[(dating_tb['date_type'] != 'C14'), :]
+        if dating_notc14.shape[0] > 0:
+            tb_empty = dating_notc14.loc[dating_notc14['calib_used'] != '',:]
+            tb_notempty = dating_notc14.loc[notnull_cells(dating_notc14['14C_correction']),:]
+            if tb_empty.shape[0] > 0:
+                row_no = str([i+3 for i in tb_empty.index]).replace('[', '').replace(']', '')
+                warning_ctr += 1
+                report('Dating information tab: calib_used must be empty when date_type is not C14. See row(s) %s' %row_no)
+            if tb_notempty.shape[0] > 0:
+                row_no = str([i+3 for i in tb_notempty.index]).replace('[', '').replace(']', '')
+                warning_ctr += 1
+                report('Dating information tab: 14C_correction must be empty when date_type is not C14. See row(s) %s' %row_no)
         else:
-            dating_tb_subset_no_events = dating_tb_subset_no_events.loc[(dating_tb_subset_no_events['date_type'] != p), :]
-    if dating_tb_subset_no_events.shape[0] > 0:
-        warning_ctr += check_values2list(dating_tb_subset_no_events, 'material_dated', 'Dating information', ['calcite', 'aragonite', 'organic', 'other', 'unknown'])
-    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-    # 7.iii.c.3. Check on dating table (excluding where date_used = 'no' and date_type = 'Event; hiatus') 
-    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-    dating_tb_useinagemodel = dating_tb.loc[(dating_tb['date_used'] != 'no') & (dating_tb['date_type'] != 'Event; hiatus')& (dating_tb['date_type'] != 'Event; gap (composite record'),:]
-    if len(dating_tb_useinagemodel.index) > 0:
-        for k in ['corr_age', 'corr_age_uncert_pos', 'corr_age_uncert_neg', 'modern_reference']:
-            sub_tb = dating_tb_useinagemodel.loc[pd.isnull(dating_tb_useinagemodel[k]),:]
-            number_of_rows = len(sub_tb.index)
-            if number_of_rows > 0:
-                Row_numbers = str(list(sub_tb.index + 3)).replace('[','').replace(']', '')
-                print('Dating information tab: %s is not filled in when date_used = "yes" or "unknown". %d row(s). row: %s' %(k, number_of_rows, Row_numbers))
+            pass # There are only C14 dates
+        # Where date_used is of U/Th type (has U/Th in it or 'TIMS')
+        # Create an set of indices (faster)
+        indices = [i for i, s in enumerate(dating_tb['date_type']) if (('U/Th' in s) | (s == 'TIMS'))]
+        dating_uth = dating_tb.iloc[indices,:]
+        if dating_uth.shape[0] > 0:
+        #    warning_ctr += check_no_values(dating_uth, 'Dating information', 'decay_constant')
+            tb_empty = dating_uth.loc[pd.isnull(dating_uth['decay_constant']),:]
+            if len(tb_empty.index) > 0:
+                row_no = str([i+3 for i in tb_empty.index]).replace('[', '').replace(']', '')
                 warning_ctr += 1
-    for i in set(dating_tb['entity_name']):
-        dating_tb_hiatus = dating_tb_useinagemodel.loc[(dating_tb_useinagemodel['entity_name'] == i),:]
-        if len(dating_tb_hiatus.index) == 0:
-            warning_ctr += 1
-            print('Dating information tab: Entity %s has no dating info other than hiatuses and/or not used dates. This is not allowed except for very special cases where the entity is missing an age model.' %(i))
-    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-    # 7.iii.c.4. Check integrity of dating table based on date_used
-    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-    dating_c14 = dating_tb.loc[(dating_tb['date_type'] == 'C14'), :]
-    # Where date_used == 'C14'
-    if dating_c14.shape[0] > 0:
-        warning_ctr += check_values2list(dating_c14, 'calib_used', 'Dating information', ['INTCAL13 NH', 'INTCAL13 SH', 'INTCAL13 marine', 'INTCAL09', 'INTCAL09 marine', 'INTCAL04 NH', 'INTCAL04 SH', 'INTCAL98', 'FAIRBANKS09', 'not calibrated', 'other', 'unknown'])
-    else:
-        pass # there are no C14 dates in this workbook
-    # Where date_used != 'C14'
-    dating_notc14 = dating_tb.loc[(dating_tb['date_type'] != 'C14'), :]
-    if dating_notc14.shape[0] > 0:
-        tb_empty = dating_notc14.loc[dating_notc14['calib_used'] != '',:]
-        tb_notempty = dating_notc14.loc[pd.notnull(dating_notc14['14C_correction']),:]
-        if tb_empty.shape[0] > 0:
-            row_no = str([i+3 for i in tb_empty.index]).replace('[', '').replace(']', '')
-            warning_ctr += 1
-            print('Dating information tab: calib_used must be empty when date_type is not C14. See row(s) %s' %row_no)
-        if tb_notempty.shape[0] > 0:
-            row_no = str([i+3 for i in tb_notempty.index]).replace('[', '').replace(']', '')
-            warning_ctr += 1
-            print('Dating information tab: 14C_correction must be empty when date_type is not C14. See row(s) %s' %row_no)
-    else:
-        pass # There are only C14 dates
-    # Where date_used is of U/Th type (has U/Th in it or 'TIMS')
-    # Create an set of indices (faster)
-    indices = [i for i, s in enumerate(dating_tb['date_type']) if (('U/Th' in s) | (s == 'TIMS'))]
-    dating_uth = dating_tb.iloc[indices,:]
-    if dating_uth.shape[0] > 0:
-    #    warning_ctr += check_no_values(dating_uth, 'Dating information', 'decay_constant')
-        tb_empty = dating_uth.loc[pd.isnull(dating_uth['decay_constant']),:]
-        if len(tb_empty.index) > 0:
-            row_no = str([i+3 for i in tb_empty.index]).replace('[', '').replace(']', '')
-            warning_ctr += 1
-            print('Dating information tab: decay_constant must be filled in when date_type is of U/Th type. See row(s) %s' %row_no)
+                report('Dating information tab: decay_constant must be filled in when date_type is of U/Th type. See row(s) %s' %row_no)
+            else:
+                warning_ctr += check_values2list(dating_uth, 'decay_constant', 'Dating information', ['Cheng et al. 2000', 'Cheng et al. 2013', 'Edwards et al. 1987', 'Ivanovich & Harmon 1992', 'other', 'unknown'])
         else:
-            warning_ctr += check_values2list(dating_uth, 'decay_constant', 'Dating information', ['Cheng et al. 2000', 'Cheng et al. 2013', 'Edwards et al. 1987', 'Ivanovich & Harmon 1992', 'other', 'unknown'])
-    else:
-        pass
-    # Where date_used is of U/Th type (does not have 'U/Th' in it or is not 'TIMS')
-    # Create an set of indices (faster)
-    indices = [i for i, s in enumerate(dating_tb['date_type']) if (('U/Th' not in s) & (s != 'TIMS'))]
-    dating_notuth = dating_tb.iloc[indices,:]
-    if dating_notuth.shape[0] > 0:
-        tb_empty = dating_notuth.loc[pd.notnull(dating_notuth['decay_constant']),:]
-        if tb_empty.shape[0] > 0:
-            row_no = str([i+3 for i in tb_empty.index]).replace('[', '').replace(']', '')
-            warning_ctr += 1
-            print('Dating information tab: decay_constant must be empty when date_type is not of U/Th type. See row(s) %s' %row_no)
-    else:
-        pass # There are only C14 or event date types
-    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-    # 7.iii.c.5. Check no hiatuses at the same depth as dates
-    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-    # Dating information table
-    # Make sure that for each entity, that no hiatuses have the same depth as dates
-    # 1. Loop through each entity in the dating information table
-    #   i.  subset the dating information table into two tables; hiatuses, and not 
-    #       hiatuses.
-    #   ii. check if depth_dating for the table with hiatuses are not duplicated.
-    #       If they are not:
-    #       a. Loop through each depth_dating for the table with hiatuses
-    #           - see if the depth exist in depths of table with no hiatuses
-    #
-    warning_ctr_bef = warning_ctr
-    for i in pd.unique(dating_tb['entity_name']):
-        depth_ent_hiat = dating_tb.loc[(dating_tb['entity_name'] == i) & (dating_tb['date_type'] == 'Event; hiatus'), 'depth_dating']
-        if len(depth_ent_hiat.index) == 0: # used len(dataframe.index) instead of dataframe.empty as it is faster
             pass
-        else:
-            depth_ent_nohiat = dating_tb.loc[(dating_tb['entity_name'] == i) & (dating_tb['date_type'] != 'Event; hiatus'), 'depth_dating']
-            if len(depth_ent_hiat) != len(set(depth_ent_hiat)):
-                depth_ent_ls = []
-                for j in set(depth_ent_hiat):
-                    if list(depth_ent_hiat).count(j) > 1:
-                        depth_ent_ls.append(j)
-                depth_ent_ls = str(depth_ent_ls).replace('[', '').replace(']', '')
-                print('Dating information tab: Entity %s; There are multiple hiatuses recorded at depth_dating: %s' %(i, depth_ent_ls))
+        # Where date_used is of U/Th type (does not have 'U/Th' in it or is not 'TIMS')
+        # Create an set of indices (faster)
+        indices = [i for i, s in enumerate(dating_tb['date_type']) if (('U/Th' not in s) & (s != 'TIMS'))]
+        dating_notuth = dating_tb.iloc[indices,:]
+        if dating_notuth.shape[0] > 0:
+            tb_empty = dating_notuth.loc[pd.notnull(dating_notuth['decay_constant']),:]
+            if tb_empty.shape[0] > 0:
+                row_no = str([i+3 for i in tb_empty.index]).replace('[', '').replace(']', '')
                 warning_ctr += 1
+                report('Dating information tab: decay_constant must be empty when date_type is not of U/Th type. See row(s) %s' %row_no)
+        else:
+            pass # There are only C14 or event date types
+        # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        # 7.iii.c.5. Check no hiatuses at the same depth as dates
+        # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        # Dating information table
+        # Make sure that for each entity, that no hiatuses have the same depth as dates
+        # 1. Loop through each entity in the dating information table
+        #   i.  subset the dating information table into two tables; hiatuses, and not 
+        #       hiatuses.
+        #   ii. check if depth_dating for the table with hiatuses are not duplicated.
+        #       If they are not:
+        #       a. Loop through each depth_dating for the table with hiatuses
+        #           - see if the depth exist in depths of table with no hiatuses
+        #
+        warning_ctr_bef = warning_ctr
+        is_hiatus = (dating_tb['date_type'] == 'Event; hiatus')
+        dating_hiat_parts = partition_by_entity(dating_tb.loc[is_hiatus, ['entity_name', 'depth_dating']])
+        dating_nohiat_parts = partition_by_entity(dating_tb.loc[~is_hiatus, ['entity_name', 'depth_dating']])
+        no_depths = dating_tb['depth_dating'].iloc[0:0]
+        for i in pd.unique(dating_tb['entity_name']):
+            depth_ent_hiat = dating_hiat_parts[i]['depth_dating'] if i in dating_hiat_parts else no_depths
+            if len(depth_ent_hiat.index) == 0: # used len(dataframe.index) instead of dataframe.empty as it is faster
+                pass
             else:
-                depth_ent_ls = []
-                for k in depth_ent_hiat:
-                    if k in list(depth_ent_nohiat):
-                        depth_ent_ls.append(k)
-                if len(depth_ent_ls) > 0:
+                depth_ent_nohiat = dating_nohiat_parts[i]['depth_dating'] if i in dating_nohiat_parts else no_depths
+                if len(depth_ent_hiat) != len(set(depth_ent_hiat)):
+                    depth_ent_ls = []
+                    for j in set(depth_ent_hiat):
+                        if list(depth_ent_hiat).count(j) > 1:
+                            depth_ent_ls.append(j)
                     depth_ent_ls = str(depth_ent_ls).replace('[', '').replace(']', '')
-                    print('Dating information tab: Entity %s; A hiatus cannot be at the same depth as a date. See depth_dating: %s' %(i, depth_ent_ls))
-                    warning_ctr += 1
-    # check if there has been new warnings counted. This will be use to indicate 
-    # whether or not to check for hiatuses in sample tables and in the dating table
-    warning_ctr_hiat = warning_ctr - warning_ctr_bef 
-    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-    # 7.iii.c.6. Check that if there is an Event; actively forming
-    #   that depth_dating = 0, if depth_ref = 'from top'
-    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-    for i in pd.unique(dating_tb['entity_name']):
-        depth_ref = entity_tb.loc[entity_tb['entity_name'] == i, 'depth_ref'].values[0]
-        ent_activ = dating_tb.loc[(dating_tb['entity_name'] == i) & (dating_tb['date_type'] == 'Event; actively forming'), :]
-        if len(ent_activ.index) == 0: # used len(dataframe.index) instead of dataframe.empty as it is faster
-            pass
-        elif len(ent_activ.index) > 1:
-            print('Dating information tab: Entity %s; There are more than one actively growing event.' %(i))
-            warning_ctr += 1
-        else:
-            if depth_ref == 'from top':
-                if ent_activ.loc[:,'depth_dating'].values[0] != 0:
-                    print('Dating information tab: Entity %s; Actively growing event is not at depth_dating = 0 when depth_ref is from top.' %(i))
+                    report('Dating information tab: Entity %s; There are multiple hiatuses recorded at depth_dating: %s' %(i, depth_ent_ls))
                     warning_ctr += 1
-            corr_age_ent_activ = ent_activ.loc[:,'corr_age'].values[0]
-            modref_ent_activ = ent_activ.loc[:,'modern_reference'].values[0]
-            if modref_ent_activ in ['b2k', 'BP(1950)', 'Year of chemistry']: # modern_ref = CE/BCE already changed to BP(1950)
-                if modref_ent_activ == 'b2k':
-                    corr_age_ent_activ = corr_age_ent_activ + 50
-                elif modref_ent_activ == 'Year of chemistry':
-                    chemyear_ent = ent_activ.loc[:,'chem_year'].values[0]
-                    if pd.notnull(chemyear_ent):
-                        corr_age_ent_activ = corr_age_ent_activ - (chemyear_ent - 1950)
-                    else:
-                        pass # chem_year is missing and this would have been flagged elsewhere
                 else:
-                    pass # the rest should just be BP(1950)
-            else:
-                pass # modern reference is not b2k, BP(1950) or Year of chemistry and would be flagged elsewhere
-            if corr_age_ent_activ > 0:
+                    depth_ent_ls = []
+                    for k in depth_ent_hiat:
+                        if k in list(depth_ent_nohiat):
+                            depth_ent_ls.append(k)
+                    if len(depth_ent_ls) > 0:
+                        depth_ent_ls = str(depth_ent_ls).replace('[', '').replace(']', '')
+                        report('Dating information tab: Entity %s; A hiatus cannot be at the same depth as a date. See depth_dating: %s' %(i, depth_ent_ls))
+                        warning_ctr += 1
+        # check if there has been new warnings counted. This will be use to indicate 
+        # whether or not to check for hiatuses in sample tables and in the dating table
+        warning_ctr_hiat = warning_ctr - warning_ctr_bef 
+        # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        # 7.iii.c.6. Check that if there is an Event; actively forming
+        #   that depth_dating = 0, if depth_ref = 'from top'
+        # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        dating_activ_parts = partition_by_entity(dating_tb.loc[dating_tb['date_type'] == 'Event; actively forming', :])
+        no_dates = dating_tb.iloc[0:0]
+        for i in pd.unique(dating_tb['entity_name']):
+            depth_ref = entity_tb.loc[entity_tb['entity_name'] == i, 'depth_ref'].values[0]
+            ent_activ = dating_activ_parts.get(i, no_dates)
+            if len(ent_activ.index) == 0: # used len(dataframe.index) instead of dataframe.empty as it is faster
+                pass
+            elif len(ent_activ.index) > 1:
+                report('Dating information tab: Entity %s; There are more than one actively growing event.' %(i))
                 warning_ctr += 1
-                print('Dating information tab: Entity %s; Actively growing event is not in the modern era (younger than 1950) and this is very unlikely. Please check.' %(i))
+            else:
+                if depth_ref == 'from top':
+                    if ent_activ.loc[:,'depth_dating'].values[0] != 0:
+                        report('Dating information tab: Entity %s; Actively growing event is not at depth_dating = 0 when depth_ref is from top.' %(i))
+                        warning_ctr += 1
+                corr_age_ent_activ = ent_activ.loc[:,'corr_age'].values[0]
+                modref_ent_activ = ent_activ.loc[:,'modern_reference'].values[0]
+                if modref_ent_activ in ['b2k', 'BP(1950)', 'Year of chemistry']: # modern_ref = CE/BCE already changed to BP(1950)
+                    if modref_ent_activ == 'b2k':
+                        corr_age_ent_activ = corr_age_ent_activ + 50
+                    elif modref_ent_activ == 'Year of chemistry':
+                        chemyear_ent = ent_activ.loc[:,'chem_year'].values[0]
+                        if pd.notnull(chemyear_ent):
+                            corr_age_ent_activ = corr_age_ent_activ - (chemyear_ent - 1950)
+                        else:
+                            pass # chem_year is missing and this would have been flagged elsewhere
+                    else:
+                        pass # the rest should just be BP(1950)
+                else:
+                    pass # modern reference is not b2k, BP(1950) or Year of chemistry and would be flagged elsewhere
+                if corr_age_ent_activ > 0:
+                    warning_ctr += 1
+                    report('Dating information tab: Entity %s; Actively growing event is not in the modern era (younger than 1950) and this is very unlikely. Please check.' %(i))
+    if len(dating_tb.index) > 0:
+        wb['pass_depthdating_warning'] = pass_depthdating_warning
+        wb['warning_ctr_hiat'] = warning_ctr_hiat
+    return(warning_ctr)
 
-                    
 # -----------------------------------------------------------------------------
 # Section 7.iii.e. Lamina age vs depth spreadsheet
 # -----------------------------------------------------------------------------
-if dating_lamina_tb.shape[0] > 0:
-    warning_ctr += check_no_values(dating_lamina_tb, 'Lamina age vs depth', 'entity_name')
-    warning_ctr += check_no_values(dating_lamina_tb, 'Lamina age vs depth', 'depth_lam')
-    check_lamage_warning = check_no_values(dating_lamina_tb, 'Lamina age vs depth', 'lam_age')
-    warning_ctr += check_lamage_warning
-    check_modref_warning_lam = False
-    if check_no_values(dating_lamina_tb, 'Lamina age vs depth', 'modern_reference') == 0:
-        # Check if values in rows are valid when column has to be from a dropdown box
-        if check_values2list(dating_lamina_tb, 'modern_reference', 'Lamina age vs depth', ['BP (1950)', 'b2k', 'CE/BCE', 'Year of chemistry']) == 0:
-            check_modref_warning_lam = True
+# Column rules of the Lamina age vs depth table (see check_rules())
+lamina_column_rules = compile_rules([('paired', 'lam_age_uncert_pos', 'lam_age_uncert_neg'),
+                                     ('paired', 'lam_age_uncert_neg', 'lam_age_uncert_pos'),
+                                     ('paired', 'lam_age', 'lam_age_uncert_pos'),
+                                     ('paired', 'lam_age', 'lam_age_uncert_neg'),
+                                     ('positive', 'lam_age_uncert_pos', True),
+                                     ('positive', 'lam_age_uncert_neg', True)])
+
+def check_lamina_sheet(wb):
+    """Section 7.iii.e. Checks on the Lamina age vs depth spreadsheet (non-composites)
+
+    Args:
+        wb: dictionary of pandas dataframe objects. Tables of the workbook
+
+    Returns:
+        integer, number of warnings
+    """
+    dating_tb, dating_lamina_tb = wb['dating'], wb['dating_lamina']
+    warning_ctr = 0
+    if dating_lamina_tb.shape[0] > 0:
+        warning_ctr += check_no_values(dating_lamina_tb, 'Lamina age vs depth', 'entity_name')
+        warning_ctr += check_no_values(dating_lamina_tb, 'Lamina age vs depth', 'depth_lam')
+        check_lamage_warning = check_no_values(dating_lamina_tb, 'Lamina age vs depth', 'lam_age')
+        warning_ctr += check_lamage_warning
+        check_modref_warning_lam = False
+        if check_no_values(dating_lamina_tb, 'Lamina age vs depth', 'modern_reference') == 0:
+            # Check if values in rows are valid when column has to be from a dropdown box
+            if check_values2list(dating_lamina_tb, 'modern_reference', 'Lamina age vs depth', ['BP (1950)', 'b2k', 'CE/BCE', 'Year of chemistry']) == 0:
+                check_modref_warning_lam = True
+            else:
+                warning_ctr += 1
         else:
             warning_ctr += 1
-    else:
-        warning_ctr += 1
-    if check_modref_warning_lam:
-        try:
-            warning_ctr += check_yearofchemistry_crosstable(dating_lamina_tb, dating_tb)
-        except:
-            warning_ctr += 1
-            print('Lamina age vs depth tab: There is a problem checking chem_year when modern_reference is "Year of chemistry". Perhaps modern_reference is entirely missing. Please check.')
-    # Check that the uncertainties coexist and that lam_age exist if they exist
-    warning_ctr += check_independent_dependent_col(dating_lamina_tb, 'Lamina age vs depth', 'lam_age_uncert_pos', 'lam_age_uncert_neg')
-    warning_ctr += check_independent_dependent_col(dating_lamina_tb, 'Lamina age vs depth', 'lam_age_uncert_neg', 'lam_age_uncert_pos')
-    warning_ctr += check_independent_dependent_col(dating_lamina_tb, 'Lamina age vs depth', 'lam_age', 'lam_age_uncert_pos')
-    warning_ctr += check_independent_dependent_col(dating_lamina_tb, 'Lamina age vs depth', 'lam_age', 'lam_age_uncert_neg')
-    # Check that lam_age_uncert_pos and neg have positive values
-    warning_ctr += check_positivenumbers(dating_lamina_tb, 'Lamina age vs depth', 'lam_age_uncert_pos', na_rm = True)
-    warning_ctr += check_positivenumbers(dating_lamina_tb, 'Lamina age vs depth', 'lam_age_uncert_neg', na_rm = True)
-    for i in set(dating_lamina_tb['entity_name']):
-        warning_ctr += check_notminmax_age(dating_lamina_tb.loc[dating_lamina_tb['entity_name'] == i,:], 'lam_age', 'lam_age_uncert_pos', 'lam_age_uncert_neg', 'Lamina age vs depth', i)
-    # Make sure lam_age is in valid range
-    # convert ages to BP(1950 first)
-    if check_lamage_warning == 0:
         if check_modref_warning_lam:
-            dating_lamina_tb.loc[dating_lamina_tb['modern_reference'] == 'CE/BCE', 'lam_age'] = 1950 - dating_lamina_tb.loc[dating_lamina_tb['modern_reference'] == 'CE/BCE', 'lam_age'] 
-            warning_ctr += check_numbers_in_range(dating_lamina_tb, 'Lamina age vs depth', 'lam_age', -70, np.inf)
+            try:
+                warning_ctr += check_yearofchemistry_crosstable(dating_lamina_tb, dating_tb)
+            except:
+                warning_ctr += 1
+                report('Lamina age vs depth tab: There is a problem checking chem_year when modern_reference is "Year of chemistry". Perhaps modern_reference is entirely missing. Please check.')
+        # Check that the uncertainties coexist and that lam_age exist if they exist,
+        # and that lam_age_uncert_pos and neg have positive values
+        warning_ctr += check_rules(dating_lamina_tb, 'Lamina age vs depth', lamina_column_rules)
+        dating_lamina_parts = partition_by_entity(dating_lamina_tb)
+        warning_ctr += run_entity_checks([(check_notminmax_age, (dating_lamina_parts[i], 'lam_age', 'lam_age_uncert_pos', 'lam_age_uncert_neg', 'Lamina age vs depth', i))
+                                          for i in set(dating_lamina_tb['entity_name'])])
+        # Make sure lam_age is in valid range
+        # convert ages to BP(1950 first)
+        if check_lamage_warning == 0:
+            if check_modref_warning_lam:
+                dating_lamina_tb.loc[dating_lamina_tb['modern_reference'] == 'CE/BCE', 'lam_age'] = 1950 - dating_lamina_tb.loc[dating_lamina_tb['modern_reference'] == 'CE/BCE', 'lam_age'] 
+                warning_ctr += check_numbers_in_range(dating_lamina_tb, 'Lamina age vs depth', 'lam_age', -70, np.inf)
+    return(warning_ctr)
 
 # -----------------------------------------------------------------------------
 # Section 7.iii.f. Reference spreadsheet
 # -----------------------------------------------------------------------------
-# Reference table
-# Check that if the citation is the same, the DOI must be the same
-ref_ctr = len(pd.unique(ref_tb['citation'])) # save to be printed out later
-# 1. Make a list of references with more than one count
-mylist = set(ref_tb['citation'].value_counts()[ref_tb['citation'].value_counts() > 1].index)
-if len(mylist) > 0:
-    ctr = 0
-    for i in mylist:
-        if len(set(ref_tb.loc[ref_tb['citation'] == i, 'publication_DOI'])) > 1:
-            rownumber = str(list(ref_tb.loc[ref_tb['citation'] == i, 'publication_DOI'].index + 3)).replace('[', '').replace(']', '')
-            ctr += 1 
-            try:
-                print('References tab: There is more than one DOI associated to %s. Possible drag-down error with the DOI. row:' %(i, rownumber))
-            except:
-                print('References tab: There is more than one DOI associated to one of the references. This could not be printed due to special characters in the citation. Please identify this manually. Possible drag-down error with the DOI. see row: %s' %(rownumber))
-        elif len(set(ref_tb.loc[ref_tb['citation'] == i, 'publication_DOI'])) == 0:
-            ctr += 1
-            print('Jackpot! You should go buy a lottery ticket but before, please let us know what did you do to get this (theoretically impossible) warning!')
-        else:
-            pass
-    if ctr > 0:
-        warning_ctr += 1
-else:
-    pass # all citations in this workbooks are unique
-# Check that if the DOI is the same, the citation must be the same unless the DOI is 'unpublished'
-# 1. Make a list of DOI with more than one counts
-mylist = set(ref_tb['publication_DOI'].value_counts()[ref_tb['publication_DOI'].value_counts() > 1].index)
-if len(mylist) > 0:
-    ctr = 0
-    for i in mylist:
-        if len(set(ref_tb.loc[ref_tb['publication_DOI'] == i, 'citation'])) > 1:
-            ctr += 1 
-            print('References tab: One same DOI (%s) is linked to multiple citations. If two citations are reported as "unpublished" or if the same DOI is from different chapters of the same book, please move the workbook to the "Checked" folder manually' %i)
-        elif len(set(ref_tb.loc[ref_tb['publication_DOI'] == i, 'citation'])) == 0:
-            ctr += 1
-            print('Jackpot! You should go buy a lottery ticket but before, please let us know what did you do to get this (theoretically impossible) warning!')
-        else:
-            pass
-    if ctr > 0:
-        warning_ctr += 1
-else:
-    pass # all citations in this workbooks are unique
+def check_reference_sheet(wb):
+    """Section 7.iii.f. Checks on the References spreadsheet
+
+    Args:
+        wb: dictionary of pandas dataframe objects. Tables of the workbook
+
+    Returns:
+        integer, number of warnings
+    """
+    ref_tb = wb['ref']
+    warning_ctr = 0
+    # Reference table
+    # Check that if the citation is the same, the DOI must be the same
+    # 1. Make a list of references with more than one count (grouped once with their DOIs)
+    mylist, groups = find_multiple_values(ref_tb, 'citation', 'publication_DOI')
+    if len(mylist) > 0:
+        ctr = 0
+        for i in mylist:
+            doi_count, rows = groups[i]
+            if doi_count > 1:
+                rownumber = str(list(rows + 3)).replace('[', '').replace(']', '')
+                ctr += 1 
+                try:
+                    report('References tab: There is more than one DOI associated to %s. Possible drag-down error with the DOI. row: %s' %(i, rownumber))
+                except:
+                    report('References tab: There is more than one DOI associated to one of the references. This could not be printed due to special characters in the citation. Please identify this manually. Possible drag-down error with the DOI. see row: %s' %(rownumber))
+            elif doi_count == 0:
+                ctr += 1
+                report('Jackpot! You should go buy a lottery ticket but before, please let us know what did you do to get this (theoretically impossible) warning!')
+            else:
+                pass
+        if ctr > 0:
+            warning_ctr += 1
+    else:
+        pass # all citations in this workbooks are unique
+    # Check that if the DOI is the same, the citation must be the same unless the DOI is 'unpublished'
+    # 1. Make a list of DOI with more than one counts (grouped once with their citations)
+    mylist, groups = find_multiple_values(ref_tb, 'publication_DOI', 'citation')
+    if len(mylist) > 0:
+        ctr = 0
+        for i in mylist:
+            citation_count = groups[i][0]
+            if citation_count > 1:
+                ctr += 1 
+                report('References tab: One same DOI (%s) is linked to multiple citations. If two citations are reported as "unpublished" or if the same DOI is from different chapters of the same book, please move the workbook to the "Checked" folder manually' %i)
+            elif citation_count == 0:
+                ctr += 1
+                report('Jackpot! You should go buy a lottery ticket but before, please let us know what did you do to get this (theoretically impossible) warning!')
+            else:
+                pass
+        if ctr > 0:
+            warning_ctr += 1
+    else:
+        pass # all citations in this workbooks are unique
 
-for g in np.unique(ref_tb['entity_name']):
-    ref_tb_integrity = ref_tb.loc[ref_tb['entity_name'] == g, :]
-    if len(set(ref_tb_integrity['citation'])) < ref_tb_integrity.shape[0]:
+    # entities with a citation which is repeated
+    for g in np.unique(ref_tb.loc[ref_tb.duplicated(['entity_name', 'citation']).values, 'entity_name']):
         warning_ctr += 1
-        print('References tab: There are repeated citation(s) in %s.' %g)
-    
-indices = [i for i, s in enumerate(ref_tb['publication_DOI']) if (any(x == s.lower() for x in ['unknown', '', ' ', 'n/a', 'na', 'not known', 'notknown', 'not applicable', 'unkwn'])) | s.startswith(' ') | s.endswith(' ')]
-indices = ref_tb.iloc[indices,:].index + 3
-if len(indices) > 0:
-    warning_ctr += 1
-    print('References tab: The DOI(s) entered in row %s is incorrect. This must be either a DOI, URL or "unpublished". If it looks OK in the workbook, check for spaces before or after the DOI and re-check.' %str(list(indices)))
-else:
-    indices = [i for i, s in enumerate(ref_tb['publication_DOI']) if not (s.startswith('http') | s.startswith('10.') | (s == 'unpublished'))]
-    indices = ref_tb.iloc[indices,:].index + 3
+        report('References tab: There are repeated citation(s) in %s.' %g)
+
+    doi = ref_tb['publication_DOI'].astype(str)
+    indices = ref_tb.index[placeholder_mask(doi)] + 3
     if len(indices) > 0:
         warning_ctr += 1
-        print('References tab: Incorrect DOI(s) entered in row %s. DOI/URL must either be "unpublished" (e.g. PhDs and unpublished records) or start with "http", "10."' %str(list(indices))) 
+        report('References tab: The DOI(s) entered in row %s is incorrect. This must be either a DOI, URL or "unpublished". If it looks OK in the workbook, check for spaces before or after the DOI and re-check.' %str(list(indices)))
+    else:
+        indices = ref_tb.index[~(doi.str.startswith('http') | doi.str.startswith('10.') | (doi == 'unpublished')).values] + 3
+        if len(indices) > 0:
+            warning_ctr += 1
+            report('References tab: Incorrect DOI(s) entered in row %s. DOI/URL must either be "unpublished" (e.g. PhDs and unpublished records) or start with "http", "10."' %str(list(indices))) 
 
 
-indices = [i for i, s in enumerate(ref_tb['citation']) if (any(x == s.lower() for x in ['unknown', '', ' ', 'n/a', 'na', 'not known', 'notknown', 'not applicable', 'unkwn'])) | s.startswith(' ') | s.endswith(' ')]
-indices = ref_tb.iloc[indices,:].index + 3
-if len(indices) > 0:
-    warning_ctr += 1
-    print('References tab: The citation(s) in row %s is incorrect. This cannot be empty, "unknown", "N/A", "not known", etc or have spaces before/after the text' %str(list(indices)))
+    indices = ref_tb.index[placeholder_mask(ref_tb['citation'])] + 3
+    if len(indices) > 0:
+        warning_ctr += 1
+        report('References tab: The citation(s) in row %s is incorrect. This cannot be empty, "unknown", "N/A", "not known", etc or have spaces before/after the text' %str(list(indices)))
+
+    # _____________________________________________________________________________
+    return(warning_ctr)
 
-# _____________________________________________________________________________
 #
 # Section 7.vi. Check across tables (between table integrity)
 # _____________________________________________________________________________
@@ -1820,178 +3841,231 @@ if len(indices) > 0:
 # -----------------------------------------------------------------------------
 # Section 7.vi.a. Reference spreadsheet
 # -----------------------------------------------------------------------------
+def check_across_sheets(wb):
+    """Section 7.vi.a. Checks across spreadsheets (between table integrity)
 
-# Check that if lamina age vs depth table exists that the dating information table contain an 'Event; start of laminations'
-if dating_lamina_tb.shape[0] > 0:
-    #find the unique entity name
-    entity_name_datinglamina_list = np.unique(dating_lamina_tb['entity_name'])
-    #for each of the entity name
-    for z in entity_name_datinglamina_list:
-        #there must be an Event;start of laminations
-        dating_tb_subset_startoflam = dating_tb.loc[(dating_tb['entity_name'] == z) & (dating_tb['date_type'] == 'Event; start of laminations'),:]
-        if dating_tb_subset_startoflam.shape[0] > 0:
-            pass
-        else:
-            print('Lamina age vs depth tab: There is at least one date in this tab but the dating information table does not contain an "Event; start of laminations".')
-            warning_ctr += 1
+    Args:
+        wb: dictionary of pandas dataframe objects. Tables of the workbook
 
-# Check that if dating information table conatin an 'Event; start of laminations' and whether lamina age vs depth table exists
-dating_tb_startoflam = dating_tb.loc[(dating_tb['date_type'] == 'Event; start of laminations'),:]
-if dating_tb_startoflam.shape[0] > 0:
-    #find the unique entity name
-    entity_name_datinglamina_list = np.unique(dating_tb_startoflam['entity_name'])
-    #for each of the entity name
-    for z in entity_name_datinglamina_list:
-        #there must be an lamina age vs depth
-        dating_lamina_tb_subset = dating_lamina_tb.loc[(dating_lamina_tb['entity_name'] == z),:]
-        if dating_lamina_tb_subset.shape[0] > 0:
-            pass
-        else:
-            print('Dating information tab: There is an "Event; start of laminations" but no data in the lamina age vs depth spreadsheet')
-            warning_ctr += 1
+    Returns:
+        integer, number of warnings
+    """
+    entity_tb, ref_tb, sample_tb = wb['entity'], wb['ref'], sample_columns(wb)
+    dating_tb, dating_lamina_tb = wb['dating'], wb['dating_lamina']
+    sample_tb_rm_hiatus_agemodel = wb['sample_rm_hiatus_agemodel']
+    warning_ctr_hiat = wb.get('warning_ctr_hiat')
+    warning_ctr = 0
+    # Check that if lamina age vs depth table exists that the dating information table contain an 'Event; start of laminations'
+    if dating_lamina_tb.shape[0] > 0:
+        #find the unique entity name
+        entity_name_datinglamina_list = np.unique(dating_lamina_tb['entity_name'])
+        startoflam_entities = set(dating_tb.loc[(dating_tb['date_type'] == 'Event; start of laminations'), 'entity_name'])
+        #for each of the entity name
+        for z in entity_name_datinglamina_list:
+            #there must be an Event;start of laminations
+            if z in startoflam_entities:
+                pass
+            else:
+                report('Lamina age vs depth tab: There is at least one date in this tab but the dating information table does not contain an "Event; start of laminations".')
+                warning_ctr += 1
 
-# Check if hiatuses depth in sample spreadsheet matches the depths in dating information
-if 'H' in list(sample_tb['hiatus']):
-    hiatus_sample_subset = sample_tb.loc[(sample_tb['hiatus'] == 'H'),:]
-    entity_name_unique = np.unique(hiatus_sample_subset['entity_name'])
-    for q in entity_name_unique:
-        hiatus_dating_subset = dating_tb.loc[(dating_tb['date_type'] == 'Event; hiatus') & (dating_tb['entity_name'] == q), :]
-        hiatus_sample_subset_entity = hiatus_sample_subset.loc[(hiatus_sample_subset['entity_name'] == q), :]
-        if len(set(hiatus_dating_subset['depth_dating']).intersection(hiatus_sample_subset_entity['depth_sample'])) == len(hiatus_sample_subset_entity['depth_sample']):
-            pass
-        else:
-            warning_ctr += 1
-            hiatus_ls = str(list(set(hiatus_sample_subset_entity['depth_sample']) - set(hiatus_dating_subset['depth_dating'])))
-            print('Sample data tab: Entity %s has a hiatus in this tab that does not match that of the dating spreadsheet. See depth_sample %s' %(q, hiatus_ls))
-else:
-    pass
-    #print('No hiatus in this workbook')
-if (len(dating_tb.index) > 0) & (len(sample_tb.index) > 0):
-    if warning_ctr_hiat == 0:
-        # Check if hiatus in dating table occurs in the sample table if they arein the range of the depths of samples
-        if 'Event; hiatus' in list(dating_tb['date_type']):
-            hiatus_dating_subset = dating_tb.loc[(dating_tb['date_type'] == 'Event; hiatus'),:]
-            entity_name_unique = np.unique(hiatus_dating_subset['entity_name'])
-            for q in entity_name_unique:
-                maxdepth = np.max(sample_tb.loc[(sample_tb['entity_name'] == q), 'depth_sample'])
-                mindepth = np.min(sample_tb.loc[(sample_tb['entity_name'] == q), 'depth_sample'])
-                hiatus_dating_subset_entity = hiatus_dating_subset.loc[(hiatus_dating_subset['entity_name'] == q) & (hiatus_dating_subset['depth_dating'] >= mindepth) & (hiatus_dating_subset['depth_dating'] <= maxdepth), :]
-                if sample_tb['hiatus'].dtype == 'O':
-                    hiatus_sample_subset = set(sample_tb.loc[(sample_tb['hiatus'] == 'H') & (sample_tb['entity_name'] == q), 'depth_sample'])
-                else:
-                    hiatus_sample_subset = set()
-                if len(hiatus_sample_subset.intersection(set(hiatus_dating_subset_entity['depth_dating']))) == len(hiatus_dating_subset_entity['depth_dating']):
-                    pass
-                else:
-                    warning_ctr += 1
-                    hiatus_ls = str(list(set(hiatus_dating_subset_entity['depth_dating']) - hiatus_sample_subset))
-                    print('Dating information tab: Entity %s has a hiatus in this tab that does not match that of the sample data spreadsheet. See depth_dating %s' %(q, hiatus_ls))
-        else:
-            pass
-            #print('No hiatus in this workbook')
-    
-# Check that there are at least one reference for each entity
-for g in np.unique(entity_tb['entity_name']):
-    ref_tb_integrity = ref_tb.loc[ref_tb['entity_name'] == g, :]
-    if ref_tb_integrity.shape[0] < 1:
-        warning_ctr += 1
-        print('References tab: Entity %s is missing a reference' %g)
-    
-# Check that there at least the dating table exist or both dating table and lamina age vs depth table exist  
-for e in np.unique(entity_tb.loc[entity_tb['speleothem_type'] != 'composite','entity_name']):
-    dating_tb_subset = dating_tb.loc[(dating_tb['entity_name'] == e), :]
-    datinglamina_tb_subset = dating_lamina_tb.loc[(dating_lamina_tb['entity_name'] == e), :]
-    if (dating_tb_subset.shape[0] > 0):
-        pass
+    # Check that if dating information table conatin an 'Event; start of laminations' and whether lamina age vs depth table exists
+    dating_tb_startoflam = dating_tb.loc[(dating_tb['date_type'] == 'Event; start of laminations'),:]
+    if dating_tb_startoflam.shape[0] > 0:
+        #find the unique entity name
+        entity_name_datinglamina_list = np.unique(dating_tb_startoflam['entity_name'])
+        lamina_entities = set(dating_lamina_tb['entity_name'])
+        #for each of the entity name
+        for z in entity_name_datinglamina_list:
+            #there must be an lamina age vs depth
+            if z in lamina_entities:
+                pass
+            else:
+                report('Dating information tab: There is an "Event; start of laminations" but no data in the lamina age vs depth spreadsheet')
+                warning_ctr += 1
+
+    # Check if hiatuses depth in sample spreadsheet matches the depths in dating information
+    if 'H' in list(sample_tb['hiatus']):
+        hiatus_sample_subset = sample_tb.loc[(sample_tb['hiatus'] == 'H'),:]
+        entity_name_unique = np.unique(hiatus_sample_subset['entity_name'])
+        hiatus_dating_parts = partition_by_entity(dating_tb.loc[(dating_tb['date_type'] == 'Event; hiatus'), :])
+        hiatus_sample_parts = partition_by_entity(hiatus_sample_subset)
+        for q in entity_name_unique:
+            hiatus_dating_subset = hiatus_dating_parts.get(q, dating_tb.iloc[0:0])
+            hiatus_sample_subset_entity = hiatus_sample_parts[q]
+            if len(set(hiatus_dating_subset['depth_dating']).intersection(hiatus_sample_subset_entity['depth_sample'])) == len(hiatus_sample_subset_entity['depth_sample']):
+                pass
+            else:
+                warning_ctr += 1
+                hiatus_ls = str(list(set(hiatus_sample_subset_entity['depth_sample']) - set(hiatus_dating_subset['depth_dating'])))
+                report('Sample data tab: Entity %s has a hiatus in this tab that does not match that of the dating spreadsheet. See depth_sample %s' %(q, hiatus_ls))
     else:
-        if datinglamina_tb_subset.shape[0] > 0:
-            print('Dating information tab: Entity %s has laminae information but no dating information. date_type = "Event; start of laminations" and "Event; end of laminations" must be entered' %e)
-            warning_ctr += 1
-        else:
-            print('Dating information tab: Entity %s has no dating information' %e)
+        pass
+        #print('No hiatus in this workbook')
+    if (len(dating_tb.index) > 0) & (len(sample_tb.index) > 0):
+        if warning_ctr_hiat == 0:
+            # Check if hiatus in dating table occurs in the sample table if they arein the range of the depths of samples
+            if 'Event; hiatus' in list(dating_tb['date_type']):
+                hiatus_dating_subset = dating_tb.loc[(dating_tb['date_type'] == 'Event; hiatus'),:]
+                entity_name_unique = np.unique(hiatus_dating_subset['entity_name'])
+                hiatus_dating_parts = partition_by_entity(hiatus_dating_subset)
+                sample_parts = partition_by_entity(sample_tb[['entity_name', 'depth_sample', 'hiatus']])
+                for q in entity_name_unique:
+                    sample_tb_ent = sample_parts.get(q, sample_tb.iloc[0:0])
+                    maxdepth = np.max(sample_tb_ent['depth_sample'])
+                    mindepth = np.min(sample_tb_ent['depth_sample'])
+                    hiatus_dating_subset_ent = hiatus_dating_parts[q]
+                    hiatus_dating_subset_entity = hiatus_dating_subset_ent.loc[(hiatus_dating_subset_ent['depth_dating'] >= mindepth) & (hiatus_dating_subset_ent['depth_dating'] <= maxdepth), :]
+                    if sample_tb['hiatus'].dtype.kind == 'O':  # text or categorical
+                        hiatus_sample_subset = set(sample_tb_ent.loc[(sample_tb_ent['hiatus'] == 'H'), 'depth_sample'])
+                    else:
+                        hiatus_sample_subset = set()
+                    if len(hiatus_sample_subset.intersection(set(hiatus_dating_subset_entity['depth_dating']))) == len(hiatus_dating_subset_entity['depth_dating']):
+                        pass
+                    else:
+                        warning_ctr += 1
+                        hiatus_ls = str(list(set(hiatus_dating_subset_entity['depth_dating']) - hiatus_sample_subset))
+                        report('Dating information tab: Entity %s has a hiatus in this tab that does not match that of the sample data spreadsheet. See depth_dating %s' %(q, hiatus_ls))
+            else:
+                pass
+                #print('No hiatus in this workbook')
+
+    # Check that there are at least one reference for each entity
+    ref_entities = set(ref_tb['entity_name'])
+    for g in np.unique(entity_tb['entity_name']):
+        if g not in ref_entities:
             warning_ctr += 1
-    # If there is Event; end of laminations, there must be Event; start of laminations
-    if 'Event; end of laminations' in list(dating_tb_subset['date_type']):
-        if 'Event; start of laminations' in list(dating_tb_subset['date_type']):
+            report('References tab: Entity %s is missing a reference' %g)
+
+    # Check that there at least the dating table exist or both dating table and lamina age vs depth table exist  
+    dating_parts = partition_by_entity(dating_tb)
+    dating_lamina_parts = partition_by_entity(dating_lamina_tb)
+    sample_rm_hiatus_parts = partition_by_entity(sample_tb_rm_hiatus_agemodel)
+    for e in np.unique(entity_tb.loc[entity_tb['speleothem_type'] != 'composite','entity_name']):
+        dating_tb_subset = dating_parts.get(e, dating_tb.iloc[0:0])
+        datinglamina_tb_subset = dating_lamina_parts.get(e, dating_lamina_tb.iloc[0:0])
+        if (dating_tb_subset.shape[0] > 0):
             pass
         else:
-            warning_ctr += 1
-            print('Dating information tab: there is date_type = "Event; end of laminations" but no date_type = "Event; start of laminations" for Entity %s. Both must be entered' %e)
-    else:
-        if 'Event; start of laminations' in list(dating_tb_subset['date_type']):
-            warning_ctr += 1
-            print('Dating information tab: there is date_type = "Event; start of laminations" but no date_type = "Event; end of laminations" for entity %s. Both must be entered' %e)
-    # If there is Event; end of laminations or Event; start of laminations, there shoudl be lamina age vs depth table
-    if (any(x in list(dating_tb_subset['date_type']) for x in ['Event; end of laminations', 'Event; start of laminations'])) & (datinglamina_tb_subset.shape[0] == 0):
-        warning_ctr += 1
-        print('Lamina age vs depth tab: According to the Dating information tab, entity %s is laminated (i.e. date_type = "Event; end of laminations" or "Event; start of laminations" have been entered). However, there is no information on the laminae in the lamina age vs depth table. Have you done your best to find these data?' %e)
-    # If there is lamina age vs depth table, there must be 'Event; start of laminations
-    if datinglamina_tb_subset.shape[0] > 0:
-        if ('Event; start of laminations' in list(dating_tb_subset['date_type'])):
-            pass
+            if datinglamina_tb_subset.shape[0] > 0:
+                report('Dating information tab: Entity %s has laminae information but no dating information. date_type = "Event; start of laminations" and "Event; end of laminations" must be entered' %e)
+                warning_ctr += 1
+            else:
+                report('Dating information tab: Entity %s has no dating information' %e)
+                warning_ctr += 1
+        # If there is Event; end of laminations, there must be Event; start of laminations
+        if 'Event; end of laminations' in list(dating_tb_subset['date_type']):
+            if 'Event; start of laminations' in list(dating_tb_subset['date_type']):
+                pass
+            else:
+                warning_ctr += 1
+                report('Dating information tab: there is date_type = "Event; end of laminations" but no date_type = "Event; start of laminations" for Entity %s. Both must be entered' %e)
         else:
+            if 'Event; start of laminations' in list(dating_tb_subset['date_type']):
+                warning_ctr += 1
+                report('Dating information tab: there is date_type = "Event; start of laminations" but no date_type = "Event; end of laminations" for entity %s. Both must be entered' %e)
+        # If there is Event; end of laminations or Event; start of laminations, there shoudl be lamina age vs depth table
+        if (any(x in list(dating_tb_subset['date_type']) for x in ['Event; end of laminations', 'Event; start of laminations'])) & (datinglamina_tb_subset.shape[0] == 0):
             warning_ctr += 1
-            print('Dating information tab: Entity %s has laminae data but is missing date_type = "Event; start of laminations" in the dating information spreadsheet' %e)
-    # If there is no Event; start of laminations, ann_lam_check for that particular entity must be not applicable
-    sample_tb_rm_hiatus_ent = sample_tb_rm_hiatus_agemodel.loc[sample_tb_rm_hiatus_agemodel['entity_name'] == e, :]
-    if (any(x in list(dating_tb_subset['date_type']) for x in ['Event; start of laminations', 'Event; end of laminations'])):
-        if sample_tb_rm_hiatus_ent.shape[0] > 0:
-            if (any(sample_tb_rm_hiatus_ent['ann_lam_check'] == 'not applicable')):
+            report('Lamina age vs depth tab: According to the Dating information tab, entity %s is laminated (i.e. date_type = "Event; end of laminations" or "Event; start of laminations" have been entered). However, there is no information on the laminae in the lamina age vs depth table. Have you done your best to find these data?' %e)
+        # If there is lamina age vs depth table, there must be 'Event; start of laminations
+        if datinglamina_tb_subset.shape[0] > 0:
+            if ('Event; start of laminations' in list(dating_tb_subset['date_type'])):
+                pass
+            else:
                 warning_ctr += 1
-                print('Sample data tab: Entity %s is laminated and therefore ann_lam_check cannot not be "not applicable"' %e)
+                report('Dating information tab: Entity %s has laminae data but is missing date_type = "Event; start of laminations" in the dating information spreadsheet' %e)
+        # If there is no Event; start of laminations, ann_lam_check for that particular entity must be not applicable
+        sample_tb_rm_hiatus_ent = sample_rm_hiatus_parts.get(e, sample_tb_rm_hiatus_agemodel.iloc[0:0])
+        if (any(x in list(dating_tb_subset['date_type']) for x in ['Event; start of laminations', 'Event; end of laminations'])):
+            if sample_tb_rm_hiatus_ent.shape[0] > 0:
+                if (any(sample_tb_rm_hiatus_ent['ann_lam_check'] == 'not applicable')):
+                    warning_ctr += 1
+                    report('Sample data tab: Entity %s is laminated and therefore ann_lam_check cannot not be "not applicable"' %e)
+                else:
+                    pass
             else:
-                pass
+                pass # has lamina but no age model
         else:
-            pass # has lamina but no age model
-    else:
-        if len(sample_tb_rm_hiatus_ent.index) > 0:
-            if (all(sample_tb_rm_hiatus_ent['ann_lam_check'] != 'not applicable')):
+            if len(sample_tb_rm_hiatus_ent.index) > 0:
+                if (all(sample_tb_rm_hiatus_ent['ann_lam_check'] != 'not applicable')):
+                    warning_ctr += 1
+                    report('Sample data tab: ann_lam_check for entity %s must be "not applicable" if this is a non-laminated speleothem (as assumed from the lack of date_type = "Event; start of laminations"/"Event; end of laminations" in the dating information table)' %e)
+
+    # Check integrity of the lamina dating information
+    # 1. select just the lamination dates
+    # 2. for each of these entity that is left:
+    #   Sort these by depth (or reversed with depth_ref = 'from base')
+    #   First item (first item from top) must be 'Event; end of laminations' 
+    #   Last item (first item from bottom) must be 'Event; start of laminations'
+    #   check that there are no entries where Event; start of laminations has a depth of 0 (if depth_ref = 'from top')
+    #   check that there are no entries where Event; end of laminations has a depth of 0 (if depth_ref = 'from base')
+    #   If it pass these four tests and there are more than just two of them:
+    #       check that there are no consecutive 'Event; start of laminations' (which means that they have to be alternating)
+
+    indices = [i for i, s in enumerate(dating_tb['date_type']) if ('laminations' in s)]
+    dating_tb_lam = dating_tb.iloc[indices, :]
+    # order the lamination dates of all entities at once by entity, then depth
+    # (from top) or reversed depth (from base), as the dates of each entity
+    # are sorted by depth below
+    codes, lam_entities = pd.factorize(dating_tb_lam['entity_name'], sort = True)
+    depth_refs = dict(entity_tb.drop_duplicates('entity_name')[['entity_name', 'depth_ref']].values)
+    direction = np.array([{'from top': 1, 'from base': -1}.get(depth_refs.get(e), 0) for e in lam_entities], dtype = int)
+    depths = pd.to_numeric(dating_tb_lam['depth_dating'], errors = 'coerce').values.astype(float)
+    order = np.lexsort((depths * direction[codes], codes))
+    dating_tb_lam, codes = dating_tb_lam.iloc[order, :], codes[order]
+    bounds = np.searchsorted(codes, np.arange(len(lam_entities) + 1))
+    # two consecutive dates of an entity with the same date_type (they must alternate)
+    date_types = np.asarray(dating_tb_lam['date_type'], dtype = object)
+    consecutive = np.bincount(codes[1:][(date_types[1:] == date_types[:-1]) & (codes[1:] == codes[:-1])], minlength = len(lam_entities)) > 0
+    actively_forming = set(dating_tb.loc[dating_tb['date_type'] == 'Event; actively forming', 'entity_name'])
+    for n, e in enumerate(lam_entities):
+        dating_ent = dating_tb_lam.iloc[bounds[n]:bounds[n + 1], :]
+        depth_ref = depth_refs[e]
+        further_check = True
+        if depth_ref == 'from top':
+            if any(dating_ent.loc[dating_ent['date_type'] == 'Event; start of laminations', 'depth_dating'] == 0):
                 warning_ctr += 1
-                print('Sample data tab: ann_lam_check for entity %s must be "not applicable" if this is a non-laminated speleothem (as assumed from the lack of date_type = "Event; start of laminations"/"Event; end of laminations" in the dating information table)' %e)
-           
-# Check integrity of the lamina dating information
-# 1. select just the lamination dates
-# 2. for each of these entity that is left:
-#   Sort these by depth (or reversed with depth_ref = 'from base')
-#   First item (first item from top) must be 'Event; end of laminations' 
-#   Last item (first item from bottom) must be 'Event; start of laminations'
-#   check that there are no entries where Event; start of laminations has a depth of 0 (if depth_ref = 'from top')
-#   check that there are no entries where Event; end of laminations has a depth of 0 (if depth_ref = 'from base')
-#   If it pass these four tests and there are more than just two of them:
-#       check that there are no consecutive 'Event; start of laminations' (which means that they have to be alternating)
-
-indices = [i for i, s in enumerate(dating_tb['date_type']) if ('laminations' in s)]
-dating_tb_lam = dating_tb.iloc[indices, :]
-for e in np.unique(dating_tb_lam.loc[:,'entity_name']):
-    dating_ent_activelyforming = dating_tb.loc[(dating_tb['entity_name'] == e) & (dating_tb['date_type'] == 'Event; actively forming'), :]
-    dating_ent = dating_tb_lam.loc[dating_tb_lam['entity_name'] == e,:]
-    depth_ref = entity_tb.loc[entity_tb['entity_name'] == e, 'depth_ref'].values[0]
-    further_check = True
-    if depth_ref == 'from top':
-        dating_ent = dating_ent.sort_values(by = ['depth_dating'], ascending = True)
-        if any(dating_ent.loc[dating_ent['date_type'] == 'Event; start of laminations', 'depth_dating'] == 0):
-            warning_ctr += 1
-            print('Dating information tab: depth_ref = "from top" for Entity %s and therefore date_type = "Event; start of laminations" cannot exist at depth_dating = 0. This should probably be date_type = "Event; end of laminations". Note that "start of laminations" refers to the depth at which laminae started forming (i.e. bottom/oldest part of the section) and NOT to the counting order' %e)
-            further_check = False
-    elif depth_ref == 'from base':
-        dating_ent = dating_ent.sort_values(by = ['depth_dating'], ascending = False)
-        if any(dating_ent.loc[dating_ent['date_type'] == 'Event; end of laminations', 'depth_dating'] == 0):
+                report('Dating information tab: depth_ref = "from top" for Entity %s and therefore date_type = "Event; start of laminations" cannot exist at depth_dating = 0. This should probably be date_type = "Event; end of laminations". Note that "start of laminations" refers to the depth at which laminae started forming (i.e. bottom/oldest part of the section) and NOT to the counting order' %e)
+                further_check = False
+        elif depth_ref == 'from base':
+            if any(dating_ent.loc[dating_ent['date_type'] == 'Event; end of laminations', 'depth_dating'] == 0):
+                warning_ctr += 1
+                report('Dating information tab: depth_ref = "from base" for Entity %s and therefore date_type = "Event; end of laminations" cannot exist at depth_dating = 0. This should probably be date_type = "Event; start of laminations". Note that "start of laminations" refers to the depth at which laminae started forming (i.e. bottom/oldest part of the section) and NOT to the counting order' %e)
+                further_check = False
+        else:
+            report('Dating information tab: The depth_ref chosen for entity %s is not "from top" or "from base". Cannot perform further checks ' %e)
             warning_ctr += 1
-            print('Dating information tab: depth_ref = "from base" for Entity %s and therefore date_type = "Event; end of laminations" cannot exist at depth_dating = 0. This should probably be date_type = "Event; start of laminations". Note that "start of laminations" refers to the depth at which laminae started forming (i.e. bottom/oldest part of the section) and NOT to the counting order' %e)
             further_check = False
-    else:
-        print('Dating information tab: The depth_ref chosen for entity %s is not "from top" or "from base". Cannot perform further checks ' %e)
-        warning_ctr += 1
-        further_check = False
-    if further_check == True:
-        if dating_ent['date_type'].iloc[0] != 'Event; end of laminations':
-            further_check = False
-            warning_ctr += 1
-            print('Dating information tab: The youngest date related to laminae for entity %s is not linked to an "Event; end of laminations". This may be missing. Note that "start of laminations" refers to the depth at which laminae started forming (i.e. bottom/oldest part of the section) and NOT to the counting order' %e)
-        else:
-            if len(dating_ent_activelyforming.index) == 0:
-                if depth_ref == 'from top':
-                    if dating_ent['depth_dating'].iloc[0] == 0:
+        if further_check == True:
+            if dating_ent['date_type'].iloc[0] != 'Event; end of laminations':
+                further_check = False
+                warning_ctr += 1
+                report('Dating information tab: The youngest date related to laminae for entity %s is not linked to an "Event; end of laminations". This may be missing. Note that "start of laminations" refers to the depth at which laminae started forming (i.e. bottom/oldest part of the section) and NOT to the counting order' %e)
+            else:
+                if e not in actively_forming:
+                    if depth_ref == 'from top':
+                        if dating_ent['depth_dating'].iloc[0] == 0:
+                            modref_ent = dating_ent['modern_reference'].iloc[0]
+                            corrage_ent = dating_ent['corr_age'].iloc[0]
+                            nocheck = False
+                            if modref_ent in ['b2k', 'BP(1950)', 'Year of chemistry']:
+                                if modref_ent == 'b2k':
+                                    corrage_ent = corrage_ent + 50
+                                elif modref_ent == 'Year of chemistry':
+                                    chemyear_ent = dating_ent['chem_year'].iloc[0]
+                                    if pd.notnull(chemyear_ent):
+                                        corrage_ent = corrage_ent - (chemyear_ent - 1950)
+                                    else:
+                                        nocheck = True # chem_year is missing and this would have been flagged elsewhere
+                                else:
+                                    pass # the rest should just be BP(1950)
+                            else:
+                                nocheck = True
+                            if nocheck == False:
+                                if corrage_ent <= 0:
+                                    report('Informative: Dating information tab: The youngest "Event; end of laminations" appears like it could also be an "Event; actively forming". Please add this extra date_type if this is the case.')                  
+                    if depth_ref == 'from base':
                         modref_ent = dating_ent['modern_reference'].iloc[0]
                         corrage_ent = dating_ent['corr_age'].iloc[0]
                         nocheck = False
@@ -1999,7 +4073,7 @@ for e in np.unique(dating_tb_lam.loc[:,'entity_name']):
                             if modref_ent == 'b2k':
                                 corrage_ent = corrage_ent + 50
                             elif modref_ent == 'Year of chemistry':
-                                chemyear_ent = dating_ent['chem_year'].iloc[0]
+                                chemyear_ent = dating_ent['chem_year']
                                 if pd.notnull(chemyear_ent):
                                     corrage_ent = corrage_ent - (chemyear_ent - 1950)
                                 else:
@@ -2010,127 +4084,989 @@ for e in np.unique(dating_tb_lam.loc[:,'entity_name']):
                             nocheck = True
                         if nocheck == False:
                             if corrage_ent <= 0:
-                                print('Informative: Dating information tab: The youngest "Event; end of laminations" appears like it could also be an "Event; actively forming". Please add this extra date_type if this is the case.')                  
-                if depth_ref == 'from base':
-                    modref_ent = dating_ent['modern_reference'].iloc[0]
-                    corrage_ent = dating_ent['corr_age'].iloc[0]
-                    nocheck = False
-                    if modref_ent in ['b2k', 'BP(1950)', 'Year of chemistry']:
-                        if modref_ent == 'b2k':
-                            corrage_ent = corrage_ent + 50
-                        elif modref_ent == 'Year of chemistry':
-                            chemyear_ent = dating_ent['chem_year']
-                            if pd.notnull(chemyear_ent):
-                                corrage_ent = corrage_ent - (chemyear_ent - 1950)
-                            else:
-                                nocheck = True # chem_year is missing and this would have been flagged elsewhere
-                        else:
-                            pass # the rest should just be BP(1950)
-                    else:
-                        nocheck = True
-                    if nocheck == False:
-                        if corrage_ent <= 0:
-                            print('Informative: Dating information tab: The youngest "Event; end of laminations" appears like it could also be an "Event; actively forming". Please add this extra date_type if this is the case.')                  
-            else:
-                pass # no need to check as there is already one 'Event; actively forming'
-        if list(dating_ent['date_type'])[-1] != 'Event; start of laminations':
-            further_check = False
-            warning_ctr += 1
-            print('Dating information tab: The oldest date related to laminae for entity %s is not linked to an "Event; start of laminations". This may be missing. Note that "start of laminations" refers to the depth at which laminae started forming (i.e. bottom/oldest part of the section) and NOT to the counting order' %e)
-        if further_check == True:
-            if dating_ent.shape[0] > 2:
-                consec_warning = False
-                for i in range(dating_ent.shape[0]):
-                    if i == 0:
-                        date_type = dating_ent['date_type'].iloc[i]
-                    if i > 0:
-                        if date_type == dating_ent['date_type'].iloc[i]:
-                            consec_warning = True
-                        else:
-                            date_type = dating_ent['date_type'].iloc[i]
-                if consec_warning == True:
-                    warning_ctr += 1
-                    print('Dating information tab: There are two consecutive "Event; end of laminations" or "Event; start of laminations" when the dating information of entity %s is sorted by depth. The two events should alternate between each other.' %e)
-        
-        
-# Check that entity name in dating information and sample data matches the ones on the entity metadata spreadsheet
-# sample table
-warning_ctr += check_entity_names(entity_tb, sample_tb, 'Sample data')
-# dating information table
-warning_ctr += check_entity_names(entity_tb, dating_tb, 'Dating information')
-# Lamina age vs depth
-warning_ctr += check_entity_names(entity_tb, dating_lamina_tb, 'Lamina age vs depth')
-# References
-warning_ctr += check_entity_names(entity_tb, ref_tb, 'References')
+                                report('Informative: Dating information tab: The youngest "Event; end of laminations" appears like it could also be an "Event; actively forming". Please add this extra date_type if this is the case.')                  
+                else:
+                    pass # no need to check as there is already one 'Event; actively forming'
+            if list(dating_ent['date_type'])[-1] != 'Event; start of laminations':
+                further_check = False
+                warning_ctr += 1
+                report('Dating information tab: The oldest date related to laminae for entity %s is not linked to an "Event; start of laminations". This may be missing. Note that "start of laminations" refers to the depth at which laminae started forming (i.e. bottom/oldest part of the section) and NOT to the counting order' %e)
+            if further_check == True:
+                if dating_ent.shape[0] > 2:
+                    if consecutive[n]:
+                        warning_ctr += 1
+                        report('Dating information tab: There are two consecutive "Event; end of laminations" or "Event; start of laminations" when the dating information of entity %s is sorted by depth. The two events should alternate between each other.' %e)
+
+
+    # Check that entity name in dating information and sample data matches the ones on the entity metadata spreadsheet
+    # sample table
+    warning_ctr += check_entity_names(entity_tb, sample_tb, 'Sample data')
+    # dating information table
+    warning_ctr += check_entity_names(entity_tb, dating_tb, 'Dating information')
+    # Lamina age vs depth
+    warning_ctr += check_entity_names(entity_tb, dating_lamina_tb, 'Lamina age vs depth')
+    # References
+    warning_ctr += check_entity_names(entity_tb, ref_tb, 'References')
+    return(warning_ctr)
 
 # -----------------------------------------------------------------------------
 # Section 7.vi.b. All entities
 # -----------------------------------------------------------------------------
-# Check that the last 10 characters in data_DOI_URL and publication_DOI are not
-# identical
-# 1. Loop through each entity in entity_tb
-#   i. Selects for data_DOI_URL
-#   ii. If exists, subset the last 10 characters
-#       a. subset ref_tb table for references of that particular entity
-#           - Loop through each publication_DOI for that entity, only select last 10 characters
-#           - if last 10 characters are the same, raise warning for that entity
-
-for i in entity_tb['entity_name']:
-    dataDOIURL = entity_tb.loc[entity_tb['entity_name'] == i, 'data_DOI_URL']
-    if len(dataDOIURL) == 1:
-        dataDOIURL = dataDOIURL.iloc[0] # select for the just data_DOI_URL
-        if dataDOIURL == '':
-            pass
-        else:
-            dataDOIURLend = dataDOIURL[-10:]
-            pub_DOI_ent = ref_tb.loc[ref_tb['entity_name'] == i, 'publication_DOI']
-            for j in pub_DOI_ent:
-                pub_DOI_last10 = j[-10:]
-                if pub_DOI_last10 == dataDOIURLend:
-                    print('Entity metadata tab: data_DOI_URL; Entity %s likely has the same data_DOI_URL as publication_DOI in References tab. The data_DOI_URL refers only to the data (e.g. https://doi.org/10.17864/1947.147 or https://www.ncdc.noaa.gov/paleo-search/study/24070) while the publication_DOI refers to the paper (e.g. https://doi.org/10.5194/essd-10-1687-2018). If no data_DOI_URL is available, please leave empty.' %(i))
-                    warning_ctr += 1
-                    break
-    else:
-        warning_ctr += 1
+def check_data_doi(wb):
+    """Section 7.vi.b. Checks for all entities that data_DOI_URL is not the publication_DOI
+
+    Args:
+        wb: dictionary of pandas dataframe objects. Tables of the workbook
+
+    Returns:
+        integer, number of warnings
+    """
+    entity_tb, ref_tb = wb['entity'], wb['ref']
+    warning_ctr = 0
+    # Check that the last 10 characters in data_DOI_URL and publication_DOI are not
+    # identical
+    # 1. Entities which appear more than once in entity_tb are counted as a warning
+    # 2. The last 10 characters of data_DOI_URL (if exists) of each entity are
+    #    merged with the last 10 characters of the publication_DOI of the
+    #    references of the same entity: a match raises a warning for that entity
+    name_counts = entity_tb['entity_name'].map(entity_tb['entity_name'].value_counts()).values
+    warning_ctr += int(np.sum(name_counts != 1))
+    data_doi = entity_tb.loc[(name_counts == 1) & (entity_tb['data_DOI_URL'] != '').values, ['entity_name', 'data_DOI_URL']]
+    data_doi = pd.DataFrame({'entity_name': data_doi['entity_name'].values,
+                             'DOI_last10': data_doi['data_DOI_URL'].astype(str).str[-10:].values})
+    pub_doi = pd.DataFrame({'entity_name': ref_tb['entity_name'].values,
+                            'DOI_last10': ref_tb['publication_DOI'].astype(str).str[-10:].values})
+    same_doi = set(data_doi.merge(pub_doi, on = ['entity_name', 'DOI_last10'])['entity_name'])
+    for i in data_doi['entity_name']:
+        if i in same_doi:
+            report('Entity metadata tab: data_DOI_URL; Entity %s likely has the same data_DOI_URL as publication_DOI in References tab. The data_DOI_URL refers only to the data (e.g. https://doi.org/10.17864/1947.147 or https://www.ncdc.noaa.gov/paleo-search/study/24070) while the publication_DOI refers to the paper (e.g. https://doi.org/10.5194/essd-10-1687-2018). If no data_DOI_URL is available, please leave empty.' %(i))
+            warning_ctr += 1
+    return(warning_ctr)
+
+# Sections of checks, in the order in which they are run
+section_checks = [('7.i.a', check_site_sheet),
+                  ('7.i.b', check_entity_sheet),
+                  ('7.i.c', check_sample_sheet_all),
+                  ('7.ii', check_composites),
+                  ('7.iii.c', check_sample_sheet),
+                  ('7.iii.d', check_dating_sheet),
+                  ('7.iii.e', check_lamina_sheet),
+                  ('7.iii.f', check_reference_sheet),
+                  ('7.vi.a', check_across_sheets),
+                  ('7.vi.b', check_data_doi)]
 
 # =============================================================================
 # Section 8. Print out the number of unknowns
 # =============================================================================
+def report_unknowns(wb, unknown_counts, entity_count):
+    """Print out the number of "unknown" and how to deal with missing depths
 
-if total_unkwn > 0:
-    if site_unkwn == 0:
-        site_unkwn_txt = ''
-    else:
-        site_unkwn_txt = '%d in the site table; ' %site_unkwn
-    if entity_unkwn == 0:
-        entity_unkwn_txt = ''
-    else:
-        entity_unkwn_txt = '%d in the entity table; ' %entity_unkwn
-    if dating_unkwn == 0:
-        dating_unkwn_txt = ''
-    else:
-        dating_unkwn_txt = '%d in the dating information table; ' %dating_unkwn
-    if sample_unkwn == 0:
-        sample_unkwn_txt = ''
-    else:
-        sample_unkwn_txt = '%d in the sample table; ' %sample_unkwn
-    print('Informative: There is a total of %d "unknown" in %d entities in this workbook: %s%s%s%s Please ensure that the information is truly inaccessible before choosing "unknown".' %(total_unkwn, entity_count, site_unkwn_txt, entity_unkwn_txt, dating_unkwn_txt, sample_unkwn_txt))
-if len(dating_tb.index) > 0:
-    if pass_depthdating_warning == False:
-        print('If depths in Dating information table really cannot be obtained, please add dummy depths to make sure that other checks can be performed. IMPORTANT: Do not forget to delete the dummy depths from the workbook once it has passed all checks.')
-if len(sample_tb.index) > 0:
-    if pass_depthsample_checks == False:
-        print('If depths in the Sample data table really cannot be obtained, please add dummy depths to make sure that other checks can be performed. IMPORTANT: Do not forget to delete the dummy depths from the workbook once it has passed all checks.')
+    Args:
+        wb: dictionary of pandas dataframe objects. Tables of the workbook (after
+            the checks)
+        unknown_counts: tuple. Output of count_unknowns()
+        entity_count: integer. Number of entities in the workbook
 
+    Returns:
+        None
+    """
+    total_unkwn, table_unkwn, column_unkwn = unknown_counts
+    dating_tb, sample_tb = wb['dating'], sample_columns(wb)
+    pass_depthdating_warning = wb.get('pass_depthdating_warning')
+    pass_depthsample_checks = wb.get('pass_depthsample_checks')
+    if total_unkwn > 0:
+        unkwn_txt = ''
+        for table_name in table_unkwn:
+            if table_unkwn[table_name] > 0:
+                # point at the columns, e.g. '3 in the sample table (mineralogy: 2, arag_corr: 1); '
+                col_txt = ', '.join(['%s: %d' %(col, ctr) for col, ctr in column_unkwn[table_name].items()])
+                unkwn_txt = '%s%d in the %s (%s); ' %(unkwn_txt, table_unkwn[table_name], table_name, col_txt)
+        report('Informative: There is a total of %d "unknown" in %d entities in this workbook: %s Please ensure that the information is truly inaccessible before choosing "unknown".' %(total_unkwn, entity_count, unkwn_txt))
+    if len(dating_tb.index) > 0:
+        if pass_depthdating_warning == False:
+            report('If depths in Dating information table really cannot be obtained, please add dummy depths to make sure that other checks can be performed. IMPORTANT: Do not forget to delete the dummy depths from the workbook once it has passed all checks.')
+    if len(sample_tb.index) > 0:
+        if pass_depthsample_checks == False:
+            report('If depths in the Sample data table really cannot be obtained, please add dummy depths to make sure that other checks can be performed. IMPORTANT: Do not forget to delete the dummy depths from the workbook once it has passed all checks.')
 
-print('%d warning/s were detected' %warning_ctr)
 # =============================================================================
 # Section 9. Move files to Checked folder
 # =============================================================================
-if warning_ctr < 1:
+def move_to_checked(input_file):
+    """Move a workbook which passed the checks to the Checked folder (in the
+    folder of the workbook)
+
+    Args:
+        input_file: string. File name of the workbook
+
+    Returns:
+        None
+    """
     try:
-        shutil.move(input_file, os.path.join('Checked', input_file))
+        shutil.move(input_file, os.path.join(os.path.dirname(input_file), 'Checked', os.path.basename(input_file)))
     except IOError:
         print('Checked folder is likely missing. Unable to move file automatically into Checked folder.')
-    
 
+# =============================================================================
+# Section 10. Check a workbook
+# =============================================================================
+# Number of threads running the sections of checks of one workbook at the same
+# time (1: one section after the other)
+sheet_workers = 1
+# Stages of the sections of checks when they are run on sheet_workers threads.
+# The chains of sections of a stage run at the same time, each on its own copy
+# of wb (with a copy of the tables its sections change in place), and the next
+# stage starts when they have all finished. The checks of each spreadsheet come
+# first, the checks across spreadsheets (7.vi) after them
+section_stages = [[(['7.i.a'], []), (['7.i.b'], []), (['7.i.c'], []), (['7.ii'], []), (['7.iii.f'], [])],
+                  [(['7.iii.c'], []), (['7.iii.d', '7.iii.e'], ['dating', 'dating_lamina'])],
+                  [(['7.vi.a'], []), (['7.vi.b'], [])]]
+
+def set_sheet_workers(workers):
+    """Set the number of threads running the sections of checks of one workbook
+
+    Args:
+        workers: integer. Number of threads (1: no pool)
+
+    Returns:
+        None
+    """
+    global sheet_workers
+    sheet_workers = workers
+
+def run_chain(sections, wb, executor = None, incremental = (None, None)):
+    """Run sections of checks one after the other (on a thread of a pool),
+    keeping their messages instead of printing them
+
+    Args:
+        sections: list of strings. Sections of section_checks
+        wb: dictionary of pandas dataframe objects. Tables of the workbook
+        executor: pool of the checks performed per entity of the workbook (see
+            start_entity_pool()), None if there is none
+        incremental: tuple, (state, fingerprints) of the workbook checked with
+            a state (see call_section()), (None, None) otherwise
+
+    Returns:
+        list of tuples, (section, number of warnings, list of messages, error
+        raised or None), one per section run. The sections after an error are
+        not run
+    """
+    checks = dict(section_checks)
+    results = []
+    entity_log.executor = executor
+    incremental_log.state, incremental_log.fingerprints = incremental
+    for section in sections:
+        messages = []
+        message_log.messages, message_log.echo = messages, False
+        try:
+            results.append((section, call_section(section, checks[section], (wb,)), messages, None))
+        except Exception as e:
+            results.append((section, 0, messages, e))
+            break
+        finally:
+            message_log.messages = None
+    entity_log.executor = None
+    incremental_log.state, incremental_log.fingerprints = None, None
+    return(results)
+
+def run_section_stages(wb, result):
+    """Run the sections of checks on sheet_workers threads, stage by stage (see
+    section_stages). The checks per entity of the sections are split over the
+    pool of the workbook (see start_entity_pool()). The messages are printed
+    and the warnings counted in the order of section_checks, as when the
+    sections are run one after the other
+
+    Args:
+        wb: dictionary of pandas dataframe objects. Tables of the workbook,
+            updated with the tables set or changed by the sections
+        result: dictionary. Output of check_workbook() being filled in
+            ('warning_ctr' is increased)
+
+    Returns:
+        None
+
+    Raises:
+        the first error raised by a section, in the order of section_checks,
+        once the messages of the sections before it are printed
+    """
+    order = [section for section, check in section_checks]
+    done = {}
+    n_reported = 0
+    with ThreadPoolExecutor(max_workers = sheet_workers) as executor:
+        for stage in section_stages:
+            before = dict(wb)
+            views = []
+            for sections, changed in stage:
+                view = dict(wb)
+                for key in changed:
+                    view[key] = view[key].copy()
+                views.append(view)
+            incremental = (getattr(incremental_log, 'state', None), getattr(incremental_log, 'fingerprints', None))
+            for view, results in zip(views, executor.map(run_chain, [sections for sections, changed in stage], views,
+                                                         [entity_log.executor] * len(stage), [incremental] * len(stage))):
+                for section, warning_ctr, messages, error in results:
+                    done[section] = (warning_ctr, messages, error)
+                for key in view:
+                    if view[key] is not before.get(key):
+                        wb[key] = view[key]
+            while (n_reported < len(order)) and (order[n_reported] in done):
+                warning_ctr, messages, error = done[order[n_reported]]
+                for message in messages:
+                    report(message)
+                if error is not None:
+                    raise error
+                result['warning_ctr'] += warning_ctr
+                n_reported += 1
+
+def check_workbook(input_file = None, tables = None, echo = False, state = None):
+    """Perform all the checks on a workbook and collect the warnings
+
+    Args:
+        input_file: string. File name of the workbook. Only used for reading in
+            the workbook when tables is not given
+        tables: dictionary of pandas dataframe objects. Tables keyed as in
+            sheet_names, if the spreadsheets were already read in (the
+            dataframes are copied, empty rows removed)
+        echo: boolean. If True, also print out the messages as they are raised
+        state: dictionary. To check a workbook again after it was edited, give
+            the same dictionary (empty the first time) to each check. The
+            spreadsheets read in and the results of the sections and of the
+            checks per entity are kept in it, and only the spreadsheets,
+            sections and entities which changed are read in or checked again
+
+    Returns:
+        dictionary with
+            'input_file': string, input_file
+            'warning_ctr': integer, number of warnings
+            'messages': list of strings, all messages in the order they were raised
+            'warnings': list of strings, messages which are not 'Informative'
+            'informative': list of strings, 'Informative' messages
+            'unknown_counts': dictionary of the number of "unknown" ('total',
+                'table' and 'column', see count_values())
+            'entity_count': integer, number of entities
+            'fatal': string, the message if the checks could not continue, None otherwise
+            'passed': boolean, True if all the checks were performed with no warnings
+            'profile': dictionary, see stop_profile(), if profile_checks is True
+                (None otherwise)
+
+    NOTES:
+        - If the checks could not continue ('fatal'), 'warning_ctr' only counts
+          the warnings raised before.
+        - With sheet_workers > 1, the sections of checks run on a pool of
+          threads (see section_stages) and their checks per entity, most of the
+          time of the Sample data checks, on a pool of sheet_workers processes
+          (unless entity_workers > 1). The messages and the number of warnings
+          are the same as without it. With profiling, the sections run one
+          after the other (their wall times would overlap), the checks per
+          entity still run on the pool.
+        - With a state, the results are the same as without it: a section is
+          run again when any table it read changed (see call_section()).
+    """
+    messages = []
+    message_log.messages, message_log.echo = messages, echo
+    incremental_log.state, incremental_log.fingerprints = state, {}
+    result = {'input_file': input_file, 'warning_ctr': 0, 'messages': messages,
+              'unknown_counts': None, 'entity_count': 0, 'fatal': None, 'profile': None}
+    if profile_checks:
+        start_profile()
+    entity_log.executor = start_entity_pool()
+    try:
+        if tables is None:
+            reuse, fingerprints = None, None
+            if state is not None:
+                # spreadsheets which did not change are not read in again
+                fingerprints = sheet_fingerprints(input_file)
+            if fingerprints is not None:
+                reuse = dict([(sheet_names[key], table.copy()) for key, (fp, table) in state.get('sheets', {}).items()
+                              if (fp is not None) and (fingerprints.get(sheet_names[key]) == fp)])
+            wb = run_section('2', read_workbook, input_file, reuse, low_memory & (state is None))
+            if fingerprints is not None:
+                state['sheets'] = dict([(key, (fingerprints.get(sheet_names[key]), wb[key].copy())) for key in sheet_names])
+        else:
+            wb = dict([(key, tables[key].dropna(how = 'all').copy()) for key in sheet_names])
+        run_section('3', check_columns, wb)
+        run_section('5', set_column_types, wb)
+        unknown_counts = run_section('6', count_unknowns, wb)
+        result['unknown_counts'] = dict(zip(['total', 'table', 'column'], unknown_counts))
+        result['entity_count'] = len(pd.unique(wb['entity']['entity_name']))
+        if (sheet_workers > 1) & (not profile_checks):
+            run_section_stages(wb, result)
+        else:
+            for section, check in section_checks:
+                result['warning_ctr'] += run_section(section, check, wb)
+        run_section('8', report_unknowns, wb, unknown_counts, result['entity_count'])
+    except WorkbookError as e:
+        result['fatal'] = str(e)
+    except Exception as e:
+        # messages raised before an unexpected error, see check_workbook_safe()
+        e.messages = messages
+        raise
+    finally:
+        message_log.messages = None
+        incremental_log.state, incremental_log.fingerprints = None, None
+        if entity_log.executor is not None:
+            entity_log.executor.shutdown()
+        entity_log.executor = None
+        if profile_checks:
+            result['profile'] = stop_profile()
+    result['warnings'] = [m for m in messages if not m.startswith('Informative')]
+    result['informative'] = [m for m in messages if m.startswith('Informative')]
+    result['passed'] = (result['fatal'] is None) & (result['warning_ctr'] < 1)
+    return(result)
+
+# =============================================================================
+# Section 11. Check a batch of workbooks
+# =============================================================================
+def list_workbooks(inputs):
+    """List the workbooks given as files, folders or glob patterns
+
+    Args:
+        inputs: list of strings. Workbook file names, folders (all .xlsx/.xls
+            files in the folder, not in subfolders) or glob patterns
+
+    Returns:
+        list of strings, file names of the workbooks (sorted, no duplicates)
+
+    NOTES:
+        - Excel lock files (starting with '~$') are skipped
+    """
+    input_files = []
+    for i in inputs:
+        if os.path.isdir(i):
+            input_files += glob.glob(os.path.join(i, '*.xlsx')) + glob.glob(os.path.join(i, '*.xls'))
+        elif os.path.isfile(i):
+            input_files.append(i)
+        else:
+            input_files += glob.glob(i)
+    return(sorted(set([f for f in input_files if not os.path.basename(f).startswith('~$')])))
+
+# Version of the checks, for the cache of the results: hash of this script, so
+# that results of other versions of the checks are not used
+checker_version = file_hash(os.path.abspath(__file__))[:12]
+
+def check_workbook_safe(input_file):
+    """Run check_workbook() on a workbook, for the batch mode and the QC server.
+    Unexpected errors are recorded as 'fatal' (with the messages raised before
+    them) so that the other workbooks can still be checked
+
+    Args:
+        input_file: string. File name of the workbook
+
+    Returns:
+        dictionary, output of check_workbook()
+    """
+    try:
+        return(check_workbook(input_file))
+    except Exception as e:
+        messages = getattr(e, 'messages', [])
+        return({'input_file': input_file, 'warning_ctr': 0, 'messages': messages,
+                'warnings': [m for m in messages if not m.startswith('Informative')],
+                'informative': [m for m in messages if m.startswith('Informative')],
+                'unknown_counts': None, 'entity_count': 0,
+                'fatal': 'The checks failed with %s: %s' %(type(e).__name__, e), 'passed': False,
+                'profile': None, 'crashed': True})
+
+def init_worker(cache_folder, profiling, low_memory_reading, workbook_workers = (1, 'thread', 1)):
+    """Set the cache folder, profiling, streamed checks and pools of a process
+    checking workbooks of a batch as in the main process
+
+    Args:
+        cache_folder: string. See set_cache_dir()
+        profiling: tuple, (profile_checks, profile_memory). See set_profiling()
+        low_memory_reading: tuple, (low_memory, sample_chunk_rows). See set_low_memory()
+        workbook_workers: tuple, (entity_workers, entity_pool, sheet_workers).
+            See set_entity_workers() and set_sheet_workers()
+
+    Returns:
+        None
+    """
+    set_cache_dir(cache_folder)
+    set_profiling(*profiling)
+    set_low_memory(*low_memory_reading)
+    set_entity_workers(*workbook_workers[:2])
+    set_sheet_workers(workbook_workers[2])
+
+def worker_pool(workers = None):
+    """Pool of processes checking workbooks, set up as this process (see
+    init_worker())
+
+    Args:
+        workers: integer. Number of processes (default: number of CPUs)
+
+    Returns:
+        concurrent.futures.ProcessPoolExecutor
+    """
+    return(ProcessPoolExecutor(max_workers = workers, initializer = init_worker,
+                               initargs = (cache_dir, (profile_checks, profile_memory), (low_memory, sample_chunk_rows),
+                                           (entity_workers, entity_pool, sheet_workers))))
+
+def check_workbooks(input_files, workers = None):
+    """Check several workbooks in parallel. Results of workbooks checked before
+    (same content, same checker_version, same versions of pandas and numpy) are
+    taken from the cache, unless the checks are profiled
+
+    Args:
+        input_files: list of strings. File names of the workbooks
+        workers: integer. Number of processes (default: number of CPUs). With 1,
+            the workbooks are checked one after the other in this process
+
+    Returns:
+        list of dictionaries, outputs of check_workbook() in the order of
+        input_files, with 'cached' (boolean) added
+    """
+    results = [None] * len(input_files)
+    keys = [None] * len(input_files)
+    if cache_dir and not profile_checks:
+        for n, f in enumerate(input_files):
+            try:
+                keys[n] = '%s_%s_pd%s_np%s' %(file_hash(f), checker_version, pd.__version__, np.__version__)
+            except (IOError, OSError):
+                continue # cannot be read in, check_workbook() reports it
+            cached = read_cache('results', keys[n])
+            if cached is not None:
+                cached['input_file'], cached['cached'] = f, True
+                results[n] = cached
+    to_check = [n for n in range(len(input_files)) if results[n] is None]
+    if workers == 1 or len(to_check) < 2:
+        checked = [check_workbook_safe(input_files[n]) for n in to_check]
+    else:
+        with worker_pool(workers) as executor:
+            checked = list(executor.map(check_workbook_safe, [input_files[n] for n in to_check]))
+    for n, r in zip(to_check, checked):
+        r['cached'] = False
+        results[n] = r
+        # unexpected errors are not cached, they may not come from the workbook
+        if (keys[n] is not None) & (not r.get('crashed', False)):
+            write_cache('results', keys[n], r)
+    return(results)
+
+def print_summary(results):
+    """Print out the summary table of a batch: warnings and informative messages
+    per workbook and whether it passed the checks
+
+    Args:
+        results: list of dictionaries. Outputs of check_workbook()
+
+    Returns:
+        None
+    """
+    width = max([len('workbook')] + [len(r['input_file']) for r in results])
+    print('%-*s  %8s  %11s  %s' %(width, 'workbook', 'warnings', 'informative', 'status'))
+    for r in results:
+        if r['fatal'] is not None:
+            status = 'not checked (%s)' %r['fatal']
+        elif r['passed']:
+            status = 'passed'
+        else:
+            status = 'failed'
+        if r.get('cached', False):
+            status = status + ' (cached)'
+        print('%-*s  %8d  %11d  %s' %(width, r['input_file'], r['warning_ctr'], len(r['informative']), status))
+    print('%d of %d workbook/s passed the checks' %(sum([r['passed'] for r in results]), len(results)))
+
+def check_batch(inputs, workers = None):
+    """Check a batch of workbooks, print out the warnings of each workbook and the
+    summary table, and move the workbooks which passed to the Checked folder
+
+    Args:
+        inputs: list of strings. Workbook file names, folders or glob patterns
+            (see list_workbooks())
+        workers: integer. Number of processes (default: number of CPUs)
+
+    Returns:
+        list of dictionaries, outputs of check_workbook()
+    """
+    input_files = list_workbooks(inputs)
+    if len(input_files) == 0:
+        sys.exit('No workbooks found in %s' %str(inputs).replace('[', '').replace(']', ''))
+    results = check_workbooks(input_files, workers)
+    for r in results:
+        if r.get('cached', False):
+            print('=== %s (cached) ===' %r['input_file'])
+        else:
+            print('=== %s ===' %r['input_file'])
+        for message in r['messages']:
+            print(message)
+        if r['fatal'] is not None:
+            print(r['fatal'])
+        else:
+            print('%d warning/s were detected' %r['warning_ctr'])
+    print('')
+    print_summary(results)
+    for r in results:
+        write_profile(r)
+        if r['passed']:
+            move_to_checked(r['input_file'])
+    return(results)
+
+# =============================================================================
+# Section 12. Check a workbook again each time it is saved (watch mode)
+# =============================================================================
+def watch_workbook(input_file, interval = 1.0):
+    """Check a workbook each time it is saved, until it passes the checks (it
+    is then moved to the Checked folder) or the script is interrupted (Ctrl+C).
+    All the warnings are printed out each time, but only the spreadsheets,
+    sections and entities which changed are checked again (see check_workbook())
+
+    Args:
+        input_file: string. File name of the workbook
+        interval: float. Seconds between two looks at the modification time of
+            the workbook
+
+    Returns:
+        dictionary, output of the last check_workbook(), None if the workbook
+        was never checked
+    """
+    state, result, mtime = {}, None, None
+    try:
+        while True:
+            try:
+                current = os.path.getmtime(input_file)
+            except OSError:
+                current = None # being saved, or removed
+            if (current is not None) and (current != mtime):
+                mtime = current
+                start = time.perf_counter()
+                print('=== %s (%s) ===' %(input_file, time.strftime('%H:%M:%S')))
+                result = check_workbook(input_file, echo = True, state = state)
+                if result['fatal'] is not None:
+                    print(result['fatal'])
+                else:
+                    print('%d warning/s were detected' %result['warning_ctr'])
+                print('Checked in %.2f s. Waiting for the workbook to be saved again (Ctrl+C to stop)' %(time.perf_counter() - start))
+                if result['passed']:
+                    move_to_checked(input_file)
+                    return(result)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        return(result)
+
+# =============================================================================
+# Section 13. QC server
+# =============================================================================
+# Port of the QC server on this computer (python wb_check.py --serve), also
+# used by wb_client.py
+server_port = int(os.environ.get('SISAL_QC_PORT', '8765'))
+# Folder of the token of the QC server (environment variable SISAL_QC_TOKEN_DIR,
+# default: home folder), also used by wb_client.py. The server writes a new
+# random token to .sisal_qc_token_<port> when it starts, readable by this user
+# only, and only checks the workbooks of requests which send it
+server_token_dir = os.environ.get('SISAL_QC_TOKEN_DIR', os.path.expanduser('~'))
+
+def server_token_file(port):
+    """File name of the token of the QC server on port (see server_token_dir)"""
+    return(os.path.join(server_token_dir, '.sisal_qc_token_%d' %port))
+
+class QCRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Requests to the QC server:
+        - POST /check with {"input_file": <path of the workbook>} checks the
+          workbook and returns the output of check_workbook() (JSON). The
+          workbook is not moved to the Checked folder. Only requests with
+          Content-Type: application/json are accepted, so that a web page
+          cannot send a workbook path to the server without the permission of
+          the browser (CORS), and with the token of the server (header
+          X-SISAL-QC-Token, see server_token_file()), which a web page cannot
+          read
+        - GET /status returns {"status": "ok", "checker_version": ...}
+    Requests whose Host is not 127.0.0.1:<port> or localhost:<port> are
+    refused, so that a web page cannot reach the server through a name of its
+    own resolving to 127.0.0.1 (DNS rebinding)
+    """
+    def send_json(self, status, content):
+        body = json.dumps(content, default = json_value).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def check_host(self):
+        port = self.server.server_address[1]
+        if self.headers.get('Host', '').strip().lower() not in ['127.0.0.1:%d' %port, 'localhost:%d' %port]:
+            self.send_json(403, {'error': 'requests to the QC server must be sent to 127.0.0.1:%d or localhost:%d' %(port, port)})
+            return(False)
+        return(True)
+
+    def do_GET(self):
+        if not self.check_host():
+            return
+        if self.path != '/status':
+            self.send_json(404, {'error': 'unknown request %s' %self.path})
+            return
+        self.send_json(200, {'status': 'ok', 'checker_version': checker_version})
+
+    def do_POST(self):
+        if not self.check_host():
+            return
+        if self.path != '/check':
+            self.send_json(404, {'error': 'unknown request %s' %self.path})
+            return
+        if not hmac.compare_digest(self.headers.get('X-SISAL-QC-Token', '').encode('utf-8'), self.server.token.encode('utf-8')):
+            self.send_json(403, {'error': 'missing or wrong token of the QC server (%s)' %server_token_file(self.server.server_address[1])})
+            return
+        if self.headers.get('Content-Type', '').split(';')[0].strip().lower() != 'application/json':
+            self.send_json(415, {'error': 'expected Content-Type: application/json'})
+            return
+        try:
+            input_file = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))['input_file']
+        except (ValueError, KeyError, TypeError):
+            self.send_json(400, {'error': 'expected {"input_file": <path of the workbook>}'})
+            return
+        executor = self.server.executor
+        try:
+            result = executor.submit(check_workbook_safe, input_file).result()
+        except BrokenProcessPool:
+            # a process of the pool died (e.g. out of memory): start a new pool
+            with self.server.lock:
+                if self.server.executor is executor:
+                    self.server.executor = worker_pool(self.server.workers)
+            self.send_json(500, {'error': 'The checks of %s stopped the process checking it' %input_file})
+            return
+        write_profile(result)
+        self.send_json(200, result)
+
+def start_server(port = None, workers = 1):
+    """Start the QC server on this computer (127.0.0.1): its pool of processes
+    and its token (see server_token_file()). Requests are answered once
+    serve_forever() of the server is called
+
+    Args:
+        port: integer. Port of the server (default: server_port, 0: any free port)
+        workers: integer. Number of workbooks checked at the same time
+
+    Returns:
+        http.server.ThreadingHTTPServer. To be closed with stop_server()
+    """
+    port = server_port if port is None else port
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', port), QCRequestHandler)
+    server.workers, server.lock = workers, threading.Lock()
+    server.token = secrets.token_hex(32)
+    token_file = server_token_file(server.server_address[1])
+    try:
+        fd = os.open(token_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.chmod(token_file, 0o600) # if it was already there
+        with os.fdopen(fd, 'w') as f:
+            f.write(server.token)
+    except:
+        server.server_close()
+        raise
+    server.executor = worker_pool(workers)
+    return(server)
+
+def stop_server(server):
+    """Close the QC server started by start_server() and remove its token
+
+    Args:
+        server: http.server.ThreadingHTTPServer
+
+    Returns:
+        None
+    """
+    token_file = server_token_file(server.server_address[1])
+    server.server_close()
+    server.executor.shutdown()
+    try:
+        with open(token_file) as f:
+            token = f.read()
+        if token == server.token:
+            os.remove(token_file) # not if another server was started on the port since
+    except (IOError, OSError):
+        pass
+
+def serve(port = None, workers = 1):
+    """Run the QC server on this computer (127.0.0.1) until it is interrupted
+    (Ctrl+C). The modules are imported once, and the workbooks are checked by
+    a pool of processes started once, so that a workbook sent by wb_client.py
+    (or the upload portal) is checked without starting Python again
+
+    Args:
+        port: integer. Port of the server (default: server_port)
+        workers: integer. Number of workbooks checked at the same time
+
+    Returns:
+        None
+    """
+    server = start_server(port, workers)
+    port = server.server_address[1]
+    print('QC server listening on http://127.0.0.1:%d (checker version %s, %d worker/s, token in %s). Ctrl+C to stop'
+          %(port, checker_version, workers, server_token_file(port)))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_server(server)
+
+# =============================================================================
+# Section 14. Check the workbooks put in an inbox folder (daemon)
+# =============================================================================
+# Seconds between two scans of the inbox folder when inotify is not available,
+# and seconds a workbook must be left unchanged before it is checked (so that
+# a workbook being copied into the inbox is not checked half-written)
+inbox_poll_interval = 2.0
+inbox_settle_time = 2.0
+
+def inotify_watch(folder):
+    """Watch the files written or moved into a folder with inotify (Linux)
+
+    Args:
+        folder: string. The folder
+
+    Returns:
+        integer, file descriptor which becomes readable when a file of the
+        folder is written or moved in. None if inotify is not available (the
+        folder is then scanned every inbox_poll_interval seconds)
+    """
+    IN_CLOSE_WRITE, IN_MOVED_TO = 0x08, 0x80
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno = True)
+        fd = libc.inotify_init()
+    except (OSError, AttributeError, TypeError):
+        return(None)
+    if fd < 0:
+        return(None)
+    if libc.inotify_add_watch(fd, os.fsencode(folder), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+        os.close(fd)
+        return(None)
+    return(fd)
+
+def wait_for_inbox(fd, timeout):
+    """Wait until a file is written or moved into the inbox folder, or for
+    timeout seconds
+
+    Args:
+        fd: integer. Output of inotify_watch(), None to only wait
+        timeout: float. Seconds, None to wait for a file (only with inotify)
+
+    Returns:
+        None
+    """
+    if fd is None:
+        time.sleep(timeout)
+    elif len(select.select([fd], [], [], timeout)[0]) > 0:
+        os.read(fd, 65536) # the events only wake up the scan of the folder
+
+def write_report(result):
+    """Write the messages of a workbook to a text file next to the workbook
+    (<workbook>_report.txt), as printed out by the command line
+
+    Args:
+        result: dictionary. Output of check_workbook()
+
+    Returns:
+        None
+    """
+    lines = list(result['messages'])
+    if result['fatal'] is not None:
+        lines.append(result['fatal'])
+    else:
+        lines.append('%d warning/s were detected' %result['warning_ctr'])
+    try:
+        with open(os.path.splitext(result['input_file'])[0] + '_report.txt', 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+    except (IOError, OSError):
+        print('Unable to write the report of %s.' %result['input_file'])
+
+def report_time(input_file):
+    """Modification time of the report of a workbook (see write_report())
+
+    Args:
+        input_file: string. File name of the workbook
+
+    Returns:
+        float, 0 if there is no report
+    """
+    try:
+        return(os.path.getmtime(os.path.splitext(input_file)[0] + '_report.txt'))
+    except OSError:
+        return(0)
+
+def watch_inbox(inbox, workers = None, stop = None):
+    """Check the workbooks put in an inbox folder until the script is
+    interrupted (Ctrl+C). New workbooks, and workbooks modified since they
+    were checked, are checked on a pool of processes. The messages of each
+    workbook are written next to it (write_report()), and the workbooks which
+    passed are moved to the Checked folder of the inbox
+
+    Args:
+        inbox: string. The inbox folder
+        workers: integer. Number of processes (default: number of CPUs)
+        stop: threading.Event. The daemon stops when it is set (default: only
+            Ctrl+C stops it)
+
+    Returns:
+        None
+
+    NOTES:
+        - The inbox is scanned again when inotify reports a file written or
+          moved in (Linux), otherwise every inbox_poll_interval seconds. A
+          workbook is only checked once it was left unchanged for
+          inbox_settle_time seconds.
+        - Workbooks with a report more recent than the workbook (e.g. checked
+          before the daemon was restarted) are not checked again.
+        - If a process of the pool dies (e.g. out of memory), the pool is
+          replaced by a new one and the workbooks which were queued on it are
+          checked again one at a time on a pool of one process, as the pool
+          does not tell which workbook stopped the process. Only the workbook
+          which stops that process has a report saying so (and is checked again
+          once it is modified).
+    """
+    fd = inotify_watch(inbox)
+    print('Watching %s (%s). Ctrl+C to stop' %(inbox, 'inotify' if fd is not None else 'scanned every %g s' %inbox_poll_interval))
+    executor = worker_pool(workers)
+    isolated = None # pool of one process for the workbooks of a pool which died
+    # modification time and size of the workbooks when they were queued
+    queued = {}
+    pending = {} # future: (workbook, pool it was submitted to)
+    suspects = [] # workbooks of a pool which died, to be checked alone
+    checked_before = set()
+    try:
+        while (stop is None) or (not stop.is_set()):
+            settling = False
+            input_files = list_workbooks([inbox])
+            for f in input_files:
+                try:
+                    stat = os.stat(f)
+                except OSError:
+                    continue # moved away since the folder was listed
+                if (queued.get(f) == (stat.st_mtime, stat.st_size)) or (f in [g for g, pool in pending.values()]) or (f in suspects):
+                    continue
+                if time.time() - stat.st_mtime < inbox_settle_time:
+                    settling = True # may still be being copied
+                    continue
+                queued[f] = (stat.st_mtime, stat.st_size)
+                if (f not in checked_before) & (report_time(f) >= stat.st_mtime):
+                    continue # checked before the daemon was started
+                try:
+                    future = executor.submit(check_workbook_safe, f)
+                except BrokenProcessPool:
+                    executor.shutdown(wait = False)
+                    executor = worker_pool(workers)
+                    future = executor.submit(check_workbook_safe, f)
+                pending[future] = (f, executor)
+            for f in set(queued) - set(input_files):
+                del queued[f]
+            for future in [future for future in pending if future.done()]:
+                f, pool = pending.pop(future)
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    # a process of the pool died (e.g. out of memory)
+                    if pool is not isolated:
+                        # any workbook queued on the pool may have stopped it:
+                        # check them again alone. A new pool is started once
+                        # per pool which died
+                        if pool is executor:
+                            executor.shutdown(wait = False)
+                            executor = worker_pool(workers)
+                        suspects.append(f)
+                        print('%s: a process of the pool stopped, checking it again alone' %f)
+                        continue
+                    isolated.shutdown(wait = False)
+                    isolated = None
+                    result = {'input_file': f, 'messages': [], 'warning_ctr': 0, 'passed': False, 'profile': None,
+                              'fatal': 'The checks of %s stopped the process checking it' %f}
+                checked_before.add(f)
+                write_report(result)
+                write_profile(result)
+                if result['fatal'] is not None:
+                    print('%s: not checked (%s)' %(f, result['fatal']))
+                else:
+                    print('%s: %d warning/s were detected' %(f, result['warning_ctr']))
+                if result['passed']:
+                    move_to_checked(f)
+            while (len(suspects) > 0) and (not any([pool is isolated for g, pool in pending.values()])):
+                f = suspects.pop(0)
+                if os.path.isfile(f):
+                    if isolated is None:
+                        isolated = worker_pool(1)
+                    pending[isolated.submit(check_workbook_safe, f)] = (f, isolated)
+            if len(pending) > 0:
+                timeout = 0.2 # to report the checks as they finish
+            elif settling:
+                timeout = inbox_settle_time
+            elif (fd is None) or (stop is not None):
+                timeout = inbox_poll_interval
+            else:
+                timeout = None
+            wait_for_inbox(fd, timeout)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        executor.shutdown(wait = False, cancel_futures = True)
+        if isolated is not None:
+            isolated.shutdown(wait = False, cancel_futures = True)
+        if fd is not None:
+            os.close(fd)
+
+# =============================================================================
+# Section 15. Command line
+# =============================================================================
+def main(argv):
+    """Check the workbook/s given on the command line, print out the warnings and
+    move the workbooks with no warnings to the Checked folder
+
+    Args:
+        argv: list of strings. Command line arguments, e.g.
+            ['wb_check.py', 'workbook.xlsx'] or
+            ['wb_check.py', 'submissions', '--workers', '8']
+
+    Returns:
+        None
+    """
+    parser = argparse.ArgumentParser(description = 'Check SISAL workbooks.')
+    parser.add_argument('inputs', nargs = '*', help = 'workbook, folder of workbooks or glob pattern')
+    parser.add_argument('-w', '--workers', type = int, default = None, help = 'number of processes for a batch (default: number of CPUs)')
+    parser.add_argument('--entity-workers', type = int, default = 1, help = 'number of threads/processes for the checks performed per entity of one workbook (default: 1)')
+    parser.add_argument('--sheet-workers', type = int, default = 1, help = 'number of threads running the checks of the spreadsheets of one workbook at the same time, and of processes for their checks per entity unless --entity-workers is given (default: 1)')
+    parser.add_argument('--entity-pool', choices = ['thread', 'process'], default = 'thread', help = 'type of pool for --entity-workers (default: thread)')
+    parser.add_argument('--profile', action = 'store_true', help = 'write the wall time and rows of each section and check to <workbook>_profile.json (also with SISAL_PROFILE=1)')
+    parser.add_argument('--profile-memory', action = 'store_true', help = 'as --profile, with the peak memory of each section and check traced by tracemalloc, which slows the checks down several times (also with SISAL_PROFILE_MEMORY=1)')
+    parser.add_argument('--low-memory', action = 'store_true', help = 'stream the Sample data spreadsheets in chunks of rows and only keep the rows the checks flag and a few columns, for very large spreadsheets; same warnings, not used with --watch (also with SISAL_LOW_MEMORY=1)')
+    parser.add_argument('--watch', action = 'store_true', help = 'check the workbook again each time it is saved, until it passes the checks (only what changed is checked again)')
+    parser.add_argument('--daemon', action = 'store_true', help = 'watch the folder given (inbox) and check the workbooks put in it until stopped: reports are written next to the workbooks and the workbooks which passed are moved to Checked')
+    parser.add_argument('--serve', action = 'store_true', help = 'run the QC server for wb_client.py instead of checking workbooks (--workers: workbooks checked at the same time, default: 1)')
+    parser.add_argument('--port', type = int, default = None, help = 'port of the QC server (default: %d, or SISAL_QC_PORT)' %server_port)
+    parser.add_argument('--cache', action = 'store_true', help = 'cache the spreadsheets read in and the results in %s (or SISAL_CACHE_DIR)' %default_cache_dir)
+    parser.add_argument('--no-cache', action = 'store_true', help = 'do not use the cache, even if SISAL_CACHE_DIR is set')
+    args = parser.parse_args(argv[1:])
+    if args.cache and not cache_dir:
+        set_cache_dir(default_cache_dir)
+    if args.no_cache:
+        set_cache_dir('')
+    if args.profile or args.profile_memory:
+        set_profiling(True, args.profile_memory or profile_memory)
+    if args.low_memory:
+        set_low_memory(True)
+    # also set in the processes of a batch, the daemon and the QC server (see
+    # init_worker())
+    set_entity_workers(args.entity_workers, args.entity_pool)
+    set_sheet_workers(args.sheet_workers)
+    if args.serve:
+        serve(args.port, args.workers or 1)
+        return
+    if len(args.inputs) == 0:
+        parser.error('the following arguments are required: inputs')
+    if args.daemon:
+        if (len(args.inputs) > 1) | (not os.path.isdir(args.inputs[0])):
+            parser.error('--daemon needs one folder (the inbox)')
+        watch_inbox(args.inputs[0], args.workers)
+        return
+    # one workbook: same output as before batch mode
+    if (len(args.inputs) > 1) | os.path.isdir(args.inputs[0]) | (glob.escape(args.inputs[0]) != args.inputs[0]):
+        check_batch(args.inputs, args.workers)
+        return
+    input_file = args.inputs[0]
+    if args.watch:
+        watch_workbook(input_file)
+        return
+    result = check_workbook(input_file, echo = True)
+    write_profile(result)
+    if result['fatal'] is not None:
+        sys.exit(result['fatal'])
+    print('%d warning/s were detected' %result['warning_ctr'])
+    if result['passed']:
+        move_to_checked(input_file)
+
+if __name__ == '__main__':
+    main(sys.argv)
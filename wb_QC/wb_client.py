@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Checks a workbook with the QC server (python wb_check.py --serve), so that
+Python and the checks are not started again for each workbook. Executed from
+the command line as wb_check.py:
+
+    python wb_client.py input.xlsx
+
+The warnings are printed out and the workbook is moved to the Checked folder if
+there are none, as with python wb_check.py input.xlsx. If no QC server is
+running, the workbook is checked by wb_check.py in this process.
+
+18 October 2026
+    - First version. Only the standard library is imported, unless there is no
+      QC server.
+    - The client waits at most --timeout seconds (SISAL_QC_TIMEOUT, default
+      600) for the QC server.
+    - The token written by the QC server when it starts (~/.sisal_qc_token_<port>,
+      or in SISAL_QC_TOKEN_DIR) is sent with each workbook.
+"""
+
+# =============================================================================
+# Section 1. Import prerequisite modules
+# =============================================================================
+import argparse, json, os, shutil, socket, sys
+from urllib import error, request
+
+# =============================================================================
+# Section 2. Send the workbook to the QC server
+# =============================================================================
+# Port of the QC server, as server_port in wb_check.py
+server_port = int(os.environ.get('SISAL_QC_PORT', '8765'))
+# Seconds to wait for the QC server to check a workbook (environment variable
+# SISAL_QC_TIMEOUT)
+server_timeout = float(os.environ.get('SISAL_QC_TIMEOUT', '600'))
+# Folder of the token of the QC server, as server_token_dir in wb_check.py
+server_token_dir = os.environ.get('SISAL_QC_TOKEN_DIR', os.path.expanduser('~'))
+
+def read_token(port):
+    """Token written by the QC server on port when it started ('' if there is
+    none), see server_token_file() in wb_check.py"""
+    try:
+        with open(os.path.join(server_token_dir, '.sisal_qc_token_%d' %port)) as f:
+            return(f.read().strip())
+    except (IOError, OSError):
+        return('')
+
+def check_on_server(input_file, port, timeout = None):
+    """Check a workbook with the QC server
+
+    Args:
+        input_file: string. File name of the workbook
+        port: integer. Port of the QC server
+        timeout: float. Seconds to wait for the QC server (default:
+            server_timeout)
+
+    Returns:
+        dictionary, output of check_workbook() (see wb_check.py). None if there
+        is no QC server on port
+
+    Raises:
+        RuntimeError: the QC server could not check the workbook, or did not
+            answer within timeout seconds
+    """
+    timeout = server_timeout if timeout is None else timeout
+    body = json.dumps({'input_file': os.path.abspath(input_file)}).encode('utf-8')
+    req = request.Request('http://127.0.0.1:%d/check' %port, data = body,
+                          headers = {'Content-Type': 'application/json', 'X-SISAL-QC-Token': read_token(port)})
+    try:
+        with request.urlopen(req, timeout = timeout) as response:
+            return(json.loads(response.read().decode('utf-8')))
+    except error.HTTPError as e:
+        raise RuntimeError(json.loads(e.read().decode('utf-8')).get('error', str(e)))
+    except socket.timeout:
+        raise RuntimeError('The QC server did not answer within %g seconds' %timeout)
+    except error.URLError as e:
+        if isinstance(e.reason, socket.timeout):
+            raise RuntimeError('The QC server did not answer within %g seconds' %timeout)
+        return(None)
+
+def move_to_checked(input_file):
+    """Move a workbook which passed the checks to the Checked folder next to it,
+    as move_to_checked() in wb_check.py
+
+    Args:
+        input_file: string. File name of the workbook
+
+    Returns:
+        None
+    """
+    try:
+        shutil.move(input_file, os.path.join(os.path.dirname(input_file), 'Checked', os.path.basename(input_file)))
+    except IOError:
+        print('Checked folder is likely missing. Unable to move file automatically into Checked folder.')
+
+# =============================================================================
+# Section 3. Command line
+# =============================================================================
+def main(argv):
+    """Check the workbook given on the command line with the QC server, print
+    out the warnings and move the workbook to the Checked folder if there are
+    none
+
+    Args:
+        argv: list of strings. Command line arguments, e.g.
+            ['wb_client.py', 'workbook.xlsx']
+
+    Returns:
+        None
+    """
+    parser = argparse.ArgumentParser(description = 'Check a SISAL workbook with the QC server (python wb_check.py --serve).')
+    parser.add_argument('input_file', help = 'workbook')
+    parser.add_argument('--port', type = int, default = server_port, help = 'port of the QC server (default: %d, or SISAL_QC_PORT)' %server_port)
+    parser.add_argument('--timeout', type = float, default = server_timeout, help = 'seconds to wait for the QC server (default: %g, or SISAL_QC_TIMEOUT)' %server_timeout)
+    args = parser.parse_args(argv[1:])
+    try:
+        result = check_on_server(args.input_file, args.port, args.timeout)
+    except RuntimeError as e:
+        sys.exit(str(e))
+    if result is None:
+        # no QC server: check the workbook in this process
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import wb_check
+        wb_check.main([argv[0], args.input_file])
+        return
+    for message in result['messages']:
+        print(message)
+    if result['fatal'] is not None:
+        sys.exit(result['fatal'])
+    print('%d warning/s were detected' %result['warning_ctr'])
+    if result['passed']:
+        move_to_checked(args.input_file)
+
+if __name__ == '__main__':
+    main(sys.argv)